@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the concurrent add read sets handler against the serial path (FASTQ_MANAGER_MAX_WORKERS=1).
+
+The fastq manager is replaced by an in-process fake with a fixed latency per request.
+Runs the handler once for each of 10 libraries across 8 lanes (80 fastq objects),
+a third of which already have a different read set attached and a third of which already have the right read set.
+The updates are diffed against a run manifest in a local object store (as the plan read set updates step does),
+and written next to it.
+
+The final fastq objects, and the order of calls made for each fastq object, must be identical for both paths.
+
+python3 app/benchmarks/bench_add_read_sets_concurrency.py
+"""
+
+# Standard imports
+import sys
+import json
+import types
+import tempfile
+import threading
+from copy import deepcopy
+from os import environ
+from time import sleep
+from typing import Dict, List, Any
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path, time_callable
+
+# Globals
+NUM_LIBRARIES = 10
+NUM_LANES = 8
+REQUEST_LATENCY_SECONDS = 0.01
+MAX_WORKERS_LIST = [1, 4, 8, 16]
+INSTRUMENT_RUN_ID = "250320_A01052_0256_BHFCFCDSXF"
+CACHE_ROOT_URI = "s3://bench-cache-bucket/cache/fastq-glue/"
+
+
+class FakeFastqManager:
+    """
+    In-process stand-in for the fastq manager endpoints used by the handler
+    """
+
+    def __init__(self, fastq_objects: Dict[str, Dict[str, Any]]):
+        self.fastq_objects = deepcopy(fastq_objects)
+        self.calls_by_fastq_id: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+
+    def record(self, fastq_id: str, call_name: str):
+        sleep(REQUEST_LATENCY_SECONDS)
+        with self.lock:
+            self.calls_by_fastq_id.setdefault(fastq_id, []).append(call_name)
+
+    def detach_read_set(self, fastq_id: str):
+        self.record(fastq_id, "detach_read_set")
+        if self.fastq_objects[fastq_id]['readSet'] is None:
+            raise ValueError(f"{fastq_id} has no read set to detach")
+        self.fastq_objects[fastq_id]['readSet'] = None
+
+    def add_read_set(self, fastq_id: str, read_set: Dict[str, Any]):
+        self.record(fastq_id, "add_read_set")
+        if self.fastq_objects[fastq_id]['readSet'] is not None:
+            raise ValueError(f"{fastq_id} already has a read set")
+        self.fastq_objects[fastq_id]['readSet'] = read_set
+
+    def add_read_count(self, fastq_id: str, read_count: Dict[str, Any]):
+        self.record(fastq_id, "add_read_count")
+        self.fastq_objects[fastq_id]['readCount'] = read_count
+
+
+def generate_inputs():
+    from fastq_glue_tools.read_set_diff import diff_read_sets, write_read_set_updates
+    from fastq_glue_tools.run_manifest import write_run_manifest
+
+    fastq_objects = {}
+    fastq_id_list_by_library = {}
+    run_manifest_rows = []
+    for library_iter_ in range(NUM_LIBRARIES):
+        library_id = f"L{library_iter_:07d}"
+        fastq_id_list = []
+        for lane_iter_ in range(1, NUM_LANES + 1):
+            fastq_id = f"fqr.{library_iter_:04d}{lane_iter_:02d}"
+            read1_file_uri = f"s3://bucket/run/L{library_iter_:07d}_L00{lane_iter_}_R1_001.fastq.ora"
+            read2_file_uri = f"s3://bucket/run/L{library_iter_:07d}_L00{lane_iter_}_R2_001.fastq.ora"
+            existing_read_set = [
+                None,
+                {"r1": {"s3Uri": "s3://bucket/old/R1.fastq.gz"}, "r2": {"s3Uri": "s3://bucket/old/R2.fastq.gz"}},
+                {"r1": {"s3Uri": read1_file_uri}, "r2": {"s3Uri": read2_file_uri}},
+            ][(library_iter_ + lane_iter_) % 3]
+            fastq_objects[fastq_id] = {
+                "id": fastq_id,
+                "library": {"libraryId": library_id},
+                "lane": lane_iter_,
+                "readSet": existing_read_set,
+                "readCount": None,
+            }
+            fastq_id_list.append(fastq_id)
+            run_manifest_rows.append({
+                "libraryId": library_id,
+                "lane": lane_iter_,
+                "index": "ACGTACGT+TGCATGCA",
+                "cycleCount": 302,
+                "read1FileUri": read1_file_uri,
+                "read2FileUri": read2_file_uri,
+                "readCount": 1_000_000 + library_iter_,
+                "baseCountEst": 302_000_000 + library_iter_,
+                "hasBclconvertData": True,
+                "hasFileNames": True,
+                "hasDemuxStats": True,
+            })
+        fastq_id_list_by_library[library_id] = fastq_id_list
+
+    run_manifest_uri = write_run_manifest(
+        cache_root_uri=CACHE_ROOT_URI,
+        instrument_run_id=INSTRUMENT_RUN_ID,
+        sources={
+            "fastqListUri": "s3://bench-bucket/Reports/fastq_list.csv",
+            "fastqListEtag": "fastq-list-etag",
+            "demuxStatsUri": "s3://bench-bucket/Reports/Demultiplex_Stats.csv",
+            "demuxStatsEtag": "demux-stats-etag",
+            "samplesheetSha256": "samplesheet-sha256",
+        },
+        run_manifest_rows=run_manifest_rows,
+    )
+
+    read_set_updates_uri = write_read_set_updates(
+        run_manifest_uri,
+        diff_read_sets(list(fastq_objects.values()), run_manifest_rows)['readSetUpdateList']
+    )
+
+    events = list(map(
+        lambda library_id_iter_: {
+            "libraryIdList": [library_id_iter_],
+            "readSetUpdatesUri": read_set_updates_uri,
+        },
+        fastq_id_list_by_library.keys()
+    ))
+
+    return fastq_objects, events
+
+
+def install_fake_fastq_manager(fake_fastq_manager: FakeFastqManager):
+    fake_fastq_module = types.ModuleType("orcabus_api_tools.fastq")
+    fake_fastq_module.detach_read_set = fake_fastq_manager.detach_read_set
+    fake_fastq_module.add_read_set = fake_fastq_manager.add_read_set
+    fake_fastq_module.add_read_count = fake_fastq_manager.add_read_count
+    sys.modules.setdefault("orcabus_api_tools", types.ModuleType("orcabus_api_tools"))
+    sys.modules["orcabus_api_tools.fastq"] = fake_fastq_module
+
+
+def run_handler(
+        handler_module: types.ModuleType,
+        fastq_objects: Dict[str, Dict[str, Any]],
+        events: List[Dict[str, Any]],
+        max_workers: int
+) -> FakeFastqManager:
+    fake_fastq_manager = FakeFastqManager(fastq_objects)
+    # Point the handler at this run's fake
+    handler_module.detach_read_set = fake_fastq_manager.detach_read_set
+    handler_module.add_read_set = fake_fastq_manager.add_read_set
+    handler_module.add_read_count = fake_fastq_manager.add_read_count
+
+    environ["FASTQ_MANAGER_MAX_WORKERS"] = str(max_workers)
+    for event in events:
+        handler_module.handler(event, None)
+
+    return fake_fastq_manager
+
+
+def main():
+    environ["LOCAL_OBJECT_STORE_DIR"] = tempfile.mkdtemp(prefix="bench_add_read_sets_")
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("add_read_sets_to_fastq_objects_py")
+
+    fastq_objects, events = generate_inputs()
+    install_fake_fastq_manager(FakeFastqManager(fastq_objects))
+
+    import add_read_sets_to_fastq_objects
+
+    # Outputs must be identical to the serial path
+    serial_fastq_manager = run_handler(add_read_sets_to_fastq_objects, fastq_objects, events, max_workers=1)
+    for max_workers in MAX_WORKERS_LIST[1:]:
+        concurrent_fastq_manager = run_handler(
+            add_read_sets_to_fastq_objects, fastq_objects, events, max_workers=max_workers
+        )
+        assert serial_fastq_manager.fastq_objects == concurrent_fastq_manager.fastq_objects, \
+            "Fastq objects differ from the serial path"
+        assert serial_fastq_manager.calls_by_fastq_id == concurrent_fastq_manager.calls_by_fastq_id, \
+            "Per fastq call order differs from the serial path"
+
+    timings = {
+        max_workers: time_callable(
+            lambda: run_handler(add_read_sets_to_fastq_objects, fastq_objects, events, max_workers=max_workers),
+            repeats=3
+        )
+        for max_workers in MAX_WORKERS_LIST
+    }
+
+    print(json.dumps(
+        {
+            "numEvents": len(events),
+            "numFastqObjects": len(fastq_objects),
+            "numRequests": sum(map(len, serial_fastq_manager.calls_by_fastq_id.values())),
+            "requestLatencySeconds": REQUEST_LATENCY_SECONDS,
+            "byMaxWorkers": {
+                str(max_workers): {
+                    **timing,
+                    "speedup": timings[1]['bestSeconds'] / timing['bestSeconds'],
+                }
+                for max_workers, timing in timings.items()
+            },
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
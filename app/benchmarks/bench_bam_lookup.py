@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the bam lookups of the get bam by library id handler on portal runs with many files.
+
+A synthetic dragen-wgts-dna workflow run (tumor and normal bams) is padded out to 1,000 - 50,000 files,
+and the file manager is the in-process fake, with a fixed latency per listing (--latency-ms).
+
+For each portal run size, we time
+
+* per suffix - the portal run is listed, and scanned, once per bam (as the handler did before)
+* cold - the handler lists the portal run once and looks up each bam in the file index
+* warm - the handler is triggered again for the same workflow run (the index is in the in-process LRU)
+
+and check the file index matches a linear scan for a sample of suffixes (whole keys, basenames, partial basenames
+and suffixes that match nothing).
+
+python3 app/benchmarks/bench_bam_lookup.py
+"""
+
+# Standard imports
+import json
+import random
+import argparse
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path, time_callable
+from fake_orcabus_api_tools import (
+    FakeFastqManager,
+    FakeFileManager,
+    FakeWorkflowManager,
+    install_fake_orcabus_api_tools
+)
+from synthetic_run import get_workflow_run
+
+# Globals
+NUM_FILES_LIST = [1000, 10000, 50000]
+DEFAULT_LATENCY_MS = 50.0
+NUM_SAMPLE_SUFFIXES = 200
+SEED = 21
+
+
+def get_linear_scan_file_uri(file_list: List[Dict[str, Any]], suffix: str) -> Optional[str]:
+    return next(map(
+        lambda file_iter_: f"s3://{file_iter_['bucket']}/{file_iter_['key']}",
+        filter(lambda file_iter_: file_iter_['key'].endswith(suffix), file_list)
+    ), None)
+
+
+def get_sample_suffixes(rng: random.Random, file_list: List[Dict[str, Any]]) -> List[str]:
+    sample_keys = list(map(lambda file_iter_: file_iter_['key'], rng.sample(file_list, NUM_SAMPLE_SUFFIXES)))
+    return (
+        sample_keys +
+        list(map(lambda key_iter_: key_iter_.rsplit("/", 1)[-1], sample_keys)) +
+        list(map(lambda key_iter_: key_iter_[-rng.randint(1, 8):], sample_keys)) +
+        list(map(lambda key_iter_: f"{key_iter_}.missing", sample_keys)) +
+        [".bam", ".bai", "_tumor.bam"]
+    )
+
+
+def pad_file_list(rng: random.Random, file_list: List[Dict[str, Any]], num_files: int) -> List[Dict[str, Any]]:
+    output_prefix = file_list[0]['key'].split("/", 3)
+    output_prefix = "/".join(output_prefix[:3])
+    padded_file_list = file_list + [
+        {
+            "bucket": file_list[0]['bucket'],
+            "key": f"{output_prefix}/intermediates/{file_index_iter_ % 97:02d}/{file_index_iter_:06d}.{rng.choice(['bam', 'bai', 'json', 'vcf.gz'])}"
+        }
+        for file_index_iter_ in range(max(num_files - len(file_list), 0))
+    ]
+    rng.shuffle(padded_file_list)
+    return padded_file_list
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS, help="Latency of each listing")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fake_file_manager = FakeFileManager()
+    fake_workflow_manager = FakeWorkflowManager()
+    install_fake_orcabus_api_tools(
+        FakeFastqManager(),
+        fake_file_manager=fake_file_manager,
+        fake_workflow_manager=fake_workflow_manager
+    )
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("get_bam_by_library_id_py")
+
+    import get_bam_by_library_id
+    from fastq_glue_tools.portal_run_files import PortalRunFileIndex, clear_portal_run_file_index_memory_cache
+
+    rng = random.Random(SEED)
+    workflow_run = get_workflow_run(
+        rng,
+        workflow_name="dragen-wgts-dna",
+        library_id="L2500101",
+        tumor_library_id="L2500102",
+        run_date=date(2025, 3, 20),
+        workflow_run_number=1
+    )
+    portal_run_id = workflow_run['workflowRunObj']['portalRunId']
+    event = {"workflowRunObj": workflow_run['workflowRunObj']}
+    fake_workflow_manager.add_payload(workflow_run['workflowRunObj']['orcabusId'], workflow_run['payload'])
+
+    results = {}
+    for num_files_iter_ in NUM_FILES_LIST:
+        file_list = pad_file_list(rng, workflow_run['fileList'], num_files_iter_)
+        fake_file_manager.reset()
+        fake_file_manager.add_files(portal_run_id, file_list)
+
+        # The index must agree with a linear scan
+        file_index = PortalRunFileIndex(file_list)
+        for suffix_iter_ in get_sample_suffixes(rng, file_list):
+            assert file_index.get_file_uri_by_suffix(suffix_iter_) == get_linear_scan_file_uri(file_list, suffix_iter_), \
+                f"Index and linear scan disagree on suffix {suffix_iter_}"
+
+        clear_portal_run_file_index_memory_cache()
+        bam_file_by_library_id_list = get_bam_by_library_id.handler(event, None)['bamFileByLibraryIdList']
+        suffix_list = list(map(
+            lambda bam_file_iter_: bam_file_iter_['bamUri'].split("/", 3)[-1],
+            bam_file_by_library_id_list
+        ))
+
+        def lookup_per_suffix():
+            return list(map(
+                lambda suffix_iter_: get_linear_scan_file_uri(
+                    fake_file_manager.list_files_from_portal_run_id(portal_run_id),
+                    suffix_iter_
+                ),
+                suffix_list
+            ))
+
+        def lookup_cold():
+            clear_portal_run_file_index_memory_cache()
+            return get_bam_by_library_id.handler(event, None)
+
+        def lookup_warm():
+            return get_bam_by_library_id.handler(event, None)
+
+        fake_file_manager.latency_seconds = args.latency_ms / 1000
+        mode_results = {}
+        for mode_name_iter_, mode_func_iter_ in [
+            ("perSuffix", lookup_per_suffix),
+            ("cold", lookup_cold),
+            ("warm", lookup_warm),
+        ]:
+            fake_file_manager.request_counter.clear()
+            mode_func_iter_()
+            num_listings = fake_file_manager.request_counter["list_files_from_portal_run_id"]
+            mode_results[mode_name_iter_] = {
+                **time_callable(mode_func_iter_, repeats=args.repeats),
+                "listings": num_listings,
+            }
+        fake_file_manager.latency_seconds = 0.0
+
+        assert lookup_per_suffix() == list(map(
+            lambda bam_file_iter_: bam_file_iter_['bamUri'],
+            bam_file_by_library_id_list
+        ))
+
+        results[str(num_files_iter_)] = mode_results
+
+    print(json.dumps(
+        {
+            "latencyMs": args.latency_ms,
+            "numFiles": results,
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
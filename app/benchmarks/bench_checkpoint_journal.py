@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+
+"""
+Interrupt the create fastq set object and add read sets handlers after every fastq manager write in turn,
+retry them (as the step function would) with the same execution id, and check the end state.
+
+Each library (new, topup / append and rerun / replace) is created, and then has its read sets added,
+against the in-process fake fastq manager.
+The nth attempt fails just before its nth write, as a lambda timeout would, and the retry runs to completion.
+
+For each journal store (none, in-memory sqlite and a sqlite file) we check that every library ends up with
+
+* exactly one fastq set with fastqs on the run, and one current fastq set, that no longer allows additional fastqs
+* one fastq per lane from the run, each in the fastq set (no orphaned fastq objects)
+* a read set and read count on every fastq from the run
+
+and count the writes the retries repeated (or skipped).
+Without a journal store the failures are expected to show up (and are reported, not raised),
+with either journal store any failure, or any repeated write, is an error.
+
+python3 app/benchmarks/bench_checkpoint_journal.py
+"""
+
+# Standard imports
+import json
+import tempfile
+from collections import Counter
+from os import environ
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path
+from bench_create_fastq_set_object_api_calls import (
+    INSTRUMENT_RUN_ID,
+    NUM_LANES,
+    PREVIOUS_INSTRUMENT_RUN_ID,
+    add_existing_fastq_set,
+    get_bclconvert_data
+)
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+LIBRARY_ID_BY_ACTION = {
+    "new": "L2500001",
+    "append": "L2500002",
+    "replace": "L2500003",
+}
+# Lanes whose fastqs already have a (different) read set, so the read set is detached first
+OLD_READ_SET_LANES = [3, 4]
+CACHE_ROOT_URI = "s3://bench-cache-bucket/cache/fastq-glue/"
+READ_ENDPOINT_PREFIXES = ("get_", "list_")
+
+
+class SimulatedTimeout(Exception):
+    pass
+
+
+class WriteInterrupter:
+    """
+    Counts the fastq manager writes, and fails the next write once fail_after writes have been made
+    """
+
+    def __init__(self):
+        self.num_writes = 0
+        self.fail_after: Optional[int] = None
+
+    def __call__(self, endpoint_name: str):
+        if endpoint_name.startswith(READ_ENDPOINT_PREFIXES):
+            return
+        if self.fail_after is not None and self.num_writes >= self.fail_after:
+            self.fail_after = None
+            raise SimulatedTimeout(f"Timed out before write {self.num_writes + 1} ({endpoint_name})")
+        self.num_writes += 1
+
+
+def get_run_fastqs(fake_fastq_manager: FakeFastqManager, library_id: str) -> List[Dict[str, Any]]:
+    return list(filter(
+        lambda fastq_iter_: (
+            fastq_iter_['instrumentRunId'] == INSTRUMENT_RUN_ID and
+            fastq_iter_['library']['libraryId'] == library_id
+        ),
+        fake_fastq_manager.fastqs.values()
+    ))
+
+
+def get_library_violations(fake_fastq_manager: FakeFastqManager, library_id: str) -> List[str]:
+    fastq_set_list = list(map(
+        fake_fastq_manager.get_fastq_set_with_fastqs,
+        fake_fastq_manager.fastq_set_ids_by_library_id.get(library_id, [])
+    ))
+    fastq_sets_on_run = list(filter(
+        lambda fastq_set_iter_: any(map(
+            lambda fastq_iter_: fastq_iter_['instrumentRunId'] == INSTRUMENT_RUN_ID,
+            fastq_set_iter_['fastqSet']
+        )),
+        fastq_set_list
+    ))
+    current_fastq_sets = list(filter(lambda fastq_set_iter_: fastq_set_iter_['isCurrentFastqSet'], fastq_set_list))
+    run_fastqs = get_run_fastqs(fake_fastq_manager, library_id)
+
+    violations = []
+    if len(fastq_sets_on_run) != 1:
+        violations.append(f"{len(fastq_sets_on_run)} fastq sets on the run")
+    if len(current_fastq_sets) != 1:
+        violations.append(f"{len(current_fastq_sets)} current fastq sets")
+    if any(map(lambda fastq_set_iter_: fastq_set_iter_['allowAdditionalFastq'], fastq_set_list)):
+        violations.append("fastq set still allows additional fastqs")
+    if len(run_fastqs) != NUM_LANES:
+        violations.append(f"{len(run_fastqs)} fastqs on the run")
+    if any(map(lambda fastq_iter_: fastq_iter_['fastqSetId'] is None, run_fastqs)):
+        violations.append("orphaned fastqs on the run")
+    return violations
+
+
+def get_read_set_violations(fake_fastq_manager: FakeFastqManager, library_id: str) -> List[str]:
+    run_fastqs = get_run_fastqs(fake_fastq_manager, library_id)
+    violations = []
+    if any(map(lambda fastq_iter_: fastq_iter_['readSet'] is None, run_fastqs)):
+        violations.append("fastq without a read set")
+    if any(map(
+        lambda fastq_iter_: fastq_iter_['readSet'] is not None and "/old/" in fastq_iter_['readSet']['r1']['s3Uri'],
+        run_fastqs
+    )):
+        violations.append("fastq with the old read set")
+    if any(map(lambda fastq_iter_: fastq_iter_['readCount'] is None, run_fastqs)):
+        violations.append("fastq without a read count")
+    return violations
+
+
+def get_run_manifest_uri(library_id: str) -> str:
+    from fastq_glue_tools.run_manifest import write_run_manifest
+
+    return write_run_manifest(
+        cache_root_uri=CACHE_ROOT_URI,
+        instrument_run_id=INSTRUMENT_RUN_ID,
+        sources={
+            "fastqListUri": "s3://bench-bucket/Reports/fastq_list.csv",
+            "fastqListEtag": f"fastq-list-etag-{library_id}",
+            "demuxStatsUri": "s3://bench-bucket/Reports/Demultiplex_Stats.csv",
+            "demuxStatsEtag": "demux-stats-etag",
+            "samplesheetSha256": "samplesheet-sha256",
+        },
+        run_manifest_rows=[
+            {
+                "libraryId": library_id,
+                "lane": lane_iter_,
+                "index": "ACGTACGT+TGCATGCA",
+                "cycleCount": 302,
+                "read1FileUri": f"s3://bucket/run/{library_id}_L00{lane_iter_}_R1_001.fastq.ora",
+                "read2FileUri": f"s3://bucket/run/{library_id}_L00{lane_iter_}_R2_001.fastq.ora",
+                "readCount": 1_000_000,
+                "baseCountEst": 302_000_000,
+                "hasBclconvertData": True,
+                "hasFileNames": True,
+                "hasDemuxStats": True,
+            }
+            for lane_iter_ in range(1, NUM_LANES + 1)
+        ],
+    )
+
+
+def run_with_retry(
+        handler: Callable,
+        event: Dict[str, Any],
+        interrupter: WriteInterrupter,
+        fail_after: Optional[int]
+) -> Optional[str]:
+    """
+    Run the handler, failing before write fail_after + 1, then retry it once (the retry is not interrupted).
+    Returns the name of the error the retry raised, if any
+    :param handler:
+    :param event:
+    :param interrupter:
+    :param fail_after:
+    :return:
+    """
+    interrupter.fail_after = fail_after
+    try:
+        handler(event, None)
+        return None
+    except SimulatedTimeout:
+        pass
+
+    try:
+        handler(event, None)
+    except Exception as e:
+        return type(e).__name__
+    return None
+
+
+def get_read_set_updates_uri(fake_fastq_manager: FakeFastqManager, library_id: str) -> str:
+    """
+    Plan the library's read set updates against its run manifest, as the plan read set updates step does
+    :param fake_fastq_manager:
+    :param library_id:
+    :return:
+    """
+    from fastq_glue_tools.read_set_diff import diff_read_sets, write_read_set_updates
+    from fastq_glue_tools.run_manifest import get_run_manifest_rows
+
+    run_manifest_uri = get_run_manifest_uri(library_id)
+    return write_read_set_updates(
+        run_manifest_uri,
+        diff_read_sets(
+            get_run_fastqs(fake_fastq_manager, library_id),
+            get_run_manifest_rows(run_manifest_uri)
+        )['readSetUpdateList']
+    )
+
+
+def seed_library(fake_fastq_manager: FakeFastqManager, action: str, library_id: str):
+    fake_fastq_manager.reset()
+    if action in ["append", "replace"]:
+        add_existing_fastq_set(fake_fastq_manager, library_id, PREVIOUS_INSTRUMENT_RUN_ID)
+
+
+def add_old_read_sets(fake_fastq_manager: FakeFastqManager, library_id: str):
+    for fastq_iter_ in get_run_fastqs(fake_fastq_manager, library_id):
+        fastq_iter_['readSet'] = (
+            {"r1": {"s3Uri": "s3://bucket/old/R1.fastq.gz"}, "r2": {"s3Uri": "s3://bucket/old/R2.fastq.gz"}}
+            if fastq_iter_['lane'] in OLD_READ_SET_LANES
+            else None
+        )
+        fastq_iter_['readCount'] = None
+
+
+def run_interruptions(
+        create_fastq_set_object: Any,
+        add_read_sets_to_fastq_objects: Any,
+        fake_fastq_manager: FakeFastqManager,
+        interrupter: WriteInterrupter,
+        journal_store_path: Optional[str]
+) -> Dict[str, Any]:
+    if journal_store_path is None:
+        environ.pop("LOCAL_JOURNAL_STORE_PATH", None)
+    else:
+        environ["LOCAL_JOURNAL_STORE_PATH"] = journal_store_path
+
+    error_list = []
+    violations_list = []
+    num_interruptions = 0
+    num_repeated_writes = 0
+    num_skipped_writes = 0
+    for action_iter_, library_id_iter_ in LIBRARY_ID_BY_ACTION.items():
+        create_event = {
+            "instrumentRunId": INSTRUMENT_RUN_ID,
+            "libraryId": library_id_iter_,
+            "bclConvertData": get_bclconvert_data(library_id_iter_),
+            "fastqSetCreationAction": action_iter_,
+        }
+
+        # Count the writes of an uninterrupted invocation
+        seed_library(fake_fastq_manager, action_iter_, library_id_iter_)
+        interrupter.num_writes = 0
+        create_fastq_set_object.handler(create_event, None)
+        num_create_writes = interrupter.num_writes
+
+        # Interrupt the create fastq set object handler after each write
+        for fail_after_iter_ in range(num_create_writes):
+            seed_library(fake_fastq_manager, action_iter_, library_id_iter_)
+            interrupter.num_writes = 0
+            error_name = run_with_retry(
+                create_fastq_set_object.handler,
+                {**create_event, "executionId": str(uuid4())},
+                interrupter,
+                fail_after_iter_
+            )
+            num_interruptions += 1
+            num_repeated_writes += max(interrupter.num_writes - num_create_writes, 0)
+            num_skipped_writes += max(num_create_writes - interrupter.num_writes, 0)
+            if error_name is not None:
+                error_list.append(error_name)
+            violations = get_library_violations(fake_fastq_manager, library_id_iter_)
+            if len(violations) > 0:
+                violations_list.append({
+                    "action": action_iter_,
+                    "failedBeforeWrite": fail_after_iter_ + 1,
+                    "violations": violations,
+                })
+
+        # Count the writes of an uninterrupted add read sets invocation, over a freshly created fastq set
+        seed_library(fake_fastq_manager, action_iter_, library_id_iter_)
+        create_fastq_set_object.handler(create_event, None)
+        add_old_read_sets(fake_fastq_manager, library_id_iter_)
+        read_sets_event = {
+            "libraryIdList": [library_id_iter_],
+            "readSetUpdatesUri": get_read_set_updates_uri(fake_fastq_manager, library_id_iter_),
+        }
+        interrupter.num_writes = 0
+        add_read_sets_to_fastq_objects.handler(read_sets_event, None)
+        num_read_set_writes = interrupter.num_writes
+
+        # Interrupt the add read sets handler after each write
+        for fail_after_iter_ in range(num_read_set_writes):
+            add_old_read_sets(fake_fastq_manager, library_id_iter_)
+            interrupter.num_writes = 0
+            error_name = run_with_retry(
+                add_read_sets_to_fastq_objects.handler,
+                {**read_sets_event, "executionId": str(uuid4())},
+                interrupter,
+                fail_after_iter_
+            )
+            num_interruptions += 1
+            num_repeated_writes += max(interrupter.num_writes - num_read_set_writes, 0)
+            num_skipped_writes += max(num_read_set_writes - interrupter.num_writes, 0)
+            if error_name is not None:
+                error_list.append(error_name)
+            violations = get_read_set_violations(fake_fastq_manager, library_id_iter_)
+            if len(violations) > 0:
+                violations_list.append({
+                    "action": f"{action_iter_} (read sets)",
+                    "failedBeforeWrite": fail_after_iter_ + 1,
+                    "violations": violations,
+                })
+
+    return {
+        "journalStore": journal_store_path if journal_store_path is not None else "none",
+        "interruptions": num_interruptions,
+        "repeatedWrites": num_repeated_writes,
+        "skippedWrites": num_skipped_writes,
+        "retryErrors": dict(Counter(error_list)),
+        "interruptionsWithViolations": len(violations_list),
+        "violations": dict(Counter(map(
+            lambda violation_iter_: f"{violation_iter_[0]}: {violation_iter_[1]}",
+            [
+                (violations_iter_['action'], violation_iter_)
+                for violations_iter_ in violations_list
+                for violation_iter_ in violations_iter_['violations']
+            ]
+        ))),
+    }
+
+
+def main():
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("create_fastq_set_object_py")
+    add_lambda_to_path("add_read_sets_to_fastq_objects_py")
+
+    fake_fastq_manager = FakeFastqManager()
+    install_fake_orcabus_api_tools(fake_fastq_manager)
+    interrupter = WriteInterrupter()
+    fake_fastq_manager.on_request = interrupter
+
+    import create_fastq_set_object
+    import add_read_sets_to_fastq_objects
+
+    with tempfile.TemporaryDirectory(prefix="bench_checkpoint_journal_") as tmp_dir:
+        environ["LOCAL_OBJECT_STORE_DIR"] = str(Path(tmp_dir) / "object-store")
+        environ["FASTQ_MANAGER_MAX_WORKERS"] = "1"
+        environ.pop("LOCAL_LOCK_STORE_PATH", None)
+
+        results = list(map(
+            lambda journal_store_path_iter_: run_interruptions(
+                create_fastq_set_object,
+                add_read_sets_to_fastq_objects,
+                fake_fastq_manager,
+                interrupter,
+                journal_store_path_iter_
+            ),
+            [None, ":memory:", str(Path(tmp_dir) / "journal.sqlite")]
+        ))
+
+    for result_iter_ in results[1:]:
+        assert result_iter_['interruptionsWithViolations'] == 0, \
+            f"Violations with the {result_iter_['journalStore']} journal store"
+        assert len(result_iter_['retryErrors']) == 0, \
+            f"Retry errors with the {result_iter_['journalStore']} journal store"
+        assert result_iter_['repeatedWrites'] == 0, \
+            f"Repeated writes with the {result_iter_['journalStore']} journal store"
+
+    print(json.dumps(
+        {
+            "numLanes": NUM_LANES,
+            "results": results,
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
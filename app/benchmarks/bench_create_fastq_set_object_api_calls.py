@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+"""
+Count the fastq manager requests made by the create fastq set object lambda.
+
+Runs the handler against the in-process fake fastq manager for each of the four library states
+(new, topup / append, rerun / replace, already on this run / exists),
+both with and without a fastq set creation plan, and checks
+
+* the library's fastq sets are read (get_fastq_sets) exactly once per invocation
+* the fastq manager ends up in the expected state
+
+Previously one invocation could read the library's fastq sets up to four times.
+
+python3 app/benchmarks/bench_create_fastq_set_object_api_calls.py
+"""
+
+# Standard imports
+import json
+from typing import Dict, Any, List
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+INSTRUMENT_RUN_ID = "250320_A01052_0256_BHFCFCDSXF"
+PREVIOUS_INSTRUMENT_RUN_ID = "250101_A01052_0250_BHAAAAAAXF"
+NUM_LANES = 4
+TOPUP_LIBRARY_ID = "L2500002"
+RERUN_LIBRARY_ID = "L2500003"
+
+
+class FakeSpread:
+    """
+    Stand-in for gspread_pandas.Spread
+    """
+
+    def __init__(self, spread: str, sheet: str):
+        self.sheet = sheet
+
+    def sheet_to_df(self, index: int = 0) -> pd.DataFrame:
+        return pd.DataFrame({
+            "LibraryID": [
+                f"{TOPUP_LIBRARY_ID}_topup",
+                f"{RERUN_LIBRARY_ID}_rerun",
+            ]
+        })
+
+
+def get_bclconvert_data(library_id: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            "libraryId": library_id,
+            "index": "ACGTACGT+TGCATGCA",
+            "lane": lane_iter_,
+            "cycleCount": 302,
+        }
+        for lane_iter_ in range(1, NUM_LANES + 1)
+    ]
+
+
+def add_existing_fastq_set(fake_fastq_manager: FakeFastqManager, library_id: str, instrument_run_id: str):
+    fake_fastq_manager.create_fastq_set_object(
+        library={"libraryId": library_id},
+        allowAdditionalFastq=False,
+        isCurrentFastqSet=True,
+        fastqSet=[
+            {
+                "index": "ACGTACGT+TGCATGCA",
+                "lane": lane_iter_,
+                "instrumentRunId": instrument_run_id,
+                "library": {"libraryId": library_id},
+            }
+            for lane_iter_ in range(1, NUM_LANES + 1)
+        ]
+    )
+
+
+def main():
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("create_fastq_set_object_py")
+
+    fake_fastq_manager = FakeFastqManager()
+    install_fake_orcabus_api_tools(fake_fastq_manager)
+
+    from fastq_glue_tools import tracking_sheet
+    tracking_sheet.get_spread = FakeSpread
+    tracking_sheet.get_tracking_sheet_id = lambda: "fake-tracking-sheet-id"
+
+    import create_fastq_set_object
+
+    scenarios = [
+        # library id, existing fastq set run, planned action
+        ("L2500001", None, "new"),
+        (TOPUP_LIBRARY_ID, PREVIOUS_INSTRUMENT_RUN_ID, "append"),
+        (RERUN_LIBRARY_ID, PREVIOUS_INSTRUMENT_RUN_ID, "replace"),
+        ("L2500004", INSTRUMENT_RUN_ID, "exists"),
+    ]
+
+    results = []
+    for library_id, existing_instrument_run_id, planned_action in scenarios:
+        for use_plan in [False, True]:
+            fake_fastq_manager.reset()
+            tracking_sheet.clear_tracking_sheet_cache()
+            if existing_instrument_run_id is not None:
+                add_existing_fastq_set(fake_fastq_manager, library_id, existing_instrument_run_id)
+            fake_fastq_manager.request_counter.clear()
+
+            create_fastq_set_object.handler(
+                {
+                    "instrumentRunId": INSTRUMENT_RUN_ID,
+                    "libraryId": library_id,
+                    "bclConvertData": get_bclconvert_data(library_id),
+                    **({"fastqSetCreationAction": planned_action} if use_plan else {}),
+                },
+                None
+            )
+
+            assert fake_fastq_manager.request_counter["get_fastq_sets"] == 1, \
+                f"{planned_action} read the fastq sets {fake_fastq_manager.request_counter['get_fastq_sets']} times"
+
+            # Check the end state
+            fastq_sets = list(fake_fastq_manager.fastq_sets.values())
+            current_fastq_sets = list(filter(lambda fastq_set_iter_: fastq_set_iter_['isCurrentFastqSet'], fastq_sets))
+            assert len(current_fastq_sets) == 1, "Expected one current fastq set"
+            expected_num_fastq_sets, expected_num_current_fastqs = {
+                "new": (1, NUM_LANES),
+                "append": (1, 2 * NUM_LANES),
+                "replace": (2, NUM_LANES),
+                "exists": (1, NUM_LANES),
+            }[planned_action]
+            assert len(fastq_sets) == expected_num_fastq_sets, f"Unexpected number of fastq sets for {planned_action}"
+            assert len(current_fastq_sets[0]['fastqSet']) == expected_num_current_fastqs, \
+                f"Unexpected number of fastqs in the current fastq set for {planned_action}"
+
+            results.append({
+                "action": planned_action,
+                "withPlan": use_plan,
+                "requests": dict(fake_fastq_manager.request_counter),
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the vectorised baseCountEst computation against the previous iterrows implementation.
+
+Uses 10,000 synthetic demux stats rows (1,250 samples across 8 lanes).
+
+The previous implementation never applied per-sample override cycles
+(it checked the whole bclconvertData list, rather than the row, for an overrideCycles key),
+so outputs are only compared against it on a samplesheet without per-sample override cycles.
+With per-sample override cycles, outputs are compared against a row-by-row reference.
+
+python3 app/benchmarks/bench_demux_base_count_est.py
+"""
+
+# Standard imports
+import re
+import json
+from typing import Dict, Any, Optional
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import add_layer_to_path, time_callable
+
+add_layer_to_path()
+
+from fastq_glue_tools.samplesheet import get_global_cycle_count
+from fastq_glue_tools.demux_stats import get_base_count_est_series
+
+# Globals
+NUM_LANES = 8
+NUM_SAMPLES = 1250
+
+
+def generate_inputs(with_override_cycles: bool):
+    samplesheet = {
+        "header": {},
+        "reads": {
+            "read1Cycles": 151,
+            "read2Cycles": 151,
+        },
+        "bclconvertSettings": {},
+        "bclconvertData": [
+            dict(filter(
+                lambda kv_iter_: kv_iter_[1] is not None,
+                {
+                    "lane": lane_iter_,
+                    "sampleId": f"L25{sample_iter_:05d}",
+                    "index": "ACGTACGTAC",
+                    "overrideCycles": (
+                        f"Y{51 + sample_iter_ % 100};I10;I10;Y{51 + lane_iter_}"
+                        if with_override_cycles and sample_iter_ % 2 == 0
+                        else None
+                    ),
+                }.items()
+            ))
+            for lane_iter_ in range(1, NUM_LANES + 1)
+            for sample_iter_ in range(NUM_SAMPLES)
+        ]
+    }
+
+    demux_stats_df = pd.DataFrame([
+        {
+            "SampleID": f"L25{sample_iter_:05d}",
+            "Lane": lane_iter_,
+            "# Reads": 1_000_000 + sample_iter_ * lane_iter_,
+        }
+        for lane_iter_ in range(1, NUM_LANES + 1)
+        for sample_iter_ in range(NUM_SAMPLES)
+    ])
+
+    return samplesheet, demux_stats_df
+
+
+# Previous implementation, kept here as the baseline
+def legacy_get_cycle_count_from_override_cycles(override_cycles: str) -> int:
+    read_cycle_regex_match = re.findall("(?:[yY])([0-9]+)", override_cycles)
+    if read_cycle_regex_match is None or len(read_cycle_regex_match) == 0:
+        raise ValueError("Invalid override_cycles format")
+    if len(read_cycle_regex_match) == 1:
+        return int(read_cycle_regex_match[0])
+    return int(read_cycle_regex_match[0]) + int(read_cycle_regex_match[1])
+
+
+def legacy_get_cycle_count_from_bclconvert_data_row(bclconvert_data_row) -> Optional[int]:
+    if "overrideCycles" in bclconvert_data_row:
+        return legacy_get_cycle_count_from_override_cycles(bclconvert_data_row['overrideCycles'])
+    return None
+
+
+def legacy_get_est_count_from_samplesheet(
+        series_iter_,
+        samplesheet_dict: Dict[str, Any],
+        global_cycle_count: int
+):
+    return list(map(
+        lambda series_iter_map_: (
+                (
+                    legacy_get_cycle_count_from_bclconvert_data_row(next(filter(
+                        lambda bclconvert_data_iter_: (
+                            bclconvert_data_iter_['sampleId'] == series_iter_map_[1]['SampleID']
+                        ),
+                        samplesheet_dict['bclconvertData']
+                    )))
+                    if legacy_get_cycle_count_from_bclconvert_data_row(samplesheet_dict['bclconvertData']) is not None
+                    else global_cycle_count
+                ) * series_iter_map_[1]['# Reads']
+        ),
+        series_iter_.iterrows()
+    ))
+
+
+def reference_get_est_count(demux_stats_df: pd.DataFrame, samplesheet: Dict[str, Any], global_cycle_count: int):
+    # Row by row reference, applying per-sample, per-lane override cycles
+    cycle_count_by_sample_lane = {}
+    for row in samplesheet['bclconvertData']:
+        cycle_count_by_sample_lane.setdefault(
+            (row['sampleId'], int(row['lane'])),
+            (
+                legacy_get_cycle_count_from_override_cycles(row['overrideCycles'])
+                if 'overrideCycles' in row
+                else global_cycle_count
+            )
+        )
+    return [
+        cycle_count_by_sample_lane.get((row['SampleID'], int(row['Lane'])), global_cycle_count) * row['# Reads']
+        for row in demux_stats_df.to_dict(orient='records')
+    ]
+
+
+def main():
+    # No per-sample override cycles, outputs must match the previous implementation
+    samplesheet, demux_stats_df = generate_inputs(with_override_cycles=False)
+    global_cycle_count = get_global_cycle_count(samplesheet)
+
+    assert (
+        legacy_get_est_count_from_samplesheet(demux_stats_df, samplesheet, global_cycle_count) ==
+        get_base_count_est_series(demux_stats_df, samplesheet, global_cycle_count).tolist()
+    ), "Outputs differ from the previous implementation"
+
+    legacy_timing = time_callable(
+        lambda: legacy_get_est_count_from_samplesheet(demux_stats_df, samplesheet, global_cycle_count),
+        repeats=1
+    )
+    vectorised_timing = time_callable(
+        lambda: get_base_count_est_series(demux_stats_df, samplesheet, global_cycle_count)
+    )
+
+    # Per-sample override cycles, outputs must match the row by row reference
+    override_samplesheet, override_demux_stats_df = generate_inputs(with_override_cycles=True)
+    override_global_cycle_count = get_global_cycle_count(override_samplesheet)
+    assert (
+        reference_get_est_count(override_demux_stats_df, override_samplesheet, override_global_cycle_count) ==
+        get_base_count_est_series(
+            override_demux_stats_df, override_samplesheet, override_global_cycle_count
+        ).tolist()
+    ), "Per-sample override cycles were not applied"
+
+    override_vectorised_timing = time_callable(
+        lambda: get_base_count_est_series(override_demux_stats_df, override_samplesheet, override_global_cycle_count)
+    )
+
+    print(json.dumps(
+        {
+            "numDemuxRows": len(demux_stats_df),
+            "numSamplesheetRows": len(samplesheet['bclconvertData']),
+            "legacyIterrows": legacy_timing,
+            "vectorised": vectorised_timing,
+            "vectorisedWithOverrideCycles": override_vectorised_timing,
+            "speedup": legacy_timing['bestSeconds'] / vectorised_timing['bestSeconds'],
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the columnar fastq list row builder in the create fastq set object lambda
+against the previous iterrows row construction (which also parsed the run date once per row).
+
+For 1, 8 and 64 lanes, builds the fastq set and the fastq list for each of 2,000 libraries,
+with the fastq manager requests replaced by functions that return their payloads,
+and checks the payloads are byte-identical to those of the previous implementation.
+
+run_legacy and run_columnar are also called by app/tests/test_fastq_list_rows.py,
+so a change to the lambda's signatures fails the tests rather than only this benchmark.
+
+python3 app/benchmarks/bench_fastq_list_rows.py
+"""
+
+# Standard imports
+import json
+from typing import Any, Callable, Dict, List
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import add_layer_to_path, add_lambda_to_path, time_callable
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+INSTRUMENT_RUN_ID = "20251124_LH00944_0001_A23CCTGLT4"
+NUM_LIBRARIES = 2000
+NUM_LANES_LIST = [1, 8, 64]
+REPEATS = 3
+
+
+def get_payload(**kwargs) -> Dict[str, Any]:
+    return kwargs
+
+
+def generate_bclconvert_data_dfs(num_lanes: int, num_libraries: int = NUM_LIBRARIES) -> List[pd.DataFrame]:
+    # As built by the handler, one dataframe per library
+    return list(map(
+        lambda library_iter_: pd.DataFrame([
+            {
+                "libraryId": f"L25{library_iter_:05d}",
+                "index": "ACGTACGTAC+TGCATGCATG",
+                "lane": lane_iter_,
+                "cycleCount": 302,
+            }
+            for lane_iter_ in range(1, num_lanes + 1)
+        ]),
+        range(num_libraries)
+    ))
+
+
+# Previous implementation, kept here as the baseline
+def legacy_generate_fastq_list_from_inputs(
+        create_fastq_set_object_module: Any,
+        instrument_run_id: str,
+        bclconvert_data_df: pd.DataFrame,
+        create_fastq_object: Callable
+) -> List[Dict]:
+    return list(map(
+        lambda index_row_iter_: create_fastq_object(
+            index=index_row_iter_[1]["index"],
+            lane=index_row_iter_[1]["lane"],
+            instrumentRunId=instrument_run_id,
+            library={
+                "libraryId": index_row_iter_[1]["libraryId"]
+            },
+            platform=create_fastq_set_object_module.DEFAULT_PLATFORM,
+            center=create_fastq_set_object_module.DEFAULT_CENTER,
+            date=create_fastq_set_object_module.get_date_from_instrument_run_id(instrument_run_id),
+            isValid=True,
+        ),
+        bclconvert_data_df.iterrows()
+    ))
+
+
+def legacy_create_fastq_set_from_df(
+        create_fastq_set_object_module: Any,
+        bclconvert_data_df: pd.DataFrame,
+        instrument_run_id: str,
+        create_fastq_set_object: Callable
+) -> Dict:
+    return create_fastq_set_object(
+        library={
+            "libraryId": pd.Series(bclconvert_data_df["libraryId"].unique()).item(),
+        },
+        allowAdditionalFastq=False,
+        isCurrentFastqSet=True,
+        fastqSet=list(map(
+            lambda index_row_iter_: dict({
+                "index": index_row_iter_[1]["index"],
+                "lane": index_row_iter_[1]["lane"],
+                "instrumentRunId": instrument_run_id,
+                "library": {
+                    "libraryId": index_row_iter_[1]["libraryId"]
+                },
+                "platform": create_fastq_set_object_module.DEFAULT_PLATFORM,
+                "center": create_fastq_set_object_module.DEFAULT_CENTER,
+                "date": create_fastq_set_object_module.get_date_from_instrument_run_id(instrument_run_id),
+                "isValid": True,
+            }),
+            bclconvert_data_df.iterrows()
+        ))
+    )
+
+
+def run_legacy(create_fastq_set_object_module: Any, bclconvert_data_dfs: List[pd.DataFrame]) -> List[Any]:
+    return list(map(
+        lambda bclconvert_data_df_iter_: [
+            legacy_create_fastq_set_from_df(
+                create_fastq_set_object_module, bclconvert_data_df_iter_, INSTRUMENT_RUN_ID, get_payload
+            ),
+            legacy_generate_fastq_list_from_inputs(
+                create_fastq_set_object_module, INSTRUMENT_RUN_ID, bclconvert_data_df_iter_, get_payload
+            ),
+        ],
+        bclconvert_data_dfs
+    ))
+
+
+def run_columnar(create_fastq_set_object_module: Any, bclconvert_data_dfs: List[pd.DataFrame]) -> List[Any]:
+    from fastq_glue_tools.checkpoint_journal import get_checkpoint_journal
+
+    return list(map(
+        lambda bclconvert_data_df_iter_: [
+            create_fastq_set_object_module.create_fastq_set_from_df(
+                bclconvert_data_df=bclconvert_data_df_iter_,
+                instrument_run_id=INSTRUMENT_RUN_ID
+            ),
+            create_fastq_set_object_module.generate_fastq_list_from_inputs(
+                instrument_run_id=INSTRUMENT_RUN_ID,
+                bclconvert_data_df=bclconvert_data_df_iter_,
+                # No execution id, so every fastq object is created
+                journal=get_checkpoint_journal(None, bclconvert_data_df_iter_["libraryId"].iloc[0])
+            ),
+        ],
+        bclconvert_data_dfs
+    ))
+
+
+def main():
+    add_layer_to_path()
+    add_lambda_to_path("create_fastq_set_object_py")
+    install_fake_orcabus_api_tools(FakeFastqManager())
+
+    import create_fastq_set_object
+
+    # Return the request payloads rather than calling the (fake) fastq manager
+    create_fastq_set_object.create_fastq_object = get_payload
+    create_fastq_set_object.create_fastq_set_object = get_payload
+
+    results = {}
+    for num_lanes_iter_ in NUM_LANES_LIST:
+        bclconvert_data_dfs = generate_bclconvert_data_dfs(num_lanes_iter_)
+
+        # Check the payloads first
+        assert (
+            json.dumps(run_legacy(create_fastq_set_object, bclconvert_data_dfs)) ==
+            json.dumps(run_columnar(create_fastq_set_object, bclconvert_data_dfs))
+        ), f"Payloads differ for {num_lanes_iter_} lanes"
+
+        legacy_timings = time_callable(
+            lambda: run_legacy(create_fastq_set_object, bclconvert_data_dfs), repeats=REPEATS
+        )
+        columnar_timings = time_callable(
+            lambda: run_columnar(create_fastq_set_object, bclconvert_data_dfs), repeats=REPEATS
+        )
+
+        results[f"{num_lanes_iter_}Lanes"] = {
+            "numRows": NUM_LIBRARIES * num_lanes_iter_,
+            "iterrows": legacy_timings,
+            "columnar": columnar_timings,
+            "speedup": legacy_timings['bestSeconds'] / columnar_timings['bestSeconds'],
+        }
+
+    print(json.dumps(
+        {
+            "numLibraries": NUM_LIBRARIES,
+            "payloadsIdentical": True,
+            "results": results,
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the find missing fingerprints handler as the number of fastq sets on a run grows.
+
+The fastq manager is the in-process fake, with a fixed latency per request,
+and listings are charged one request per page of --page-size results (as the api tools page through them).
+Each fastq set has a single fastq on the run, every third fastq set already has a fingerprint.
+
+For 100 to 3,000 fastq sets, we time
+
+* bulk - the fastq sets are listed (paginated), with their somalier field
+* concurrent - the listing omits the somalier field, so each fastq set is fetched on the bounded thread pool
+* serial - each fastq set fetched in turn (as the handler did before)
+
+and check all three find the same fastq sets missing fingerprints.
+
+python3 app/benchmarks/bench_find_missing_fingerprints.py
+"""
+
+# Standard imports
+import json
+import math
+import argparse
+from typing import Any, Dict, List
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path, time_callable
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+NUM_FASTQ_SETS_LIST = [100, 300, 1000, 3000]
+DEFAULT_LATENCY_MS = 5.0
+DEFAULT_PAGE_SIZE = 1000
+INSTRUMENT_RUN_ID = "250320_A01052_0256_BHFCFCDSXF"
+
+
+class PagedFakeFastqManager(FakeFastqManager):
+    """
+    Charge listings one request per page of results
+    """
+
+    def __init__(self, latency_seconds: float, page_size: int):
+        super().__init__(latency_seconds=latency_seconds)
+        self.page_size = page_size
+
+    def record_extra_pages(self, endpoint_name: str, num_results: int):
+        for _ in range(max(math.ceil(num_results / self.page_size), 1) - 1):
+            self.record(endpoint_name)
+
+    def get_fastqs_in_instrument_run_id(self, instrument_run_id: str) -> List[Dict[str, Any]]:
+        fastq_list = super().get_fastqs_in_instrument_run_id(instrument_run_id)
+        self.record_extra_pages("get_fastqs_in_instrument_run_id", len(fastq_list))
+        return fastq_list
+
+    def get_fastq_sets(self, **kwargs) -> List[Dict[str, Any]]:
+        fastq_set_list = super().get_fastq_sets(**kwargs)
+        self.record_extra_pages("get_fastq_sets", len(fastq_set_list))
+        return fastq_set_list
+
+
+def seed_fastq_sets(fake_fastq_manager: FakeFastqManager, num_fastq_sets: int):
+    fake_fastq_manager.reset()
+    for fastq_set_index_iter_ in range(num_fastq_sets):
+        library_id = f"L25{fastq_set_index_iter_:05d}"
+        fastq_set = fake_fastq_manager.create_fastq_set_object(
+            library={"libraryId": library_id},
+            allowAdditionalFastq=False,
+            isCurrentFastqSet=True,
+            fastqSet=[{
+                "index": "AAAAAAAA+CCCCCCCC",
+                "lane": 1,
+                "instrumentRunId": INSTRUMENT_RUN_ID,
+                "library": {"libraryId": library_id},
+            }]
+        )
+        if fastq_set_index_iter_ % 3 == 0:
+            fake_fastq_manager.fastq_sets[fastq_set['id']]['somalier'] = {"status": "SUCCEEDED"}
+    fake_fastq_manager.request_counter.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fake_fastq_manager = PagedFakeFastqManager(latency_seconds=0.0, page_size=args.page_size)
+    install_fake_orcabus_api_tools(fake_fastq_manager)
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("find_missing_fingerprints_py")
+
+    import find_missing_fingerprints
+    from fastq_glue_tools.metrics import instrument_api_call
+
+    bulk_get_fastq_sets = find_missing_fingerprints.get_fastq_sets
+    # A listing without the somalier field
+    unprojected_get_fastq_sets = instrument_api_call(
+        lambda **kwargs: list(map(
+            lambda fastq_set_iter_: dict(filter(
+                lambda item_iter_: item_iter_[0] != 'somalier',
+                fastq_set_iter_.items()
+            )),
+            fake_fastq_manager.get_fastq_sets(**kwargs)
+        )),
+        endpoint_name="get_fastq_sets"
+    )
+
+    def find_missing_fingerprints_with_handler() -> List[str]:
+        batch_list = find_missing_fingerprints.handler({"instrumentRunId": INSTRUMENT_RUN_ID}, None)['batchList']
+        return [
+            fastq_set_id_iter_
+            for batch_iter_ in batch_list
+            for fastq_set_id_iter_ in batch_iter_['items']
+        ]
+
+    def find_missing_fingerprints_serially() -> List[str]:
+        fastq_set_id_list = list(set(filter(
+            lambda fastq_set_id_iter_: fastq_set_id_iter_ is not None,
+            map(
+                lambda fastq_iter_: fastq_iter_.get('fastqSetId'),
+                fake_fastq_manager.get_fastqs_in_instrument_run_id(INSTRUMENT_RUN_ID)
+            )
+        )))
+        return list(filter(
+            lambda fastq_set_id_iter_: fake_fastq_manager.get_fastq_set(fastq_set_id_iter_).get('somalier') is None,
+            fastq_set_id_list
+        ))
+
+    modes = {
+        "bulk": find_missing_fingerprints_with_handler,
+        "concurrent": find_missing_fingerprints_with_handler,
+        "serial": find_missing_fingerprints_serially,
+    }
+
+    results = {}
+    for num_fastq_sets_iter_ in NUM_FASTQ_SETS_LIST:
+        seed_fastq_sets(fake_fastq_manager, num_fastq_sets_iter_)
+        fake_fastq_manager.latency_seconds = args.latency_ms / 1000
+        mode_results = {}
+        missing_fastq_set_ids_by_mode = {}
+        for mode_name_iter_, mode_func_iter_ in modes.items():
+            find_missing_fingerprints.get_fastq_sets = (
+                unprojected_get_fastq_sets if mode_name_iter_ == "concurrent" else bulk_get_fastq_sets
+            )
+            fake_fastq_manager.request_counter.clear()
+            missing_fastq_set_ids_by_mode[mode_name_iter_] = sorted(mode_func_iter_())
+            num_requests = sum(fake_fastq_manager.request_counter.values())
+            # Only time the serial path once, it takes a request per fastq set
+            mode_results[mode_name_iter_] = {
+                **time_callable(mode_func_iter_, repeats=1 if mode_name_iter_ == "serial" else args.repeats),
+                "requests": num_requests,
+            }
+        find_missing_fingerprints.get_fastq_sets = bulk_get_fastq_sets
+        fake_fastq_manager.latency_seconds = 0.0
+
+        assert all(map(
+            lambda missing_fastq_set_ids_iter_: missing_fastq_set_ids_iter_ == missing_fastq_set_ids_by_mode['serial'],
+            missing_fastq_set_ids_by_mode.values()
+        )), "Expected every mode to find the same fastq sets missing fingerprints"
+        assert len(missing_fastq_set_ids_by_mode['serial']) == num_fastq_sets_iter_ - math.ceil(num_fastq_sets_iter_ / 3)
+
+        results[str(num_fastq_sets_iter_)] = mode_results
+
+    print(json.dumps(
+        {
+            "latencyMs": args.latency_ms,
+            "pageSize": args.page_size,
+            "numFastqSets": results,
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
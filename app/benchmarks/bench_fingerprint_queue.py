@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+"""
+Simulate a cohort of bams submitted for fingerprint extraction, with and without the fingerprint queue.
+
+--num-bams bams (1 - 100 GiB) finish their workflow runs over the first --burst-minutes.
+Each bam is triggered once per workflow run it is an output of (one to three times),
+and the daily sweep submits (without a bam) every fastq set whose fingerprint has not landed --sweep-hours in.
+
+The extractor runs --extractor-capacity extractions at once, first come first served,
+an extraction takes 10 minutes plus 20 seconds per GiB of bam.
+
+* direct - every trigger submits straight away (as run_extract_fingerprint did before)
+* queued - triggers enqueue and dispatch through fastq_glue_tools.fingerprint_queue (on a simulated clock),
+  and queued submissions are dispatched again every 10 minutes, as the step functions poll
+
+For each mode we report the extractions run, the most extractions waiting inside the extractor,
+and the time from a fastq set's first trigger to its first fingerprint (overall and for bams of 10 GiB or less).
+
+The run_extract_fingerprint handler is also invoked against the fake fastq manager,
+to check duplicate submissions are dropped and the in flight cap holds, and to time an invocation with the queue.
+
+python3 app/benchmarks/bench_fingerprint_queue.py
+"""
+
+# Standard imports
+import json
+import heapq
+import random
+import argparse
+from os import environ
+from statistics import mean, median
+from typing import Any, Dict, List, Tuple
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path, time_callable
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+DEFAULT_NUM_BAMS = 300
+DEFAULT_BURST_MINUTES = 60
+DEFAULT_SWEEP_HOURS = 6
+DEFAULT_EXTRACTOR_CAPACITY = 20
+POLL_INTERVAL_SECONDS = 10 * 60
+SMALL_BAM_BYTES = 10 * 2 ** 30
+REFERENCE_NAME = "hg38"
+SEED = 23
+
+
+def get_extraction_seconds(bam_size_bytes: int) -> float:
+    return 10 * 60 + 20 * bam_size_bytes / 2 ** 30
+
+
+class Extractor:
+    """
+    Runs capacity extractions at once, first come first served, on the simulated clock.
+    The sweep does not know the bam (the extractor does), so durations are looked up by fastq set
+    """
+
+    def __init__(self, capacity: int, bam_sizes_by_fastq_set_id: Dict[str, int]):
+        self.capacity = capacity
+        self.bam_sizes_by_fastq_set_id = bam_sizes_by_fastq_set_id
+        self.waiting: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.running: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.finished: List[Tuple[float, Dict[str, Any]]] = []
+        self.num_submissions = 0
+        self.max_waiting = 0
+
+    def submit(self, now: float, job: Dict[str, Any]):
+        self.num_submissions += 1
+        self.waiting.append((now, self.num_submissions, job))
+        self.start_jobs(now)
+
+    def start_jobs(self, now: float):
+        while len(self.running) < self.capacity and len(self.waiting) > 0:
+            _, job_number, job = self.waiting.pop(0)
+            heapq.heappush(self.running, (
+                now + get_extraction_seconds(self.bam_sizes_by_fastq_set_id[job['fastqSetId']]),
+                job_number,
+                job
+            ))
+        self.max_waiting = max(self.max_waiting, len(self.waiting))
+
+    def advance(self, until: float):
+        while len(self.running) > 0 and self.running[0][0] <= until:
+            finished_at, _, job = heapq.heappop(self.running)
+            self.finished.append((finished_at, job))
+            self.start_jobs(finished_at)
+
+
+def get_trigger_events(
+        rng: random.Random,
+        num_bams: int,
+        burst_seconds: float
+) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    The trigger submissions of each bam, once per workflow run it is an output of
+    :param rng:
+    :param num_bams:
+    :param burst_seconds:
+    :return:
+    """
+    trigger_events = []
+    for bam_index_iter_ in range(num_bams):
+        submission = {
+            "fastqSetId": f"fqs.{bam_index_iter_:05d}",
+            "referenceName": REFERENCE_NAME,
+            "bamUri": f"s3://bench-analysis-bucket/analysis/{bam_index_iter_:05d}/L{bam_index_iter_:07d}.bam",
+            "bamSizeBytes": rng.randint(1, 100) * 2 ** 30,
+        }
+        first_trigger_at = rng.uniform(0, burst_seconds)
+        for trigger_index_iter_ in range(1 + bam_index_iter_ % 3):
+            trigger_events.append((first_trigger_at + trigger_index_iter_ * rng.uniform(60, 600), submission))
+    return sorted(trigger_events, key=lambda trigger_event_iter_: trigger_event_iter_[0])
+
+
+def simulate(
+        trigger_events: List[Tuple[float, Dict[str, Any]]],
+        extractor_capacity: int,
+        sweep_seconds: float,
+        use_queue: bool
+) -> Dict[str, Any]:
+    """
+    Replay the triggers (and the sweep) through the extractor, directly or through the fingerprint queue
+    :param trigger_events:
+    :param extractor_capacity:
+    :param sweep_seconds:
+    :param use_queue:
+    :return:
+    """
+    from fastq_glue_tools.fingerprint_queue import (
+        SqliteFingerprintQueueStore,
+        dispatch_submissions,
+        enqueue_submissions
+    )
+
+    bam_sizes_by_fastq_set_id = dict(map(
+        lambda trigger_event_iter_: (trigger_event_iter_[1]['fastqSetId'], trigger_event_iter_[1]['bamSizeBytes']),
+        trigger_events
+    ))
+    extractor = Extractor(extractor_capacity, bam_sizes_by_fastq_set_id)
+    queue_store = SqliteFingerprintQueueStore(":memory:") if use_queue else None
+
+    def submit(now: float, submission_list: List[Dict[str, Any]]):
+        if queue_store is None:
+            for submission_iter_ in submission_list:
+                extractor.submit(now, submission_iter_)
+            return
+        enqueue_submissions(submission_list, queue_store, now=now)
+        dispatch_submissions(lambda submission_: extractor.submit(now, submission_), queue_store, now=now)
+
+    def get_missing_fingerprint_submissions(now: float) -> List[Dict[str, Any]]:
+        fingerprinted_fastq_set_ids = set(map(
+            lambda finished_iter_: finished_iter_[1]['fastqSetId'],
+            filter(lambda finished_iter_: finished_iter_[0] <= now, extractor.finished)
+        ))
+        return list(map(
+            lambda fastq_set_id_iter_: {
+                "fastqSetId": fastq_set_id_iter_,
+                "referenceName": REFERENCE_NAME,
+                # The extractor finds the bam itself
+                "bamUri": None,
+                "bamSizeBytes": None,
+            },
+            sorted(set(bam_sizes_by_fastq_set_id.keys()) - fingerprinted_fastq_set_ids)
+        ))
+
+    first_trigger_at_by_fastq_set_id: Dict[str, float] = {}
+    for trigger_at_iter_, submission_iter_ in trigger_events:
+        first_trigger_at_by_fastq_set_id.setdefault(submission_iter_['fastqSetId'], trigger_at_iter_)
+
+    # Events are (time, event number, kind, submission), polls only matter while something is queued
+    events = list(map(
+        lambda trigger_event_iter_: (trigger_event_iter_[1][0], trigger_event_iter_[0], "trigger", trigger_event_iter_[1][1]),
+        enumerate(trigger_events)
+    )) + [(sweep_seconds, len(trigger_events), "sweep", None)]
+    num_events = len(events)
+    if use_queue:
+        events.append((POLL_INTERVAL_SECONDS, num_events, "poll", None))
+        num_events += 1
+    heapq.heapify(events)
+
+    while len(events) > 0:
+        event_at, _, event_kind, submission = heapq.heappop(events)
+        extractor.advance(event_at)
+        if event_kind == "trigger":
+            submit(event_at, [submission])
+        elif event_kind == "sweep":
+            submit(event_at, get_missing_fingerprint_submissions(event_at))
+        else:
+            submit(event_at, [])
+            is_queued = any(map(
+                lambda queue_entry_iter_: queue_entry_iter_['status'] == "queued",
+                queue_store.get_entries(event_at)
+            ))
+            if is_queued or any(map(lambda event_iter_: event_iter_[2] != "poll", events)):
+                heapq.heappush(events, (event_at + POLL_INTERVAL_SECONDS, num_events, "poll", None))
+                num_events += 1
+    extractor.advance(float("inf"))
+
+    first_fingerprint_at_by_fastq_set_id: Dict[str, float] = {}
+    for finished_at_iter_, job_iter_ in sorted(extractor.finished, key=lambda finished_iter_: finished_iter_[0]):
+        first_fingerprint_at_by_fastq_set_id.setdefault(job_iter_['fastqSetId'], finished_at_iter_)
+
+    def get_latency_minutes(fastq_set_id_list: List[str]) -> Dict[str, float]:
+        latency_minutes_list = list(map(
+            lambda fastq_set_id_iter_: (
+                first_fingerprint_at_by_fastq_set_id[fastq_set_id_iter_] - first_trigger_at_by_fastq_set_id[fastq_set_id_iter_]
+            ) / 60,
+            fastq_set_id_list
+        ))
+        return {
+            "meanMinutes": round(mean(latency_minutes_list), 1),
+            "medianMinutes": round(median(latency_minutes_list), 1),
+            "maxMinutes": round(max(latency_minutes_list), 1),
+        }
+
+    assert set(first_fingerprint_at_by_fastq_set_id.keys()) == set(first_trigger_at_by_fastq_set_id.keys()), \
+        "Expected every fastq set to be fingerprinted"
+
+    return {
+        "extractions": extractor.num_submissions,
+        "maxWaitingInExtractor": extractor.max_waiting,
+        "makespanHours": round(max(first_fingerprint_at_by_fastq_set_id.values()) / 3600, 2),
+        "timeToFingerprint": get_latency_minutes(list(first_trigger_at_by_fastq_set_id.keys())),
+        "timeToFingerprintSmallBams": get_latency_minutes(list(filter(
+            lambda fastq_set_id_iter_: bam_sizes_by_fastq_set_id[fastq_set_id_iter_] <= SMALL_BAM_BYTES,
+            first_trigger_at_by_fastq_set_id.keys()
+        ))),
+    }
+
+
+def check_handler(fake_fastq_manager: FakeFastqManager, repeats: int) -> Dict[str, Any]:
+    """
+    Invoke run_extract_fingerprint with and without the queue
+    :param fake_fastq_manager:
+    :param repeats:
+    :return:
+    """
+    import run_extract_fingerprint
+    from fastq_glue_tools.fingerprint_queue import (
+        LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR,
+        MAX_IN_FLIGHT_ENV_VAR,
+        SQLITE_FINGERPRINT_QUEUE_STORES
+    )
+
+    submission = {"fastqSetId": "fqs.00000", "referenceName": REFERENCE_NAME, "bamUri": "s3://bucket/L0000000.bam"}
+    for fastq_set_index_iter_ in range(31):
+        fake_fastq_manager.fastq_sets[f"fqs.{fastq_set_index_iter_:05d}"] = {"id": f"fqs.{fastq_set_index_iter_:05d}"}
+
+    # Without the queue, every invocation submits
+    environ.pop(LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR, None)
+    fake_fastq_manager.request_counter.clear()
+    direct_timing = time_callable(lambda: run_extract_fingerprint.handler(submission, None), repeats=repeats)
+    assert fake_fastq_manager.request_counter['run_extract_fingerprint'] == repeats
+
+    # With the queue, only the first invocation submits
+    environ[LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR] = ":memory:"
+    environ[MAX_IN_FLIGHT_ENV_VAR] = "20"
+    SQLITE_FINGERPRINT_QUEUE_STORES.clear()
+    fake_fastq_manager.request_counter.clear()
+    queued_timing = time_callable(lambda: run_extract_fingerprint.handler(submission, None), repeats=repeats)
+    assert fake_fastq_manager.request_counter['run_extract_fingerprint'] == 1, \
+        "Expected duplicate submissions to be dropped"
+
+    # A burst of fastq sets is capped at the in flight limit (one is already in flight)
+    burst_output = run_extract_fingerprint.handler(
+        {
+            "fastqSetIdList": list(map(lambda index_iter_: f"fqs.{index_iter_:05d}", range(1, 31))),
+            "referenceName": REFERENCE_NAME,
+        },
+        None
+    )
+    assert fake_fastq_manager.request_counter['run_extract_fingerprint'] == 20
+    assert burst_output['queuedCount'] == 11 and burst_output['submittedCount'] == 19
+
+    # Polling with the keys does not submit more until the in flight window has passed
+    poll_output = run_extract_fingerprint.handler({"submissionKeyList": burst_output['submissionKeyList']}, None)
+    assert poll_output['queuedCount'] == 11
+
+    environ.pop(LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR, None)
+    environ.pop(MAX_IN_FLIGHT_ENV_VAR, None)
+
+    return {
+        "directInvocation": direct_timing,
+        "queuedInvocation": queued_timing,
+        "burst": burst_output | {"submissionKeyList": len(burst_output['submissionKeyList'])},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--num-bams", type=int, default=DEFAULT_NUM_BAMS)
+    parser.add_argument("--burst-minutes", type=float, default=DEFAULT_BURST_MINUTES)
+    parser.add_argument("--sweep-hours", type=float, default=DEFAULT_SWEEP_HOURS)
+    parser.add_argument("--extractor-capacity", type=int, default=DEFAULT_EXTRACTOR_CAPACITY)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    fake_fastq_manager = FakeFastqManager()
+    install_fake_orcabus_api_tools(fake_fastq_manager)
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("run_extract_fingerprint_py")
+
+    trigger_events = get_trigger_events(random.Random(SEED), args.num_bams, args.burst_minutes * 60)
+
+    print(json.dumps(
+        {
+            "numBams": args.num_bams,
+            "numTriggers": len(trigger_events),
+            "extractorCapacity": args.extractor_capacity,
+            "modes": {
+                "direct": simulate(trigger_events, args.extractor_capacity, args.sweep_hours * 3600, use_queue=False),
+                "queued": simulate(trigger_events, args.extractor_capacity, args.sweep_hours * 3600, use_queue=True),
+            },
+            "handler": check_handler(fake_fastq_manager, args.repeats),
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+Measure the import (cold start) time of each lambda module and fail on a regression.
+
+Each lambda module is imported in a fresh interpreter, with the layer and the lambda directory on the python path
+and orcabus_api_tools resolved to empty stub modules (we only import the lambda modules, we never call them).
+The best of --repeats wall times is compared against the stored baseline (import_time_baseline.json),
+a lambda has regressed if its import time is more than --tolerance-ratio times its baseline
+(plus --tolerance-ms, so that lambdas that import in a few milliseconds are not flagged on noise).
+
+The heaviest top-level imports (from python -X importtime) are reported for each lambda.
+
+Baselines are machine dependent, re-record them after changing machines with
+
+python3 app/benchmarks/bench_import_time.py --update-baseline
+
+Otherwise
+
+python3 app/benchmarks/bench_import_time.py
+"""
+
+# Standard imports
+import re
+import sys
+import json
+import argparse
+import subprocess
+from os import environ, pathsep
+from pathlib import Path
+from typing import Dict, List, Optional, TypedDict
+
+# Local imports
+from bench_utils import LAMBDAS_DIR, FASTQ_GLUE_TOOLS_LAYER_DIR
+
+# Globals
+BENCHMARKS_DIR = Path(__file__).absolute().parent
+BASELINE_PATH = BENCHMARKS_DIR / "import_time_baseline.json"
+DEFAULT_REPEATS = 5
+DEFAULT_TOLERANCE_RATIO = 1.5
+DEFAULT_TOLERANCE_MS = 25.0
+NUM_HEAVY_IMPORTS = 5
+
+IMPORT_TIME_LINE_REGEX = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# Runs in the child interpreter, the lambda module name is the first argument
+# We use __import__ rather than importlib.import_module, the latter is not traced by -X importtime
+BOOTSTRAP_CODE = """
+import sys, time
+from fake_orcabus_api_tools import install_orcabus_api_tools_import_stubs
+install_orcabus_api_tools_import_stubs()
+start_time = time.perf_counter()
+__import__(sys.argv[1])
+print(time.perf_counter() - start_time)
+"""
+
+
+class HeavyImport(TypedDict):
+    module: str
+    cumulativeMs: float
+
+
+class ImportTimeResult(TypedDict):
+    lambdaName: str
+    bestMs: float
+    baselineMs: Optional[float]
+    regressed: bool
+    heavyImports: List[HeavyImport]
+
+
+def get_lambda_module_names() -> List[str]:
+    return sorted(map(
+        lambda lambda_dir_iter_: lambda_dir_iter_.name.removesuffix("_py"),
+        filter(
+            lambda lambda_dir_iter_: (lambda_dir_iter_ / f"{lambda_dir_iter_.name.removesuffix('_py')}.py").is_file(),
+            LAMBDAS_DIR.iterdir()
+        )
+    ))
+
+
+def run_import(lambda_name: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [
+            sys.executable,
+            *(["-X", "importtime"] if importtime else []),
+            "-c", BOOTSTRAP_CODE,
+            lambda_name
+        ],
+        env={
+            **environ,
+            "PYTHONPATH": pathsep.join([
+                str(BENCHMARKS_DIR),
+                str(FASTQ_GLUE_TOOLS_LAYER_DIR),
+                str(LAMBDAS_DIR / f"{lambda_name}_py"),
+            ]),
+            "PYTHONDONTWRITEBYTECODE": "1",
+        },
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def get_heavy_imports(lambda_name: str, importtime_stderr: str) -> List[HeavyImport]:
+    """
+    Get the slowest imports made directly by the lambda module.
+    python -X importtime lists each module after its own imports,
+    so the lambda module's imports are the lines one level deeper that come just before it.
+    :param lambda_name:
+    :param importtime_stderr:
+    :return:
+    """
+    pending_imports: List[HeavyImport] = []
+    for line_iter_ in importtime_stderr.splitlines():
+        match = IMPORT_TIME_LINE_REGEX.match(line_iter_)
+        if match is None:
+            continue
+        indent = len(match.group(3))
+        if indent == 1:
+            # A top-level import, i.e either the lambda module or one of the bootstrap imports
+            if match.group(4) == lambda_name:
+                return sorted(
+                    pending_imports,
+                    key=lambda heavy_import_iter_: heavy_import_iter_['cumulativeMs'],
+                    reverse=True
+                )[:NUM_HEAVY_IMPORTS]
+            pending_imports = []
+        elif indent == 3:
+            pending_imports.append({
+                "module": match.group(4),
+                "cumulativeMs": round(int(match.group(2)) / 1000, 2),
+            })
+
+    return []
+
+
+def time_lambda_import(lambda_name: str, repeats: int) -> Dict:
+    # Warm the filesystem and bytecode caches, as the lambda runtime would have
+    run_import(lambda_name)
+
+    best_ms = min(map(
+        lambda _: float(run_import(lambda_name).stdout.strip().splitlines()[-1]) * 1000,
+        range(repeats)
+    ))
+
+    return {
+        "bestMs": round(best_ms, 2),
+        "heavyImports": get_heavy_imports(lambda_name, run_import(lambda_name, importtime=True).stderr),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--tolerance-ratio", type=float, default=DEFAULT_TOLERANCE_RATIO)
+    parser.add_argument("--tolerance-ms", type=float, default=DEFAULT_TOLERANCE_MS)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    baseline: Dict[str, float] = (
+        json.loads(BASELINE_PATH.read_text())
+        if BASELINE_PATH.is_file()
+        else {}
+    )
+
+    results: List[ImportTimeResult] = []
+    for lambda_name_iter_ in get_lambda_module_names():
+        import_time = time_lambda_import(lambda_name_iter_, args.repeats)
+        baseline_ms = baseline.get(lambda_name_iter_, None)
+        results.append({
+            "lambdaName": lambda_name_iter_,
+            "bestMs": import_time['bestMs'],
+            "baselineMs": baseline_ms,
+            "regressed": (
+                baseline_ms is not None and
+                import_time['bestMs'] > baseline_ms * args.tolerance_ratio + args.tolerance_ms
+            ),
+            "heavyImports": import_time['heavyImports'],
+        })
+
+    print(json.dumps(results, indent=2))
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(
+            dict(map(
+                lambda result_iter_: (result_iter_['lambdaName'], result_iter_['bestMs']),
+                results
+            )),
+            indent=2
+        ) + "\n")
+        return
+
+    regressed_lambda_names = list(map(
+        lambda result_iter_: result_iter_['lambdaName'],
+        filter(lambda result_iter_: result_iter_['regressed'], results)
+    ))
+    if len(regressed_lambda_names) > 0:
+        print(f"Import time regressed for: {', '.join(regressed_lambda_names)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+Stress the library locks (fastq_glue_tools.library_lock) with overlapping create fastq set object invocations.
+
+Each library (new, topup / append and rerun / replace) is sent OVERLAPPING_INVOCATIONS identical invocations at once,
+as a duplicate event or a retry overlapping a slow first attempt would,
+against the in-process fake fastq manager with a fixed latency per request.
+
+For each lease store (none, in-memory sqlite and a sqlite file) we check that every library ends up with
+
+* exactly one fastq set with fastqs on the run, and one current fastq set
+* one fastq per lane from the run
+
+Without a lease store the race is expected to show up (and is reported, not raised),
+with either lease store any duplicate is an error.
+
+The lease semantics (expiry, release by owner only) are checked against both sqlite stores first.
+
+python3 app/benchmarks/bench_library_locks.py
+"""
+
+# Standard imports
+import json
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from pathlib import Path
+from time import perf_counter, sleep
+from typing import Any, Dict, List, Optional
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path
+from bench_create_fastq_set_object_api_calls import (
+    INSTRUMENT_RUN_ID,
+    NUM_LANES,
+    PREVIOUS_INSTRUMENT_RUN_ID,
+    add_existing_fastq_set,
+    get_bclconvert_data
+)
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+NUM_LIBRARIES_PER_ACTION = 10
+OVERLAPPING_INVOCATIONS = 4
+REQUEST_LATENCY_SECONDS = 0.01
+FASTQ_SET_CREATION_ACTIONS = ["new", "append", "replace"]
+
+
+def check_lease_semantics(library_lock: Any, lock_store: Any):
+    lock_key = library_lock.get_library_lock_key("L2599999")
+    assert lock_store.try_acquire(lock_key, "owner-a", 0.2), "Expected to take a free lease"
+    assert not lock_store.try_acquire(lock_key, "owner-b", 0.2), "Expected a held lease to be refused"
+    assert not lock_store.release(lock_key, "owner-b"), "Expected only the owner to release the lease"
+    sleep(0.25)
+    assert lock_store.try_acquire(lock_key, "owner-b", 0.2), "Expected an expired lease to be taken over"
+    assert not lock_store.release(lock_key, "owner-a"), "Expected the previous owner not to release the new lease"
+    assert lock_store.release(lock_key, "owner-b")
+
+    # Waiting for a held lease gives up after wait_seconds
+    assert lock_store.try_acquire(lock_key, "owner-c", 5)
+    try:
+        with library_lock.library_lock("L2599999", lock_store=lock_store, wait_seconds=0.2):
+            raise AssertionError("Expected the lock not to be acquired")
+    except library_lock.LockNotAcquiredError:
+        pass
+    lock_store.release(lock_key, "owner-c")
+
+
+def get_library_id_list() -> Dict[str, List[str]]:
+    return dict(map(
+        lambda action_index_iter_: (
+            action_index_iter_[1],
+            list(map(
+                lambda i: f"L25{action_index_iter_[0]}{i:04d}",
+                range(NUM_LIBRARIES_PER_ACTION)
+            ))
+        ),
+        enumerate(FASTQ_SET_CREATION_ACTIONS)
+    ))
+
+
+def get_library_violations(fake_fastq_manager: FakeFastqManager, library_id: str) -> List[str]:
+    fastq_set_list = fake_fastq_manager.get_fastq_sets(library=library_id)
+    fastq_sets_on_run = list(filter(
+        lambda fastq_set_iter_: any(map(
+            lambda fastq_iter_: fastq_iter_['instrumentRunId'] == INSTRUMENT_RUN_ID,
+            fastq_set_iter_['fastqSet']
+        )),
+        fastq_set_list
+    ))
+    current_fastq_sets = list(filter(lambda fastq_set_iter_: fastq_set_iter_['isCurrentFastqSet'], fastq_set_list))
+    num_fastqs_on_run = sum(map(
+        lambda fastq_set_iter_: len(list(filter(
+            lambda fastq_iter_: fastq_iter_['instrumentRunId'] == INSTRUMENT_RUN_ID,
+            fastq_set_iter_['fastqSet']
+        ))),
+        fastq_set_list
+    ))
+
+    violations = []
+    if len(fastq_sets_on_run) != 1:
+        violations.append(f"{len(fastq_sets_on_run)} fastq sets on the run")
+    if len(current_fastq_sets) != 1:
+        violations.append(f"{len(current_fastq_sets)} current fastq sets")
+    if num_fastqs_on_run != NUM_LANES:
+        violations.append(f"{num_fastqs_on_run} fastqs on the run")
+    return violations
+
+
+def run_overlapping_invocations(
+        create_fastq_set_object: Any,
+        fake_fastq_manager: FakeFastqManager,
+        lock_store_path: Optional[str]
+) -> Dict[str, Any]:
+    if lock_store_path is None:
+        environ.pop("LOCAL_LOCK_STORE_PATH", None)
+    else:
+        environ["LOCAL_LOCK_STORE_PATH"] = lock_store_path
+
+    library_id_list_by_action = get_library_id_list()
+    fake_fastq_manager.reset()
+    fake_fastq_manager.latency_seconds = 0.0
+    for action_iter_ in ["append", "replace"]:
+        for library_id_iter_ in library_id_list_by_action[action_iter_]:
+            add_existing_fastq_set(fake_fastq_manager, library_id_iter_, PREVIOUS_INSTRUMENT_RUN_ID)
+    fake_fastq_manager.request_counter.clear()
+    fake_fastq_manager.latency_seconds = REQUEST_LATENCY_SECONDS
+
+    event_list = [
+        {
+            "instrumentRunId": INSTRUMENT_RUN_ID,
+            "libraryId": library_id_iter_,
+            "bclConvertData": get_bclconvert_data(library_id_iter_),
+            "fastqSetCreationAction": action_iter_,
+        }
+        for _ in range(OVERLAPPING_INVOCATIONS)
+        for action_iter_, library_id_list_iter_ in library_id_list_by_action.items()
+        for library_id_iter_ in library_id_list_iter_
+    ]
+
+    # Release every invocation at once
+    start_barrier = threading.Barrier(len(event_list))
+
+    def invoke(event: Dict[str, Any]) -> Optional[str]:
+        start_barrier.wait()
+        try:
+            create_fastq_set_object.handler(event, None)
+        except Exception as e:
+            return type(e).__name__
+        return None
+
+    start_time = perf_counter()
+    with ThreadPoolExecutor(max_workers=len(event_list)) as executor:
+        error_list = list(filter(lambda error_iter_: error_iter_ is not None, executor.map(invoke, event_list)))
+    wall_seconds = perf_counter() - start_time
+
+    fake_fastq_manager.latency_seconds = 0.0
+    violations_by_library_id = dict(filter(
+        lambda library_violations_iter_: len(library_violations_iter_[1]) > 0,
+        map(
+            lambda library_id_iter_: (
+                library_id_iter_, get_library_violations(fake_fastq_manager, library_id_iter_)
+            ),
+            sum(library_id_list_by_action.values(), [])
+        )
+    ))
+
+    return {
+        "lockStore": lock_store_path if lock_store_path is not None else "none",
+        "invocations": len(event_list),
+        "wallSeconds": wall_seconds,
+        "errors": dict(Counter(error_list)),
+        "librariesWithDuplicates": len(violations_by_library_id),
+        "exampleViolations": dict(list(violations_by_library_id.items())[:3]),
+    }
+
+
+def main():
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("create_fastq_set_object_py")
+
+    fake_fastq_manager = FakeFastqManager()
+    install_fake_orcabus_api_tools(fake_fastq_manager)
+
+    from fastq_glue_tools import library_lock
+    import create_fastq_set_object
+
+    with tempfile.TemporaryDirectory(prefix="bench_library_locks_") as tmp_dir:
+        lock_store_file_path = str(Path(tmp_dir) / "leases.sqlite")
+
+        check_lease_semantics(library_lock, library_lock.SqliteLockStore(":memory:"))
+        check_lease_semantics(library_lock, library_lock.SqliteLockStore(lock_store_file_path))
+
+        results = list(map(
+            lambda lock_store_path_iter_: run_overlapping_invocations(
+                create_fastq_set_object, fake_fastq_manager, lock_store_path_iter_
+            ),
+            [None, ":memory:", lock_store_file_path]
+        ))
+
+    for result_iter_ in results[1:]:
+        assert result_iter_['librariesWithDuplicates'] == 0, \
+            f"Duplicate fastq sets with the {result_iter_['lockStore']} lease store"
+        assert len(result_iter_['errors']) == 0, f"Errors with the {result_iter_['lockStore']} lease store"
+
+    print(json.dumps(
+        {
+            "numLibraries": NUM_LIBRARIES_PER_ACTION * len(FASTQ_SET_CREATION_ACTIONS),
+            "overlappingInvocations": OVERLAPPING_INVOCATIONS,
+            "requestLatencySeconds": REQUEST_LATENCY_SECONDS,
+            "raceReproducedWithoutLocks": results[0]['librariesWithDuplicates'] > 0,
+            "results": results,
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""
+Check the EMF documents written by the handler metrics (fastq_glue_tools.metrics) and measure their overhead.
+
+The documents are written to a capturing sink rather than stdout, and checked for
+
+* the handler document, with the FunctionName dimension, phase timings, bytes read, rows processed and api calls
+* one document per endpoint, with call counts, errors, latency samples and the latency histogram
+* every metric named in the _aws metadata being present in the document
+* Errors set (and the error still raised) when the handler raises
+* nothing written when FASTQ_GLUE_METRICS_ENABLED is false, or outside of an instrumented handler
+
+The overhead is the cost of an instrumented api call over a plain call (inside a handler),
+and the cost of building and writing the documents at the end of an invocation.
+
+python3 app/benchmarks/bench_metrics.py
+"""
+
+# Standard imports
+import json
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from typing import Any, Dict, List
+
+# Local imports
+from bench_utils import add_layer_to_path, time_callable
+
+# Globals
+FUNCTION_NAME = "fastq-glue-bench-metrics"
+NUM_API_CALLS = 1000
+NUM_THREADS = 8
+NUM_ENDPOINTS = 10
+REPEATS = 5
+
+
+def get_fastq(fastq_id: str) -> Dict[str, Any]:
+    return {"id": fastq_id}
+
+
+def add_read_set(fastq_id: str, read_set: Dict[str, Any]) -> Dict[str, Any]:
+    if fastq_id == "fqr.FAILS":
+        raise ValueError("Could not add read set")
+    return {"id": fastq_id, "readSet": read_set}
+
+
+def check_emf_document(emf_document: Dict[str, Any]):
+    cloudwatch_metrics = emf_document['_aws']['CloudWatchMetrics']
+    assert isinstance(emf_document['_aws']['Timestamp'], int), "Expected an integer millisecond timestamp"
+    assert len(cloudwatch_metrics) == 1, "Expected a single metric directive"
+    for dimension_set_iter_ in cloudwatch_metrics[0]['Dimensions']:
+        for dimension_name_iter_ in dimension_set_iter_:
+            assert isinstance(emf_document[dimension_name_iter_], str), f"Missing dimension {dimension_name_iter_}"
+    for metric_iter_ in cloudwatch_metrics[0]['Metrics']:
+        assert metric_iter_['Name'] in emf_document, f"Missing metric {metric_iter_['Name']}"
+        metric_value = emf_document[metric_iter_['Name']]
+        assert isinstance(metric_value, (int, float)) or (
+            isinstance(metric_value, list) and 0 < len(metric_value) <= 100
+        ), f"Metric {metric_iter_['Name']} is not a number or a list of up to 100 numbers"
+
+
+def check_captured_documents(metrics: Any):
+    from fastq_glue_tools.metrics import instrument_handler, instrument_api_call, timed_phase, add_bytes_read
+
+    captured_lines: List[str] = []
+    metrics.set_metrics_sink(captured_lines.append)
+
+    instrumented_get_fastq = instrument_api_call(get_fastq)
+    instrumented_add_read_set = instrument_api_call(add_read_set)
+
+    @instrument_handler
+    def handler(event, context):
+        with timed_phase("parse"):
+            metrics.add_rows_processed(len(event['fastqIdList']))
+        add_bytes_read(1234)
+        with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
+            fastq_list = list(executor.map(instrumented_get_fastq, event['fastqIdList']))
+        for fastq_iter_ in fastq_list:
+            instrumented_add_read_set(fastq_iter_['id'], {"r1": {}})
+        return {"numFastqs": len(fastq_list)}
+
+    # Outside of a handler, nothing is recorded
+    instrumented_get_fastq("fqr.OUTSIDE")
+    assert len(captured_lines) == 0, "Expected no documents outside of a handler"
+
+    fastq_id_list = list(map(lambda i: f"fqr.{i:04d}", range(250)))
+    assert handler({"fastqIdList": fastq_id_list}, None) == {"numFastqs": 250}
+
+    emf_documents = list(map(json.loads, captured_lines))
+    list(map(check_emf_document, emf_documents))
+    handler_document, add_read_set_document, get_fastq_document = emf_documents
+    assert handler_document['FunctionName'] == FUNCTION_NAME
+    assert handler_document['Errors'] == 0
+    assert handler_document['BytesRead'] == 1234
+    assert handler_document['RowsProcessed'] == 250
+    assert handler_document['ApiCalls'] == 500
+    assert all(map(
+        lambda metric_name_iter_: metric_name_iter_ in handler_document,
+        ["HandlerMilliseconds", "parseMilliseconds", "apiReadMilliseconds", "apiWriteMilliseconds"]
+    )), "Expected the handler, parse and api phase timings"
+
+    assert get_fastq_document['Endpoint'] == "get_fastq"
+    assert get_fastq_document['Calls'] == 250 and get_fastq_document['CallErrors'] == 0
+    assert len(get_fastq_document['Latency']) == 100, "Expected latencies to be sampled down to 100 values"
+    assert sum(get_fastq_document['LatencyHistogram']['Counts']) == 250
+    assert add_read_set_document['Endpoint'] == "add_read_set"
+    assert add_read_set_document['Calls'] == 250
+
+    # A failing handler still writes its metrics, and the error is raised
+    captured_lines.clear()
+    try:
+        handler({"fastqIdList": ["fqr.FAILS"]}, None)
+        raise AssertionError("Expected the handler to raise")
+    except ValueError:
+        pass
+    emf_documents = list(map(json.loads, captured_lines))
+    assert emf_documents[0]['Errors'] == 1
+    assert next(filter(
+        lambda emf_document_iter_: emf_document_iter_.get("Endpoint") == "add_read_set", emf_documents
+    ))['CallErrors'] == 1
+
+    # Disabled
+    captured_lines.clear()
+    environ[metrics.METRICS_ENABLED_ENV_VAR] = "false"
+    handler({"fastqIdList": fastq_id_list}, None)
+    del environ[metrics.METRICS_ENABLED_ENV_VAR]
+    assert len(captured_lines) == 0, "Expected no documents when metrics are disabled"
+
+
+def get_overhead(metrics: Any) -> Dict[str, Any]:
+    from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+    metrics.set_metrics_sink(lambda emf_document: None)
+
+    instrumented_endpoint_list = list(map(
+        lambda i: instrument_api_call(get_fastq, endpoint_name=f"get_endpoint_{i}"),
+        range(NUM_ENDPOINTS)
+    ))
+
+    def call_plain():
+        for i in range(NUM_API_CALLS):
+            get_fastq("fqr.0001")
+
+    def call_instrumented():
+        for i in range(NUM_API_CALLS):
+            instrumented_endpoint_list[i % NUM_ENDPOINTS]("fqr.0001")
+
+    plain_handler = lambda event, context: call_plain()
+    instrumented_handler = instrument_handler(lambda event, context: call_instrumented())
+    empty_handler = lambda event, context: None
+    instrumented_empty_handler = instrument_handler(empty_handler)
+
+    plain_timings = time_callable(lambda: plain_handler({}, None), repeats=REPEATS)
+    instrumented_timings = time_callable(lambda: instrumented_handler({}, None), repeats=REPEATS)
+    empty_timings = time_callable(lambda: [empty_handler({}, None) for _ in range(100)], repeats=REPEATS)
+    instrumented_empty_timings = time_callable(
+        lambda: [instrumented_empty_handler({}, None) for _ in range(100)], repeats=REPEATS
+    )
+
+    return {
+        "numApiCalls": NUM_API_CALLS,
+        "numEndpoints": NUM_ENDPOINTS,
+        "plain": plain_timings,
+        "instrumented": instrumented_timings,
+        # Includes building and writing one handler and NUM_ENDPOINTS endpoint documents
+        "overheadMicrosecondsPerApiCall": (
+            (instrumented_timings['bestSeconds'] - plain_timings['bestSeconds']) / NUM_API_CALLS * 1e6
+        ),
+        "overheadMicrosecondsPerEmptyInvocation": (
+            (instrumented_empty_timings['bestSeconds'] - empty_timings['bestSeconds']) / 100 * 1e6
+        ),
+    }
+
+
+def main():
+    add_layer_to_path()
+    environ["AWS_LAMBDA_FUNCTION_NAME"] = FUNCTION_NAME
+
+    from fastq_glue_tools import metrics
+
+    check_captured_documents(metrics)
+
+    print(json.dumps(
+        {
+            "documentsChecked": True,
+            "overhead": get_overhead(metrics),
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the plan fastq set creation handler as the number of libraries on a run grows.
+
+The fastq manager is the in-process fake, with a fixed latency per request (--latency-ms),
+and the tracking sheet is a stand-in (no google api requests).
+Of the libraries on the run, a third already have a fastq set on this run (exists),
+a third have a current fastq set on a previous run (half topups, half reruns in the tracking sheet)
+and a third are new.
+
+The fastq sets on the run are a single query, but the fastq manager only filters fastq sets by a single library,
+so each library not already on the run costs its own current fastq set query.
+For 10 to 400 libraries, we time the handler and the current fastq set queries alone
+
+* concurrent - FASTQ_MANAGER_MAX_WORKERS requests at a time (the default)
+* serial - one request at a time (FASTQ_MANAGER_MAX_WORKERS=1)
+
+and report the get_fastq_sets requests (one for the run, plus one per remaining library)
+and the milliseconds of current fastq set queries per remaining library.
+
+python3 app/benchmarks/bench_plan_fastq_set_creation.py
+"""
+
+# Standard imports
+import json
+import argparse
+from collections import Counter
+from os import environ
+from typing import Dict, List
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path, time_callable
+from bench_create_fastq_set_object_api_calls import (
+    INSTRUMENT_RUN_ID,
+    PREVIOUS_INSTRUMENT_RUN_ID,
+    add_existing_fastq_set
+)
+from fake_orcabus_api_tools import FakeFastqManager, install_fake_orcabus_api_tools
+
+# Globals
+NUM_LIBRARIES_LIST = [10, 100, 400]
+DEFAULT_LATENCY_MS = 10.0
+
+# Library ids marked as reruns in the stand-in tracking sheet
+RERUN_LIBRARY_ID_LIST: List[str] = []
+
+
+class RerunFakeSpread:
+    """
+    Stand-in for gspread_pandas.Spread, lists the reruns of the benchmark run
+    """
+
+    def __init__(self, spread: str, sheet: str):
+        self.sheet = sheet
+
+    def sheet_to_df(self, index: int = 0) -> pd.DataFrame:
+        return pd.DataFrame({
+            "LibraryID": list(map(lambda library_id_iter_: f"{library_id_iter_}_rerun", RERUN_LIBRARY_ID_LIST))
+        })
+
+
+def seed_libraries(fake_fastq_manager: FakeFastqManager, num_libraries: int) -> Dict[str, str]:
+    """
+    Seed the fastq manager and tracking sheet, return the expected action of each library
+    """
+    fake_fastq_manager.reset()
+    RERUN_LIBRARY_ID_LIST.clear()
+
+    expected_action_by_library_id = {}
+    for library_index_iter_ in range(num_libraries):
+        library_id = f"L25{library_index_iter_:05d}"
+        if library_index_iter_ % 3 == 0:
+            add_existing_fastq_set(fake_fastq_manager, library_id, INSTRUMENT_RUN_ID)
+            expected_action_by_library_id[library_id] = "exists"
+        elif library_index_iter_ % 3 == 1:
+            add_existing_fastq_set(fake_fastq_manager, library_id, PREVIOUS_INSTRUMENT_RUN_ID)
+            if library_index_iter_ % 2 == 0:
+                RERUN_LIBRARY_ID_LIST.append(library_id)
+                expected_action_by_library_id[library_id] = "replace"
+            else:
+                expected_action_by_library_id[library_id] = "append"
+        else:
+            expected_action_by_library_id[library_id] = "new"
+
+    fake_fastq_manager.request_counter.clear()
+    return expected_action_by_library_id
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_LATENCY_MS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    fake_fastq_manager = FakeFastqManager()
+    install_fake_orcabus_api_tools(fake_fastq_manager)
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("plan_fastq_set_creation_py")
+
+    from fastq_glue_tools import tracking_sheet
+    from fastq_glue_tools.concurrency import MAX_WORKERS_ENV_VAR, get_max_workers
+    tracking_sheet.get_spread = RerunFakeSpread
+    tracking_sheet.get_tracking_sheet_id = lambda: "fake-tracking-sheet-id"
+
+    import plan_fastq_set_creation
+
+    results = {}
+    for num_libraries_iter_ in NUM_LIBRARIES_LIST:
+        expected_action_by_library_id = seed_libraries(fake_fastq_manager, num_libraries_iter_)
+        library_id_list = list(expected_action_by_library_id.keys())
+        remaining_library_id_list = list(filter(
+            lambda library_id_iter_: expected_action_by_library_id[library_id_iter_] != "exists",
+            library_id_list
+        ))
+        event = {
+            "instrumentRunId": INSTRUMENT_RUN_ID,
+            "libraryIdList": library_id_list,
+        }
+
+        def plan_fastq_set_creation_with_handler() -> Dict[str, str]:
+            tracking_sheet.clear_tracking_sheet_cache()
+            return {
+                library_id_iter_: action_iter_
+                for batch_iter_ in plan_fastq_set_creation.handler(event, None)['batchList']
+                for library_id_iter_, action_iter_ in batch_iter_['fastqSetCreationPlan'].items()
+            }
+
+        def query_current_fastq_sets() -> List[str]:
+            return plan_fastq_set_creation.get_library_ids_with_current_fastq_sets(remaining_library_id_list)
+
+        fake_fastq_manager.latency_seconds = args.latency_ms / 1000
+        mode_results = {}
+        for mode_name_iter_, max_workers_iter_ in [
+            ("concurrent", None),
+            ("serial", 1),
+        ]:
+            if max_workers_iter_ is not None:
+                environ[MAX_WORKERS_ENV_VAR] = str(max_workers_iter_)
+
+            fake_fastq_manager.request_counter.clear()
+            assert plan_fastq_set_creation_with_handler() == expected_action_by_library_id, \
+                f"Expected the {mode_name_iter_} plan to match the seeded libraries"
+            num_get_fastq_sets_requests = fake_fastq_manager.request_counter["get_fastq_sets"]
+            assert num_get_fastq_sets_requests == 1 + len(remaining_library_id_list), \
+                f"Expected one run query and one query per remaining library, got {num_get_fastq_sets_requests}"
+
+            # Only time the serial path once, it takes a request per remaining library in turn
+            repeats = 1 if mode_name_iter_ == "serial" else args.repeats
+            query_timings = time_callable(query_current_fastq_sets, repeats=repeats)
+            mode_results[mode_name_iter_] = {
+                **time_callable(plan_fastq_set_creation_with_handler, repeats=repeats),
+                "maxWorkers": get_max_workers(),
+                "getFastqSetsRequests": num_get_fastq_sets_requests,
+                "currentFastqSetQuerySeconds": query_timings['bestSeconds'],
+                "currentFastqSetQueryMsPerLibrary": query_timings['bestSeconds'] * 1000 / len(remaining_library_id_list),
+            }
+            environ.pop(MAX_WORKERS_ENV_VAR, None)
+        fake_fastq_manager.latency_seconds = 0.0
+
+        results[str(num_libraries_iter_)] = {
+            "actions": dict(Counter(expected_action_by_library_id.values())),
+            "remainingLibraries": len(remaining_library_id_list),
+            **mode_results,
+        }
+
+    print(json.dumps(
+        {
+            "latencyMs": args.latency_ms,
+            "numLibraries": results,
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+Replay the copy event of a synthetic run through the add read sets handlers, and count the fastq manager requests.
+
+For each scenario (see bench_suite.py) the fastq sets are generated, then the add read sets flow is run
+
+1. first copy event - every fastq is new
+2. replayed copy event - nothing has changed
+3. re-demultiplexed - a few fastqs have a different read set (detach and add read set),
+   a few more have different read counts (add read count)
+
+Each fastq manager request takes --latency-ms, so wall time reflects the round trips saved.
+Before the read set diff, a replayed copy event fetched every fastq on the run (one request per fastq).
+
+After each pass we check every fastq on the run has the read set and read counts of the run manifest,
+and that the diff reported the expected number of skipped, updated and new fastqs.
+
+python3 app/benchmarks/bench_read_set_diff.py --scenario novaseqx-4-lanes-500-libraries
+"""
+
+# Standard imports
+import json
+import time
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+# Local imports
+from bench_suite import (
+    SCENARIOS,
+    BenchEnvironment,
+    ScenarioRecorder,
+    run_fastq_set_generation
+)
+from synthetic_run import SyntheticRun, generate_synthetic_run
+
+# Globals
+DEFAULT_SCENARIO_NAME = "novaseqx-4-lanes-500-libraries"
+DEFAULT_LATENCY_MS = 2.0
+# Fastqs changed before the re-demultiplexed pass
+NUM_CHANGED_READ_SETS = 5
+NUM_CHANGED_READ_COUNTS = 7
+
+
+def get_run_fastqs(bench_environment: BenchEnvironment, synthetic_run: SyntheticRun) -> List[Dict[str, Any]]:
+    return list(filter(
+        lambda fastq_iter_: fastq_iter_['instrumentRunId'] == synthetic_run['instrumentRunId'],
+        bench_environment.fake_fastq_manager.fastqs.values()
+    ))
+
+
+def check_read_sets_match_manifest(
+        bench_environment: BenchEnvironment,
+        synthetic_run: SyntheticRun,
+        run_manifest_uri: str
+):
+    from fastq_glue_tools.run_manifest import get_run_manifest_rows
+
+    manifest_rows_by_library_lane = dict(map(
+        lambda manifest_row_iter_: ((manifest_row_iter_['libraryId'], manifest_row_iter_['lane']), manifest_row_iter_),
+        get_run_manifest_rows(run_manifest_uri)
+    ))
+    for fastq_iter_ in get_run_fastqs(bench_environment, synthetic_run):
+        manifest_row = manifest_rows_by_library_lane[(fastq_iter_['library']['libraryId'], fastq_iter_['lane'])]
+        assert fastq_iter_['readSet'] is not None, f"{fastq_iter_['id']} has no read set"
+        assert fastq_iter_['readSet']['r1']['s3Uri'] == manifest_row['read1FileUri'], \
+            f"{fastq_iter_['id']} has the wrong read set"
+        assert fastq_iter_['readCount'] == manifest_row['readCount'], \
+            f"{fastq_iter_['id']} has the wrong read count"
+
+
+def run_add_read_sets_pass(
+        bench_environment: BenchEnvironment,
+        synthetic_run: SyntheticRun,
+        run_manifest_uri: str
+) -> Dict[str, Any]:
+    """
+    Run the add read sets flow once, from the plan
+    :param bench_environment:
+    :param synthetic_run:
+    :param run_manifest_uri:
+    :return:
+    """
+    recorder = ScenarioRecorder(bench_environment, trace_memory=False)
+    api_call_counter_before = bench_environment.get_api_call_counter()
+
+    start_time = time.perf_counter()
+    read_set_update_plan = recorder.invoke(
+        "plan_read_set_updates",
+        {"instrumentRunId": synthetic_run['instrumentRunId'], "runManifestUri": run_manifest_uri}
+    )
+    for batch_iter_ in read_set_update_plan['batchList']:
+        recorder.invoke("add_read_sets_to_fastq_objects", {
+            "libraryIdList": batch_iter_['items'],
+            "readSetUpdatesUri": read_set_update_plan['readSetUpdatesUri'],
+        })
+    wall_seconds = time.perf_counter() - start_time
+
+    api_calls = bench_environment.get_api_call_counter() - api_call_counter_before
+    check_read_sets_match_manifest(bench_environment, synthetic_run, run_manifest_uri)
+
+    return {
+        "wallSeconds": wall_seconds,
+        "invocations": dict(map(
+            lambda handler_result_iter_: (handler_result_iter_[0], handler_result_iter_[1]['invocations']),
+            recorder.handler_results.items()
+        )),
+        "readSetUpdateCounts": read_set_update_plan['readSetUpdateCounts'],
+        "fastqManagerRequests": sum(api_calls.values()),
+        "apiCalls": dict(sorted(api_calls.items())),
+    }
+
+
+def change_fastqs(bench_environment: BenchEnvironment, synthetic_run: SyntheticRun):
+    """
+    Give a few fastqs an old read set, and a few more old read counts
+    :param bench_environment:
+    :param synthetic_run:
+    :return:
+    """
+    run_fastqs = sorted(get_run_fastqs(bench_environment, synthetic_run), key=lambda fastq_iter_: fastq_iter_['id'])
+    for fastq_iter_ in run_fastqs[:NUM_CHANGED_READ_SETS]:
+        fastq_iter_['readSet'] = {
+            "r1": {"s3Uri": f"s3://bench-bucket/old/{fastq_iter_['id']}_R1.fastq.gz"},
+            "r2": {"s3Uri": f"s3://bench-bucket/old/{fastq_iter_['id']}_R2.fastq.gz"},
+            "compressionFormat": "GZIP",
+        }
+    for fastq_iter_ in run_fastqs[NUM_CHANGED_READ_SETS:NUM_CHANGED_READ_SETS + NUM_CHANGED_READ_COUNTS]:
+        fastq_iter_['readCount'] = 0
+
+
+def run_scenario(bench_environment: BenchEnvironment, scenario_name: str, latency_seconds: float) -> Dict[str, Any]:
+    scenario_config = SCENARIOS[scenario_name]
+    synthetic_run = generate_synthetic_run(
+        platform=scenario_config['platform'],
+        num_lanes=scenario_config['numLanes'],
+        num_libraries=scenario_config['numLibraries'],
+        seed=scenario_config['seed'],
+    )
+
+    with tempfile.TemporaryDirectory(prefix="bench_read_set_diff_") as local_object_store_dir:
+        bench_environment.reset(local_object_store_dir)
+        bench_environment.seed(synthetic_run)
+
+        recorder = ScenarioRecorder(bench_environment, trace_memory=False)
+        run_fastq_set_generation(recorder, synthetic_run['instrumentRunId'])
+        run_manifest_uri = recorder.invoke("build_run_manifest", {
+            "instrumentRunId": synthetic_run['instrumentRunId'],
+            "fastqListUri": synthetic_run['fastqListUri'],
+            "demuxStatsUri": synthetic_run['demuxStatsUri'],
+        })['runManifestUri']
+        num_fastqs = len(get_run_fastqs(bench_environment, synthetic_run))
+
+        for fake_iter_ in bench_environment.get_fakes_by_service_name().values():
+            fake_iter_.latency_seconds = latency_seconds
+        try:
+            passes = {
+                "firstCopyEvent": run_add_read_sets_pass(bench_environment, synthetic_run, run_manifest_uri),
+                "replayedCopyEvent": run_add_read_sets_pass(bench_environment, synthetic_run, run_manifest_uri),
+            }
+            change_fastqs(bench_environment, synthetic_run)
+            passes["reDemultiplexed"] = run_add_read_sets_pass(bench_environment, synthetic_run, run_manifest_uri)
+        finally:
+            for fake_iter_ in bench_environment.get_fakes_by_service_name().values():
+                fake_iter_.latency_seconds = 0.0
+
+    num_changed = NUM_CHANGED_READ_SETS + NUM_CHANGED_READ_COUNTS
+    assert passes['firstCopyEvent']['readSetUpdateCounts'] == {"skipped": 0, "updated": 0, "new": num_fastqs}
+    assert passes['replayedCopyEvent']['readSetUpdateCounts'] == {"skipped": num_fastqs, "updated": 0, "new": 0}
+    assert passes['replayedCopyEvent']['fastqManagerRequests'] == 1, "Expected a single listing of the run"
+    assert passes['reDemultiplexed']['readSetUpdateCounts'] == {
+        "skipped": num_fastqs - num_changed, "updated": num_changed, "new": 0
+    }
+    assert passes['reDemultiplexed']['fastqManagerRequests'] == 1 + 2 * NUM_CHANGED_READ_SETS + NUM_CHANGED_READ_COUNTS
+
+    return {
+        "config": scenario_config,
+        "numFastqs": num_fastqs,
+        # One get_fastq per fastq on the run
+        "replayedCopyEventRequestsBeforeDiff": num_fastqs,
+        "passes": passes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scenario", choices=list(SCENARIOS.keys()), action="append", default=None)
+    parser.add_argument(
+        "--latency-ms", type=float, default=DEFAULT_LATENCY_MS,
+        help="Latency added to each fastq manager request"
+    )
+    args = parser.parse_args()
+
+    bench_environment = BenchEnvironment()
+
+    print(json.dumps(
+        {
+            "latencyMs": args.latency_ms,
+            "scenarios": dict(map(
+                lambda scenario_name_iter_: (
+                    scenario_name_iter_,
+                    run_scenario(bench_environment, scenario_name_iter_, args.latency_ms / 1000)
+                ),
+                args.scenario if args.scenario is not None else [DEFAULT_SCENARIO_NAME]
+            )),
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
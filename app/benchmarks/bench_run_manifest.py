@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the run manifest against the previous per-batch join of the add read set step function.
+
+Previously each batch of 10 libraries read its rows of fastq_list.csv and Demultiplex_Stats.csv,
+and a JSONata expression then filtered the three result lists once per library
+(quadratic in the number of libraries per batch).
+The file names and demux data of each library were passed through the step function payload.
+
+The run manifest instead joins the samplesheet, fastq list and demux stats for the whole run once,
+and each library reads only its own manifest partition, the payload is the manifest uri.
+
+Uses a synthetic run of 1,000 libraries across 8 lanes in a local object store.
+The read sets and read counts for every library must be identical for both paths.
+
+python3 app/benchmarks/bench_run_manifest.py
+"""
+
+# Standard imports
+import json
+import tempfile
+from os import environ
+from pathlib import Path
+from typing import Dict, Any, List
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path, time_callable
+from fake_orcabus_api_tools import install_orcabus_api_tools_import_stubs
+
+# Globals
+NUM_LIBRARIES = 1000
+NUM_LANES = 8
+BATCH_SIZE = 10
+INSTRUMENT_RUN_ID = "250320_A01052_0256_BHFCFCDSXF"
+OUTPUT_URI = f"s3://bench-bucket/primary/{INSTRUMENT_RUN_ID}/202503201234abcd/"
+FASTQ_LIST_URI = OUTPUT_URI + "Reports/fastq_list.csv"
+DEMUX_STATS_URI = OUTPUT_URI + "Reports/Demultiplex_Stats.csv"
+CACHE_ROOT_URI = "s3://bench-cache-bucket/cache/fastq-glue/"
+
+
+def get_library_id_list() -> List[str]:
+    return [f"L25{library_iter_:05d}" for library_iter_ in range(NUM_LIBRARIES)]
+
+
+def generate_samplesheet() -> Dict[str, Any]:
+    return {
+        "header": {"instrumentPlatform": "Illumina", "instrumentType": "NovaSeq 6000"},
+        "reads": {"read1Cycles": 151, "read2Cycles": 151, "index1Cycles": 10, "index2Cycles": 10},
+        "bclconvertSettings": {},
+        "bclconvertData": [
+            {
+                "sampleId": library_id_iter_,
+                "lane": lane_iter_,
+                "index": "ACGTACGTAC",
+                "index2": "TGCATGCATG",
+                # Every third library has its own override cycles
+                **(
+                    {"overrideCycles": "Y101;I10;I10;Y101"}
+                    if library_iter_ % 3 == 0
+                    else {}
+                ),
+            }
+            for library_iter_, library_id_iter_ in enumerate(get_library_id_list())
+            for lane_iter_ in range(1, NUM_LANES + 1)
+        ],
+    }
+
+
+def write_reports(local_store_dir: Path):
+    library_id_list = get_library_id_list()
+    reports_dir = local_store_dir / "bench-bucket" / f"primary/{INSTRUMENT_RUN_ID}/202503201234abcd/Reports"
+    reports_dir.mkdir(parents=True)
+
+    pd.DataFrame([
+        {
+            "RGID": f"ACGTACGTAC.TGCATGCATG.{lane_iter_}",
+            "RGSM": library_id_iter_,
+            "RGLB": "UnknownLibrary",
+            "Lane": lane_iter_,
+            "Read1File": f"{library_id_iter_}_S{library_iter_ + 1}_L00{lane_iter_}_R1_001.fastq.ora",
+            "Read2File": f"{library_id_iter_}_S{library_iter_ + 1}_L00{lane_iter_}_R2_001.fastq.ora",
+        }
+        for library_iter_, library_id_iter_ in enumerate(library_id_list)
+        for lane_iter_ in range(1, NUM_LANES + 1)
+    ]).to_csv(reports_dir / "fastq_list.csv", index=False)
+
+    pd.DataFrame([
+        {
+            "Lane": lane_iter_,
+            "SampleID": library_id_iter_,
+            "Index": "ACGTACGTAC-TGCATGCATG",
+            "# Reads": 1_000_000 + library_iter_ * 10 + lane_iter_,
+            "# Perfect Index Reads": 990_000,
+            "# One Mismatch Index Reads": 10_000,
+            "# Two Mismatch Index Reads": 0,
+            "% Reads": 0.001,
+            "% Perfect Index Reads": 0.99,
+            "% One Mismatch Index Reads": 0.01,
+            "% Two Mismatch Index Reads": 0.0,
+        }
+        for library_iter_, library_id_iter_ in enumerate(library_id_list)
+        for lane_iter_ in range(1, NUM_LANES + 1)
+    ] + [
+        {
+            "Lane": lane_iter_,
+            "SampleID": "Undetermined",
+            "Index": "",
+            "# Reads": 5_000_000,
+            "# Perfect Index Reads": 0,
+            "# One Mismatch Index Reads": 0,
+            "# Two Mismatch Index Reads": 0,
+            "% Reads": 0.1,
+            "% Perfect Index Reads": 0.0,
+            "% One Mismatch Index Reads": 0.0,
+            "% Two Mismatch Index Reads": 0.0,
+        }
+        for lane_iter_ in range(1, NUM_LANES + 1)
+    ]).to_csv(reports_dir / "Demultiplex_Stats.csv", index=False)
+
+
+# Previous implementation, kept here as the baseline
+def legacy_get_file_names_list_by_sample(sample_id_list: List[str]) -> List[Dict[str, Any]]:
+    from urllib.parse import urlunparse
+    from fastq_glue_tools.object_store import get_bucket_key_from_s3_uri
+    from fastq_glue_tools.reports import FASTQ_LIST_REPORT_SCHEMA, read_report_csv
+
+    fastq_list_df = read_report_csv(FASTQ_LIST_URI, FASTQ_LIST_REPORT_SCHEMA, sample_id_list=sample_id_list)
+    bucket, key = get_bucket_key_from_s3_uri(FASTQ_LIST_URI.replace("Reports/fastq_list.csv", "Samples/"))
+
+    def get_file_uri_series(df: pd.DataFrame, read_file_column: str) -> pd.Series:
+        return df.apply(
+            lambda row_iter_: str(urlunparse((
+                "s3",
+                bucket,
+                str(Path(key) / f"Lane_{row_iter_['Lane']}" / row_iter_["RGSM"] / row_iter_[read_file_column]),
+                None, None, None
+            ))),
+            axis="columns"
+        )
+
+    file_names_list = fastq_list_df.assign(
+        sampleId=lambda df_iter_: df_iter_["RGSM"],
+        lane=lambda df_iter_: pd.to_numeric(df_iter_["Lane"]),
+        read1FileUri=lambda df_iter_: get_file_uri_series(df_iter_, "Read1File"),
+        read2FileUri=lambda df_iter_: get_file_uri_series(df_iter_, "Read2File"),
+    )[["sampleId", "lane", "read1FileUri", "read2FileUri"]].to_dict(orient="records")
+
+    return [
+        {
+            "sampleId": sample_id_iter_,
+            "fileNamesList": [
+                file_iter_ for file_iter_ in file_names_list if file_iter_["sampleId"] == sample_id_iter_
+            ]
+        }
+        for sample_id_iter_ in sample_id_list
+    ]
+
+
+def legacy_get_demux_data_by_sample(sample_id_list: List[str], samplesheet: Dict[str, Any]) -> List[Dict[str, Any]]:
+    from fastq_glue_tools.demux_stats import get_base_count_est_series
+    from fastq_glue_tools.reports import DEMUX_STATS_REPORT_SCHEMA, read_report_csv
+    from fastq_glue_tools.samplesheet import get_global_cycle_count
+
+    demux_stats_df = read_report_csv(DEMUX_STATS_URI, DEMUX_STATS_REPORT_SCHEMA, sample_id_list=sample_id_list)
+    demux_stats_df = demux_stats_df.assign(
+        sampleId=lambda df_iter_: df_iter_["SampleID"],
+        lane=lambda df_iter_: pd.to_numeric(df_iter_["Lane"]),
+        readCount=lambda df_iter_: df_iter_["# Reads"],
+        baseCountEst=lambda df_iter_: get_base_count_est_series(
+            df_iter_, samplesheet, get_global_cycle_count(samplesheet)
+        ),
+    )[["sampleId", "lane", "readCount", "baseCountEst"]]
+
+    return [
+        {
+            "sampleId": sample_id_iter_,
+            "demuxData": demux_stats_df.query("sampleId == @sample_id_iter_").to_dict(orient="records")
+        }
+        for sample_id_iter_ in sample_id_list
+    ]
+
+
+def legacy_get_payloads(samplesheet: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # One set of report reads per batch, then the JSONata join (a filter over the batch per library)
+    payloads = {}
+    library_id_list = get_library_id_list()
+    for batch_start_iter_ in range(0, len(library_id_list), BATCH_SIZE):
+        batch_library_id_list = library_id_list[batch_start_iter_:batch_start_iter_ + BATCH_SIZE]
+        file_names_list_by_sample = legacy_get_file_names_list_by_sample(batch_library_id_list)
+        demux_data_by_sample = legacy_get_demux_data_by_sample(batch_library_id_list, samplesheet)
+        for library_id_iter_ in batch_library_id_list:
+            payloads[library_id_iter_] = {
+                "fileNamesList": next(filter(
+                    lambda file_names_iter_: file_names_iter_["sampleId"] == library_id_iter_,
+                    file_names_list_by_sample
+                ))["fileNamesList"],
+                "demuxData": next(filter(
+                    lambda demux_data_iter_: demux_data_iter_["sampleId"] == library_id_iter_,
+                    demux_data_by_sample
+                ))["demuxData"],
+            }
+    return payloads
+
+
+def legacy_get_read_sets(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return sorted(
+        [
+            {
+                "lane": int(file_names_iter_["lane"]),
+                "read1FileUri": file_names_iter_["read1FileUri"],
+                "read2FileUri": file_names_iter_["read2FileUri"],
+                "readCount": int(demux_data_iter_["readCount"]),
+                "baseCountEst": int(demux_data_iter_["baseCountEst"]),
+            }
+            for file_names_iter_ in payload["fileNamesList"]
+            for demux_data_iter_ in payload["demuxData"]
+            if demux_data_iter_["lane"] == file_names_iter_["lane"]
+        ],
+        key=lambda read_set_iter_: read_set_iter_["lane"]
+    )
+
+
+def manifest_get_payloads(build_run_manifest_module) -> Dict[str, Dict[str, Any]]:
+    from fastq_glue_tools.run_manifest import clear_run_manifest_memory_cache
+
+    # Build the manifest from scratch each time
+    for manifest_path in Path(environ["LOCAL_OBJECT_STORE_DIR"]).glob("bench-cache-bucket/cache/fastq-glue/manifests/*"):
+        for object_path in sorted(manifest_path.rglob("*"), reverse=True):
+            object_path.unlink() if object_path.is_file() else object_path.rmdir()
+    clear_run_manifest_memory_cache()
+
+    run_manifest_uri = build_run_manifest_module.handler(
+        {
+            "instrumentRunId": INSTRUMENT_RUN_ID,
+            "fastqListUri": FASTQ_LIST_URI,
+            "demuxStatsUri": DEMUX_STATS_URI,
+        },
+        None
+    )["runManifestUri"]
+
+    return {
+        library_id_iter_: {
+            "libraryId": library_id_iter_,
+            "runManifestUri": run_manifest_uri,
+        }
+        for library_id_iter_ in get_library_id_list()
+    }
+
+
+def manifest_get_read_sets(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    from fastq_glue_tools.run_manifest import get_run_manifest_rows_for_library
+
+    return [
+        {
+            "lane": manifest_row_iter_["lane"],
+            "read1FileUri": manifest_row_iter_["read1FileUri"],
+            "read2FileUri": manifest_row_iter_["read2FileUri"],
+            "readCount": manifest_row_iter_["readCount"],
+            "baseCountEst": manifest_row_iter_["baseCountEst"],
+        }
+        for manifest_row_iter_ in get_run_manifest_rows_for_library(payload["runManifestUri"], payload["libraryId"])
+    ]
+
+
+def main():
+    local_store_dir = Path(tempfile.mkdtemp(prefix="bench_run_manifest_"))
+    environ["LOCAL_OBJECT_STORE_DIR"] = str(local_store_dir)
+    environ["FASTQ_GLUE_CACHE_URI"] = CACHE_ROOT_URI
+    write_reports(local_store_dir)
+    samplesheet = generate_samplesheet()
+
+    add_layer_to_path()
+    discard_handler_metrics()
+    add_lambda_to_path("build_run_manifest_py")
+    install_orcabus_api_tools_import_stubs()
+
+    import build_run_manifest
+    build_run_manifest.get_sample_sheet_from_instrument_run_id = lambda instrument_run_id: {
+        "sampleSheetContent": samplesheet
+    }
+
+    # Outputs must be identical
+    legacy_payloads = legacy_get_payloads(samplesheet)
+    manifest_payloads = manifest_get_payloads(build_run_manifest)
+    for library_id_iter_ in get_library_id_list():
+        assert legacy_get_read_sets(legacy_payloads[library_id_iter_]) == \
+            manifest_get_read_sets(manifest_payloads[library_id_iter_]), \
+            f"Read sets differ for {library_id_iter_}"
+
+    from fastq_glue_tools.run_manifest import get_run_manifest_index
+    run_manifest_index = get_run_manifest_index(manifest_payloads[get_library_id_list()[0]]["runManifestUri"])
+    assert len(run_manifest_index["unmatchedRows"]) == 0, "Unexpected unmatched rows"
+
+    legacy_timing = time_callable(lambda: legacy_get_payloads(samplesheet), repeats=1)
+    manifest_timing = time_callable(lambda: manifest_get_payloads(build_run_manifest), repeats=3)
+
+    print(json.dumps(
+        {
+            "numLibraries": NUM_LIBRARIES,
+            "numLanes": NUM_LANES,
+            "legacy": {
+                **legacy_timing,
+                "maxPayloadBytesPerLibrary": max(map(lambda p: len(json.dumps(p)), legacy_payloads.values())),
+            },
+            "manifest": {
+                **manifest_timing,
+                "maxPayloadBytesPerLibrary": max(map(lambda p: len(json.dumps(p)), manifest_payloads.values())),
+                "numPartitions": run_manifest_index["numPartitions"],
+            },
+            "speedup": legacy_timing["bestSeconds"] / manifest_timing["bestSeconds"],
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""
+Measure the per invocation overhead of creating AWS clients and http connections,
+before and after the shared runtime helpers (fastq_glue_tools.runtime).
+
+A local http server stands in for S3, SSM, DynamoDB and the OrcaBus apis
+(boto3 is pointed at it with AWS_ENDPOINT_URL_<SERVICE>), it counts the connections opened and the requests made.
+
+Each simulated invocation makes
+
+* 2 ssm parameter reads (the tracking sheet id and the google secret)
+* 4 s3 head object requests (object store etags)
+* 6 dynamodb put item requests (leases and journal checkpoints)
+* 20 OrcaBus api requests
+
+Before - a new boto3 client per request, every ssm parameter read from ssm,
+a new http connection per api request (requests.get).
+After - clients cached for the execution environment, ssm parameters cached,
+api requests through the keep-alive session of the thread (get_http_session).
+
+We report the first (cold) invocation, the mean of the warm invocations, and the connections opened and requests made.
+Connections to a local server are cheap, the TLS handshake saved per api request in a lambda is not measured here.
+
+python3 app/benchmarks/bench_runtime_clients.py
+"""
+
+# Standard imports
+import json
+import socket
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import environ
+from statistics import mean
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional
+
+# Local imports
+from bench_utils import add_layer_to_path
+
+# Globals
+NUM_SSM_PARAMETER_READS = 2
+NUM_S3_REQUESTS = 4
+NUM_DYNAMODB_REQUESTS = 6
+NUM_API_REQUESTS = 20
+SSM_PARAMETER_NAMES = ["/fake/tracking-sheet-id", "/fake/gdrive-auth-json"]
+
+
+class FakeAwsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers just enough of S3 (HeadObject), SSM (GetParameter), DynamoDB (PutItem) and the OrcaBus apis (GET json)
+    """
+    # Keep connections open, as AWS and the OrcaBus apis do
+    protocol_version = "HTTP/1.1"
+    counters: Counter = Counter()
+    counters_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, without this a reused connection waits on the delayed ack
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.counters_lock:
+            self.counters['connections'] += 1
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def send_body(self, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for header_name_iter_, header_value_iter_ in (headers or {}).items():
+            self.send_header(header_name_iter_, header_value_iter_)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def count_request(self, request_name: str):
+        with self.counters_lock:
+            self.counters[request_name] += 1
+
+    def do_HEAD(self):
+        self.count_request("s3")
+        self.send_body(b"", "application/octet-stream", {"ETag": '"d41d8cd98f00b204e9800998ecf8427e"'})
+
+    def do_GET(self):
+        self.count_request("api")
+        self.send_body(json.dumps({"id": self.path.rsplit("/", 1)[-1]}).encode(), "application/json")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        target = self.headers.get("X-Amz-Target", "")
+        if target.startswith("AmazonSSM"):
+            self.count_request("ssm")
+            body = {"Parameter": {"Name": "parameter", "Type": "SecureString", "Value": "value"}}
+        else:
+            self.count_request("dynamodb")
+            body = {}
+        self.send_body(json.dumps(body).encode(), "application/x-amz-json-1.1")
+
+
+def run_invocation_before(endpoint_url: str):
+    import boto3
+    import requests
+
+    for parameter_name_iter_ in SSM_PARAMETER_NAMES[:NUM_SSM_PARAMETER_READS]:
+        boto3.client('ssm').get_parameter(Name=parameter_name_iter_, WithDecryption=True)
+    for request_index_iter_ in range(NUM_S3_REQUESTS):
+        boto3.client('s3').head_object(Bucket="bucket", Key=f"cache/{request_index_iter_}.json")
+    for request_index_iter_ in range(NUM_DYNAMODB_REQUESTS):
+        boto3.client('dynamodb').put_item(TableName="table", Item={"lockKey": {"S": str(request_index_iter_)}})
+    for request_index_iter_ in range(NUM_API_REQUESTS):
+        requests.get(f"{endpoint_url}/api/v1/fastq/fqr.{request_index_iter_:05d}").json()
+
+
+def run_invocation_after(endpoint_url: str):
+    from fastq_glue_tools.runtime import get_dynamodb_client, get_http_session, get_s3_client, get_ssm_parameter_value
+
+    for parameter_name_iter_ in SSM_PARAMETER_NAMES[:NUM_SSM_PARAMETER_READS]:
+        get_ssm_parameter_value(parameter_name_iter_)
+    for request_index_iter_ in range(NUM_S3_REQUESTS):
+        get_s3_client().head_object(Bucket="bucket", Key=f"cache/{request_index_iter_}.json")
+    for request_index_iter_ in range(NUM_DYNAMODB_REQUESTS):
+        get_dynamodb_client().put_item(TableName="table", Item={"lockKey": {"S": str(request_index_iter_)}})
+    for request_index_iter_ in range(NUM_API_REQUESTS):
+        get_http_session().get(f"{endpoint_url}/api/v1/fastq/fqr.{request_index_iter_:05d}").json()
+
+
+def time_invocations(
+        run_invocation: Callable[[str], None],
+        endpoint_url: str,
+        num_invocations: int
+) -> Dict[str, Any]:
+    FakeAwsRequestHandler.counters.clear()
+    invocation_seconds = []
+    for _ in range(num_invocations):
+        start_time = perf_counter()
+        run_invocation(endpoint_url)
+        invocation_seconds.append(perf_counter() - start_time)
+
+    return {
+        "coldInvocationMs": round(invocation_seconds[0] * 1000, 2),
+        "warmInvocationMeanMs": round(mean(invocation_seconds[1:]) * 1000, 2),
+        "connectionsPerInvocation": round(FakeAwsRequestHandler.counters['connections'] / num_invocations, 2),
+        "requestsPerInvocation": dict(map(
+            lambda request_name_iter_: (
+                request_name_iter_,
+                round(FakeAwsRequestHandler.counters[request_name_iter_] / num_invocations, 2)
+            ),
+            ["ssm", "s3", "dynamodb", "api"]
+        )),
+    }
+
+
+def check_shared_clients():
+    """
+    Clients requested from several threads at once are created once,
+    each thread gets (and keeps) its own http session, and requests itself is left alone
+    :return:
+    """
+    import requests
+    from fastq_glue_tools import runtime
+
+    original_request = requests.api.request
+
+    runtime.clear_boto3_client_cache()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        s3_client_list = list(executor.map(lambda _: runtime.get_s3_client(), range(32)))
+    assert len(set(map(id, s3_client_list))) == 1, "Expected a single s3 client across threads"
+    assert s3_client_list[0].meta.config.max_pool_connections == runtime.get_max_pool_connections(), \
+        "Expected the s3 client connection pool to be sized by FASTQ_GLUE_MAX_POOL_CONNECTIONS"
+
+    # Hold each thread until all have started, so every thread takes a task
+    thread_barrier = threading.Barrier(4)
+
+    def get_thread_http_session_id(_) -> int:
+        thread_barrier.wait()
+        http_session_id = id(runtime.get_http_session())
+        assert id(runtime.get_http_session()) == http_session_id, "Expected a single http session per thread"
+        return http_session_id
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        http_session_id_list = list(executor.map(get_thread_http_session_id, range(4)))
+    assert len(set(http_session_id_list)) == 4, "Expected a separate http session for each thread"
+
+    http_session = runtime.get_http_session()
+    assert http_session.get_adapter("https://").poolmanager.connection_pool_kw['maxsize'] == \
+        runtime.get_max_pool_connections(), \
+        "Expected the http session connection pool to be sized by FASTQ_GLUE_MAX_POOL_CONNECTIONS"
+    runtime.reset_http_session()
+    assert runtime.get_http_session() is not http_session, "Expected reset_http_session to drop the session"
+    assert requests.api.request is original_request, "Expected requests to be left alone"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--num-invocations", type=int, default=20)
+    args = parser.parse_args()
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), FakeAwsRequestHandler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    endpoint_url = f"http://127.0.0.1:{http_server.server_address[1]}"
+
+    # Offline credentials, and every service pointed at the local server
+    environ.update({
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "ap-southeast-2",
+        "AWS_ENDPOINT_URL_S3": endpoint_url,
+        "AWS_ENDPOINT_URL_SSM": endpoint_url,
+        "AWS_ENDPOINT_URL_DYNAMODB": endpoint_url,
+    })
+    add_layer_to_path()
+
+    # Import once up front, import time is measured by bench_import_time.py
+    import boto3
+    import requests
+    from fastq_glue_tools import runtime
+
+    results = {
+        "before": time_invocations(run_invocation_before, endpoint_url, args.num_invocations),
+    }
+
+    runtime.clear_boto3_client_cache()
+    runtime.clear_ssm_parameter_cache()
+    results["after"] = time_invocations(run_invocation_after, endpoint_url, args.num_invocations)
+    runtime.reset_http_session()
+
+    assert results["after"]["requestsPerInvocation"]["ssm"] < NUM_SSM_PARAMETER_READS, \
+        "Expected ssm parameters to be read from the cache"
+    assert results["after"]["connectionsPerInvocation"] < results["before"]["connectionsPerInvocation"], \
+        "Expected connections to be reused"
+
+    check_shared_clients()
+    http_server.shutdown()
+
+    print(json.dumps(
+        {
+            "numInvocations": args.num_invocations,
+            "requestsPerInvocation": {
+                "ssmParameterReads": NUM_SSM_PARAMETER_READS,
+                "s3": NUM_S3_REQUESTS,
+                "dynamodb": NUM_DYNAMODB_REQUESTS,
+                "api": NUM_API_REQUESTS,
+            },
+            "modes": results,
+            "warmSpeedup": round(
+                results["before"]["warmInvocationMeanMs"] / results["after"]["warmInvocationMeanMs"], 2
+            ),
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the samplesheet index against the previous per-library scan
+of the bclconvertData section.
+
+Uses a synthetic 4,000 row samplesheet (500 libraries across 8 lanes, half with per-row override cycles)
+and answers the libraries in batches of 10, as the fastq set generation step function does.
+
+python3 app/benchmarks/bench_samplesheet_index.py
+"""
+
+# Standard imports
+import re
+import json
+from typing import Dict, List, Optional, Union
+
+# Local imports
+from bench_utils import add_layer_to_path, time_callable
+
+add_layer_to_path()
+
+from fastq_glue_tools.samplesheet import (
+    compile_samplesheet_index,
+    get_bclconvert_data_rows_for_sample,
+    get_global_cycle_count,
+    get_index,
+)
+
+# Globals
+NUM_LANES = 8
+NUM_LIBRARIES = 500
+BATCH_SIZE = 10
+
+
+def generate_samplesheet(num_libraries: int = NUM_LIBRARIES, num_lanes: int = NUM_LANES) -> Dict:
+    bases = "ACGT"
+    return {
+        "header": {
+            "instrumentPlatform": "NovaSeqXSeries",
+        },
+        "reads": {
+            "read1Cycles": 151,
+            "read2Cycles": 151,
+        },
+        "bclconvertSettings": {},
+        "bclconvertData": [
+            dict(filter(
+                lambda kv_iter_: kv_iter_[1] is not None,
+                {
+                    "lane": lane_iter_,
+                    "sampleId": f"L25{library_iter_:05d}",
+                    "index": "".join(bases[(library_iter_ >> (2 * i)) % 4] for i in range(10)),
+                    "index2": "".join(bases[(library_iter_ >> (2 * i + 1)) % 4] for i in range(10)),
+                    "overrideCycles": "Y101;I10;I10;Y101" if library_iter_ % 2 == 0 else None,
+                }.items()
+            ))
+            for lane_iter_ in range(1, num_lanes + 1)
+            for library_iter_ in range(num_libraries)
+        ]
+    }
+
+
+# Previous implementation, kept here as the baseline
+def legacy_get_cycle_count_from_override_cycles(override_cycles: str) -> int:
+    read_cycle_regex_match = re.findall("[yY]([0-9]+)", override_cycles)
+    if read_cycle_regex_match is None or len(read_cycle_regex_match) == 0:
+        raise ValueError("Invalid override_cycles format")
+    if len(read_cycle_regex_match) == 1:
+        return int(read_cycle_regex_match[0])
+    return int(read_cycle_regex_match[0]) + int(read_cycle_regex_match[1])
+
+
+def legacy_get_cycle_count_from_bclconvert_data_row(bclconvert_data_row: Dict[str, str]) -> Optional[int]:
+    if "overrideCycles" in bclconvert_data_row:
+        return legacy_get_cycle_count_from_override_cycles(bclconvert_data_row['overrideCycles'])
+    return None
+
+
+def legacy_get_sample_bclconvert_data_from_v2_samplesheet(
+        samplesheet: Dict,
+        sample_id: str,
+        global_cycle_count: int,
+        is_reversed: bool
+) -> List[Dict[str, Union[str, int]]]:
+    return list(map(
+        lambda bclconvert_row_iter_: {
+            "libraryId": bclconvert_row_iter_['sampleId'],
+            "index": (
+                bclconvert_row_iter_['index'] +
+                (
+                    "+" + get_index(bclconvert_row_iter_['index2'], is_reversed=is_reversed)
+                    if bclconvert_row_iter_.get('index2')
+                    else ""
+                )
+            ),
+            "lane": int(bclconvert_row_iter_['lane']),
+            "cycleCount": (
+                legacy_get_cycle_count_from_bclconvert_data_row(bclconvert_row_iter_)
+                if legacy_get_cycle_count_from_bclconvert_data_row(bclconvert_row_iter_) is not None
+                else global_cycle_count
+            )
+        },
+        list(filter(
+            lambda bclconvert_row_iter_: bclconvert_row_iter_['sampleId'] == sample_id,
+            samplesheet['bclconvertData']
+        ))
+    ))
+
+
+def legacy_batch(samplesheet: Dict, library_id_list: List[str]) -> List[Dict]:
+    global_cycle_count = get_global_cycle_count(samplesheet)
+    return list(map(
+        lambda library_id_iter_: {
+            "libraryId": library_id_iter_,
+            "bclConvertData": legacy_get_sample_bclconvert_data_from_v2_samplesheet(
+                samplesheet, library_id_iter_, global_cycle_count, is_reversed=True
+            )
+        },
+        library_id_list
+    ))
+
+
+def indexed_batch(samplesheet: Dict, library_id_list: List[str]) -> List[Dict]:
+    samplesheet_index = compile_samplesheet_index(samplesheet, sample_id_list=library_id_list)
+    return list(map(
+        lambda library_id_iter_: {
+            "libraryId": library_id_iter_,
+            "bclConvertData": get_bclconvert_data_rows_for_sample(samplesheet_index, library_id_iter_)
+        },
+        library_id_list
+    ))
+
+
+def main():
+    samplesheet = generate_samplesheet()
+    library_id_list = sorted(set(map(lambda row_iter_: row_iter_['sampleId'], samplesheet['bclconvertData'])))
+    batches = [
+        library_id_list[i:i + BATCH_SIZE]
+        for i in range(0, len(library_id_list), BATCH_SIZE)
+    ]
+
+    # Outputs must be identical
+    for batch in batches:
+        assert legacy_batch(samplesheet, batch) == indexed_batch(samplesheet, batch), "Outputs differ"
+
+    # One batch (one lambda invocation)
+    legacy_one_batch = time_callable(lambda: legacy_batch(samplesheet, batches[0]))
+    indexed_one_batch = time_callable(lambda: indexed_batch(samplesheet, batches[0]))
+
+    # The whole run (every batch)
+    legacy_all_batches = time_callable(lambda: [legacy_batch(samplesheet, batch) for batch in batches], repeats=3)
+    indexed_all_batches = time_callable(lambda: [indexed_batch(samplesheet, batch) for batch in batches], repeats=3)
+
+    # The whole run, with the full index compiled once and reused by every batch
+    def run_shared_index():
+        samplesheet_index = compile_samplesheet_index(samplesheet)
+        return [
+            [get_bclconvert_data_rows_for_sample(samplesheet_index, library_id) for library_id in batch]
+            for batch in batches
+        ]
+
+    shared_index_all_batches = time_callable(run_shared_index, repeats=3)
+
+    print(json.dumps(
+        {
+            "numSamplesheetRows": len(samplesheet['bclconvertData']),
+            "numLibraries": len(library_id_list),
+            "batchSize": BATCH_SIZE,
+            "oneBatch": {
+                "legacyScan": legacy_one_batch,
+                "samplesheetIndex": indexed_one_batch,
+                "speedup": legacy_one_batch['bestSeconds'] / indexed_one_batch['bestSeconds'],
+            },
+            "allBatches": {
+                "legacyScan": legacy_all_batches,
+                "samplesheetIndex": indexed_all_batches,
+                "speedup": legacy_all_batches['bestSeconds'] / indexed_all_batches['bestSeconds'],
+            },
+            "allBatchesSharedIndex": {
+                "legacyScan": legacy_all_batches,
+                "samplesheetIndex": shared_index_all_batches,
+                "speedup": legacy_all_batches['bestSeconds'] / shared_index_all_batches['bestSeconds'],
+            },
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
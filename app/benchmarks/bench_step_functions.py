@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+End to end step function latency, per run size
+
+Runs the five state machine templates, in order, over a synthetic run of each size,
+with the lambda invocations replaced by in-process handler calls (see sfn_harness.py),
+against the orcabus_api_tools fakes and a local directory S3 stand-in (see bench_suite.py).
+
+1. fastq_set_generation
+2. fastq_set_add_read_set
+3. add_missing_fingerprints
+4. trigger_somalier_extract, once per workflow run on the run
+5. handle_sequencing_run_failure
+
+For each state machine we print the simulated critical path (end to end) latency,
+the state transitions, child executions, retries, lambda invocations and api / object store requests.
+The critical path includes the one day wait in add_missing_fingerprints, it is also reported on its own as waitSeconds.
+
+The distributed maps run over the batches planned by the lambdas (see fastq_glue_tools.batch_planner),
+the planner settings can be changed with --env, and map settings can be overridden by state name,
+to compare batching and concurrency settings, i.e
+
+python3 app/benchmarks/bench_step_functions.py --num-libraries 1000 \
+  --env FASTQ_GLUE_BATCH_TARGET_WORK=60 \
+  --override "For each library (batched).MaxConcurrency=1"
+
+Simulated latencies can be changed with --latency, i.e --latency apiRequestSeconds=0.2,
+and transient lambda throttling can be injected with --transient-failure-rate.
+"""
+
+# Standard imports
+import json
+import argparse
+import tempfile
+from collections import Counter
+from os import environ
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, TypedDict
+
+# Local imports
+from bench_suite import BenchEnvironment, check_read_sets_added
+from sfn_harness import (
+    DEFAULT_LATENCY_MODEL,
+    ExecutionStats,
+    LatencyModel,
+    StepFunctionHarness,
+    apply_template_overrides,
+    check_template_overrides,
+    load_state_machine_template
+)
+from synthetic_run import Platform, SyntheticRun, generate_synthetic_run
+
+# Globals
+DEFAULT_NUM_LIBRARIES_LIST = [10, 100, 1000]
+DEFAULT_NUM_LANES = 4
+DEFAULT_PLATFORM: Platform = "NovaSeqX"
+
+TEMPLATE_NAMES = [
+    "fastq_set_generation",
+    "fastq_set_add_read_set",
+    "add_missing_fingerprints",
+    "trigger_somalier_extract",
+    "handle_sequencing_run_failure",
+]
+
+
+class RunSizeResult(TypedDict):
+    numLibraries: int
+    numLanes: int
+    numWorkflowRuns: int
+    stepFunctions: Dict[str, ExecutionStats]
+
+
+def get_execution_inputs(template_name: str, synthetic_run: SyntheticRun) -> List[Dict[str, Any]]:
+    if template_name == "fastq_set_add_read_set":
+        return [{"instrumentRunId": synthetic_run['instrumentRunId'], "outputUri": synthetic_run['outputUri']}]
+    if template_name == "trigger_somalier_extract":
+        return list(map(
+            lambda workflow_run_iter_: {"workflowRunObj": workflow_run_iter_['workflowRunObj']},
+            synthetic_run['workflowRuns']
+        ))
+    return [{"instrumentRunId": synthetic_run['instrumentRunId']}]
+
+
+def merge_execution_stats(execution_stats_list: List[ExecutionStats]) -> ExecutionStats:
+    """
+    Sum the stats of several executions of the same state machine (assumed to run one after the other)
+    :param execution_stats_list:
+    :return:
+    """
+    return {
+        "criticalPathSeconds": sum(map(lambda stats_iter_: stats_iter_['criticalPathSeconds'], execution_stats_list)),
+        "waitSeconds": sum(map(lambda stats_iter_: stats_iter_['waitSeconds'], execution_stats_list)),
+        "retrySeconds": sum(map(lambda stats_iter_: stats_iter_['retrySeconds'], execution_stats_list)),
+        "stateTransitions": sum(map(lambda stats_iter_: stats_iter_['stateTransitions'], execution_stats_list)),
+        "childExecutions": sum(map(lambda stats_iter_: stats_iter_['childExecutions'], execution_stats_list)),
+        "retries": sum(map(lambda stats_iter_: stats_iter_['retries'], execution_stats_list)),
+        "lambdaInvocations": dict(sum(
+            map(lambda stats_iter_: Counter(stats_iter_['lambdaInvocations']), execution_stats_list),
+            Counter()
+        )),
+        "requests": dict(sum(
+            map(lambda stats_iter_: Counter(stats_iter_['requests']), execution_stats_list),
+            Counter()
+        )),
+        "computeSeconds": sum(map(lambda stats_iter_: stats_iter_['computeSeconds'], execution_stats_list)),
+    }
+
+
+def run_step_functions(
+        bench_environment: BenchEnvironment,
+        harness: StepFunctionHarness,
+        state_machines: Dict[str, Dict[str, Any]],
+        synthetic_run: SyntheticRun
+) -> Dict[str, ExecutionStats]:
+    with tempfile.TemporaryDirectory(prefix="bench_step_functions_") as local_object_store_dir:
+        bench_environment.reset(local_object_store_dir)
+        bench_environment.seed(synthetic_run)
+
+        bench_environment.request_listeners.append(harness.record_request)
+        try:
+            step_function_stats = {}
+            for template_name_iter_ in TEMPLATE_NAMES:
+                step_function_stats[template_name_iter_] = merge_execution_stats(list(map(
+                    lambda execution_input_iter_: harness.start_execution(
+                        state_machines[template_name_iter_], execution_input_iter_
+                    )[1],
+                    get_execution_inputs(template_name_iter_, synthetic_run)
+                )))
+                if template_name_iter_ == "fastq_set_add_read_set":
+                    check_read_sets_added(bench_environment, synthetic_run)
+        finally:
+            bench_environment.request_listeners.remove(harness.record_request)
+
+    return step_function_stats
+
+
+def parse_override(override: str) -> Tuple[str, str, int]:
+    """
+    Parse 'State name.Field=value'
+    :param override:
+    :return:
+    """
+    state_field, value = override.rsplit("=", 1)
+    state_name, field_name = state_field.rsplit(".", 1)
+    return state_name, field_name, int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--num-libraries", action="append", type=int, dest="num_libraries_list",
+        help=f"Run size, may be given more than once, defaults to {DEFAULT_NUM_LIBRARIES_LIST}"
+    )
+    parser.add_argument("--num-lanes", type=int, default=DEFAULT_NUM_LANES)
+    parser.add_argument("--platform", choices=["NovaSeq6000", "NovaSeqX"], default=DEFAULT_PLATFORM)
+    parser.add_argument(
+        "--override", action="append", default=[],
+        help="Map setting by state name, 'State name.MaxConcurrency=N' or 'State name.MaxItemsPerBatch=N'"
+    )
+    parser.add_argument(
+        "--env", action="append", default=[],
+        help="Lambda environment variable, 'NAME=value', i.e FASTQ_GLUE_BATCH_TARGET_WORK=60"
+    )
+    parser.add_argument(
+        "--latency", action="append", default=[],
+        help=f"Simulated latency, 'name=seconds', names are {', '.join(DEFAULT_LATENCY_MODEL.keys())}"
+    )
+    parser.add_argument("--transient-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", type=Path, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    template_overrides: Dict[str, Dict[str, int]] = {}
+    for override_iter_ in args.override:
+        state_name, field_name, value = parse_override(override_iter_)
+        template_overrides.setdefault(state_name, {})[field_name] = value
+
+    latency_model: LatencyModel = dict(DEFAULT_LATENCY_MODEL)
+    for latency_iter_ in args.latency:
+        latency_name, latency_value = latency_iter_.split("=", 1)
+        if latency_name not in latency_model:
+            raise ValueError(f"Unknown latency {latency_name}")
+        latency_model[latency_name] = float(latency_value)
+
+    lambda_environment = dict(map(lambda env_iter_: tuple(env_iter_.split("=", 1)), args.env))
+    environ.update(lambda_environment)
+
+    check_template_overrides(
+        list(map(load_state_machine_template, TEMPLATE_NAMES)),
+        template_overrides
+    )
+    state_machines = dict(map(
+        lambda template_name_iter_: (
+            template_name_iter_,
+            apply_template_overrides(load_state_machine_template(template_name_iter_), template_overrides)
+        ),
+        TEMPLATE_NAMES
+    ))
+
+    bench_environment = BenchEnvironment()
+
+    results: Dict[str, Any] = {
+        "platform": args.platform,
+        "overrides": template_overrides,
+        "environment": lambda_environment,
+        "latencyModel": latency_model,
+        "transientFailureRate": args.transient_failure_rate,
+        "runSizes": [],
+    }
+    for num_libraries_iter_ in (
+            args.num_libraries_list if args.num_libraries_list is not None else DEFAULT_NUM_LIBRARIES_LIST
+    ):
+        synthetic_run = generate_synthetic_run(
+            platform=args.platform,
+            num_lanes=args.num_lanes,
+            num_libraries=num_libraries_iter_,
+            seed=args.seed,
+        )
+        # A new harness per run size, so each starts with cold lambdas
+        harness = StepFunctionHarness(
+            bench_environment.get_lambda_handlers(),
+            latency_model=latency_model,
+            transient_failure_rate=args.transient_failure_rate,
+            seed=args.seed,
+        )
+        run_size_result: RunSizeResult = {
+            "numLibraries": num_libraries_iter_,
+            "numLanes": args.num_lanes,
+            "numWorkflowRuns": len(synthetic_run['workflowRuns']),
+            "stepFunctions": run_step_functions(bench_environment, harness, state_machines, synthetic_run),
+        }
+        results['runSizes'].append(run_size_result)
+
+    print(json.dumps(results, indent=2))
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,662 @@
+#!/usr/bin/env python3
+
+"""
+Offline benchmark suite for the lambda handlers
+
+For each scenario, a synthetic run (see synthetic_run.py) is pushed through the handlers in step function order,
+against the in-process orcabus_api_tools fakes and a local directory S3 stand-in (LOCAL_OBJECT_STORE_DIR)
+
+1. Fastq set generation:
+   invalidate_samplesheet_cache, get_library_id_list_from_samplesheet, plan_fastq_set_creation (which plans the batches),
+   then get_bclconvert_data_from_samplesheet per planned batch and create_fastq_set_object per library
+2. Add read sets:
+   build_run_reports_cache, build_run_manifest, plan_read_set_updates,
+   then add_read_sets_to_fastq_objects per planned batch
+3. Add missing fingerprints:
+   find_missing_fingerprints, then run_extract_fingerprint per planned batch
+4. Trigger somalier extract, per workflow run:
+   get_bam_by_library_id, then get_fastq_set_id_by_library and run_extract_fingerprint per bam
+5. Handle sequencing run failure:
+   get_fastq_and_fastq_set_ids_from_instrument_run_id,
+   then unlink_and_invalidate_fastqs per planned batch
+
+Events and responses are passed through json, as they would be by the lambda runtime.
+Module level caches are kept across invocations (as in a warm lambda) and cleared between scenarios.
+
+For each handler we record the number of invocations, the total and mean wall time (of the fastest of --repeats passes),
+the peak traced memory of any one invocation above the memory held before it
+(from a second pass under tracemalloc, skip with --no-memory),
+and the number of requests made to each fake api endpoint and to the object store.
+
+Results are printed as JSON, use --output to also write them to a file,
+and --compare to compare against the results of a previous commit, i.e
+
+python3 app/benchmarks/bench_suite.py --output app/benchmarks/results/$(git rev-parse --short HEAD).json
+python3 app/benchmarks/bench_suite.py --compare app/benchmarks/results/<previous commit>.json
+"""
+
+# Standard imports
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import importlib
+import subprocess
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timezone
+from os import environ
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypedDict
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import APP_DIR, LAMBDAS_DIR, add_layer_to_path, discard_handler_metrics
+from fake_orcabus_api_tools import (
+    FakeFastqManager,
+    FakeSequenceRunManager,
+    FakeFileManager,
+    FakeWorkflowManager,
+    install_fake_orcabus_api_tools
+)
+from synthetic_run import (
+    Platform,
+    SyntheticRun,
+    generate_synthetic_run,
+    get_bclconvert_data_rows,
+    write_synthetic_run_reports
+)
+
+# Globals
+CACHE_ROOT_URI = "s3://synthetic-cache-bucket/cache/fastq-glue/"
+DEFAULT_REFERENCE_NAME = "hg38"
+DEFAULT_SCENARIO_NAMES = ["novaseq6000-1-lane-10-libraries", "novaseqx-4-lanes-500-libraries"]
+
+# Object store methods, by the S3 request they make
+OBJECT_STORE_REQUEST_NAMES = {
+    "get_etag": "head_object",
+    "get_object_bytes": "get_object",
+    "get_object_stream": "get_object",
+    "put_object_bytes": "put_object",
+    "delete_object": "delete_object",
+}
+
+
+class ScenarioConfig(TypedDict):
+    platform: Platform
+    numLanes: int
+    numLibraries: int
+    seed: int
+
+
+class HandlerResult(TypedDict):
+    invocations: int
+    wallSeconds: float
+    meanSeconds: float
+    peakMemoryBytes: Optional[int]
+    apiCalls: Dict[str, int]
+    objectStoreCalls: Dict[str, int]
+
+
+class ScenarioResult(TypedDict):
+    config: ScenarioConfig
+    wallSeconds: float
+    handlers: Dict[str, HandlerResult]
+
+
+SCENARIOS: Dict[str, ScenarioConfig] = {
+    "novaseq6000-1-lane-10-libraries": {
+        "platform": "NovaSeq6000",
+        "numLanes": 1,
+        "numLibraries": 10,
+        "seed": 1,
+    },
+    "novaseq6000-4-lanes-100-libraries": {
+        "platform": "NovaSeq6000",
+        "numLanes": 4,
+        "numLibraries": 100,
+        "seed": 2,
+    },
+    "novaseqx-4-lanes-500-libraries": {
+        "platform": "NovaSeqX",
+        "numLanes": 4,
+        "numLibraries": 500,
+        "seed": 3,
+    },
+    "novaseqx-8-lanes-5000-libraries": {
+        "platform": "NovaSeqX",
+        "numLanes": 8,
+        "numLibraries": 5000,
+        "seed": 4,
+    },
+}
+
+LAMBDA_NAMES = [
+    "invalidate_samplesheet_cache",
+    "get_library_id_list_from_samplesheet",
+    "plan_fastq_set_creation",
+    "get_bclconvert_data_from_samplesheet",
+    "create_fastq_set_object",
+    "build_run_reports_cache",
+    "build_run_manifest",
+    "plan_read_set_updates",
+    "add_read_sets_to_fastq_objects",
+    "find_missing_fingerprints",
+    "run_extract_fingerprint",
+    "get_bam_by_library_id",
+    "get_fastq_set_id_by_library",
+    "get_fastq_and_fastq_set_ids_from_instrument_run_id",
+    "unlink_and_invalidate_fastqs",
+]
+
+
+class FakeSpread:
+    """
+    Stand-in for gspread_pandas.Spread, the year tab lists the topups and reruns of the synthetic run
+    """
+
+    library_id_list: List[str] = []
+
+    def __init__(self, spread: str, sheet: str):
+        self.sheet = sheet
+
+    def sheet_to_df(self, index: int = 0) -> pd.DataFrame:
+        return pd.DataFrame({"LibraryID": FakeSpread.library_id_list})
+
+
+class BenchEnvironment:
+    """
+    The fakes, the object store request counter and the lambda modules, shared by every scenario.
+    Request listeners are called with the service name (or 's3') and endpoint name of every request
+    """
+
+    def __init__(self):
+        self.fake_fastq_manager = FakeFastqManager()
+        self.fake_sequence_run_manager = FakeSequenceRunManager()
+        self.fake_file_manager = FakeFileManager()
+        self.fake_workflow_manager = FakeWorkflowManager()
+        self.object_store_counter: Counter = Counter()
+        self.request_listeners: List[Callable[[str, str], None]] = []
+
+        for service_name_iter_, fake_iter_ in self.get_fakes_by_service_name().items():
+            fake_iter_.on_request = self.get_request_notifier(service_name_iter_)
+
+        install_fake_orcabus_api_tools(
+            self.fake_fastq_manager,
+            fake_sequence_run_manager=self.fake_sequence_run_manager,
+            fake_file_manager=self.fake_file_manager,
+            fake_workflow_manager=self.fake_workflow_manager,
+        )
+        add_layer_to_path()
+        discard_handler_metrics()
+        self.install_object_store_counter()
+
+        from fastq_glue_tools import tracking_sheet
+        tracking_sheet.get_spread = FakeSpread
+        tracking_sheet.get_tracking_sheet_id = lambda: "synthetic-tracking-sheet-id"
+
+        self.lambda_modules = dict(map(
+            lambda lambda_name_iter_: (lambda_name_iter_, self.import_lambda_module(lambda_name_iter_)),
+            LAMBDA_NAMES
+        ))
+
+    def get_fakes_by_service_name(self) -> Dict[str, Any]:
+        return {
+            "fastq": self.fake_fastq_manager,
+            "sequence": self.fake_sequence_run_manager,
+            "filemanager": self.fake_file_manager,
+            "workflow": self.fake_workflow_manager,
+        }
+
+    def get_request_notifier(self, service_name: str) -> Callable[[str], None]:
+        def notify_request_listeners(endpoint_name: str):
+            for request_listener_iter_ in self.request_listeners:
+                request_listener_iter_(service_name, endpoint_name)
+        return notify_request_listeners
+
+    def get_lambda_handlers(self) -> Dict[str, Callable[[Dict[str, Any], Any], Any]]:
+        return dict(map(
+            lambda lambda_name_iter_: (lambda_name_iter_, self.lambda_modules[lambda_name_iter_].handler),
+            LAMBDA_NAMES
+        ))
+
+    @staticmethod
+    def import_lambda_module(lambda_name: str) -> Any:
+        sys.path.insert(0, str(LAMBDAS_DIR / f"{lambda_name}_py"))
+        return importlib.import_module(lambda_name)
+
+    def install_object_store_counter(self):
+        from fastq_glue_tools.object_store import LocalObjectStore
+
+        notify_request_listeners = self.get_request_notifier("s3")
+
+        def get_counted_method(method_name: str, method: Callable) -> Callable:
+            def counted_method(object_store_self, *args, **kwargs):
+                self.object_store_counter[OBJECT_STORE_REQUEST_NAMES[method_name]] += 1
+                notify_request_listeners(OBJECT_STORE_REQUEST_NAMES[method_name])
+                return method(object_store_self, *args, **kwargs)
+            return counted_method
+
+        for method_name_iter_ in OBJECT_STORE_REQUEST_NAMES.keys():
+            setattr(
+                LocalObjectStore,
+                method_name_iter_,
+                get_counted_method(method_name_iter_, getattr(LocalObjectStore, method_name_iter_))
+            )
+
+    def get_api_call_counter(self) -> Counter:
+        api_call_counter = Counter()
+        for service_name_iter_, fake_iter_ in self.get_fakes_by_service_name().items():
+            for endpoint_name_iter_, count_iter_ in fake_iter_.request_counter.items():
+                api_call_counter[f"{service_name_iter_}.{endpoint_name_iter_}"] = count_iter_
+        return api_call_counter
+
+    def reset(self, local_object_store_dir: str):
+        """
+        Reset the fakes and the module level caches, and point the object store at an empty directory
+        :param local_object_store_dir:
+        :return:
+        """
+        from fastq_glue_tools.portal_run_files import clear_portal_run_file_index_memory_cache
+        from fastq_glue_tools.run_manifest import clear_run_manifest_memory_cache
+        from fastq_glue_tools.samplesheet_cache import clear_samplesheet_memory_cache
+        from fastq_glue_tools.tracking_sheet import clear_tracking_sheet_cache
+
+        for fake_iter_ in self.get_fakes_by_service_name().values():
+            fake_iter_.reset()
+        self.object_store_counter.clear()
+
+        clear_portal_run_file_index_memory_cache()
+        clear_run_manifest_memory_cache()
+        clear_samplesheet_memory_cache()
+        clear_tracking_sheet_cache()
+
+        environ["LOCAL_OBJECT_STORE_DIR"] = local_object_store_dir
+        environ["FASTQ_GLUE_CACHE_URI"] = CACHE_ROOT_URI
+        # Leases are held in this process, as the handlers are
+        environ["LOCAL_LOCK_STORE_PATH"] = ":memory:"
+        # Each harness execution has its own execution id, so journals never collide between runs
+        environ["LOCAL_JOURNAL_STORE_PATH"] = ":memory:"
+
+    def seed(self, synthetic_run: SyntheticRun):
+        """
+        Load the synthetic run into the fakes and the object store
+        :param synthetic_run:
+        :return:
+        """
+        from fastq_glue_tools.object_store import get_object_store
+
+        self.fake_sequence_run_manager.add_samplesheet(synthetic_run['instrumentRunId'], synthetic_run['samplesheet'])
+        write_synthetic_run_reports(synthetic_run, get_object_store())
+
+        # Topups and reruns have a current fastq set on the previous run
+        for library_id_iter_ in synthetic_run['topupLibraryIdList'] + synthetic_run['rerunLibraryIdList']:
+            self.fake_fastq_manager.create_fastq_set_object(
+                library={"libraryId": library_id_iter_},
+                allowAdditionalFastq=False,
+                isCurrentFastqSet=True,
+                fastqSet=list(map(
+                    lambda bclconvert_row_iter_: {
+                        "index": f"{bclconvert_row_iter_['index']}+{bclconvert_row_iter_['index2']}",
+                        "lane": bclconvert_row_iter_['lane'],
+                        "instrumentRunId": synthetic_run['previousInstrumentRunId'],
+                        "library": {"libraryId": library_id_iter_},
+                    },
+                    get_bclconvert_data_rows(synthetic_run, library_id_iter_)
+                ))
+            )
+        FakeSpread.library_id_list = (
+            list(map(lambda library_id_iter_: f"{library_id_iter_}_topup", synthetic_run['topupLibraryIdList'])) +
+            list(map(lambda library_id_iter_: f"{library_id_iter_}_rerun", synthetic_run['rerunLibraryIdList']))
+        )
+
+        for workflow_run_iter_ in synthetic_run['workflowRuns']:
+            self.fake_workflow_manager.add_payload(
+                workflow_run_iter_['workflowRunObj']['orcabusId'],
+                workflow_run_iter_['payload']
+            )
+            self.fake_file_manager.add_files(
+                workflow_run_iter_['workflowRunObj']['portalRunId'],
+                workflow_run_iter_['fileList']
+            )
+
+        # Seeding is not part of the benchmark
+        self.fake_fastq_manager.request_counter.clear()
+        self.object_store_counter.clear()
+
+
+class ScenarioRecorder:
+    """
+    Invoke the handlers and record their wall time, memory and requests
+    """
+
+    def __init__(self, bench_environment: BenchEnvironment, trace_memory: bool):
+        self.bench_environment = bench_environment
+        self.trace_memory = trace_memory
+        self.handler_results: Dict[str, HandlerResult] = {}
+
+    def invoke(self, lambda_name: str, event: Dict[str, Any]) -> Any:
+        api_call_counter_before = self.bench_environment.get_api_call_counter()
+        object_store_counter_before = Counter(self.bench_environment.object_store_counter)
+        event = json.loads(json.dumps(event))
+
+        # Peak memory is measured above the memory already held before the invocation
+        traced_memory_bytes_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        response = self.bench_environment.lambda_modules[lambda_name].handler(event, None)
+        wall_seconds = time.perf_counter() - start_time
+        peak_memory_bytes = (
+            tracemalloc.get_traced_memory()[1] - traced_memory_bytes_before
+            if self.trace_memory
+            else None
+        )
+
+        handler_result = self.handler_results.setdefault(lambda_name, {
+            "invocations": 0,
+            "wallSeconds": 0.0,
+            "meanSeconds": 0.0,
+            "peakMemoryBytes": None,
+            "apiCalls": {},
+            "objectStoreCalls": {},
+        })
+        handler_result['invocations'] += 1
+        handler_result['wallSeconds'] += wall_seconds
+        handler_result['meanSeconds'] = handler_result['wallSeconds'] / handler_result['invocations']
+        if peak_memory_bytes is not None:
+            handler_result['peakMemoryBytes'] = max(handler_result['peakMemoryBytes'] or 0, peak_memory_bytes)
+        handler_result['apiCalls'] = dict(
+            Counter(handler_result['apiCalls']) +
+            (self.bench_environment.get_api_call_counter() - api_call_counter_before)
+        )
+        handler_result['objectStoreCalls'] = dict(
+            Counter(handler_result['objectStoreCalls']) +
+            (self.bench_environment.object_store_counter - object_store_counter_before)
+        )
+
+        return json.loads(json.dumps(response))
+
+
+def run_fastq_set_generation(recorder: ScenarioRecorder, instrument_run_id: str):
+    recorder.invoke("invalidate_samplesheet_cache", {"instrumentRunId": instrument_run_id})
+    library_id_list_response = recorder.invoke(
+        "get_library_id_list_from_samplesheet", {"instrumentRunId": instrument_run_id}
+    )
+    batch_list = recorder.invoke(
+        "plan_fastq_set_creation",
+        {
+            "instrumentRunId": instrument_run_id,
+            "libraryIdList": library_id_list_response['libraryIdList'],
+            "numLanesByLibraryId": library_id_list_response['numLanesByLibraryId'],
+        }
+    )['batchList']
+
+    for batch_iter_ in batch_list:
+        bclconvert_data_by_library = recorder.invoke(
+            "get_bclconvert_data_from_samplesheet",
+            {"libraryIdList": batch_iter_['items'], "instrumentRunId": instrument_run_id}
+        )['bclConvertDataByLibrary']
+        for library_iter_ in bclconvert_data_by_library:
+            recorder.invoke("create_fastq_set_object", {
+                "libraryId": library_iter_['libraryId'],
+                "bclConvertData": library_iter_['bclConvertData'],
+                "instrumentRunId": instrument_run_id,
+                "fastqSetCreationAction": batch_iter_['fastqSetCreationPlan'][library_iter_['libraryId']],
+            })
+
+
+def run_add_read_sets(recorder: ScenarioRecorder, synthetic_run: SyntheticRun):
+    instrument_run_id = synthetic_run['instrumentRunId']
+    recorder.invoke("build_run_reports_cache", {
+        "fastqListUri": synthetic_run['fastqListUri'],
+        "demuxStatsUri": synthetic_run['demuxStatsUri'],
+    })
+    run_manifest_uri = recorder.invoke("build_run_manifest", {
+        "instrumentRunId": instrument_run_id,
+        "fastqListUri": synthetic_run['fastqListUri'],
+        "demuxStatsUri": synthetic_run['demuxStatsUri'],
+    })['runManifestUri']
+    read_set_update_plan = recorder.invoke(
+        "plan_read_set_updates", {"instrumentRunId": instrument_run_id, "runManifestUri": run_manifest_uri}
+    )
+
+    for batch_iter_ in read_set_update_plan['batchList']:
+        recorder.invoke("add_read_sets_to_fastq_objects", {
+            "libraryIdList": batch_iter_['items'],
+            "readSetUpdatesUri": read_set_update_plan['readSetUpdatesUri'],
+        })
+
+
+def run_add_missing_fingerprints(recorder: ScenarioRecorder, instrument_run_id: str):
+    batch_list = recorder.invoke(
+        "find_missing_fingerprints", {"instrumentRunId": instrument_run_id}
+    )['batchList']
+    for batch_iter_ in batch_list:
+        recorder.invoke("run_extract_fingerprint", {
+            "fastqSetIdList": batch_iter_['items'],
+            "referenceName": DEFAULT_REFERENCE_NAME,
+        })
+
+
+def run_trigger_somalier_extract(recorder: ScenarioRecorder, synthetic_run: SyntheticRun):
+    for workflow_run_iter_ in synthetic_run['workflowRuns']:
+        bam_file_by_library_id_list = recorder.invoke(
+            "get_bam_by_library_id", {"workflowRunObj": workflow_run_iter_['workflowRunObj']}
+        )['bamFileByLibraryIdList']
+        for bam_file_iter_ in bam_file_by_library_id_list:
+            fastq_set_id = recorder.invoke(
+                "get_fastq_set_id_by_library", {"libraryId": bam_file_iter_['libraryId']}
+            )['fastqSetId']
+            recorder.invoke("run_extract_fingerprint", {
+                "fastqSetId": fastq_set_id,
+                "bamUri": bam_file_iter_['bamUri'],
+                "bamSizeBytes": bam_file_iter_['bamSizeBytes'],
+                "referenceName": bam_file_iter_['referenceName'],
+            })
+
+
+def run_handle_sequencing_run_failure(recorder: ScenarioRecorder, instrument_run_id: str):
+    batch_list = recorder.invoke(
+        "get_fastq_and_fastq_set_ids_from_instrument_run_id", {"instrumentRunId": instrument_run_id}
+    )['batchList']
+    for batch_iter_ in batch_list:
+        fastq_clean_up_summary = recorder.invoke("unlink_and_invalidate_fastqs", {
+            "fastqAndFastqSetIdPairs": batch_iter_['items'],
+        })
+        assert fastq_clean_up_summary['failedCount'] == 0, \
+            f"Expected every fastq to be cleaned up, got {fastq_clean_up_summary['failedList']}"
+
+
+def check_read_sets_added(bench_environment: BenchEnvironment, synthetic_run: SyntheticRun):
+    fastq_list = list(filter(
+        lambda fastq_iter_: fastq_iter_['instrumentRunId'] == synthetic_run['instrumentRunId'],
+        bench_environment.fake_fastq_manager.fastqs.values()
+    ))
+    assert len(fastq_list) == len(synthetic_run['samplesheet']['bclconvertData']), \
+        "Expected one fastq per library per lane"
+    assert all(map(lambda fastq_iter_: fastq_iter_['readSet'] is not None, fastq_list)), \
+        "Expected every fastq on the run to have a read set"
+
+
+def run_scenario_pass(
+        bench_environment: BenchEnvironment,
+        synthetic_run: SyntheticRun,
+        trace_memory: bool
+) -> ScenarioRecorder:
+    with tempfile.TemporaryDirectory(prefix="bench_suite_") as local_object_store_dir:
+        bench_environment.reset(local_object_store_dir)
+        bench_environment.seed(synthetic_run)
+
+        recorder = ScenarioRecorder(bench_environment, trace_memory=trace_memory)
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            run_fastq_set_generation(recorder, synthetic_run['instrumentRunId'])
+            run_add_read_sets(recorder, synthetic_run)
+            check_read_sets_added(bench_environment, synthetic_run)
+            run_add_missing_fingerprints(recorder, synthetic_run['instrumentRunId'])
+            run_trigger_somalier_extract(recorder, synthetic_run)
+            run_handle_sequencing_run_failure(recorder, synthetic_run['instrumentRunId'])
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+
+    return recorder
+
+
+def run_scenario(
+        bench_environment: BenchEnvironment,
+        scenario_config: ScenarioConfig,
+        trace_memory: bool,
+        repeats: int = 1
+) -> ScenarioResult:
+    synthetic_run = generate_synthetic_run(
+        platform=scenario_config['platform'],
+        num_lanes=scenario_config['numLanes'],
+        num_libraries=scenario_config['numLibraries'],
+        seed=scenario_config['seed'],
+    )
+
+    # Keep the fastest pass of each handler
+    handler_results: Dict[str, HandlerResult] = {}
+    for _ in range(repeats):
+        for lambda_name_iter_, handler_result_iter_ in run_scenario_pass(
+                bench_environment, synthetic_run, trace_memory=False
+        ).handler_results.items():
+            if (
+                    lambda_name_iter_ not in handler_results or
+                    handler_result_iter_['wallSeconds'] < handler_results[lambda_name_iter_]['wallSeconds']
+            ):
+                handler_results[lambda_name_iter_] = handler_result_iter_
+
+    # Tracing memory slows every allocation, so memory is measured in a second pass
+    if trace_memory:
+        for lambda_name_iter_, memory_result_iter_ in run_scenario_pass(
+                bench_environment, synthetic_run, trace_memory=True
+        ).handler_results.items():
+            handler_results[lambda_name_iter_]['peakMemoryBytes'] = memory_result_iter_['peakMemoryBytes']
+
+    return {
+        "config": scenario_config,
+        "wallSeconds": sum(map(lambda handler_result_iter_: handler_result_iter_['wallSeconds'], handler_results.values())),
+        "handlers": handler_results,
+    }
+
+
+def get_git_commit() -> Dict[str, Any]:
+    try:
+        return {
+            "gitCommit": subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip(),
+            "gitDirty": len(subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                cwd=APP_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()) > 0,
+        }
+    except (OSError, subprocess.CalledProcessError):
+        return {"gitCommit": None, "gitDirty": None}
+
+
+def get_comparison(results: Dict[str, Any], baseline_results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare the wall time, memory and api calls of each handler in each scenario against the baseline results.
+    Ratios are current / baseline, so lower is better.
+    :param results:
+    :param baseline_results:
+    :return:
+    """
+    def get_ratio(current_value: Optional[float], baseline_value: Optional[float]) -> Optional[float]:
+        if current_value is None or not baseline_value:
+            return None
+        return round(current_value / baseline_value, 3)
+
+    comparison = {}
+    for scenario_name_iter_, scenario_result_iter_ in results['scenarios'].items():
+        baseline_scenario_result = baseline_results['scenarios'].get(scenario_name_iter_, None)
+        if baseline_scenario_result is None:
+            continue
+        comparison[scenario_name_iter_] = {
+            "wallSecondsRatio": get_ratio(
+                scenario_result_iter_['wallSeconds'], baseline_scenario_result['wallSeconds']
+            ),
+            "handlers": {
+                lambda_name_iter_: {
+                    "wallSecondsRatio": get_ratio(
+                        handler_result_iter_['wallSeconds'],
+                        baseline_scenario_result['handlers'][lambda_name_iter_]['wallSeconds']
+                    ),
+                    "peakMemoryBytesRatio": get_ratio(
+                        handler_result_iter_['peakMemoryBytes'],
+                        baseline_scenario_result['handlers'][lambda_name_iter_]['peakMemoryBytes']
+                    ),
+                    "apiCallsDelta": sum(handler_result_iter_['apiCalls'].values()) - sum(
+                        baseline_scenario_result['handlers'][lambda_name_iter_]['apiCalls'].values()
+                    ),
+                }
+                for lambda_name_iter_, handler_result_iter_ in scenario_result_iter_['handlers'].items()
+                if lambda_name_iter_ in baseline_scenario_result['handlers']
+            },
+        }
+
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--scenario", action="append", choices=list(SCENARIOS.keys()), dest="scenario_names",
+        help=f"Scenario to run, may be given more than once, defaults to {', '.join(DEFAULT_SCENARIO_NAMES)}"
+    )
+    parser.add_argument("--all", action="store_true", help="Run every scenario")
+    parser.add_argument("--repeats", type=int, default=1, help="Timed passes per scenario, the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--output", type=Path, help="Also write the results to this file")
+    parser.add_argument("--compare", type=Path, help="Results of a previous run to compare against")
+    args = parser.parse_args()
+
+    scenario_names = (
+        list(SCENARIOS.keys()) if args.all
+        else args.scenario_names if args.scenario_names is not None
+        else DEFAULT_SCENARIO_NAMES
+    )
+
+    bench_environment = BenchEnvironment()
+
+    results = {
+        **get_git_commit(),
+        "createdAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.platform(),
+        "scenarios": dict(map(
+            lambda scenario_name_iter_: (
+                scenario_name_iter_,
+                run_scenario(
+                    bench_environment,
+                    SCENARIOS[scenario_name_iter_],
+                    trace_memory=not args.no_memory,
+                    repeats=args.repeats
+                )
+            ),
+            scenario_names
+        )),
+    }
+
+    if args.compare is not None:
+        results['comparison'] = get_comparison(results, json.loads(args.compare.read_text()))
+
+    print(json.dumps(results, indent=2))
+
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the tracking sheet cache against the previous per-call download of the year tab.
+
+Google Sheets and SSM are replaced by in-process fakes with a fixed latency per request.
+Each year tab has 5,000 rows, and 40 re-sequenced libraries (across two years) are classified
+as topup or rerun, as create_fastq_set_object does for libraries with an existing current fastq set
+(once per warm invocation of the lambda).
+
+Classifications must be identical for both paths.
+
+python3 app/benchmarks/bench_tracking_sheet_cache.py
+"""
+
+# Standard imports
+import json
+from os import environ
+from time import sleep
+from typing import Dict, List
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from bench_utils import add_layer_to_path, time_callable
+
+add_layer_to_path()
+
+from fastq_glue_tools import runtime, tracking_sheet
+from fastq_glue_tools.tracking_sheet import (
+    clear_tracking_sheet_cache,
+    get_tracking_sheet_classification,
+    get_year_from_library_id,
+)
+
+# Globals
+NUM_ROWS_PER_YEAR = 5000
+YEARS = [2024, 2025]
+NUM_LIBRARIES = 40
+SHEET_LATENCY_SECONDS = 0.2
+SSM_LATENCY_SECONDS = 0.02
+
+
+class FakeSpread:
+    """
+    Stand-in for gspread_pandas.Spread, serves a synthetic year tab
+    """
+    num_downloads = 0
+
+    def __init__(self, spread: str, sheet: str):
+        self.spread = spread
+        self.sheet = sheet
+
+    def sheet_to_df(self, index: int = 0) -> pd.DataFrame:
+        FakeSpread.num_downloads += 1
+        sleep(SHEET_LATENCY_SECONDS)
+        year_suffix = int(self.sheet) % 100
+        return pd.DataFrame({
+            "LibraryID": [
+                (
+                    f"L{year_suffix:02d}{row_iter_:05d}" +
+                    ["", "_topup", "_rerun", ""][row_iter_ % 4]
+                    if row_iter_ % 10 != 9
+                    else ""
+                )
+                for row_iter_ in range(NUM_ROWS_PER_YEAR)
+            ],
+            "SampleID": [f"PRJ{row_iter_:06d}" for row_iter_ in range(NUM_ROWS_PER_YEAR)],
+        })
+
+
+class FakeSsmClient:
+    """
+    Stand-in for the boto3 ssm client
+    """
+    num_requests = 0
+
+    def get_parameter(self, Name: str, WithDecryption: bool) -> Dict:
+        FakeSsmClient.num_requests += 1
+        sleep(SSM_LATENCY_SECONDS)
+        return {"Parameter": {"Value": json.dumps({"name": Name})}}
+
+
+def get_library_id_list() -> List[str]:
+    return [
+        f"L{year_iter_ % 100:02d}{library_iter_ * 7:05d}"
+        for year_iter_ in YEARS
+        for library_iter_ in range(NUM_LIBRARIES // len(YEARS))
+    ]
+
+
+# Previous implementation, kept here as the baseline
+def legacy_get_metadata_sheet_for_library_year(year: int) -> pd.DataFrame:
+    tracking_sheet_id = FakeSsmClient().get_parameter(
+        Name=environ[tracking_sheet.METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH_ENV_VAR],
+        WithDecryption=True
+    )["Parameter"]["Value"]
+    return FakeSpread(spread=tracking_sheet_id, sheet=f"{year}").sheet_to_df(index=0).replace("", pd.NA)
+
+
+def legacy_library_id_suffix_in_sheet(library_id: str, suffix: str) -> bool:
+    library_id_list = (
+        legacy_get_metadata_sheet_for_library_year(
+            get_year_from_library_id(library_id)
+        )['LibraryID']
+        .dropna()
+        .unique()
+        .tolist()
+    )
+    return f"{library_id}{suffix}" in library_id_list
+
+
+def legacy_classify(library_id_list: List[str]) -> List[Dict[str, bool]]:
+    # Each library with an existing fastq set called set_google_secrets (one ssm request)
+    # and then is_rerun (one ssm request and one download of the year tab)
+    # is_topup was never called, we classify both here to compare outputs
+    return list(map(
+        lambda library_id_iter_: {
+            "isTopup": legacy_library_id_suffix_in_sheet(library_id_iter_, "_topup"),
+            "isRerun": legacy_library_id_suffix_in_sheet(library_id_iter_, "_rerun"),
+        },
+        library_id_list
+    ))
+
+
+def cached_classify(library_id_list: List[str]) -> List[Dict[str, bool]]:
+    return list(map(
+        lambda library_id_iter_: dict(get_tracking_sheet_classification(
+            library_id_iter_,
+            spread_factory=FakeSpread
+        )),
+        library_id_list
+    ))
+
+
+def main():
+    environ[tracking_sheet.METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH_ENV_VAR] = "/fake/tracking-sheet-id"
+    environ[tracking_sheet.GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH_ENV_VAR] = "/fake/gdrive-auth-json"
+    runtime.get_ssm_client = FakeSsmClient
+
+    library_id_list = get_library_id_list()
+
+    # Outputs must be identical
+    assert legacy_classify(library_id_list) == cached_classify(library_id_list), "Classifications differ"
+    assert any(map(lambda c: c['isTopup'], cached_classify(library_id_list))), "No topups in the synthetic sheet"
+    assert any(map(lambda c: c['isRerun'], cached_classify(library_id_list))), "No reruns in the synthetic sheet"
+
+    # Previous implementation
+    FakeSpread.num_downloads = 0
+    FakeSsmClient.num_requests = 0
+    legacy_timing = time_callable(lambda: legacy_classify(library_id_list), repeats=1)
+    legacy_counts = {
+        "sheetDownloads": FakeSpread.num_downloads,
+        "ssmRequests": FakeSsmClient.num_requests,
+    }
+
+    # Cold cache, i.e the first invocation in a new execution environment
+    FakeSpread.num_downloads = 0
+    FakeSsmClient.num_requests = 0
+    runtime.clear_ssm_parameter_cache()
+    clear_tracking_sheet_cache()
+    cached_timing = time_callable(lambda: cached_classify(library_id_list), repeats=1)
+    cached_counts = {
+        "sheetDownloads": FakeSpread.num_downloads,
+        "ssmRequests": FakeSsmClient.num_requests,
+    }
+
+    print(json.dumps(
+        {
+            "numRowsPerYear": NUM_ROWS_PER_YEAR,
+            "numLibraries": len(library_id_list),
+            "numYears": len(YEARS),
+            "legacy": {**legacy_timing, **legacy_counts},
+            "cached": {**cached_timing, **cached_counts},
+            "speedup": legacy_timing['bestSeconds'] / cached_timing['bestSeconds'],
+        },
+        indent=2
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark helpers
+
+Benchmarks are run from the repository root, i.e
+
+python3 app/benchmarks/bench_samplesheet_index.py
+
+and need the layer (and any lambda directories under test) on the python path.
+"""
+
+# Standard imports
+import sys
+import time
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, Any
+
+# Globals
+APP_DIR = Path(__file__).absolute().parent.parent
+LAMBDAS_DIR = APP_DIR / "lambdas"
+LAYERS_DIR = APP_DIR / "layers"
+FASTQ_GLUE_TOOLS_LAYER_DIR = LAYERS_DIR / "fastq_glue_tools_layer"
+
+
+def add_layer_to_path():
+    if str(FASTQ_GLUE_TOOLS_LAYER_DIR) not in sys.path:
+        sys.path.insert(0, str(FASTQ_GLUE_TOOLS_LAYER_DIR))
+
+
+def discard_handler_metrics():
+    """
+    Handlers write their metrics to stdout, drop them so that they are not mixed in with the benchmark output
+    :return:
+    """
+    add_layer_to_path()
+    from fastq_glue_tools.metrics import set_metrics_sink
+
+    set_metrics_sink(lambda emf_document: None)
+
+
+def add_lambda_to_path(lambda_dir_name: str):
+    lambda_dir = LAMBDAS_DIR / lambda_dir_name
+    if str(lambda_dir) not in sys.path:
+        sys.path.insert(0, str(lambda_dir))
+
+
+def time_callable(
+        func: Callable[[], Any],
+        repeats: int = 5
+) -> Dict[str, float]:
+    """
+    Time a callable, return the best and median wall time in seconds
+    :param func:
+    :param repeats:
+    :return:
+    """
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+
+    return {
+        "bestSeconds": min(timings),
+        "medianSeconds": median(timings),
+    }
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+
+"""
+In-process stand-ins for the orcabus_api_tools modules used by the lambdas.
+
+* FakeFastqManager (orcabus_api_tools.fastq) keeps fastq and fastq set objects in memory
+* FakeSequenceRunManager (orcabus_api_tools.sequence) serves samplesheets and library lists by instrument run id
+* FakeFileManager (orcabus_api_tools.filemanager) serves file listings by portal run id
+* FakeWorkflowManager (orcabus_api_tools.workflow) serves workflow run payloads by workflow run orcabus id
+
+Each fake counts every request by endpoint and can add a fixed latency to each request.
+
+install_fake_orcabus_api_tools registers the fakes in sys.modules,
+so it must be called before any lambda module is imported.
+Lambda modules bind the fake endpoints at import time, so reuse (and reset) a single instance of each fake.
+
+install_orcabus_api_tools_import_stubs instead resolves any orcabus_api_tools.* import to an empty stub module,
+for when we only need to import (not call) a lambda module.
+"""
+
+# Standard imports
+import sys
+import json
+import types
+import threading
+import importlib.abc
+import importlib.machinery
+from collections import Counter
+from copy import deepcopy
+from time import sleep
+from typing import Any, Callable, Dict, List, Optional, Union
+
+
+class FakeService:
+    """
+    Request counting (and latency) shared by the fakes,
+    on_request (if set) is called with the endpoint name of every request
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.request_counter: Counter = Counter()
+        self.lock = threading.Lock()
+        self.on_request: Optional[Callable[[str], None]] = None
+
+    def reset(self):
+        self.request_counter.clear()
+
+    def record(self, endpoint_name: str):
+        if self.latency_seconds > 0:
+            sleep(self.latency_seconds)
+        with self.lock:
+            self.request_counter[endpoint_name] += 1
+        if self.on_request is not None:
+            self.on_request(endpoint_name)
+
+
+class FakeFastqManager(FakeService):
+    """
+    In-memory fastq manager
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        super().__init__(latency_seconds=latency_seconds)
+        self.fastqs: Dict[str, Dict[str, Any]] = {}
+        self.fastq_sets: Dict[str, Dict[str, Any]] = {}
+        self.fastq_set_ids_by_library_id: Dict[str, List[str]] = {}
+        self.fastq_ids_by_instrument_run_id: Dict[str, List[str]] = {}
+        self.num_ids = 0
+
+    def reset(self):
+        super().reset()
+        self.num_ids = 0
+        self.fastqs.clear()
+        self.fastq_sets.clear()
+        self.fastq_set_ids_by_library_id.clear()
+        self.fastq_ids_by_instrument_run_id.clear()
+
+    def add_fastq(self, fastq: Dict[str, Any]):
+        self.fastqs[fastq['id']] = fastq
+        self.fastq_ids_by_instrument_run_id.setdefault(fastq['instrumentRunId'], []).append(fastq['id'])
+
+    def next_id(self, prefix: str) -> str:
+        # Counted under the lock, so concurrent creates never share an id
+        with self.lock:
+            self.num_ids += 1
+            return f"{prefix}.{self.num_ids - 1:026d}"
+
+    def get_fastq_set_with_fastqs(self, fastq_set_id: str) -> Dict[str, Any]:
+        fastq_set = deepcopy(self.fastq_sets[fastq_set_id])
+        fastq_set['fastqSet'] = list(map(
+            lambda fastq_id_iter_: deepcopy(self.fastqs[fastq_id_iter_]),
+            fastq_set['fastqSet']
+        ))
+        return fastq_set
+
+    # Fastq endpoints
+    def create_fastq_object(self, **fastq_kwargs) -> Dict[str, Any]:
+        self.record("create_fastq_object")
+        fastq_id = self.next_id("fqr")
+        self.add_fastq({
+            "id": fastq_id,
+            **deepcopy(fastq_kwargs),
+            "readSet": None,
+            "readCount": None,
+            "baseCountEst": None,
+            "fastqSetId": None,
+        })
+        return deepcopy(self.fastqs[fastq_id])
+
+    def get_fastq(self, fastq_id: str, **kwargs) -> Dict[str, Any]:
+        self.record("get_fastq")
+        return deepcopy(self.fastqs[fastq_id])
+
+    def get_fastqs_in_instrument_run_id(self, instrument_run_id: str) -> List[Dict[str, Any]]:
+        self.record("get_fastqs_in_instrument_run_id")
+        return list(map(
+            lambda fastq_id_iter_: deepcopy(self.fastqs[fastq_id_iter_]),
+            self.fastq_ids_by_instrument_run_id.get(instrument_run_id, [])
+        ))
+
+    def get_fastqs_in_libraries_and_instrument_run_id(
+            self,
+            library_id_list: List[str],
+            instrument_run_id: str
+    ) -> List[Dict[str, Any]]:
+        self.record("get_fastqs_in_libraries_and_instrument_run_id")
+        library_id_set = set(library_id_list)
+        return list(map(
+            deepcopy,
+            filter(
+                lambda fastq_iter_: fastq_iter_['library']['libraryId'] in library_id_set,
+                map(
+                    lambda fastq_id_iter_: self.fastqs[fastq_id_iter_],
+                    self.fastq_ids_by_instrument_run_id.get(instrument_run_id, [])
+                )
+            )
+        ))
+
+    def invalidate_fastq(self, fastq_id: str):
+        self.record("invalidate_fastq")
+        self.fastqs[fastq_id]['isValid'] = False
+
+    def detach_read_set(self, fastq_id: str):
+        self.record("detach_read_set")
+        if self.fastqs[fastq_id]['readSet'] is None:
+            raise ValueError(f"{fastq_id} has no read set to detach")
+        self.fastqs[fastq_id]['readSet'] = None
+
+    def add_read_set(self, fastq_id: str, read_set: Dict[str, Any]):
+        self.record("add_read_set")
+        if self.fastqs[fastq_id]['readSet'] is not None:
+            raise ValueError(f"{fastq_id} already has a read set")
+        self.fastqs[fastq_id]['readSet'] = deepcopy(read_set)
+
+    def add_read_count(self, fastq_id: str, read_count: Dict[str, Any]):
+        self.record("add_read_count")
+        self.fastqs[fastq_id]['readCount'] = read_count['readCount']
+        self.fastqs[fastq_id]['baseCountEst'] = read_count['baseCountEst']
+
+    # Fastq set endpoints
+    def create_fastq_set_object(
+            self,
+            library: Dict[str, str],
+            allowAdditionalFastq: bool,
+            isCurrentFastqSet: bool,
+            fastqSet: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        self.record("create_fastq_set_object")
+        fastq_set_id = self.next_id("fqs")
+        self.fastq_sets[fastq_set_id] = {
+            "id": fastq_set_id,
+            "library": deepcopy(library),
+            "allowAdditionalFastq": allowAdditionalFastq,
+            "isCurrentFastqSet": isCurrentFastqSet,
+            "somalier": None,
+            "fastqSet": [],
+        }
+        self.fastq_set_ids_by_library_id.setdefault(library['libraryId'], []).append(fastq_set_id)
+        for fastq_iter_ in fastqSet:
+            fastq_id = self.next_id("fqr")
+            self.add_fastq({
+                "id": fastq_id,
+                **deepcopy(dict(fastq_iter_)),
+                "readSet": None,
+                "readCount": None,
+                "baseCountEst": None,
+                "fastqSetId": fastq_set_id,
+            })
+            self.fastq_sets[fastq_set_id]['fastqSet'].append(fastq_id)
+        return self.get_fastq_set_with_fastqs(fastq_set_id)
+
+    def get_fastq_sets(
+            self,
+            library: Optional[str] = None,
+            instrumentRunId: Optional[str] = None,
+            currentFastqSet: Optional[Union[str, bool]] = None,
+            **kwargs
+    ) -> List[Dict[str, Any]]:
+        self.record("get_fastq_sets")
+        fastq_set_list = list(map(
+            self.get_fastq_set_with_fastqs,
+            (
+                self.fastq_set_ids_by_library_id.get(library, [])
+                if library is not None
+                else list(self.fastq_sets.keys())
+            )
+        ))
+        if instrumentRunId is not None:
+            fastq_set_list = list(filter(
+                lambda fastq_set_iter_: any(map(
+                    lambda fastq_iter_: fastq_iter_['instrumentRunId'] == instrumentRunId,
+                    fastq_set_iter_['fastqSet']
+                )),
+                fastq_set_list
+            ))
+        if currentFastqSet is not None:
+            # Passed as a bool or as a json string
+            is_current_fastq_set = (
+                currentFastqSet if isinstance(currentFastqSet, bool) else json.loads(currentFastqSet)
+            )
+            fastq_set_list = list(filter(
+                lambda fastq_set_iter_: fastq_set_iter_['isCurrentFastqSet'] == is_current_fastq_set,
+                fastq_set_list
+            ))
+        return fastq_set_list
+
+    def allow_additional_fastqs_to_fastq_set(self, fastq_set_id: str):
+        self.record("allow_additional_fastqs_to_fastq_set")
+        self.fastq_sets[fastq_set_id]['allowAdditionalFastq'] = True
+
+    def disallow_additional_fastqs_to_fastq_set(self, fastq_set_id: str):
+        self.record("disallow_additional_fastqs_to_fastq_set")
+        self.fastq_sets[fastq_set_id]['allowAdditionalFastq'] = False
+
+    def link_fastq_to_fastq_set(self, fastq_set_id: str, fastq_id: str):
+        self.record("link_fastq_to_fastq_set")
+        if not self.fastq_sets[fastq_set_id]['allowAdditionalFastq']:
+            raise ValueError(f"{fastq_set_id} does not allow additional fastqs")
+        self.fastq_sets[fastq_set_id]['fastqSet'].append(fastq_id)
+        self.fastqs[fastq_id]['fastqSetId'] = fastq_set_id
+
+    def get_fastq_set(self, fastq_set_id: str, **kwargs) -> Dict[str, Any]:
+        self.record("get_fastq_set")
+        return self.get_fastq_set_with_fastqs(fastq_set_id)
+
+    def unlink_fastq_from_fastq_set(self, fastq_id: str, fastq_set_id: str):
+        self.record("unlink_fastq_from_fastq_set")
+        self.fastq_sets[fastq_set_id]['fastqSet'].remove(fastq_id)
+        self.fastqs[fastq_id]['fastqSetId'] = None
+
+    def set_is_not_current_fastq_set(self, fastq_set_id: str):
+        self.record("set_is_not_current_fastq_set")
+        self.fastq_sets[fastq_set_id]['isCurrentFastqSet'] = False
+
+    # Job endpoints
+    def run_extract_fingerprint(self, fastq_set_id: str, reference_name: str, bam_uri: Optional[str] = None):
+        self.record("run_extract_fingerprint")
+        if fastq_set_id not in self.fastq_sets:
+            raise ValueError(f"Could not find fastq set {fastq_set_id}")
+
+
+class FakeSequenceRunManager(FakeService):
+    """
+    In-memory sequence run manager
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        super().__init__(latency_seconds=latency_seconds)
+        self.samplesheets: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self):
+        super().reset()
+        self.samplesheets.clear()
+
+    def add_samplesheet(self, instrument_run_id: str, samplesheet: Dict[str, Any]):
+        self.samplesheets[instrument_run_id] = deepcopy(samplesheet)
+
+    def get_sample_sheet_from_instrument_run_id(self, instrument_run_id: str) -> Dict[str, Any]:
+        self.record("get_sample_sheet_from_instrument_run_id")
+        return {
+            "sampleSheetContent": deepcopy(self.samplesheets[instrument_run_id]),
+        }
+
+    def get_libraries_from_instrument_run_id(self, instrument_run_id: str) -> List[str]:
+        self.record("get_libraries_from_instrument_run_id")
+        return list(dict.fromkeys(map(
+            lambda bclconvert_row_iter_: bclconvert_row_iter_['sampleId'],
+            self.samplesheets[instrument_run_id]['bclconvertData']
+        )))
+
+
+class FakeFileManager(FakeService):
+    """
+    In-memory file manager, file records are {bucket, key}
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        super().__init__(latency_seconds=latency_seconds)
+        self.files_by_portal_run_id: Dict[str, List[Dict[str, Any]]] = {}
+
+    def reset(self):
+        super().reset()
+        self.files_by_portal_run_id.clear()
+
+    def add_files(self, portal_run_id: str, file_list: List[Dict[str, Any]]):
+        self.files_by_portal_run_id.setdefault(portal_run_id, []).extend(deepcopy(file_list))
+
+    def list_files_from_portal_run_id(self, portal_run_id: str, **kwargs) -> List[Dict[str, Any]]:
+        self.record("list_files_from_portal_run_id")
+        return deepcopy(self.files_by_portal_run_id.get(portal_run_id, []))
+
+
+class FakeWorkflowManager(FakeService):
+    """
+    In-memory workflow manager, holds the latest payload of each workflow run
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        super().__init__(latency_seconds=latency_seconds)
+        self.payloads_by_workflow_run_orcabus_id: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self):
+        super().reset()
+        self.payloads_by_workflow_run_orcabus_id.clear()
+
+    def add_payload(self, workflow_run_orcabus_id: str, payload: Dict[str, Any]):
+        self.payloads_by_workflow_run_orcabus_id[workflow_run_orcabus_id] = deepcopy(payload)
+
+    def get_latest_payload_from_workflow_run(self, workflow_run_orcabus_id: str) -> Dict[str, Any]:
+        self.record("get_latest_payload_from_workflow_run")
+        return deepcopy(self.payloads_by_workflow_run_orcabus_id[workflow_run_orcabus_id])
+
+
+class EndpointNotFakedError(Exception):
+    """
+    Raised when an endpoint of a fake that was not passed to install_fake_orcabus_api_tools is called
+    """
+
+    def __init__(self, module_name: str, endpoint_name: str, faked_module_names: List[str]):
+        self.module_name = module_name
+        self.endpoint_name = endpoint_name
+        super().__init__(
+            f"No fake was installed for {module_name}.{endpoint_name}, "
+            f"fakes are installed for: {', '.join(faked_module_names) if faked_module_names else 'none'}"
+        )
+
+
+# Modules registered with a fake service
+FAKED_MODULE_NAMES: List[str] = []
+
+
+def add_fake_module(module_name: str, fake_service: Optional[FakeService], endpoint_names: List[str]) -> types.ModuleType:
+    """
+    Register a module whose endpoints are the bound methods of the fake
+    (or which raise EndpointNotFakedError if the fake was not provided)
+    :param module_name:
+    :param fake_service:
+    :param endpoint_names:
+    :return:
+    """
+    fake_module = types.ModuleType(module_name)
+    fake_module.__path__ = []
+
+    if fake_service is not None and module_name not in FAKED_MODULE_NAMES:
+        FAKED_MODULE_NAMES.append(module_name)
+    elif fake_service is None and module_name in FAKED_MODULE_NAMES:
+        FAKED_MODULE_NAMES.remove(module_name)
+
+    for endpoint_name in endpoint_names:
+        if fake_service is not None:
+            setattr(fake_module, endpoint_name, getattr(fake_service, endpoint_name))
+        else:
+            def endpoint_not_faked(*args, endpoint_name_=endpoint_name, **kwargs):
+                raise EndpointNotFakedError(module_name, endpoint_name_, FAKED_MODULE_NAMES)
+            setattr(fake_module, endpoint_name, endpoint_not_faked)
+
+    sys.modules[module_name] = fake_module
+    parent_module_name, _, child_module_name = module_name.rpartition(".")
+    setattr(sys.modules[parent_module_name], child_module_name, fake_module)
+
+    return fake_module
+
+
+def install_fake_orcabus_api_tools(
+        fake_fastq_manager: FakeFastqManager,
+        fake_sequence_run_manager: Optional[FakeSequenceRunManager] = None,
+        fake_file_manager: Optional[FakeFileManager] = None,
+        fake_workflow_manager: Optional[FakeWorkflowManager] = None,
+):
+    """
+    Register the fakes as
+    * orcabus_api_tools.fastq (and orcabus_api_tools.fastq.models)
+    * orcabus_api_tools.sequence
+    * orcabus_api_tools.filemanager
+    * orcabus_api_tools.workflow (and orcabus_api_tools.workflow.models)
+    Endpoints of fakes that are not provided raise EndpointNotFakedError when called
+    :param fake_fastq_manager:
+    :param fake_sequence_run_manager:
+    :param fake_file_manager:
+    :param fake_workflow_manager:
+    :return:
+    """
+    orcabus_api_tools_module = sys.modules.setdefault(
+        "orcabus_api_tools", types.ModuleType("orcabus_api_tools")
+    )
+    orcabus_api_tools_module.__path__ = []
+
+    add_fake_module("orcabus_api_tools.fastq", fake_fastq_manager, [
+        "create_fastq_object",
+        "get_fastq",
+        "get_fastqs_in_instrument_run_id",
+        "get_fastqs_in_libraries_and_instrument_run_id",
+        "invalidate_fastq",
+        "detach_read_set",
+        "add_read_set",
+        "add_read_count",
+        "create_fastq_set_object",
+        "get_fastq_sets",
+        "get_fastq_set",
+        "allow_additional_fastqs_to_fastq_set",
+        "disallow_additional_fastqs_to_fastq_set",
+        "link_fastq_to_fastq_set",
+        "unlink_fastq_from_fastq_set",
+        "set_is_not_current_fastq_set",
+        "run_extract_fingerprint",
+    ])
+    fastq_models_module = add_fake_module("orcabus_api_tools.fastq.models", None, [])
+    fastq_models_module.FastqSet = dict
+    fastq_models_module.FastqListRow = dict
+
+    add_fake_module("orcabus_api_tools.sequence", fake_sequence_run_manager, [
+        "get_sample_sheet_from_instrument_run_id",
+        "get_libraries_from_instrument_run_id",
+    ])
+
+    add_fake_module("orcabus_api_tools.filemanager", fake_file_manager, [
+        "list_files_from_portal_run_id",
+    ])
+
+    add_fake_module("orcabus_api_tools.workflow", fake_workflow_manager, [
+        "get_latest_payload_from_workflow_run",
+    ])
+    workflow_models_module = add_fake_module("orcabus_api_tools.workflow.models", None, [])
+    workflow_models_module.WorkflowRun = dict
+
+
+class OrcabusApiToolsStubModule(types.ModuleType):
+    """
+    Module where every attribute is a placeholder
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return type(name, (dict,), {})
+
+
+class OrcabusApiToolsStubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Resolve orcabus_api_tools and any of its submodules to a stub module
+    """
+
+    def find_spec(self, fullname: str, path=None, target=None) -> Optional[importlib.machinery.ModuleSpec]:
+        if fullname != "orcabus_api_tools" and not fullname.startswith("orcabus_api_tools."):
+            return None
+        return importlib.machinery.ModuleSpec(fullname, self, is_package=True)
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> types.ModuleType:
+        return OrcabusApiToolsStubModule(spec.name)
+
+    def exec_module(self, module: types.ModuleType):
+        module.__path__ = []
+
+
+def install_orcabus_api_tools_import_stubs():
+    if not any(map(lambda finder_iter_: isinstance(finder_iter_, OrcabusApiToolsStubFinder), sys.meta_path)):
+        sys.meta_path.insert(0, OrcabusApiToolsStubFinder())
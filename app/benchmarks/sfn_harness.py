@@ -0,0 +1,826 @@
+#!/usr/bin/env python3
+
+"""
+Local step function harness
+
+Evaluates the (JSONata) state machine templates under app/step-function-templates against in-process lambda handlers,
+with a simulated clock, so that the latency of a whole execution can be estimated for a given run size
+and batching / concurrency settings can be compared without deploying anything.
+
+Supported states are Task (lambda:invoke and events:putEvents), Pass, Map (inline and distributed, with ItemBatcher
+and a number or expression MaxConcurrency),
+Parallel, Choice (Condition and Default), Wait, Succeed and Fail, with Arguments / Output / Assign / Items / ItemSelector and Retry.
+Unsupported states, fields, resources or JSONata raise UnsupportedStateError (listing what is supported),
+rather than being silently skipped.
+
+Each execution (and distributed map child execution) is given a unique $states.context.Execution.Id.
+
+JSONata expressions are evaluated by a small evaluator covering what the templates use,
+variables and paths ($states.input.libraryIdList), string concatenation (&), arithmetic, comparisons, comments,
+and the $lookup, $count, $keys and $string functions.
+
+Handlers run one at a time in this process, the simulated clock then charges
+
+* every state transition
+* every lambda invocation (and a cold start for the first invocation of each lambda)
+* the handler's measured compute time
+* every api and object store request made by the handler
+  (requests made on worker threads are assumed to overlap, so the slowest thread is charged)
+* the start of every distributed map child execution
+* waits and retry intervals
+
+Map iterations are scheduled onto MaxConcurrency slots (in item order), so the map's latency is the makespan,
+Parallel branches take as long as the slowest branch.
+The critical path of an execution is the total simulated time from start to end.
+"""
+
+# Standard imports
+import re
+import json
+import heapq
+import random
+import threading
+import time
+from copy import deepcopy
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypedDict
+from uuid import uuid4
+
+# Globals
+STEP_FUNCTION_TEMPLATES_DIR = Path(__file__).absolute().parent.parent / "step-function-templates"
+
+JSONATA_EXPRESSION_REGEX = re.compile(r"^\s*\{%(.*)%\}\s*$", re.DOTALL)
+LAMBDA_FUNCTION_ARN_PLACEHOLDER_REGEX = re.compile(r"^\$\{__(\w+)_lambda_function_arn__\}$")
+
+EXECUTION_ARN_PREFIX = "arn:aws:states:local:000000000000:execution:harness"
+
+LAMBDA_INVOKE_RESOURCE = "arn:aws:states:::lambda:invoke"
+EVENTS_PUT_EVENTS_RESOURCE = "arn:aws:states:::events:putEvents"
+
+# Step functions runs at most 40 inline map iterations at once, distributed maps up to 10,000 child executions
+DEFAULT_INLINE_MAX_CONCURRENCY = 40
+DEFAULT_DISTRIBUTED_MAX_CONCURRENCY = 10000
+
+DEFAULT_RETRY_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_INTERVAL_SECONDS = 1
+DEFAULT_RETRY_BACKOFF_RATE = 2.0
+
+TRANSIENT_ERROR_NAME = "Lambda.TooManyRequestsException"
+TASK_FAILED_ERROR_NAME = "States.TaskFailed"
+ALL_ERROR_NAME = "States.ALL"
+
+# Fields each state type may use, anything else raises UnsupportedStateError
+COMMON_STATE_FIELDS = {"Type", "Comment", "Next", "End", "Output", "Assign", "QueryLanguage"}
+SUPPORTED_STATE_FIELDS = {
+    "Task": COMMON_STATE_FIELDS | {"Resource", "Arguments", "Retry"},
+    "Pass": COMMON_STATE_FIELDS,
+    "Wait": COMMON_STATE_FIELDS | {"Seconds"},
+    "Map": COMMON_STATE_FIELDS | {
+        "Items", "ItemSelector", "ItemProcessor", "ItemBatcher", "MaxConcurrency", "Label", "Retry",
+    },
+    "Parallel": COMMON_STATE_FIELDS | {"Branches", "Retry"},
+    "Choice": {"Type", "Comment", "Choices", "Default", "Output", "Assign", "QueryLanguage"},
+    "Succeed": {"Type", "Comment", "Output", "QueryLanguage"},
+    "Fail": {"Type", "Comment", "Error", "Cause", "QueryLanguage"},
+}
+SUPPORTED_CHOICE_FIELDS = {"Condition", "Next", "Comment"}
+SUPPORTED_TASK_RESOURCES = [LAMBDA_INVOKE_RESOURCE, EVENTS_PUT_EVENTS_RESOURCE]
+SUPPORTED_TEMPLATE_OVERRIDES = ["MaxConcurrency", "MaxItemsPerBatch"]
+
+
+class LatencyModel(TypedDict):
+    stateTransitionSeconds: float
+    lambdaInvokeSeconds: float
+    lambdaColdStartSeconds: float
+    apiRequestSeconds: float
+    objectStoreRequestSeconds: float
+    childExecutionStartSeconds: float
+    eventsPutSeconds: float
+    # Multiplier applied to the measured handler compute time
+    computeScale: float
+
+
+DEFAULT_LATENCY_MODEL: LatencyModel = {
+    "stateTransitionSeconds": 0.05,
+    "lambdaInvokeSeconds": 0.03,
+    "lambdaColdStartSeconds": 1.5,
+    "apiRequestSeconds": 0.1,
+    "objectStoreRequestSeconds": 0.03,
+    "childExecutionStartSeconds": 0.5,
+    "eventsPutSeconds": 0.05,
+    "computeScale": 1.0,
+}
+
+
+class ExecutionStats(TypedDict):
+    criticalPathSeconds: float
+    waitSeconds: float
+    retrySeconds: float
+    stateTransitions: int
+    childExecutions: int
+    retries: int
+    lambdaInvocations: Dict[str, int]
+    requests: Dict[str, int]
+    # Real time spent in the handlers
+    computeSeconds: float
+
+
+class UnsupportedStateError(Exception):
+    """
+    Raised for a state, field, task resource or JSONata construct the harness does not evaluate
+    """
+
+    def __init__(self, message: str, supported: Iterable[Any]):
+        self.supported = list(supported)
+        super().__init__(f"{message}, supported: {', '.join(map(str, self.supported))}")
+
+
+class StepFunctionExecutionError(Exception):
+    def __init__(self, error: str, cause: str):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+# JSONata subset
+class Undefined:
+    """
+    JSONata undefined, fields that evaluate to undefined are dropped from objects
+    """
+
+    def __repr__(self) -> str:
+        return "undefined"
+
+
+UNDEFINED = Undefined()
+
+JSONATA_TOKEN_REGEX = re.compile(
+    r"\s*(?:"
+    r"(?P<comment>/\*.*?\*/)|"
+    r"(?P<number>\d+(?:\.\d+)?)|"
+    r"(?P<string>'[^']*'|\"[^\"]*\")|"
+    r"(?P<variable>\$[A-Za-z_][A-Za-z0-9_]*)|"
+    r"(?P<name>[A-Za-z_][A-Za-z0-9_]*)|"
+    r"(?P<operator>>=|<=|!=|[&*/+\-.(),<>=])"
+    r")",
+    re.DOTALL
+)
+
+
+def tokenize_jsonata(expression: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    expression = expression.strip()
+    while position < len(expression):
+        match = JSONATA_TOKEN_REGEX.match(expression, position)
+        if match is None or match.end() == position:
+            raise UnsupportedStateError(
+                f"Unsupported JSONata at position {position} of '{expression}'", get_supported_jsonata()
+            )
+        position = match.end()
+        if match.lastgroup != "comment":
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    return tokens
+
+
+def jsonata_string(value: Any) -> str:
+    if value is UNDEFINED:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, separators=(",", ":"))
+
+
+def jsonata_lookup(obj: Any, key: Any) -> Any:
+    if isinstance(obj, list):
+        values = list(filter(
+            lambda value_iter_: value_iter_ is not UNDEFINED,
+            map(lambda obj_iter_: jsonata_lookup(obj_iter_, key), obj)
+        ))
+        return values[0] if len(values) == 1 else values if len(values) > 0 else UNDEFINED
+    if isinstance(obj, dict):
+        return obj.get(key, UNDEFINED)
+    return UNDEFINED
+
+
+JSONATA_FUNCTIONS: Dict[str, Callable[..., Any]] = {
+    "lookup": jsonata_lookup,
+    "count": lambda value: 0 if value is UNDEFINED else len(value) if isinstance(value, list) else 1,
+    "keys": lambda value: list(value.keys()) if isinstance(value, dict) else UNDEFINED,
+    "string": jsonata_string,
+}
+
+
+JSONATA_COMPARISON_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "=": lambda left, right: left == right,
+    "!=": lambda left, right: left != right,
+    "<": lambda left, right: left < right,
+    "<=": lambda left, right: left <= right,
+    ">": lambda left, right: left > right,
+    ">=": lambda left, right: left >= right,
+}
+
+
+def get_supported_jsonata() -> List[str]:
+    return [
+        "numbers", "strings", "$variables", "paths (a.b)", "parentheses", "& + - * /",
+        *JSONATA_COMPARISON_OPERATORS.keys(),
+        *map(lambda function_name_iter_: f"${function_name_iter_}()", JSONATA_FUNCTIONS.keys()),
+    ]
+
+
+class JsonataEvaluator:
+    """
+    Recursive descent evaluator of the JSONata subset
+
+    comparison := expression (('=' | '!=' | '<' | '<=' | '>' | '>=') expression)?
+    expression := term (('&' | '+' | '-') term)*
+    term := path (('*' | '/') path)*
+    path := primary ('.' name)*
+    primary := number | string | variable | variable '(' arguments ')' | '(' expression ')'
+    """
+
+    def __init__(self, expression: str, bindings: Dict[str, Any]):
+        self.expression = expression
+        self.tokens = tokenize_jsonata(expression)
+        self.position = 0
+        self.bindings = bindings
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self, expected_value: Optional[str] = None) -> Tuple[str, str]:
+        token = self.peek()
+        if token is None or (expected_value is not None and token[1] != expected_value):
+            raise UnsupportedStateError(
+                f"Could not parse JSONata '{self.expression}', expected {expected_value}", get_supported_jsonata()
+            )
+        self.position += 1
+        return token
+
+    def evaluate(self) -> Any:
+        value = self.parse_comparison()
+        if self.peek() is not None:
+            raise UnsupportedStateError(
+                f"Could not parse JSONata '{self.expression}' past token {self.peek()}", get_supported_jsonata()
+            )
+        return value
+
+    def parse_comparison(self) -> Any:
+        value = self.parse_expression()
+        if self.peek() is None or self.peek()[1] not in JSONATA_COMPARISON_OPERATORS:
+            return value
+        operator = self.take()[1]
+        right_value = self.parse_expression()
+        if value is UNDEFINED or right_value is UNDEFINED:
+            return False
+        return JSONATA_COMPARISON_OPERATORS[operator](value, right_value)
+
+    def parse_expression(self) -> Any:
+        value = self.parse_term()
+        while self.peek() is not None and self.peek()[1] in ["&", "+", "-"]:
+            operator = self.take()[1]
+            right_value = self.parse_term()
+            if operator == "&":
+                value = jsonata_string(value) + jsonata_string(right_value)
+            elif value is UNDEFINED or right_value is UNDEFINED:
+                value = UNDEFINED
+            else:
+                value = value + right_value if operator == "+" else value - right_value
+        return value
+
+    def parse_term(self) -> Any:
+        value = self.parse_path()
+        while self.peek() is not None and self.peek()[1] in ["*", "/"]:
+            operator = self.take()[1]
+            right_value = self.parse_path()
+            if value is UNDEFINED or right_value is UNDEFINED:
+                value = UNDEFINED
+            else:
+                value = value * right_value if operator == "*" else value / right_value
+        return value
+
+    def parse_path(self) -> Any:
+        value = self.parse_primary()
+        while self.peek() is not None and self.peek()[1] == ".":
+            self.take(".")
+            value = jsonata_lookup(value, self.take()[1])
+        return value
+
+    def parse_primary(self) -> Any:
+        token_type, token_value = self.take()
+        if token_type == "number":
+            return float(token_value) if "." in token_value else int(token_value)
+        if token_type == "string":
+            return token_value[1:-1]
+        if token_type == "operator" and token_value == "(":
+            value = self.parse_comparison()
+            self.take(")")
+            return value
+        if token_type == "variable":
+            name = token_value[1:]
+            if self.peek() is not None and self.peek()[1] == "(":
+                return self.parse_function_call(name)
+            return self.bindings.get(name, UNDEFINED)
+        raise UnsupportedStateError(
+            f"Unsupported JSONata token {token_value} in '{self.expression}'", get_supported_jsonata()
+        )
+
+    def parse_function_call(self, function_name: str) -> Any:
+        if function_name not in JSONATA_FUNCTIONS:
+            raise UnsupportedStateError(
+                f"Unsupported JSONata function ${function_name}",
+                map(lambda function_name_iter_: f"${function_name_iter_}", JSONATA_FUNCTIONS.keys())
+            )
+        self.take("(")
+        arguments = []
+        while self.peek() is not None and self.peek()[1] != ")":
+            arguments.append(self.parse_expression())
+            if self.peek() is not None and self.peek()[1] == ",":
+                self.take(",")
+        self.take(")")
+        return JSONATA_FUNCTIONS[function_name](*arguments)
+
+
+def evaluate_template_value(value: Any, bindings: Dict[str, Any]) -> Any:
+    """
+    Evaluate every '{% ... %}' string in the (json) value, undefined fields are dropped
+    :param value:
+    :param bindings: Variables by name, including 'states'
+    :return:
+    """
+    if isinstance(value, dict):
+        return dict(filter(
+            lambda kv_iter_: kv_iter_[1] is not UNDEFINED,
+            map(
+                lambda kv_iter_: (kv_iter_[0], evaluate_template_value(kv_iter_[1], bindings)),
+                value.items()
+            )
+        ))
+    if isinstance(value, list):
+        return list(map(lambda value_iter_: evaluate_template_value(value_iter_, bindings), value))
+    if isinstance(value, str) and (expression_match := JSONATA_EXPRESSION_REGEX.match(value)):
+        return JsonataEvaluator(expression_match.group(1), bindings).evaluate()
+    return value
+
+
+def get_makespan(durations: List[float], max_concurrency: int) -> float:
+    """
+    Schedule the durations, in order, onto max_concurrency slots, and return when the last one finishes
+    :param durations:
+    :param max_concurrency:
+    :return:
+    """
+    slot_finish_times = [0.0] * max(1, min(max_concurrency, len(durations)))
+    for duration_iter_ in durations:
+        heapq.heappush(slot_finish_times, heapq.heappop(slot_finish_times) + duration_iter_)
+    return max(slot_finish_times) if len(durations) > 0 else 0.0
+
+
+def load_state_machine_template(template_name: str) -> Dict[str, Any]:
+    """
+    Load a template by name, i.e fastq_set_generation loads fastq_set_generation_sfn_template.asl.json
+    :param template_name:
+    :return:
+    """
+    return json.loads((STEP_FUNCTION_TEMPLATES_DIR / f"{template_name}_sfn_template.asl.json").read_text())
+
+
+def apply_template_overrides(
+        state_machine: Dict[str, Any],
+        template_overrides: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Override the MaxConcurrency / MaxItemsPerBatch of map states by state name, i.e
+    {"For each library (batched)": {"MaxConcurrency": 10, "MaxItemsPerBatch": 20}}
+    :param state_machine:
+    :param template_overrides:
+    :return:
+    """
+    state_machine = deepcopy(state_machine)
+
+    def apply_to_states(states: Dict[str, Any]):
+        for state_name_iter_, state_iter_ in states.items():
+            for field_name_iter_, field_value_iter_ in template_overrides.get(state_name_iter_, {}).items():
+                if field_name_iter_ == "MaxConcurrency":
+                    state_iter_['MaxConcurrency'] = field_value_iter_
+                elif field_name_iter_ == "MaxItemsPerBatch":
+                    # Batches planned by a lambda (batch descriptors) cannot be rebatched here
+                    if "ItemBatcher" not in state_iter_:
+                        raise ValueError(
+                            f"{state_name_iter_} has no ItemBatcher, its batches are planned by a lambda"
+                        )
+                    state_iter_['ItemBatcher']['MaxItemsPerBatch'] = field_value_iter_
+                else:
+                    raise UnsupportedStateError(f"Cannot override {field_name_iter_}", SUPPORTED_TEMPLATE_OVERRIDES)
+            if "ItemProcessor" in state_iter_:
+                apply_to_states(state_iter_['ItemProcessor']['States'])
+            for branch_iter_ in state_iter_.get("Branches", []):
+                apply_to_states(branch_iter_['States'])
+
+    apply_to_states(state_machine['States'])
+
+    return state_machine
+
+
+def check_template_overrides(state_machines: List[Dict[str, Any]], template_overrides: Dict[str, Dict[str, Any]]):
+    """
+    Raise a ValueError if an override names a state that is in none of the state machines
+    :param state_machines:
+    :param template_overrides:
+    :return:
+    """
+    state_names = set()
+
+    def add_state_names(states: Dict[str, Any]):
+        for state_name_iter_, state_iter_ in states.items():
+            state_names.add(state_name_iter_)
+            if "ItemProcessor" in state_iter_:
+                add_state_names(state_iter_['ItemProcessor']['States'])
+            for branch_iter_ in state_iter_.get("Branches", []):
+                add_state_names(branch_iter_['States'])
+
+    for state_machine_iter_ in state_machines:
+        add_state_names(state_machine_iter_['States'])
+
+    unknown_state_names = sorted(set(template_overrides.keys()) - state_names)
+    if len(unknown_state_names) > 0:
+        raise ValueError(f"Overrides name unknown states {unknown_state_names}")
+
+
+class StepFunctionHarness:
+    """
+    Run state machine executions against the lambda handlers with a simulated clock
+    """
+
+    def __init__(
+            self,
+            lambda_handlers: Dict[str, Callable[[Dict[str, Any], Any], Any]],
+            latency_model: Optional[LatencyModel] = None,
+            transient_failure_rate: float = 0.0,
+            seed: int = 0,
+    ):
+        """
+        :param lambda_handlers: Handler by lambda name (the snake case name in the arn placeholder)
+        :param latency_model:
+        :param transient_failure_rate: Probability that an invocation fails with a (retryable) throttling error
+        :param seed: Seeds the transient failures and the retry jitter
+        """
+        self.lambda_handlers = lambda_handlers
+        self.latency_model = latency_model if latency_model is not None else DEFAULT_LATENCY_MODEL
+        self.transient_failure_rate = transient_failure_rate
+        self.rng = random.Random(seed)
+        self.warm_lambda_names = set()
+        self.stats: ExecutionStats = self.get_empty_stats()
+        # Execution ids of the running execution and its running child executions, innermost last
+        self.execution_id_stack: List[str] = []
+
+        # Requests made while a handler is running, by thread
+        self.request_seconds_by_thread_id: Dict[int, float] = {}
+        self.handler_thread_id: Optional[int] = None
+        self.request_lock = threading.Lock()
+
+    @staticmethod
+    def get_empty_stats() -> ExecutionStats:
+        return {
+            "criticalPathSeconds": 0.0,
+            "waitSeconds": 0.0,
+            "retrySeconds": 0.0,
+            "stateTransitions": 0,
+            "childExecutions": 0,
+            "retries": 0,
+            "lambdaInvocations": {},
+            "requests": {},
+            "computeSeconds": 0.0,
+        }
+
+    def record_request(self, service_name: str, endpoint_name: str):
+        """
+        Request listener, charge the request to the thread that made it
+        :param service_name: 's3' for object store requests
+        :param endpoint_name:
+        :return:
+        """
+        if self.handler_thread_id is None:
+            return
+        with self.request_lock:
+            request_name = f"{service_name}.{endpoint_name}"
+            self.stats['requests'][request_name] = self.stats['requests'].get(request_name, 0) + 1
+            thread_id = threading.get_ident()
+            self.request_seconds_by_thread_id[thread_id] = (
+                self.request_seconds_by_thread_id.get(thread_id, 0.0) + (
+                    self.latency_model['objectStoreRequestSeconds']
+                    if service_name == "s3"
+                    else self.latency_model['apiRequestSeconds']
+                )
+            )
+
+    def start_execution(
+            self,
+            state_machine: Dict[str, Any],
+            execution_input: Dict[str, Any]
+    ) -> Tuple[Any, ExecutionStats]:
+        """
+        Run the state machine to completion
+        :param state_machine:
+        :param execution_input:
+        :return: The execution output and its stats
+        """
+        self.stats = self.get_empty_stats()
+        # Unique across harnesses, as journals and leases may outlive a harness
+        self.execution_id_stack = [f"{EXECUTION_ARN_PREFIX}:{uuid4()}"]
+        output, duration_seconds = self.run_states(state_machine, json.loads(json.dumps(execution_input)), {})
+        self.stats['criticalPathSeconds'] = duration_seconds
+        return output, self.stats
+
+    def run_states(
+            self,
+            state_machine: Dict[str, Any],
+            state_input: Any,
+            variables: Dict[str, Any]
+    ) -> Tuple[Any, float]:
+        duration_seconds = 0.0
+        state_name = state_machine['StartAt']
+        while True:
+            state = state_machine['States'][state_name]
+            unsupported_fields = set(state.keys()) - SUPPORTED_STATE_FIELDS.get(state['Type'], set())
+            if state['Type'] not in SUPPORTED_STATE_FIELDS:
+                raise UnsupportedStateError(
+                    f"State '{state_name}' is of unsupported type {state['Type']}", SUPPORTED_STATE_FIELDS.keys()
+                )
+            if len(unsupported_fields) > 0:
+                raise UnsupportedStateError(
+                    f"State '{state_name}' of type {state['Type']} "
+                    f"uses unsupported fields {sorted(unsupported_fields)}",
+                    sorted(SUPPORTED_STATE_FIELDS[state['Type']])
+                )
+
+            self.stats['stateTransitions'] += 1
+            duration_seconds += self.latency_model['stateTransitionSeconds']
+
+            state_output, state_duration_seconds = self.run_state(state, state_input, variables)
+            duration_seconds += state_duration_seconds
+
+            if state['Type'] in ["Succeed", "Fail"] or state.get("End", False):
+                return state_output, duration_seconds
+
+            state_name = state['Next'] if state['Type'] != "Choice" else self.get_choice_next(state, state_input, variables)
+            state_input = state_output
+
+    def get_choice_next(self, state: Dict[str, Any], state_input: Any, variables: Dict[str, Any]) -> str:
+        """
+        The next state of the first choice whose condition holds, or the default
+        :param state:
+        :param state_input:
+        :param variables:
+        :return:
+        """
+        bindings = {
+            **variables,
+            "states": {
+                "input": state_input,
+                "context": {"Execution": {"Id": self.execution_id_stack[-1]}},
+            },
+        }
+        for choice_iter_ in state['Choices']:
+            if set(choice_iter_.keys()) - SUPPORTED_CHOICE_FIELDS:
+                raise UnsupportedStateError(
+                    f"Unsupported choice fields {sorted(set(choice_iter_.keys()) - SUPPORTED_CHOICE_FIELDS)}",
+                    sorted(SUPPORTED_CHOICE_FIELDS)
+                )
+            if evaluate_template_value(choice_iter_['Condition'], bindings) is True:
+                return choice_iter_['Next']
+        if "Default" not in state:
+            raise StepFunctionExecutionError("States.NoChoiceMatched", "No choice matched and there is no default")
+        return state['Default']
+
+    def run_state(self, state: Dict[str, Any], state_input: Any, variables: Dict[str, Any]) -> Tuple[Any, float]:
+        """
+        Run a single state, assign its variables and return its output and duration
+        :param state:
+        :param state_input:
+        :param variables:
+        :return:
+        """
+        states_binding: Dict[str, Any] = {
+            "input": state_input,
+            "context": {"Execution": {"Id": self.execution_id_stack[-1]}},
+        }
+        bindings = {**variables, "states": states_binding}
+
+        if state['Type'] == "Fail":
+            raise StepFunctionExecutionError(state.get("Error", "States.Fail"), state.get("Cause", ""))
+
+        if state['Type'] == "Wait":
+            wait_seconds = evaluate_template_value(state['Seconds'], bindings)
+            self.stats['waitSeconds'] += wait_seconds
+            result, duration_seconds = state_input, float(wait_seconds)
+        elif state['Type'] in ["Pass", "Succeed", "Choice"]:
+            result, duration_seconds = state_input, 0.0
+        elif state['Type'] == "Task":
+            result, duration_seconds = self.run_with_retries(state, lambda: self.run_task(state, bindings))
+            states_binding['result'] = result
+        elif state['Type'] == "Map":
+            result, duration_seconds = self.run_with_retries(state, lambda: self.run_map(state, bindings, variables))
+            states_binding['result'] = result
+        else:
+            result, duration_seconds = self.run_with_retries(
+                state, lambda: self.run_parallel(state, state_input, variables)
+            )
+            states_binding['result'] = result
+
+        # Assign and Output both see the variables from before the state
+        output = evaluate_template_value(state['Output'], bindings) if "Output" in state else result
+        if "Assign" in state:
+            variables.update(evaluate_template_value(state['Assign'], bindings))
+
+        return output, duration_seconds
+
+    def run_with_retries(self, state: Dict[str, Any], run: Callable[[], Tuple[Any, float]]) -> Tuple[Any, float]:
+        """
+        Run the state, retrying on matching errors.
+        The duration includes failed attempts and retry intervals (with full jitter if requested).
+        :param state:
+        :param run:
+        :return:
+        """
+        duration_seconds = 0.0
+        attempts_by_retrier: Dict[int, int] = {}
+        while True:
+            try:
+                result, attempt_duration_seconds = run()
+                return result, duration_seconds + attempt_duration_seconds
+            except StepFunctionExecutionError as error:
+                duration_seconds += getattr(error, "duration_seconds", 0.0)
+                # States.TaskFailed and States.ALL match any error but a timeout
+                error_names = [error.error] + (
+                    [TASK_FAILED_ERROR_NAME, ALL_ERROR_NAME] if error.error != "States.Timeout" else []
+                )
+                retrier_index, retrier = next(
+                    filter(
+                        lambda retrier_iter_: any(map(
+                            lambda error_name_iter_: error_name_iter_ in retrier_iter_[1]['ErrorEquals'],
+                            error_names
+                        )),
+                        enumerate(state.get("Retry", []))
+                    ),
+                    (None, None)
+                )
+                if retrier is None:
+                    raise
+                attempts_by_retrier[retrier_index] = attempts_by_retrier.get(retrier_index, 0) + 1
+                if attempts_by_retrier[retrier_index] > retrier.get("MaxAttempts", DEFAULT_RETRY_MAX_ATTEMPTS):
+                    raise
+
+                interval_seconds = (
+                    retrier.get("IntervalSeconds", DEFAULT_RETRY_INTERVAL_SECONDS) *
+                    retrier.get("BackoffRate", DEFAULT_RETRY_BACKOFF_RATE) ** (attempts_by_retrier[retrier_index] - 1)
+                )
+                if "MaxDelaySeconds" in retrier:
+                    interval_seconds = min(interval_seconds, retrier['MaxDelaySeconds'])
+                if retrier.get("JitterStrategy", "NONE") == "FULL":
+                    interval_seconds = self.rng.uniform(0, interval_seconds)
+
+                self.stats['retries'] += 1
+                self.stats['retrySeconds'] += interval_seconds
+                duration_seconds += interval_seconds
+
+    def run_task(self, state: Dict[str, Any], bindings: Dict[str, Any]) -> Tuple[Any, float]:
+        arguments = evaluate_template_value(state.get("Arguments", {}), bindings)
+
+        if state['Resource'] == EVENTS_PUT_EVENTS_RESOURCE:
+            self.stats['lambdaInvocations']['events:putEvents'] = (
+                self.stats['lambdaInvocations'].get('events:putEvents', 0) + 1
+            )
+            return (
+                {
+                    "Entries": list(map(lambda i: {"EventId": f"event-{i}"}, range(len(arguments['Entries'])))),
+                    "FailedEntryCount": 0,
+                },
+                self.latency_model['eventsPutSeconds']
+            )
+
+        if state['Resource'] != LAMBDA_INVOKE_RESOURCE:
+            raise UnsupportedStateError(f"Unsupported task resource {state['Resource']}", SUPPORTED_TASK_RESOURCES)
+
+        lambda_name_match = LAMBDA_FUNCTION_ARN_PLACEHOLDER_REGEX.match(arguments['FunctionName'])
+        if lambda_name_match is None or lambda_name_match.group(1) not in self.lambda_handlers:
+            raise UnsupportedStateError(
+                f"No handler for function {arguments['FunctionName']}",
+                map(
+                    lambda lambda_name_iter_: f"${{__{lambda_name_iter_}_lambda_function_arn__}}",
+                    sorted(self.lambda_handlers.keys())
+                )
+            )
+        lambda_name = lambda_name_match.group(1)
+
+        self.stats['lambdaInvocations'][lambda_name] = self.stats['lambdaInvocations'].get(lambda_name, 0) + 1
+        duration_seconds = self.latency_model['lambdaInvokeSeconds']
+        if lambda_name not in self.warm_lambda_names:
+            self.warm_lambda_names.add(lambda_name)
+            duration_seconds += self.latency_model['lambdaColdStartSeconds']
+
+        if self.rng.random() < self.transient_failure_rate:
+            error = StepFunctionExecutionError(TRANSIENT_ERROR_NAME, f"Simulated throttling of {lambda_name}")
+            error.duration_seconds = duration_seconds
+            raise error
+
+        self.request_seconds_by_thread_id = {}
+        self.handler_thread_id = threading.get_ident()
+        start_time = time.perf_counter()
+        try:
+            response = self.lambda_handlers[lambda_name](json.loads(json.dumps(arguments.get("Payload", {}))), None)
+            handler_error = None
+        except Exception as e:
+            response = None
+            handler_error = e
+        finally:
+            compute_seconds = time.perf_counter() - start_time
+            self.handler_thread_id = None
+
+        # Requests on the handler thread are sequential, worker threads overlap with each other
+        handler_thread_request_seconds = self.request_seconds_by_thread_id.pop(threading.get_ident(), 0.0)
+        request_seconds = handler_thread_request_seconds + max(self.request_seconds_by_thread_id.values(), default=0.0)
+
+        self.stats['computeSeconds'] += compute_seconds
+        duration_seconds += compute_seconds * self.latency_model['computeScale'] + request_seconds
+
+        if handler_error is not None:
+            error = StepFunctionExecutionError(type(handler_error).__name__, str(handler_error))
+            error.duration_seconds = duration_seconds
+            raise error from handler_error
+
+        return {"StatusCode": 200, "Payload": json.loads(json.dumps(response))}, duration_seconds
+
+    def run_map(
+            self,
+            state: Dict[str, Any],
+            bindings: Dict[str, Any],
+            variables: Dict[str, Any]
+    ) -> Tuple[List[Any], float]:
+        items = evaluate_template_value(state['Items'], bindings)
+        is_distributed = state['ItemProcessor'].get("ProcessorConfig", {}).get("Mode", "INLINE") == "DISTRIBUTED"
+
+        if "ItemSelector" in state:
+            items = list(map(
+                lambda index_item_iter_: evaluate_template_value(
+                    state['ItemSelector'],
+                    {
+                        **bindings,
+                        "states": {
+                            **bindings['states'],
+                            "context": {
+                                **bindings['states']['context'],
+                                "Map": {"Item": {"Index": index_item_iter_[0], "Value": index_item_iter_[1]}},
+                            },
+                        }
+                    }
+                ),
+                enumerate(items)
+            ))
+
+        if "ItemBatcher" in state:
+            max_items_per_batch = state['ItemBatcher'].get("MaxItemsPerBatch", len(items))
+            batch_input = evaluate_template_value(state['ItemBatcher'].get("BatchInput", {}), bindings)
+            items = [
+                {"Items": items[i:i + max_items_per_batch], "BatchInput": batch_input}
+                for i in range(0, len(items), max_items_per_batch)
+            ]
+
+        # MaxConcurrency may be a JSONata expression, i.e the recommended concurrency of a batch plan
+        max_concurrency = evaluate_template_value(state.get("MaxConcurrency", 0), bindings) or (
+            DEFAULT_DISTRIBUTED_MAX_CONCURRENCY if is_distributed else DEFAULT_INLINE_MAX_CONCURRENCY
+        )
+
+        outputs = []
+        durations = []
+        for item_index_iter_, item_iter_ in enumerate(items):
+            if is_distributed:
+                # Each item is a child execution, which cannot see the parent's variables
+                self.stats['childExecutions'] += 1
+                self.execution_id_stack.append(f"{self.execution_id_stack[-1]}/{item_index_iter_}")
+                try:
+                    output, duration_seconds = self.run_states(state['ItemProcessor'], item_iter_, {})
+                finally:
+                    self.execution_id_stack.pop()
+                duration_seconds += self.latency_model['childExecutionStartSeconds']
+            else:
+                output, duration_seconds = self.run_states(state['ItemProcessor'], item_iter_, dict(variables))
+            outputs.append(output)
+            durations.append(duration_seconds)
+
+        return outputs, get_makespan(durations, max_concurrency)
+
+    def run_parallel(
+            self,
+            state: Dict[str, Any],
+            state_input: Any,
+            variables: Dict[str, Any]
+    ) -> Tuple[List[Any], float]:
+        outputs = []
+        durations = []
+        for branch_iter_ in state['Branches']:
+            output, duration_seconds = self.run_states(branch_iter_, deepcopy(state_input), dict(variables))
+            outputs.append(output)
+            durations.append(duration_seconds)
+        return outputs, max(durations, default=0.0)
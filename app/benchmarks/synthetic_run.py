@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+
+"""
+Synthetic sequencing run generator
+
+Generates a realistic (but entirely made up) instrument run for the benchmarks
+
+* a NovaSeq 6000 (YYMMDD_A01052_NNNN_<flowcell>) or NovaSeq X (YYYYMMDD_LH00944_NNNN_<flowcell>) instrument run id
+* the v2 samplesheet, as returned by the sequence run manager
+* the fastq_list.csv and Demultiplex_Stats.csv reports, as written by BCLConvert
+* libraries that were sequenced on a previous run (topups and reruns)
+* dragen workflow runs (payload and output file listing) for the fingerprint steps
+
+Each library is on a random subset of the lanes, a third of the libraries have their own override cycles
+(half of those with UMIs), read counts vary per library and lane.
+The same seed always generates the same run.
+"""
+
+# Standard imports
+import csv
+import io
+import zlib
+import random
+import string
+from datetime import date, timedelta
+from typing import Any, Dict, List, Literal, Optional, TypedDict
+
+# Globals
+Platform = Literal["NovaSeq6000", "NovaSeqX"]
+
+NOVASEQ_6000_PLATFORM: Platform = "NovaSeq6000"
+NOVASEQ_X_PLATFORM: Platform = "NovaSeqX"
+
+MIN_NUM_LANES = 1
+MAX_NUM_LANES = 8
+
+READ_CYCLES = 151
+INDEX_CYCLES = 10
+
+OUTPUT_BUCKET = "synthetic-pipeline-bucket"
+ANALYSIS_BUCKET = "synthetic-analysis-bucket"
+
+FASTQ_LIST_COLUMNS = ["RGID", "RGSM", "RGLB", "Lane", "Read1File", "Read2File"]
+DEMUX_STATS_COLUMNS = [
+    "Lane", "SampleID", "Index", "# Reads",
+    "# Perfect Index Reads", "# One Mismatch Index Reads", "# Two Mismatch Index Reads",
+    "% Reads", "% Perfect Index Reads", "% One Mismatch Index Reads", "% Two Mismatch Index Reads",
+]
+
+# Override cycles for libraries that do not use the samplesheet read cycles
+LIBRARY_OVERRIDE_CYCLES = "Y151;I8N2;I8N2;Y151"
+LIBRARY_UMI_OVERRIDE_CYCLES = "U7N1Y143;I8N2;I8N2;U7N1Y143"
+
+DRAGEN_WORKFLOW_NAMES = ["dragen-wgts-dna", "dragen-tso500-ctdna", "dragen-wgts-rna"]
+NUM_OTHER_FILES_PER_WORKFLOW_RUN = 250
+
+
+class SyntheticWorkflowRun(TypedDict):
+    workflowRunObj: Dict[str, Any]
+    payload: Dict[str, Any]
+    fileList: List[Dict[str, Any]]
+
+
+class SyntheticRun(TypedDict):
+    instrumentRunId: str
+    platform: Platform
+    numLanes: int
+    libraryIdList: List[str]
+    samplesheet: Dict[str, Any]
+    # Reports
+    outputUri: str
+    fastqListUri: str
+    demuxStatsUri: str
+    fastqListCsv: str
+    demuxStatsCsv: str
+    # Libraries with a current fastq set from the previous run
+    previousInstrumentRunId: str
+    topupLibraryIdList: List[str]
+    rerunLibraryIdList: List[str]
+    # Downstream workflow runs
+    workflowRuns: List[SyntheticWorkflowRun]
+
+
+def get_random_string(rng: random.Random, length: int, alphabet: str = string.ascii_uppercase + string.digits) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def get_instrument_run_id(rng: random.Random, platform: Platform, run_date: date, run_number: int) -> str:
+    if platform == NOVASEQ_6000_PLATFORM:
+        # i.e 250320_A01052_0256_BHFCFCDSXF
+        return f"{run_date.strftime('%y%m%d')}_A01052_{run_number:04d}_BH{get_random_string(rng, 6)}XF"
+    if platform == NOVASEQ_X_PLATFORM:
+        # i.e 20251124_LH00944_0001_A23CCTGLT4
+        return f"{run_date.strftime('%Y%m%d')}_LH00944_{run_number:04d}_A22{get_random_string(rng, 5)}LT3"
+    raise ValueError(f"Unsupported platform: {platform}")
+
+
+def get_index(library_number: int, offset: int) -> str:
+    # A unique index per library
+    return "".join(
+        "ACGT"[(library_number >> (2 * position_iter_ + offset)) % 4]
+        for position_iter_ in range(INDEX_CYCLES)
+    )
+
+
+def get_samplesheet_header(instrument_run_id: str, platform: Platform) -> Dict[str, Any]:
+    return {
+        "fileFormatVersion": 2,
+        "runName": instrument_run_id,
+        "instrumentPlatform": "NovaSeqXSeries" if platform == NOVASEQ_X_PLATFORM else "NovaSeq",
+        "instrumentType": "NovaSeq X" if platform == NOVASEQ_X_PLATFORM else "NovaSeq 6000",
+    }
+
+
+def get_csv_text(column_names: List[str], rows: List[Dict[str, Any]]) -> str:
+    csv_buffer = io.StringIO()
+    csv_writer = csv.DictWriter(csv_buffer, fieldnames=column_names, lineterminator="\n")
+    csv_writer.writeheader()
+    csv_writer.writerows(rows)
+    return csv_buffer.getvalue()
+
+
+def get_demux_stats_row(lane: int, sample_id: str, index: str, num_reads: int, lane_num_reads: int) -> Dict[str, Any]:
+    num_perfect_index_reads = int(num_reads * 0.97)
+    num_one_mismatch_index_reads = num_reads - num_perfect_index_reads
+    return {
+        "Lane": lane,
+        "SampleID": sample_id,
+        "Index": index,
+        "# Reads": num_reads,
+        "# Perfect Index Reads": num_perfect_index_reads,
+        "# One Mismatch Index Reads": num_one_mismatch_index_reads,
+        "# Two Mismatch Index Reads": 0,
+        "% Reads": round(num_reads / lane_num_reads, 6),
+        "% Perfect Index Reads": round(num_perfect_index_reads / max(num_reads, 1), 6),
+        "% One Mismatch Index Reads": round(num_one_mismatch_index_reads / max(num_reads, 1), 6),
+        "% Two Mismatch Index Reads": 0.0,
+    }
+
+
+def get_file_size(key: str) -> int:
+    """
+    A size derived from the key (so the rng sequence is not disturbed), bams are 1 - 100 GiB
+    :param key:
+    :return:
+    """
+    key_hash = zlib.crc32(key.encode())
+    if key.endswith(".bam"):
+        return (1 + key_hash % 100) * 2 ** 30
+    return 1 + key_hash % 2 ** 20
+
+
+def get_workflow_run(
+        rng: random.Random,
+        workflow_name: str,
+        library_id: str,
+        tumor_library_id: Optional[str],
+        run_date: date,
+        workflow_run_number: int
+) -> SyntheticWorkflowRun:
+    portal_run_id = f"{run_date.strftime('%Y%m%d')}{get_random_string(rng, 8, alphabet='0123456789abcdef')}"
+    output_prefix = f"analysis/{workflow_name}/{portal_run_id}"
+
+    if workflow_name == "dragen-tso500-ctdna":
+        bam_key_list = [f"{output_prefix}/Logs_Intermediates/DragenCaller/{library_id}/{library_id}_tumor.bam"]
+    elif workflow_name == "dragen-wgts-dna":
+        bam_key_list = [f"{output_prefix}/{library_id}__dragen_wgts_dna_germline_variant_calling/{library_id}.bam"]
+        if tumor_library_id is not None:
+            bam_key_list.append(
+                f"{output_prefix}/{tumor_library_id}__dragen_wgts_dna_somatic_variant_calling/{tumor_library_id}_tumor.bam"
+            )
+    else:
+        bam_key_list = [f"{output_prefix}/{library_id}__dragen_wgts_rna_variant_calling/{library_id}.bam"]
+
+    # Plenty of other outputs, including the bam indexes and checksums
+    other_key_list = [
+        f"{output_prefix}/{'/'.join(get_random_string(rng, 6).lower() for _ in range(rng.randint(1, 3)))}.{rng.choice(['json', 'csv', 'vcf.gz', 'html', 'txt'])}"
+        for _ in range(NUM_OTHER_FILES_PER_WORKFLOW_RUN)
+    ] + [
+        f"{bam_key_iter_}{suffix_iter_}"
+        for bam_key_iter_ in bam_key_list
+        for suffix_iter_ in [".bai", ".md5sum"]
+    ]
+
+    file_key_list = bam_key_list + other_key_list
+    rng.shuffle(file_key_list)
+
+    return {
+        "workflowRunObj": {
+            "orcabusId": f"wfr.{workflow_run_number:026d}",
+            "portalRunId": portal_run_id,
+            "workflow": {
+                "name": workflow_name,
+            },
+            "libraries": [
+                {"libraryId": library_id_iter_}
+                for library_id_iter_ in [library_id, tumor_library_id]
+                if library_id_iter_ is not None
+            ],
+        },
+        "payload": {
+            "data": {
+                "tags": {
+                    "libraryId": library_id,
+                    **({"tumorLibraryId": tumor_library_id} if tumor_library_id is not None else {}),
+                },
+            },
+        },
+        "fileList": [
+            {"bucket": ANALYSIS_BUCKET, "key": file_key_iter_, "size": get_file_size(file_key_iter_)}
+            for file_key_iter_ in file_key_list
+        ],
+    }
+
+
+def generate_synthetic_run(
+        platform: Platform = NOVASEQ_X_PLATFORM,
+        num_lanes: int = MAX_NUM_LANES,
+        num_libraries: int = 100,
+        seed: int = 0,
+        topup_fraction: float = 0.05,
+        rerun_fraction: float = 0.02,
+        num_workflow_runs: Optional[int] = None,
+) -> SyntheticRun:
+    """
+    Generate a synthetic instrument run
+    :param platform: NovaSeq6000 or NovaSeqX
+    :param num_lanes: Between 1 and 8
+    :param num_libraries:
+    :param seed:
+    :param topup_fraction: Fraction of libraries that are topups of a library on the previous run
+    :param rerun_fraction: Fraction of libraries that are reruns of a library on the previous run
+    :param num_workflow_runs: Number of downstream dragen workflow runs, defaults to one per ten libraries
+    :return:
+    """
+    if not MIN_NUM_LANES <= num_lanes <= MAX_NUM_LANES:
+        raise ValueError(f"Number of lanes must be between {MIN_NUM_LANES} and {MAX_NUM_LANES}, got {num_lanes}")
+    if num_libraries < 1:
+        raise ValueError(f"Number of libraries must be at least 1, got {num_libraries}")
+
+    rng = random.Random(seed)
+
+    run_date = date(2025, 1, 1) + timedelta(days=rng.randint(0, 300))
+    previous_run_date = run_date - timedelta(days=rng.randint(7, 60))
+    run_number = rng.randint(100, 999)
+
+    instrument_run_id = get_instrument_run_id(rng, platform, run_date, run_number)
+    previous_instrument_run_id = get_instrument_run_id(rng, platform, previous_run_date, run_number - 1)
+
+    library_id_list = [
+        f"L{run_date.strftime('%y')}{library_number_iter_ + 1:05d}"
+        for library_number_iter_ in range(num_libraries)
+    ]
+
+    # Each library is either on every lane, or on a random subset of the lanes
+    lanes_by_library_id: Dict[str, List[int]] = dict(map(
+        lambda library_id_iter_: (
+            library_id_iter_,
+            (
+                list(range(1, num_lanes + 1))
+                if rng.random() < 0.5
+                else sorted(rng.sample(range(1, num_lanes + 1), rng.randint(1, num_lanes)))
+            )
+        ),
+        library_id_list
+    ))
+
+    override_cycles_by_library_id: Dict[str, Optional[str]] = dict(map(
+        lambda library_number_iter_: (
+            library_id_list[library_number_iter_],
+            (
+                None if library_number_iter_ % 3 != 0
+                else LIBRARY_UMI_OVERRIDE_CYCLES if library_number_iter_ % 6 == 0
+                else LIBRARY_OVERRIDE_CYCLES
+            )
+        ),
+        range(num_libraries)
+    ))
+
+    samplesheet = {
+        "header": get_samplesheet_header(instrument_run_id, platform),
+        "reads": {
+            "read1Cycles": READ_CYCLES,
+            "read2Cycles": READ_CYCLES,
+            "index1Cycles": INDEX_CYCLES,
+            "index2Cycles": INDEX_CYCLES,
+        },
+        "bclconvertSettings": {
+            "softwareVersion": "4.3.13",
+            "minimumTrimmedReadLength": 35,
+            "minimumAdapterOverlap": 3,
+            "adapterRead1": "CTGTCTCTTATACACATCT",
+            "adapterRead2": "CTGTCTCTTATACACATCT",
+        },
+        "bclconvertData": [
+            {
+                "lane": lane_iter_,
+                "sampleId": library_id_iter_,
+                "index": get_index(library_number_iter_, 0),
+                "index2": get_index(library_number_iter_, 1),
+                **(
+                    {"overrideCycles": override_cycles_by_library_id[library_id_iter_]}
+                    if override_cycles_by_library_id[library_id_iter_] is not None
+                    else {}
+                ),
+            }
+            for lane_iter_ in range(1, num_lanes + 1)
+            for library_number_iter_, library_id_iter_ in enumerate(library_id_list)
+            if lane_iter_ in lanes_by_library_id[library_id_iter_]
+        ],
+    }
+
+    # Reports
+    portal_run_id = f"{run_date.strftime('%Y%m%d')}{get_random_string(rng, 8, alphabet='0123456789abcdef')}"
+    output_uri = f"s3://{OUTPUT_BUCKET}/primary/{instrument_run_id}/{portal_run_id}/"
+    fastq_suffix = "fastq.ora" if platform == NOVASEQ_X_PLATFORM else "fastq.gz"
+
+    fastq_list_rows = []
+    demux_stats_rows = []
+    for lane_iter_ in range(1, num_lanes + 1):
+        lane_library_list = [
+            (library_number_iter_, library_id_iter_)
+            for library_number_iter_, library_id_iter_ in enumerate(library_id_list)
+            if lane_iter_ in lanes_by_library_id[library_id_iter_]
+        ]
+        num_reads_list = [rng.randint(2_000_000, 40_000_000) for _ in lane_library_list]
+        num_undetermined_reads = rng.randint(5_000_000, 50_000_000)
+        lane_num_reads = sum(num_reads_list) + num_undetermined_reads
+
+        for (library_number_iter_, library_id_iter_), num_reads_iter_ in zip(lane_library_list, num_reads_list):
+            index = get_index(library_number_iter_, 0)
+            index2 = get_index(library_number_iter_, 1)
+            fastq_list_rows.append({
+                "RGID": f"{index}.{index2}.{lane_iter_}",
+                "RGSM": library_id_iter_,
+                "RGLB": "UnknownLibrary",
+                "Lane": lane_iter_,
+                "Read1File": f"{library_id_iter_}_S{library_number_iter_ + 1}_L{lane_iter_:03d}_R1_001.{fastq_suffix}",
+                "Read2File": f"{library_id_iter_}_S{library_number_iter_ + 1}_L{lane_iter_:03d}_R2_001.{fastq_suffix}",
+            })
+            demux_stats_rows.append(get_demux_stats_row(
+                lane_iter_, library_id_iter_, f"{index}-{index2}", num_reads_iter_, lane_num_reads
+            ))
+
+        demux_stats_rows.append(get_demux_stats_row(
+            lane_iter_, "Undetermined", "", num_undetermined_reads, lane_num_reads
+        ))
+
+    # Topups and reruns of libraries on the previous run
+    resequenced_library_id_list = rng.sample(
+        library_id_list,
+        min(num_libraries, round(num_libraries * topup_fraction) + round(num_libraries * rerun_fraction))
+    )
+    num_reruns = min(len(resequenced_library_id_list), round(num_libraries * rerun_fraction))
+
+    # Downstream workflow runs
+    if num_workflow_runs is None:
+        num_workflow_runs = num_libraries // 10 + 1
+    workflow_runs = []
+    for workflow_run_number_iter_ in range(num_workflow_runs):
+        workflow_name = DRAGEN_WORKFLOW_NAMES[workflow_run_number_iter_ % len(DRAGEN_WORKFLOW_NAMES)]
+        library_id, tumor_library_id = rng.sample(library_id_list, 2) if num_libraries > 1 else (library_id_list[0], None)
+        workflow_runs.append(get_workflow_run(
+            rng,
+            workflow_name=workflow_name,
+            library_id=library_id,
+            tumor_library_id=(
+                tumor_library_id
+                if workflow_name == "dragen-wgts-dna" and workflow_run_number_iter_ % 2 == 0
+                else None
+            ),
+            run_date=run_date + timedelta(days=2),
+            workflow_run_number=workflow_run_number_iter_ + 1,
+        ))
+
+    return {
+        "instrumentRunId": instrument_run_id,
+        "platform": platform,
+        "numLanes": num_lanes,
+        "libraryIdList": library_id_list,
+        "samplesheet": samplesheet,
+        "outputUri": output_uri,
+        "fastqListUri": f"{output_uri}Reports/fastq_list.csv",
+        "demuxStatsUri": f"{output_uri}Reports/Demultiplex_Stats.csv",
+        "fastqListCsv": get_csv_text(FASTQ_LIST_COLUMNS, fastq_list_rows),
+        "demuxStatsCsv": get_csv_text(DEMUX_STATS_COLUMNS, demux_stats_rows),
+        "previousInstrumentRunId": previous_instrument_run_id,
+        "topupLibraryIdList": sorted(resequenced_library_id_list[num_reruns:]),
+        "rerunLibraryIdList": sorted(resequenced_library_id_list[:num_reruns]),
+        "workflowRuns": workflow_runs,
+    }
+
+
+def get_bclconvert_data_rows(synthetic_run: SyntheticRun, library_id: str) -> List[Dict[str, Any]]:
+    return list(filter(
+        lambda bclconvert_row_iter_: bclconvert_row_iter_['sampleId'] == library_id,
+        synthetic_run['samplesheet']['bclconvertData']
+    ))
+
+
+def write_synthetic_run_reports(synthetic_run: SyntheticRun, object_store: Any):
+    """
+    Write the fastq list and demux stats reports to the object store (the S3 stand-in)
+    :param synthetic_run:
+    :param object_store:
+    :return:
+    """
+    object_store.put_object_bytes(synthetic_run['fastqListUri'], synthetic_run['fastqListCsv'].encode())
+    object_store.put_object_bytes(synthetic_run['demuxStatsUri'], synthetic_run['demuxStatsCsv'].encode())
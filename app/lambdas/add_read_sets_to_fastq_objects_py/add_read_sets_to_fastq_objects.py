@@ -2,80 +2,171 @@
 
 """
 Add read sets and read counts to fastq objects.
+
+Given readSetUpdatesUri and libraryIdList (the output of the plan read set updates step),
+only the updates planned for these libraries are applied,
+fastqs whose read set and read counts already match the run manifest are never fetched or written to.
+Each update's detach -> add read set -> add read count chain (only the calls the update needs)
+is run concurrently with the chains of the other updates.
+
+Calls within a chain are always made in order.
+
+Each completed call is checkpointed in the journal of the library for this execution (executionId),
+so a retry of this invocation resumes each chain where the previous attempt stopped,
+rather than finding the read set attached and skipping the read count (see fastq_glue_tools.checkpoint_journal).
+
+Set FASTQ_MANAGER_MAX_WORKERS to 1 to run every request serially.
 """
 
+# Imports
+from typing import Dict, List, Optional
+
 # Layer imports
 from orcabus_api_tools.fastq import (
-    get_fastq, add_read_set,
+    add_read_set,
     add_read_count, detach_read_set
 )
+from fastq_glue_tools.checkpoint_journal import CheckpointJournal, get_checkpoint_journal
+from fastq_glue_tools.concurrency import (
+    RetryPolicy,
+    call_with_retries,
+    get_max_workers,
+    get_retry_policy,
+    map_concurrently
+)
+from fastq_glue_tools.read_set_diff import (
+    ReadSetUpdate,
+    get_read_set_updates_by_library_id,
+    get_read_set_updates_for_libraries
+)
 
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
 
-def handler(event, context):
+# Count and time every api call against its endpoint
+add_read_set = instrument_api_call(add_read_set)
+add_read_count = instrument_api_call(add_read_count)
+detach_read_set = instrument_api_call(detach_read_set)
+
+
+def apply_read_set_update(
+        read_set_update: ReadSetUpdate,
+        retry_policy: RetryPolicy,
+        journal: CheckpointJournal
+):
     """
-    Add read sets and read counts to fastq objects.
-    :param event:
-    :param context:
+    Make the calls the planned update needs, in order,
+    calls checkpointed by a previous attempt of this execution are not repeated
+    :param read_set_update:
+    :param retry_policy:
+    :param journal:
     :return:
     """
+    lane = read_set_update['lane']
 
-    # Get the input parameters
-    fastq_id_list = event['fastqIdList']
-    file_names_list = event['fileNamesList']
-    demux_data = event['demuxData']
+    if read_set_update['detachReadSet']:
+        journal.checkpoint(
+            "detachReadSet",
+            lambda: call_with_retries(
+                lambda: detach_read_set(read_set_update['fastqId']),
+                retry_policy=retry_policy
+            ),
+            lane=lane
+        )
 
-    # Get fastq objects from fastq list
-    fastq_objects = list(map(
-        lambda fastq_id_iter_: get_fastq(fastq_id_iter_, includeS3Details=True),
-        fastq_id_list
-    ))
+    if read_set_update['readSet'] is not None:
+        journal.checkpoint(
+            "addReadSet",
+            lambda: call_with_retries(
+                lambda: add_read_set(
+                    fastq_id=read_set_update['fastqId'],
+                    read_set=read_set_update['readSet']
+                ),
+                retry_policy=retry_policy
+            ),
+            lane=lane
+        )
+
+    if read_set_update['readCount'] is not None:
+        journal.checkpoint(
+            "addReadCount",
+            lambda: call_with_retries(
+                lambda: add_read_count(
+                    fastq_id=read_set_update['fastqId'],
+                    read_count=read_set_update['readCount']
+                ),
+                retry_policy=retry_policy
+            ),
+            lane=lane
+        )
 
-    for fastq_object in fastq_objects:
-        # Files
-        fastq_file_name = next(filter(
-            lambda file_name_iter_: file_name_iter_['lane'] == fastq_object['lane'],
-            file_names_list
-        ))
-
-        # Demux data
-        demux_data_object = next(filter(
-            lambda demux_data_iter_: demux_data_iter_['lane'] == fastq_object['lane'],
-            demux_data
-        ))
-
-        if (
-            fastq_object['readSet'] is not None
-            and fastq_object['readSet'].get('r1', {}).get('s3Uri', None) == fastq_file_name['read1FileUri']
-            and fastq_object['readSet'].get('r2', {}).get('s3Uri', None) == fastq_file_name['read2FileUri']
-        ):
-            # The read set is already attached, skip
-            continue
-
-        if fastq_object['readSet'] is not None:
-            # Detach the old read set first
-            detach_read_set(fastq_object['id'])
-
-        # Add read set
-        add_read_set(
-            fastq_id=fastq_object['id'],
-            read_set={
-                "r1": {
-                    "s3Uri": fastq_file_name['read1FileUri']
-                },
-                "r2": {
-                    "s3Uri": fastq_file_name['read2FileUri']
-                },
-                "compressionFormat": (
-                    "ORA" if fastq_file_name['read1FileUri'].endswith('.ora') else "GZIP"
-                )
-            }
+
+def apply_read_set_updates(
+        read_set_updates_uri: str,
+        library_id_list: List[str],
+        execution_id: Optional[str]
+) -> Dict[str, int]:
+    """
+    Apply the planned updates of the libraries, returns the number of updated and new fastqs
+    :param read_set_updates_uri:
+    :param library_id_list:
+    :param execution_id:
+    :return:
+    """
+    read_set_update_list = get_read_set_updates_for_libraries(read_set_updates_uri, library_id_list)
+
+    # Get the concurrency / retry configuration
+    max_workers = get_max_workers()
+    retry_policy = get_retry_policy()
+
+    # Get the calls completed by previous attempts of this execution, for each library with updates
+    library_id_with_updates_list = list(get_read_set_updates_by_library_id(read_set_update_list).keys())
+    journals_by_library_id: Dict[str, CheckpointJournal] = dict(zip(
+        library_id_with_updates_list,
+        map_concurrently(
+            lambda library_id_iter_: get_checkpoint_journal(execution_id, library_id_iter_),
+            library_id_with_updates_list,
+            max_workers=max_workers
         )
+    ))
+
+    # Run the mutation chain of each update
+    map_concurrently(
+        lambda read_set_update_iter_: apply_read_set_update(
+            read_set_update_iter_,
+            retry_policy=retry_policy,
+            journal=journals_by_library_id[read_set_update_iter_['libraryId']]
+        ),
+        read_set_update_list,
+        max_workers=max_workers
+    )
+
+    return {
+        "updated": len(list(filter(
+            lambda read_set_update_iter_: read_set_update_iter_['updateType'] == 'update',
+            read_set_update_list
+        ))),
+        "new": len(list(filter(
+            lambda read_set_update_iter_: read_set_update_iter_['updateType'] == 'new',
+            read_set_update_list
+        ))),
+    }
+
+
+@instrument_handler
+def handler(event, context):
+    """
+    Add read sets and read counts to fastq objects.
+    :param event:
+    :param context:
+    :return:
+    """
 
-        # Add read counts
-        add_read_count(
-            fastq_id=fastq_object['id'],
-            read_count={
-                "readCount": demux_data_object['readCount'],
-                "baseCountEst": demux_data_object['baseCountEst']
-            }
+    # Apply the planned updates
+    return {
+        "readSetUpdateCounts": apply_read_set_updates(
+            read_set_updates_uri=event['readSetUpdatesUri'],
+            library_id_list=event['libraryIdList'],
+            execution_id=event.get('executionId', None)
         )
+    }
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+
+"""
+Build the run manifest
+
+Given the inputs instrumentRunId, fastqListUri and demuxStatsUri,
+
+1. Load the bclconvert data (from the samplesheet), the fastq list and the demux stats for the whole run, once,
+   reports are read from their parquet sidecars (see build run reports cache), or parsed if no sidecar exists
+2. Join the three on libraryId / lane (hash joins, rather than a filter per library)
+3. Flag the rows that are missing from any of the three sources
+4. Write the rows out as a run manifest, partitioned on library id (see fastq_glue_tools.run_manifest)
+
+Returns the manifest uri, the per-library steps then only need the manifest uri and their library id.
+
+The manifest is keyed on the etags of both reports and the sha256 of the samplesheet,
+if the manifest for these versions already exists the reports are not read again.
+
+Manifest rows have the following columns:
+* libraryId
+* lane
+* index  (samplesheet)
+* cycleCount  (samplesheet)
+* read1FileUri  (fastq list)
+* read2FileUri  (fastq list)
+* readCount  (demux stats)
+* baseCountEst  (demux stats, readCount * cycleCount, the global cycle count is used if the row is not in the samplesheet)
+* hasBclconvertData / hasFileNames / hasDemuxStats
+"""
+
+# Imports
+import json
+import hashlib
+import logging
+from typing import Dict, Any, List, Union
+import pandas as pd
+
+# Orcabus API tool imports
+from orcabus_api_tools.sequence import (
+    get_sample_sheet_from_instrument_run_id
+)
+
+# Layer imports
+from fastq_glue_tools.object_store import (
+    get_object_store,
+    get_bucket_key_from_s3_uri,
+    get_cache_root_uri,
+    ObjectStore
+)
+from fastq_glue_tools.reports import (
+    ReportSchema,
+    FASTQ_LIST_REPORT_SCHEMA,
+    DEMUX_STATS_REPORT_SCHEMA,
+    read_report_csv
+)
+from fastq_glue_tools.report_cache import read_report_rows_from_cache
+from fastq_glue_tools.run_manifest import (
+    RunManifestRow,
+    RunManifestSources,
+    get_run_manifest_id,
+    get_run_manifest_uri,
+    get_run_manifest_index,
+    write_run_manifest
+)
+from fastq_glue_tools.samplesheet import compile_samplesheet_index, get_global_cycle_count
+from fastq_glue_tools.samplesheet_cache import get_cached_samplesheet, get_compact_samplesheet
+from fastq_glue_tools.demux_stats import get_base_count_est_series
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+get_sample_sheet_from_instrument_run_id = instrument_api_call(get_sample_sheet_from_instrument_run_id)
+
+# Globals
+JOIN_KEYS = ["libraryId", "lane"]
+SOURCE_FLAG_COLUMNS = ["hasBclconvertData", "hasFileNames", "hasDemuxStats"]
+UNDETERMINED_SAMPLE_ID = "Undetermined"
+NUM_UNMATCHED_ROWS_TO_LOG = 10
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_samplesheet_sha256(samplesheet: Dict[str, Any]) -> str:
+    return hashlib.sha256(
+        json.dumps(get_compact_samplesheet(samplesheet), sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def get_report_etag(report_uri: str, object_store: ObjectStore) -> str:
+    report_etag = object_store.get_etag(report_uri)
+    if report_etag is None:
+        raise FileNotFoundError(f"Could not find report {report_uri}")
+    return report_etag
+
+
+def read_report(report_uri: str, report_schema: ReportSchema, object_store: ObjectStore) -> pd.DataFrame:
+    """
+    Read the whole report from its sidecar, falling back to the report itself if the sidecar has not been built
+    :param report_uri:
+    :param report_schema:
+    :param object_store:
+    :return:
+    """
+    report_df = read_report_rows_from_cache(
+        report_uri=report_uri,
+        sample_id_list=None,
+        report_schema=report_schema,
+        object_store=object_store
+    )
+    if report_df is not None:
+        return report_df
+
+    return read_report_csv(
+        report_uri,
+        report_schema=report_schema,
+        object_store=object_store
+    )
+
+
+def get_bclconvert_data_df(samplesheet: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Get the bclconvert data rows for every sample in the samplesheet.
+    As with the base count estimate lookup, only the first row of a library / lane is kept.
+
+    Output columns are as follows:
+    * libraryId
+    * lane
+    * index
+    * cycleCount
+    * hasBclconvertData
+    :param samplesheet:
+    :return:
+    """
+    samplesheet_index = compile_samplesheet_index(samplesheet)
+
+    return pd.DataFrame(
+        [
+            bclconvert_row_iter_
+            for bclconvert_rows_iter_ in samplesheet_index['bclConvertDataBySampleId'].values()
+            for bclconvert_row_iter_ in bclconvert_rows_iter_
+        ],
+        columns=["libraryId", "index", "lane", "cycleCount"],
+    ).astype({
+        "lane": "int64",
+        "cycleCount": "int64",
+    }).drop_duplicates(
+        subset=JOIN_KEYS,
+        keep="first"
+    ).assign(
+        hasBclconvertData=True
+    )
+
+
+def get_file_names_df(fastq_list_uri: str, object_store: ObjectStore) -> pd.DataFrame:
+    """
+    Read the fastq list, and convert the file names to uris with column operations.
+    Files live under <outputUri>/Samples/Lane_<lane>/<sample id>/
+
+    Output columns are as follows:
+    * libraryId
+    * lane
+    * read1FileUri
+    * read2FileUri (None for single ended reads)
+    * hasFileNames
+    :param fastq_list_uri:
+    :param object_store:
+    :return:
+    """
+    fastq_list_df = read_report(fastq_list_uri, FASTQ_LIST_REPORT_SCHEMA, object_store)
+
+    samples_bucket, samples_prefix = get_bucket_key_from_s3_uri(
+        fastq_list_uri.replace("Reports/fastq_list.csv", "Samples/")
+    )
+
+    sample_dir_uri_series = (
+        f"s3://{samples_bucket}/{samples_prefix.rstrip('/')}/Lane_" +
+        fastq_list_df["Lane"].astype(str) + "/" +
+        fastq_list_df["RGSM"] + "/"
+    )
+
+    return pd.DataFrame({
+        "libraryId": fastq_list_df["RGSM"],
+        "lane": fastq_list_df["Lane"].astype("int64"),
+        "read1FileUri": sample_dir_uri_series + fastq_list_df["Read1File"],
+        "read2FileUri": (sample_dir_uri_series + fastq_list_df["Read2File"]).astype(object).where(
+            fastq_list_df["Read2File"].notna(), None
+        ),
+    }).drop_duplicates(
+        subset=JOIN_KEYS,
+        keep="first"
+    ).assign(
+        hasFileNames=True
+    )
+
+
+def get_demux_stats_df(
+        demux_stats_uri: str,
+        samplesheet: Dict[str, Any],
+        object_store: ObjectStore
+) -> pd.DataFrame:
+    """
+    Read the demux stats, dropping the undetermined reads,
+    and compute the estimated base count for the whole run in one column operation
+
+    Output columns are as follows:
+    * libraryId
+    * lane
+    * readCount
+    * baseCountEst
+    * hasDemuxStats
+    :param demux_stats_uri:
+    :param samplesheet:
+    :param object_store:
+    :return:
+    """
+    demux_stats_df = read_report(demux_stats_uri, DEMUX_STATS_REPORT_SCHEMA, object_store)
+
+    demux_stats_df = demux_stats_df.loc[demux_stats_df["SampleID"] != UNDETERMINED_SAMPLE_ID]
+
+    return pd.DataFrame({
+        "libraryId": demux_stats_df["SampleID"],
+        "lane": demux_stats_df["Lane"].astype("int64"),
+        "readCount": demux_stats_df["# Reads"].astype("int64"),
+        "baseCountEst": get_base_count_est_series(
+            demux_stats_df,
+            samplesheet,
+            get_global_cycle_count(samplesheet)
+        ),
+    }).drop_duplicates(
+        subset=JOIN_KEYS,
+        keep="first"
+    ).assign(
+        hasDemuxStats=True
+    )
+
+
+def merge_run_manifest_dataframes(
+        bclconvert_data_df: pd.DataFrame,
+        file_names_df: pd.DataFrame,
+        demux_stats_df: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Outer join the three dataframes on libraryId and lane,
+    rows missing from a source have that source's flag set to False.
+    :param bclconvert_data_df:
+    :param file_names_df:
+    :param demux_stats_df:
+    :return:
+    """
+    run_manifest_df = pd.merge(
+        bclconvert_data_df,
+        file_names_df,
+        on=JOIN_KEYS,
+        how="outer",
+    )
+    run_manifest_df = pd.merge(
+        run_manifest_df,
+        demux_stats_df,
+        on=JOIN_KEYS,
+        how="outer",
+    )
+
+    run_manifest_df[SOURCE_FLAG_COLUMNS] = run_manifest_df[SOURCE_FLAG_COLUMNS].fillna(False).astype(bool)
+
+    return run_manifest_df.assign(
+        cycleCount=lambda df_iter_: df_iter_["cycleCount"].astype("Int64"),
+        readCount=lambda df_iter_: df_iter_["readCount"].astype("Int64"),
+        baseCountEst=lambda df_iter_: df_iter_["baseCountEst"].astype("Int64"),
+    ).sort_values(
+        by=JOIN_KEYS,
+        kind="stable"
+    ).reset_index(drop=True)
+
+
+def get_run_manifest_rows(run_manifest_df: pd.DataFrame) -> List[RunManifestRow]:
+    """
+    Convert the run manifest dataframe to (json serialisable) records, missing values become None
+    :param run_manifest_df:
+    :return:
+    """
+    run_manifest_df = run_manifest_df[list(RunManifestRow.__annotations__.keys())]
+
+    return list(map(
+        lambda record_iter_: RunManifestRow(**record_iter_),
+        run_manifest_df.astype(object).where(
+            run_manifest_df.notna(), None
+        ).to_dict(orient="records")
+    ))
+
+
+@instrument_handler
+def handler(event, context) -> Dict[str, Union[str, int]]:
+    """
+    Build the run manifest for this instrument run
+    :param event:
+    :param context:
+    :return:
+    """
+
+    # Get the inputs
+    instrument_run_id = event['instrumentRunId']
+    fastq_list_uri = event['fastqListUri']
+    demux_stats_uri = event['demuxStatsUri']
+
+    # Get the cache root
+    cache_root_uri = get_cache_root_uri()
+    if cache_root_uri is None:
+        raise ValueError("The fastq glue cache uri has not been configured")
+
+    object_store = get_object_store()
+
+    # Read the samplesheet (through the samplesheet cache)
+    samplesheet = get_cached_samplesheet(
+        instrument_run_id,
+        fetch_samplesheet=lambda: get_sample_sheet_from_instrument_run_id(instrument_run_id)['sampleSheetContent'],
+        object_store=object_store
+    )
+
+    sources: RunManifestSources = {
+        "fastqListUri": fastq_list_uri,
+        "fastqListEtag": get_report_etag(fastq_list_uri, object_store),
+        "demuxStatsUri": demux_stats_uri,
+        "demuxStatsEtag": get_report_etag(demux_stats_uri, object_store),
+        "samplesheetSha256": get_samplesheet_sha256(samplesheet),
+    }
+
+    # Check if the manifest for these versions of the sources has already been built
+    run_manifest_uri = get_run_manifest_uri(cache_root_uri, instrument_run_id, get_run_manifest_id(sources))
+    if object_store.get_etag(run_manifest_uri) is None:
+        run_manifest_df = merge_run_manifest_dataframes(
+            bclconvert_data_df=get_bclconvert_data_df(samplesheet),
+            file_names_df=get_file_names_df(fastq_list_uri, object_store),
+            demux_stats_df=get_demux_stats_df(demux_stats_uri, samplesheet, object_store),
+        )
+
+        run_manifest_uri = write_run_manifest(
+            cache_root_uri=cache_root_uri,
+            instrument_run_id=instrument_run_id,
+            sources=sources,
+            run_manifest_rows=get_run_manifest_rows(run_manifest_df),
+            object_store=object_store
+        )
+    else:
+        logger.info(f"Run manifest {run_manifest_uri} already exists, skipping")
+
+    run_manifest_index = get_run_manifest_index(run_manifest_uri, object_store=object_store)
+
+    if len(run_manifest_index['unmatchedRows']) > 0:
+        logger.warning(
+            f"{len(run_manifest_index['unmatchedRows'])} of {run_manifest_index['numRows']} rows "
+            f"in the run manifest are missing from at least one source, first rows: "
+            f"{json.dumps(run_manifest_index['unmatchedRows'][:NUM_UNMATCHED_ROWS_TO_LOG])}"
+        )
+
+    return {
+        "runManifestUri": run_manifest_uri,
+        "numLibraries": run_manifest_index['numLibraries'],
+        "numUnmatchedRows": len(run_manifest_index['unmatchedRows']),
+    }
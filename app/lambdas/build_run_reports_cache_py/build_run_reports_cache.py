@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Build the run reports cache
+
+Given the inputs fastqListUri and demuxStatsUri,
+parse each report once and write a parquet sidecar sorted by sample id
+to the fastq glue cache.
+
+The build run manifest step then reads both reports from their sidecars,
+rather than parse the csvs again.
+"""
+
+# Imports
+from typing import Dict
+
+# Layer imports
+from fastq_glue_tools.object_store import get_cache_root_uri
+from fastq_glue_tools.report_cache import build_report_sidecar
+from fastq_glue_tools.reports import (
+    FASTQ_LIST_REPORT_SCHEMA,
+    DEMUX_STATS_REPORT_SCHEMA
+)
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler
+
+
+@instrument_handler
+def handler(event, context) -> Dict[str, str]:
+    """
+    Build the fastq list and demux stats sidecars for this run
+    :param event:
+    :param context:
+    :return:
+    """
+
+    # Get the inputs
+    fastq_list_uri = event['fastqListUri']
+    demux_stats_uri = event['demuxStatsUri']
+
+    # Get the cache root
+    cache_root_uri = get_cache_root_uri()
+    if cache_root_uri is None:
+        raise ValueError("The fastq glue cache uri has not been configured")
+
+    return {
+        "fastqListCacheUri": build_report_sidecar(
+            report_uri=fastq_list_uri,
+            report_schema=FASTQ_LIST_REPORT_SCHEMA,
+            cache_root_uri=cache_root_uri
+        ),
+        "demuxStatsCacheUri": build_report_sidecar(
+            report_uri=demux_stats_uri,
+            report_schema=DEMUX_STATS_REPORT_SCHEMA,
+            cache_root_uri=cache_root_uri
+        ),
+    }
@@ -59,19 +59,10 @@ The fastq set object has the following structure:
 """
 
 # Imports
-import typing
-from typing import Optional, List
-from pathlib import Path
-from tempfile import TemporaryDirectory
-import boto3
+from typing import Dict, List, Optional, TypedDict
 import re
 import pandas as pd
 from datetime import datetime
-import json
-from os import environ
-
-# Custom imports (only if we need to read the lab-metadata tracking sheet)
-from gspread_pandas import Spread
 
 # Layer imports
 from orcabus_api_tools.fastq import (
@@ -87,19 +78,24 @@ from orcabus_api_tools.fastq.models import (
     FastqSet, FastqListRow
 )
 
-if typing.TYPE_CHECKING:
-    from mypy_boto3_ssm import SSMClient
+from fastq_glue_tools.checkpoint_journal import CheckpointJournal, get_checkpoint_journal
+from fastq_glue_tools.library_lock import get_lease_seconds, library_lock
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call, timed_phase, add_rows_processed
+
+# Count and time every api call against its endpoint
+create_fastq_set_object = instrument_api_call(create_fastq_set_object)
+create_fastq_object = instrument_api_call(create_fastq_object)
+allow_additional_fastqs_to_fastq_set = instrument_api_call(allow_additional_fastqs_to_fastq_set)
+disallow_additional_fastqs_to_fastq_set = instrument_api_call(disallow_additional_fastqs_to_fastq_set)
+link_fastq_to_fastq_set = instrument_api_call(link_fastq_to_fastq_set)
+set_is_not_current_fastq_set = instrument_api_call(set_is_not_current_fastq_set)
+get_fastq_sets = instrument_api_call(get_fastq_sets)
 
 # Globals
 DEFAULT_PLATFORM = "Illumina"
 DEFAULT_CENTER = "UMCCR"
-
-# For emergency use only!
-# Currently no way to distinguish between topups and rerun
-# Solution is to use the metadata tracking sheet
-GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH_ENV_VAR = "GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH"
-METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH_ENV_VAR = "METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH"
-GET_YEAR_FROM_LIBRARY_ID_REGEX = re.compile(r"L(?:PRJ)?(\d{2})(?:\d{5})?")
 INSTRUMENT_RUN_ID_TO_DATE_REGEX = {
     # NovaSeq6000 example: 250320_A01052_0256_BHFCFCDSXF
     "NovaSeq6000": re.compile(r"(\d{6})_[A-Z0-9]+_[0-9]{4}_[A-Z0-9]+"),
@@ -108,6 +104,13 @@ INSTRUMENT_RUN_ID_TO_DATE_REGEX = {
 }
 
 
+class LibraryFastqSetSnapshot(TypedDict):
+    libraryId: str
+    fastqSetsOnRun: List[FastqSet]
+    currentFastqSets: List[FastqSet]
+    otherFastqSets: List[FastqSet]
+
+
 def get_date_from_instrument_run_id(instrument_run_id: str) -> str:
     if match := INSTRUMENT_RUN_ID_TO_DATE_REGEX["NovaSeq6000"].match(instrument_run_id):
         return datetime.strptime(match.group(1), "%y%m%d").strftime("%Y-%m-%d")
@@ -119,66 +122,83 @@ def get_date_from_instrument_run_id(instrument_run_id: str) -> str:
         )
 
 
-def merge_dataframes(
+def get_fastq_list_row_run_fields(instrument_run_id: str) -> Dict[str, str]:
+    """
+    Get the fields that are the same for every fastq list row of the run,
+    so that the date is parsed once rather than once per row
+    :param instrument_run_id:
+    :return:
+    """
+    return {
+        "instrumentRunId": instrument_run_id,
+        "platform": DEFAULT_PLATFORM,
+        "center": DEFAULT_CENTER,
+        # Convert 250320_A01052_0256_BHFCFCDSXF
+        # To 2025-03-20
+        # For NovaSeq X, we convert
+        # 20251124_LH00944_0001_A23CCTGLT4 to 2025-11-24
+        "date": get_date_from_instrument_run_id(instrument_run_id),
+    }
+
+
+def get_fastq_list_rows_from_df(
+        instrument_run_id: str,
         bclconvert_data_df: pd.DataFrame,
-        filenames_df: pd.DataFrame,
-        demux_stats_df: pd.DataFrame,
-) -> pd.DataFrame:
+) -> List[FastqListRow]:
     """
-    Merge the three dataframes on libraryId and lane
-
-    Output columns are as follows:
-    * libraryId
-    * lane
-    * index
-    * cycleCount
-    * read1FileUri
-    * read2FileUri
-    * readCount
+    Build the fastq list rows from the columns of the bclconvert data,
+    column.tolist() gives us native python values without boxing each row into a series
+    :param instrument_run_id:
+    :param bclconvert_data_df:
+    :return:
     """
-    merged_df = pd.merge(
-        bclconvert_data_df,
-        filenames_df,
-        on=["libraryId", "lane"],
-        how="inner",
-    )
-    merged_df = pd.merge(
-        merged_df,
-        demux_stats_df,
-        on=["libraryId", "lane"],
-        how="inner",
-    )
-    return merged_df
+    run_fields = get_fastq_list_row_run_fields(instrument_run_id)
+
+    return list(map(
+        lambda index_iter_, lane_iter_, library_id_iter_: FastqListRow(**dict({
+            "index": index_iter_,
+            "lane": lane_iter_,
+            "instrumentRunId": run_fields["instrumentRunId"],
+            "library": {
+                "libraryId": library_id_iter_
+            },
+            "platform": run_fields["platform"],
+            "center": run_fields["center"],
+            "date": run_fields["date"],
+            "isValid": True,
+        })),
+        bclconvert_data_df["index"].tolist(),
+        bclconvert_data_df["lane"].tolist(),
+        bclconvert_data_df["libraryId"].tolist(),
+    ))
 
 
 def generate_fastq_list_from_inputs(
         instrument_run_id: str,
         bclconvert_data_df: pd.DataFrame,
+        journal: Optional[CheckpointJournal] = None
 ) -> List[FastqListRow]:
     """
-    Generate fastq list row list from the inputs
+    Generate fastq list row list from the inputs,
+    fastq objects created by a previous attempt are taken from the journal
     :param instrument_run_id:
     :param bclconvert_data_df:
+    :param journal: The journal of this library in this execution, disabled if not set
     :return:
     """
+    if journal is None:
+        journal = CheckpointJournal(None)
+
     return list(map(
-        lambda index_row_iter_: create_fastq_object(
-            index=index_row_iter_[1]["index"],
-            lane=index_row_iter_[1]["lane"],
-            instrumentRunId=instrument_run_id,
-            library={
-                "libraryId": index_row_iter_[1]["libraryId"]
-            },
-            platform=DEFAULT_PLATFORM,
-            center=DEFAULT_CENTER,
-            # Convert 250320_A01052_0256_BHFCFCDSXF
-            # To 2025-03-20
-            # For NovaSeq X, we convert
-            # 20251124_LH00944_0001_A23CCTGLT4 to 2025-11-24
-            date=get_date_from_instrument_run_id(instrument_run_id),
-            isValid=True,
+        lambda fastq_list_row_iter_: journal.checkpoint(
+            "createFastqObject",
+            lambda: create_fastq_object(**fastq_list_row_iter_),
+            lane=fastq_list_row_iter_['lane']
         ),
-        bclconvert_data_df.iterrows()
+        get_fastq_list_rows_from_df(
+            instrument_run_id=instrument_run_id,
+            bclconvert_data_df=bclconvert_data_df
+        )
     ))
 
 
@@ -198,185 +218,74 @@ def create_fastq_set_from_df(
         },
         allowAdditionalFastq=False,
         isCurrentFastqSet=True,
-        fastqSet=list(map(
-            lambda index_row_iter_: FastqListRow(**dict({
-                "index": index_row_iter_[1]["index"],
-                "lane": index_row_iter_[1]["lane"],
-                "instrumentRunId": instrument_run_id,
-                "library": {
-                    "libraryId": index_row_iter_[1]["libraryId"]
-                },
-                "platform": DEFAULT_PLATFORM,
-                "center": DEFAULT_CENTER,
-                # Convert 250320_A01052_0256_BHFCFCDSXF
-                # To 2025-03-20
-                "date": get_date_from_instrument_run_id(instrument_run_id),
-                "isValid": True,
-            })),
-            bclconvert_data_df.iterrows()
-        ))
-    )
-
-
-def get_ssm_client() -> 'SSMClient':
-    return boto3.client('ssm')
-
-
-def create_gspread_pandas_dir() -> Path:
-    """
-    Get the gspread pandas creds directory
-    :return:
-    """
-
-    # Create the directory
-    gspread_pandas_creds_dir = TemporaryDirectory()
-
-    return Path(gspread_pandas_creds_dir.name)
-
-
-def get_google_secret_contents() -> str:
-    ssm_client: SSMClient = get_ssm_client()
-
-    return ssm_client.get_parameter(
-        Name=environ[GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH_ENV_VAR],
-        WithDecryption=True
-    ).get("Parameter").get("Value")
-
-
-def download_google_secret_json_to_gspread_pandas_dir(gspread_pandas_dir: Path):
-    secret_contents: str = get_google_secret_contents()
-
-    if not gspread_pandas_dir.is_dir():
-        gspread_pandas_dir.mkdir(parents=True, exist_ok=True)
-
-    with open(gspread_pandas_dir / "google_secret.json", "w") as g_secret_h:
-        g_secret_h.write(secret_contents)
-
-
-def set_google_secrets():
-    if environ.get("GSPREAD_PANDAS_CONFIG_DIR", None) is not None:
-        return
-
-    # Add in the secret and set the env var
-    gspread_pandas_dir = create_gspread_pandas_dir()
-
-    download_google_secret_json_to_gspread_pandas_dir(gspread_pandas_dir)
-
-    environ["GSPREAD_PANDAS_CONFIG_DIR"] = str(gspread_pandas_dir)
-
-
-def get_tracking_sheet_id() -> str:
-    """
-    Get the sheet id for glims
-    """
-    ssm_client: SSMClient = get_ssm_client()
-
-    return ssm_client.get_parameter(
-        Name=environ[METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH_ENV_VAR],
-        WithDecryption=True
-    ).get("Parameter").get("Value")
-
-
-def get_metadata_sheet_for_library_year(year: int) -> pd.DataFrame:
-    metadata_sheet_df: pd.DataFrame = Spread(
-        spread=get_tracking_sheet_id(),
-        sheet=f"{year}"
-    ).sheet_to_df(index=0)
-
-    return metadata_sheet_df.replace("", pd.NA)
-
-
-def get_year_from_library_id(library_id: str):
-    """
-    Regex to get the year from the library id
-    L(?:PRJ)?\d{2}(?:\d{5})?
-    :param library_id:
-    :return:
-    """
-    library_regex_obj = GET_YEAR_FROM_LIBRARY_ID_REGEX.match(
-        library_id
-    )
-
-    if library_regex_obj is None:
-        raise ValueError(
-            f"Could not get year from library id: {library_id}"
+        fastqSet=get_fastq_list_rows_from_df(
+            instrument_run_id=instrument_run_id,
+            bclconvert_data_df=bclconvert_data_df
         )
-
-    # Get the year from the library id
-    year = library_regex_obj.group(1)
-
-    return datetime.strptime(year, "%y").year
+    )
 
 
-def has_existing_fastq_set(
-        library_id: Optional[str] = None,
-        instrument_run_id: Optional[str] = None,
-        is_current_fastq_set: Optional[bool] = None
-) -> bool:
+def get_library_fastq_set_snapshot(
+        library_id: str,
+        instrument_run_id: str
+) -> LibraryFastqSetSnapshot:
     """
-    Check if there already exists a current fastq set for this library id.
-    If this is true then we may have a topup or a rerun. In order to
-    find this out, we will need to pull down the lab-metadata sheet.
+    Fetch all fastq sets for this library once, and classify them in memory as
+    * fastqSetsOnRun: fastq sets with a fastq from this instrument run
+    * currentFastqSets: the current fastq set(s) for this library
+    * otherFastqSets: everything else
+    A fastq set may be both on this run and current.
     :param library_id:
     :param instrument_run_id:
-    :param is_current_fastq_set:
     :return:
     """
-    return (
-        True
-        if len(get_fastq_sets(
-            **dict(filter(
-                lambda kv: kv[1] is not None,
-                {
-                    "library": library_id,
-                    "instrumentRunId": instrument_run_id,
-                    "currentFastqSet": json.dumps(is_current_fastq_set) if is_current_fastq_set else None,
-                }.items()
-            ))
-        )) > 0
-        else False
+    fastq_set_list: List[FastqSet] = get_fastq_sets(
+        library=library_id
     )
 
+    fastq_sets_on_run = list(filter(
+        lambda fastq_set_iter_: any(map(
+            lambda fastq_iter_: fastq_iter_.get('instrumentRunId', None) == instrument_run_id,
+            fastq_set_iter_.get('fastqSet', [])
+        )),
+        fastq_set_list
+    ))
+    current_fastq_sets = list(filter(
+        lambda fastq_set_iter_: fastq_set_iter_.get('isCurrentFastqSet', False),
+        fastq_set_list
+    ))
 
-def is_topup(
-        library_id: str,
-) -> bool:
-    library_id_list = (
-        get_metadata_sheet_for_library_year(
-            get_year_from_library_id(library_id)
-        )['LibraryID']
-        .dropna()
-        .unique()
-        .tolist()
-    )
-
-
-    if f"{library_id}_topup" in library_id_list:
-        return True
-    return False
+    return {
+        "libraryId": library_id,
+        "fastqSetsOnRun": fastq_sets_on_run,
+        "currentFastqSets": current_fastq_sets,
+        "otherFastqSets": list(filter(
+            lambda fastq_set_iter_: (
+                fastq_set_iter_ not in fastq_sets_on_run and
+                fastq_set_iter_ not in current_fastq_sets
+            ),
+            fastq_set_list
+        )),
+    }
 
 
-def is_rerun(
-        library_id: str,
-) -> bool:
-    library_id_list = (
-        get_metadata_sheet_for_library_year(
-            get_year_from_library_id(library_id)
-        )['LibraryID']
-        .dropna()
-        .unique()
-        .tolist()
-    )
+def get_current_fastq_set(
+        library_fastq_set_snapshot: LibraryFastqSetSnapshot
+) -> FastqSet:
+    # Check we have one and only one fastq set
+    if len(library_fastq_set_snapshot['currentFastqSets']) != 1:
+        raise ValueError(
+            f"Expected one and only one fastq set for this library id {library_fastq_set_snapshot['libraryId']}"
+        )
 
-    if f"{library_id}_rerun" in library_id_list:
-        return True
-    return False
+    return library_fastq_set_snapshot['currentFastqSets'][0]
 
 
 def append_to_existing_fastq_set(
-        library_id: str,
+        library_fastq_set_snapshot: LibraryFastqSetSnapshot,
         instrument_run_id: str,
-        bclconvert_data_df: pd.DataFrame
+        bclconvert_data_df: pd.DataFrame,
+        journal: CheckpointJournal
 ) -> FastqSet:
     """
     Append fastqs to the existing fastq set
@@ -388,48 +297,67 @@ def append_to_existing_fastq_set(
     3. Then we link each of the fastqs to the fastq set
 
     4. And then we disable adding additional fastqs to the existing fastq set
+
+    Each step is checkpointed in the journal, a retry resumes from the first step that was not completed
     :return:
     """
 
     # Get the existing fastq set
-    fastq_set = get_fastq_sets(
-        library=library_id,
-        currentFastqSet=json.dumps(True),
-    )
-
-    # Check we have one and only one fastq set
-    if len(fastq_set) != 1:
-        raise ValueError(f"Expected one and only one fastq set for this library id {library_id}")
-
-    # Get the existing fastq set
-    fastq_set = fastq_set[0]
+    fastq_set = get_current_fastq_set(library_fastq_set_snapshot)
 
     # Allow additional fastqs to the existing fastq set
-    allow_additional_fastqs_to_fastq_set(fastq_set_id=fastq_set['id'])
+    journal.checkpoint(
+        "allowAdditionalFastqs",
+        lambda: allow_additional_fastqs_to_fastq_set(fastq_set_id=fastq_set['id'])
+    )
 
     # Create the new fastq list row objects from the inputs
     new_fastq_list = generate_fastq_list_from_inputs(
         instrument_run_id=instrument_run_id,
-        bclconvert_data_df=bclconvert_data_df
+        bclconvert_data_df=bclconvert_data_df,
+        journal=journal
     )
 
     # Link each of the fastqs to the fastq set
     for new_fastq in new_fastq_list:
-        link_fastq_to_fastq_set(
-            fastq_set_id=fastq_set['id'],
-            fastq_id=new_fastq['id']
+        journal.checkpoint(
+            "linkFastqToFastqSet",
+            lambda: link_fastq_to_fastq_set(
+                fastq_set_id=fastq_set['id'],
+                fastq_id=new_fastq['id']
+            ),
+            lane=new_fastq['lane']
         )
 
     # Disable adding additional fastqs to the existing fastq set
-    disallow_additional_fastqs_to_fastq_set(fastq_set_id=fastq_set['id'])
+    journal.checkpoint(
+        "disallowAdditionalFastqs",
+        lambda: disallow_additional_fastqs_to_fastq_set(fastq_set_id=fastq_set['id'])
+    )
 
     return fastq_set
 
 
+def set_current_fastq_set_not_current(
+        library_fastq_set_snapshot: LibraryFastqSetSnapshot
+) -> str:
+    """
+    Set the current fastq set of the library to not current, return its id
+    :param library_fastq_set_snapshot:
+    :return:
+    """
+    fastq_set = get_current_fastq_set(library_fastq_set_snapshot)
+
+    _ = set_is_not_current_fastq_set(fastq_set['id'])
+
+    return fastq_set['id']
+
+
 def replace_current_fastq_set(
-        library_id: str,
+        library_fastq_set_snapshot: LibraryFastqSetSnapshot,
         instrument_run_id: str,
         bclconvert_data_df: pd.DataFrame,
+        journal: CheckpointJournal
 ):
     """
     Rerun the fastq set -
@@ -439,26 +367,20 @@ def replace_current_fastq_set(
 
     1. Get the existing fastq set and set currentFastqSet to false
     2. Create the new fastq set object from the inputs
+
+    The first step is checkpointed in the journal, after it the library has no current fastq set,
+    so a retry must not look for it again
     :return:
     """
 
-    # Get the existing fastq set
-    fastq_set = get_fastq_sets(
-        library=library_id,
-        currentFastqSet=json.dumps(True)
-    )
-
-    # Check we have one and only one fastq set
-    if len(fastq_set) != 1:
-        raise ValueError(f"Expected one and only one fastq set for this library id {library_id}")
-
-    # Get the existing fastq set
-    fastq_set = fastq_set[0]
-
     # Set the existing fastq set to not current
-    _ = set_is_not_current_fastq_set(fastq_set['id'])
+    _ = journal.checkpoint(
+        "setIsNotCurrentFastqSet",
+        lambda: set_current_fastq_set_not_current(library_fastq_set_snapshot)
+    )
 
     # Create the new fastq set object from the inputs
+    # (once created, a retry finds it on the run)
     return generate_fastq_set_from_inputs(
         instrument_run_id=instrument_run_id,
         bclconvert_data_df=bclconvert_data_df,
@@ -479,52 +401,116 @@ def generate_fastq_set_from_inputs(
     )
 
 
-def handler(event, context):
+def get_fastq_set_creation_action(
+        library_fastq_set_snapshot: LibraryFastqSetSnapshot
+) -> str:
     """
-    Given the
-    :param event:
-    :param context:
+    Decide what to do for this library when no fastq set creation plan has been provided
+    One of 'exists', 'replace', 'append' or 'new'
+    :param library_fastq_set_snapshot:
     :return:
     """
-    # Get the inputs from the event
-    instrument_run_id = event["instrumentRunId"]
-    bclconvert_data_df = pd.DataFrame(event["bclConvertData"])
-    library_id = event['libraryId']
-
     # Check if has existing fastq set
     # If has existing fastq set for this instrument run id, we just return
     # Chances are we've already created the fastq set
-    library_id = pd.Series(bclconvert_data_df["libraryId"].unique()).item()
-    if has_existing_fastq_set(
-            library_id=library_id,
-            instrument_run_id=instrument_run_id,
-    ):
-        return get_fastq_sets(
-            library=library_id,
-            instrumentRunId=instrument_run_id,
-        )
+    if len(library_fastq_set_snapshot['fastqSetsOnRun']) > 0:
+        return 'exists'
 
     # If has existing fastq set for this library id
     # But not on this run
-    if has_existing_fastq_set(
-            library_id=library_id,
-            is_current_fastq_set=True
-    ):
+    if len(library_fastq_set_snapshot['currentFastqSets']) > 0:
         # Check if topup or rerun
         # Now we pull in the metadata tracking sheet
-        set_google_secrets()
+        # For emergency use only!
+        # Currently no way to distinguish between topups and rerun
+        # Solution is to use the metadata tracking sheet (cached across warm invocations)
+        # Imported here, as this is the only code path that needs the google sheets dependencies
+        from fastq_glue_tools.tracking_sheet import get_tracking_sheet_classification
 
-        if is_rerun(library_id):
-            return replace_current_fastq_set(
-                library_id=library_id,
-                instrument_run_id=instrument_run_id,
-                bclconvert_data_df=bclconvert_data_df
-            )
+        if get_tracking_sheet_classification(library_fastq_set_snapshot['libraryId'])['isRerun']:
+            return 'replace'
+        return 'append'
 
+    return 'new'
+
+
+def resolve_fastq_set_creation_action(
+        library_fastq_set_snapshot: LibraryFastqSetSnapshot,
+        journal: CheckpointJournal,
+        fastq_set_creation_action: Optional[str] = None
+) -> str:
+    """
+    Follow the planned action, unless the fastq set already exists on this run
+    :param library_fastq_set_snapshot:
+    :param journal:
+    :param fastq_set_creation_action:
+    :return:
+    """
+    if (
+        journal.has_checkpoint("allowAdditionalFastqs") and
+        not journal.has_checkpoint("disallowAdditionalFastqs")
+    ):
+        # A previous attempt stopped halfway through appending,
+        # the fastqs it linked are on the run but the remaining lanes are not
+        return 'append'
+    if fastq_set_creation_action is None:
+        return get_fastq_set_creation_action(library_fastq_set_snapshot)
+    if len(library_fastq_set_snapshot['fastqSetsOnRun']) > 0:
+        # The plan is from before this invocation,
+        # a previous invocation may have already created the fastq set
+        return 'exists'
+    return fastq_set_creation_action
+
+
+def create_fastq_set_for_library(
+        library_id: str,
+        instrument_run_id: str,
+        bclconvert_data_df: pd.DataFrame,
+        fastq_set_creation_action: Optional[str] = None,
+        journal: Optional[CheckpointJournal] = None
+):
+    """
+    Take the snapshot of the library's fastq sets and follow the fastq set creation action,
+    must be called while holding the library lock
+    :param library_id:
+    :param instrument_run_id:
+    :param bclconvert_data_df:
+    :param fastq_set_creation_action:
+    :param journal: The journal of this library in this execution, disabled if not set
+    :return:
+    """
+    if journal is None:
+        journal = get_checkpoint_journal(None, library_id)
+
+    # Get all fastq sets for this library
+    library_fastq_set_snapshot = get_library_fastq_set_snapshot(
+        library_id=library_id,
+        instrument_run_id=instrument_run_id
+    )
+
+    fastq_set_creation_action = resolve_fastq_set_creation_action(
+        library_fastq_set_snapshot,
+        journal=journal,
+        fastq_set_creation_action=fastq_set_creation_action
+    )
+
+    if fastq_set_creation_action == 'exists':
+        return library_fastq_set_snapshot['fastqSetsOnRun']
+
+    if fastq_set_creation_action == 'replace':
+        return replace_current_fastq_set(
+            library_fastq_set_snapshot=library_fastq_set_snapshot,
+            instrument_run_id=instrument_run_id,
+            bclconvert_data_df=bclconvert_data_df,
+            journal=journal
+        )
+
+    if fastq_set_creation_action == 'append':
         return append_to_existing_fastq_set(
-            library_id=library_id,
+            library_fastq_set_snapshot=library_fastq_set_snapshot,
             instrument_run_id=instrument_run_id,
-            bclconvert_data_df=bclconvert_data_df
+            bclconvert_data_df=bclconvert_data_df,
+            journal=journal
         )
 
     # Otherwise
@@ -533,3 +519,42 @@ def handler(event, context):
         instrument_run_id=instrument_run_id,
         bclconvert_data_df=bclconvert_data_df
     )
+
+
+@instrument_handler
+def handler(event, context):
+    """
+    Create, append to or replace the fastq set for this library.
+
+    The action for each library is planned once for the whole run by the plan fastq set creation step
+    and passed in as fastqSetCreationAction (one of 'new', 'append', 'replace' or 'exists'),
+    if not provided we work it out here.
+
+    The fastq sets of the library are fetched once, into a snapshot that is passed through each branch.
+    The snapshot is taken, and the writes made, while holding the lock on the library id,
+    so overlapping invocations for the same library run one after the other,
+    and the later invocation finds the fastq set on the run and does nothing.
+
+    The writes are checkpointed in the journal of the library for this execution (executionId),
+    so a retry of this invocation resumes where the previous attempt stopped (see fastq_glue_tools.checkpoint_journal).
+    :param event:
+    :param context:
+    :return:
+    """
+    # Get the inputs from the event
+    instrument_run_id = event["instrumentRunId"]
+    with timed_phase("parse"):
+        bclconvert_data_df = pd.DataFrame(event["bclConvertData"])
+        library_id = pd.Series(bclconvert_data_df["libraryId"].unique()).item()
+    add_rows_processed(len(bclconvert_data_df))
+    fastq_set_creation_action = event.get("fastqSetCreationAction", None)
+    execution_id = event.get("executionId", None)
+
+    with library_lock(library_id, lease_seconds=get_lease_seconds(context)):
+        return create_fastq_set_for_library(
+            library_id=library_id,
+            instrument_run_id=instrument_run_id,
+            bclconvert_data_df=bclconvert_data_df,
+            fastq_set_creation_action=fastq_set_creation_action,
+            journal=get_checkpoint_journal(execution_id, library_id)
+        )
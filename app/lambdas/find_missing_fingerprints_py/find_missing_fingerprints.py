@@ -5,19 +5,133 @@ Find missing fingerprints
 
 Given an instrument run id, query the fastq manager for
 fastq set IDs missing somalier fingerprints.
+
+The fastq sets are those of the fastqs on the run.
+Rather than fetch each fastq set in turn, the fastq sets on the run are listed in bulk
+(get_fastq_sets, paginated by the api tools) and only their id and somalier fields are kept,
+so the number of requests does not grow with the number of fastq sets on the run.
+Any fastq set missing from the listing, or listed without its somalier field,
+is fetched individually on a bounded thread pool (see fastq_glue_tools.concurrency).
+
+The fastq set ids are planned into batches (see fastq_glue_tools.batch_planner),
+returned as batchList and recommendedMaxConcurrency for the distributed map,
+each fastq set id is only returned in its batch.
 """
 
 # Standard imports
-from typing import List, Dict
+from typing import Any, List, Dict, Optional, TypedDict
 
 # Layers
 from orcabus_api_tools.fastq import (
     get_fastqs_in_instrument_run_id,
-    get_fastq_set
+    get_fastq_set,
+    get_fastq_sets
 )
+from fastq_glue_tools.batch_planner import BatchPlan, plan_uniform_batches
+from fastq_glue_tools.concurrency import (
+    call_with_retries,
+    get_max_workers,
+    get_retry_policy,
+    map_concurrently
+)
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+get_fastqs_in_instrument_run_id = instrument_api_call(get_fastqs_in_instrument_run_id)
+get_fastq_set = instrument_api_call(get_fastq_set)
+get_fastq_sets = instrument_api_call(get_fastq_sets)
+
+# Globals
+# Each fastq set is a single run extract fingerprint invocation,
+# whose full lambda response is kept in the map output
+WORK_PER_FASTQ_SET = 1
+PAYLOAD_BYTES_PER_FASTQ_SET = 2048
+
+
+class FastqSetFingerprint(TypedDict):
+    id: str
+    somalier: Optional[Dict[str, Any]]
+
+
+def get_fastq_set_fingerprint(fastq_set: Dict[str, Any]) -> FastqSetFingerprint:
+    return {
+        "id": fastq_set['id'],
+        "somalier": fastq_set.get('somalier'),
+    }
+
+
+def get_fastq_set_id_list_on_run(instrument_run_id: str) -> List[str]:
+    """
+    Get the (sorted, unique) fastq set ids of the fastqs on the run
+    :param instrument_run_id:
+    :return:
+    """
+    return sorted(set(filter(
+        lambda fastq_set_id_iter_: fastq_set_id_iter_ is not None,
+        map(
+            lambda fastq_iter_: fastq_iter_.get('fastqSetId') or None,
+            call_with_retries(
+                lambda: get_fastqs_in_instrument_run_id(instrument_run_id),
+                retry_policy=get_retry_policy()
+            )
+        )
+    )))
 
 
-def handler(event, context) -> Dict[str, List[str]]:
+def get_fastq_set_fingerprints(
+        instrument_run_id: str,
+        fastq_set_id_list: List[str]
+) -> List[FastqSetFingerprint]:
+    """
+    Get the id and somalier fields of each fastq set, in the order of fastq_set_id_list.
+    Fastq sets are listed in bulk, those not in the listing (or listed without somalier) are fetched concurrently
+    :param instrument_run_id:
+    :param fastq_set_id_list:
+    :return:
+    """
+    retry_policy = get_retry_policy()
+
+    # Project each listed fastq set down to its id and somalier fields
+    listed_fastq_set_fingerprints_by_id: Dict[str, FastqSetFingerprint] = dict(map(
+        lambda fastq_set_iter_: (fastq_set_iter_['id'], get_fastq_set_fingerprint(fastq_set_iter_)),
+        filter(
+            lambda fastq_set_iter_: 'somalier' in fastq_set_iter_,
+            call_with_retries(
+                lambda: get_fastq_sets(instrumentRunId=instrument_run_id),
+                retry_policy=retry_policy
+            )
+        )
+    ))
+
+    unlisted_fastq_set_id_list = list(filter(
+        lambda fastq_set_id_iter_: fastq_set_id_iter_ not in listed_fastq_set_fingerprints_by_id,
+        fastq_set_id_list
+    ))
+    unlisted_fastq_set_fingerprints_by_id: Dict[str, FastqSetFingerprint] = dict(zip(
+        unlisted_fastq_set_id_list,
+        map_concurrently(
+            lambda fastq_set_id_iter_: get_fastq_set_fingerprint(call_with_retries(
+                lambda: get_fastq_set(fastq_set_id_iter_),
+                retry_policy=retry_policy
+            )),
+            unlisted_fastq_set_id_list,
+            max_workers=get_max_workers()
+        )
+    ))
+
+    return list(map(
+        lambda fastq_set_id_iter_: (
+            listed_fastq_set_fingerprints_by_id.get(fastq_set_id_iter_) or
+            unlisted_fastq_set_fingerprints_by_id[fastq_set_id_iter_]
+        ),
+        fastq_set_id_list
+    ))
+
+
+@instrument_handler
+def handler(event, context) -> BatchPlan:
     """
     Find missing fingerprints
     """
@@ -25,27 +139,20 @@ def handler(event, context) -> Dict[str, List[str]]:
     # Get inputs
     instrument_run_id = event['instrumentRunId']
 
-    # Get fastq sets
-    fastq_set_id_list = list(set(
-        list(filter(
-            lambda fastq_iter_map_: fastq_iter_map_ is not None,
-            list(map(
-                lambda fastq_iter_: (
-                    fastq_iter_.get('fastqSetId')
-                    if fastq_iter_.get('fastqSetId')
-                    else None
-                ),
-                get_fastqs_in_instrument_run_id(instrument_run_id),
-            ))
-        ))
-    ))
+    # Get the fastq sets of the fastqs on the run
+    fastq_set_id_list = get_fastq_set_id_list_on_run(instrument_run_id)
 
     # Filter to just those with a missing somalier entry
-    fastq_set_id_with_missing_fingerprints = []
-    for fastq_set_id_iter_ in fastq_set_id_list:
-        if get_fastq_set(fastq_set_id_iter_).get('somalier') is None:
-            fastq_set_id_with_missing_fingerprints.append(fastq_set_id_iter_)
+    fastq_set_id_with_missing_fingerprints = list(map(
+        lambda fastq_set_fingerprint_iter_: fastq_set_fingerprint_iter_['id'],
+        filter(
+            lambda fastq_set_fingerprint_iter_: fastq_set_fingerprint_iter_['somalier'] is None,
+            get_fastq_set_fingerprints(instrument_run_id, fastq_set_id_list)
+        )
+    ))
 
-    return {
-        "fastqSetIdList": fastq_set_id_with_missing_fingerprints
-    }
+    return plan_uniform_batches(
+        fastq_set_id_with_missing_fingerprints,
+        work_per_item=WORK_PER_FASTQ_SET,
+        payload_bytes_per_item=PAYLOAD_BYTES_PER_FASTQ_SET
+    )
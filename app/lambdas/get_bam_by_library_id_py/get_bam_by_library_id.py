@@ -10,15 +10,28 @@ While the complement normal bam file can be found under *dragen_wgts_dna_somatic
 
 For dragen-wgts-rna workflows, the bam file can be found under *dragen_wgts_rna_variant_calling/<LIBID>.bam
 
+Every bam of the workflow run is looked up together.
+The portal run is listed once, and every bam is looked up in an index of the listing,
+which is kept across warm invocations (see fastq_glue_tools.portal_run_files).
+
+Each bam is returned with its size (bamSizeBytes, null if the file manager record has no size),
+so that run_extract_fingerprint can submit smaller bams first.
 """
 # Standard imports
-from urllib.parse import urlunparse
-from typing import Literal, Dict, Final
+from typing import Literal, Dict, Final, List
 
 # Layer imports
 from orcabus_api_tools.workflow import get_latest_payload_from_workflow_run
 from orcabus_api_tools.workflow.models import WorkflowRun
 from orcabus_api_tools.filemanager import list_files_from_portal_run_id
+from fastq_glue_tools.portal_run_files import PortalRunFile, find_files_by_suffixes
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+get_latest_payload_from_workflow_run = instrument_api_call(get_latest_payload_from_workflow_run)
+list_files_from_portal_run_id = instrument_api_call(list_files_from_portal_run_id)
 
 # Globals
 # Define the Literal types with literal values (no variables inside Literal)
@@ -48,31 +61,30 @@ REFERENCE_NAME_BY_WORKFLOW_NAME_MAP: Dict[WorkflowType, ReferenceType] = {
 }
 
 
-def get_file_uri_from_portal_run_id_and_suffix(
+def get_files_from_portal_run_id_and_suffixes(
         portal_run_id: str,
-        suffix: str
-) -> str:
+        suffix_list: List[str]
+) -> Dict[str, PortalRunFile]:
     """
-    Given a portal run id and a suffix, return the file uri.
+    Given a portal run id and a list of suffixes, return the file (uri and size) of each suffix.
     :param portal_run_id:
-    :param suffix:
+    :param suffix_list:
     :return:
     """
-    try:
-        return next(map(
-            lambda file_iter_: str(urlunparse((
-                "s3", file_iter_['bucket'], file_iter_['key'],
-                None, None, None
-            ))),
-            filter(
-                lambda file_iter_: file_iter_['key'].endswith(suffix),
-                list_files_from_portal_run_id(portal_run_id=portal_run_id)
-            ))
-        )
-    except StopIteration:
-        raise FileNotFoundError(f"Bam file with suffix {suffix} not found for portal run id {portal_run_id}")
+    files_by_suffix = find_files_by_suffixes(
+        portal_run_id,
+        suffix_list,
+        list_files=lambda: list_files_from_portal_run_id(portal_run_id=portal_run_id)
+    )
 
+    for suffix_iter_, file_iter_ in files_by_suffix.items():
+        if file_iter_ is None:
+            raise FileNotFoundError(f"Bam file with suffix {suffix_iter_} not found for portal run id {portal_run_id}")
 
+    return files_by_suffix
+
+
+@instrument_handler
 def handler(event, context):
     """
     Take workflowRunObj and return a mapping of one library id and one bam file path.
@@ -84,8 +96,8 @@ def handler(event, context):
     # Get inputs
     workflow_run_obj: WorkflowRun = event['workflowRunObj']
 
-    # Initialise outputs
-    bams_by_library_id_list = []
+    # Initialise the bam suffix of each library, the bams are looked up together
+    bam_suffixes_by_library_id_list = []
 
     # Get workflow name
     workflow_name = workflow_run_obj['workflow']['name']
@@ -101,13 +113,10 @@ def handler(event, context):
     if workflow_name == DRAGEN_TSO500_CTDNA_WORKFLOW_NAME:
         library_id = latest_payload['data']['tags']['libraryId']
 
-        bams_by_library_id_list.append(
+        bam_suffixes_by_library_id_list.append(
             {
                 "libraryId": workflow_run_obj['libraries'][0]['libraryId'],
-                "bamUri": get_file_uri_from_portal_run_id_and_suffix(
-                    portal_run_id=portal_run_id,
-                    suffix=f"Logs_Intermediates/DragenCaller/{library_id}/{library_id}_tumor.bam"
-                ),
+                "bamSuffix": f"Logs_Intermediates/DragenCaller/{library_id}/{library_id}_tumor.bam",
                 "referenceName": REFERENCE_NAME_BY_WORKFLOW_NAME_MAP[workflow_name]
             }
         )
@@ -118,24 +127,18 @@ def handler(event, context):
 
         # Get the tumor bam if we have a tumor library id
         if tumor_library_id is not None:
-            bams_by_library_id_list.append(
+            bam_suffixes_by_library_id_list.append(
                 {
                     "libraryId": tumor_library_id,
-                    "bamUri": get_file_uri_from_portal_run_id_and_suffix(
-                        portal_run_id=portal_run_id,
-                        suffix=f"dragen_wgts_dna_somatic_variant_calling/{tumor_library_id}_tumor.bam"
-                    ),
+                    "bamSuffix": f"dragen_wgts_dna_somatic_variant_calling/{tumor_library_id}_tumor.bam",
                     "referenceName": REFERENCE_NAME_BY_WORKFLOW_NAME_MAP[workflow_name]
                 }
             )
         # Get the normal bam from the graph reference
-        bams_by_library_id_list.append(
+        bam_suffixes_by_library_id_list.append(
             {
                 "libraryId": library_id,
-                "bamUri": get_file_uri_from_portal_run_id_and_suffix(
-                    portal_run_id=portal_run_id,
-                    suffix=f"dragen_wgts_dna_germline_variant_calling/{library_id}.bam"
-                ),
+                "bamSuffix": f"dragen_wgts_dna_germline_variant_calling/{library_id}.bam",
                 "referenceName": REFERENCE_NAME_BY_WORKFLOW_NAME_MAP[workflow_name]
             }
         )
@@ -143,13 +146,10 @@ def handler(event, context):
     elif workflow_name == DRAGEN_WGTS_RNA_WORKFLOW_NAME:
         library_id = latest_payload['data']['tags']['libraryId']
 
-        bams_by_library_id_list.append(
+        bam_suffixes_by_library_id_list.append(
             {
                 "libraryId": workflow_run_obj['libraries'][0]['libraryId'],
-                "bamUri": get_file_uri_from_portal_run_id_and_suffix(
-                    portal_run_id=portal_run_id,
-                    suffix=f"dragen_wgts_rna_variant_calling/{library_id}.bam"
-                ),
+                "bamSuffix": f"dragen_wgts_rna_variant_calling/{library_id}.bam",
                 "referenceName": REFERENCE_NAME_BY_WORKFLOW_NAME_MAP[workflow_name]
             }
         )
@@ -157,6 +157,25 @@ def handler(event, context):
     else:
         raise ValueError(f"Unsupported workflow name: {workflow_name}")
 
+    # Look up every bam of the workflow run
+    bams_by_suffix = get_files_from_portal_run_id_and_suffixes(
+        portal_run_id=portal_run_id,
+        suffix_list=list(map(
+            lambda bam_suffix_by_library_id_iter_: bam_suffix_by_library_id_iter_['bamSuffix'],
+            bam_suffixes_by_library_id_list
+        ))
+    )
+
+    bams_by_library_id_list = list(map(
+        lambda bam_suffix_by_library_id_iter_: {
+            "libraryId": bam_suffix_by_library_id_iter_['libraryId'],
+            "bamUri": bams_by_suffix[bam_suffix_by_library_id_iter_['bamSuffix']]['uri'],
+            "bamSizeBytes": bams_by_suffix[bam_suffix_by_library_id_iter_['bamSuffix']]['size'],
+            "referenceName": bam_suffix_by_library_id_iter_['referenceName'],
+        },
+        bam_suffixes_by_library_id_list
+    ))
+
     return {
         "bamFileByLibraryIdList": bams_by_library_id_list
     }
@@ -2,14 +2,38 @@
 
 """
 Get fastq and fastq set ids from instrument run id
+
+The pairs are planned into batches (see fastq_glue_tools.batch_planner),
+returned as batchList and recommendedMaxConcurrency for the distributed map.
+Only the batches are returned, each pair is held once in the state output
+(so a 3,000 fastq run stays well within the step function payload limit).
+Each batch is cleaned up by a single unlink and invalidate fastqs invocation,
+which runs FASTQ_MANAGER_MAX_WORKERS fastqs at once,
+so a batch holds FASTQ_GLUE_BATCH_TARGET_WORK of work per worker.
 """
 
 # Standard imports
-from typing import TypedDict, Dict, List, cast
+from typing import TypedDict, List, cast
 
 # Orcabus tools
 from orcabus_api_tools.fastq import get_fastqs_in_instrument_run_id
 
+# Layer imports
+from fastq_glue_tools.batch_planner import BatchPlan, get_target_batch_work, plan_uniform_batches
+from fastq_glue_tools.concurrency import get_max_workers
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+get_fastqs_in_instrument_run_id = instrument_api_call(get_fastqs_in_instrument_run_id)
+
+# Globals
+# Each pair is unlinked then invalidated,
+# only a failure (with a truncated error message) is kept in the map output
+WORK_PER_FASTQ = 2
+PAYLOAD_BYTES_PER_FASTQ = 512
+
 
 # Classes
 class ResponseDict(TypedDict):
@@ -17,7 +41,8 @@ class ResponseDict(TypedDict):
     fastqSetId: str
 
 
-def handler(event, context) -> Dict[str, List[ResponseDict]]:
+@instrument_handler
+def handler(event, context) -> BatchPlan:
     """
     Get fastq and fastq set ids from instrument run id
     """
@@ -41,6 +66,9 @@ def handler(event, context) -> Dict[str, List[ResponseDict]]:
         fastq_list,
     ))
 
-    return {
-        "fastqAndFastqSetIdPairs": fastq_id_and_fastq_set_id_pairs
-    }
+    return plan_uniform_batches(
+        fastq_id_and_fastq_set_id_pairs,
+        work_per_item=WORK_PER_FASTQ,
+        payload_bytes_per_item=PAYLOAD_BYTES_PER_FASTQ,
+        target_batch_work=get_target_batch_work() * get_max_workers()
+    )
@@ -7,7 +7,14 @@ Given a library id, return the latest fastq set id associated with that library.
 # Layer imports
 from orcabus_api_tools.fastq import get_fastq_sets
 
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
 
+# Count and time every api call against its endpoint
+get_fastq_sets = instrument_api_call(get_fastq_sets)
+
+
+@instrument_handler
 def handler(event, context):
 
     # Set inputs
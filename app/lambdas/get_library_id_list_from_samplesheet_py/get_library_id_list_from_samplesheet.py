@@ -11,63 +11,80 @@ and then creating a fastq set object for each sample.
 
 We get the following as inputs:
 
+instrumentRunId
 
+Alongside the library id list we count the lanes (samplesheet rows) of each library,
+the plan fastq set creation step weighs each library by them when planning the batches of the map
+(see fastq_glue_tools.batch_planner), so the samplesheet is only read here.
 
+Returns
 
+{
+  "libraryIdList": [...],
+  "numLanesByLibraryId": {<libraryId>: 4, ...}
+}
 """
 
 # Imports
-import typing
-import boto3
-from pathlib import Path
-from urllib.parse import urlparse
-from typing import Tuple, Dict, List
+from collections import Counter
+from typing import Any, Dict, List
 
 # Construct imports
 from orcabus_api_tools.sequence import (
-    get_libraries_from_instrument_run_id
+    get_libraries_from_instrument_run_id,
+    get_sample_sheet_from_instrument_run_id
 )
 
-# Type hints
-if typing.TYPE_CHECKING:
-    from mypy_boto3_s3 import S3Client
+# Layer imports
+from fastq_glue_tools.samplesheet_cache import get_cached_samplesheet
 
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
 
-# Quick funcs
-def get_s3_client() -> 'S3Client':
-    return boto3.client('s3')
+# Count and time every api call against its endpoint
+get_libraries_from_instrument_run_id = instrument_api_call(get_libraries_from_instrument_run_id)
+get_sample_sheet_from_instrument_run_id = instrument_api_call(get_sample_sheet_from_instrument_run_id)
 
 
-def get_bucket_key_from_s3_uri(url: str) -> Tuple[str, str]:
-    url_obj = urlparse(url)
-    return url_obj.netloc, url_obj.path.lstrip("/")
-
+def get_num_lanes_by_library_id(instrument_run_id: str, library_id_list: List[str]) -> Dict[str, int]:
+    """
+    Count the samplesheet rows (lanes) of each library, a library missing from the samplesheet counts as one lane
+    :param instrument_run_id:
+    :param library_id_list:
+    :return:
+    """
+    samplesheet: Dict = get_cached_samplesheet(
+        instrument_run_id,
+        fetch_samplesheet=lambda: get_sample_sheet_from_instrument_run_id(instrument_run_id)['sampleSheetContent']
+    )
 
-def get_s3_object(bucket: str, key: str, output_path: Path):
-    # Make sure parent dir exists
-    output_path.parent.mkdir(exist_ok=True, parents=True)
+    num_rows_by_sample_id = Counter(map(
+        lambda bclconvert_row_iter_: bclconvert_row_iter_['sampleId'],
+        (samplesheet or {}).get('bclconvertData', [])
+    ))
 
-    get_s3_client().download_file(
-        Bucket=bucket,
-        Key=key,
-        Filename=str(output_path)
-    )
+    return dict(map(
+        lambda library_id_iter_: (library_id_iter_, max(num_rows_by_sample_id.get(library_id_iter_, 0), 1)),
+        library_id_list
+    ))
 
 
-def handler(event, context) -> Dict[str, List[str]]:
+@instrument_handler
+def handler(event, context) -> Dict[str, Any]:
     """
-    Given a samplesheet uri and a sample id,
-    Download the samplesheet, get the bclconvert data section
-    and return only the rows where sample_id is equal to sampleId
+    Given an instrument run id, get the libraries on the run and their number of lanes
     :param event:
     :param context:
     :return:
     """
 
-    # Get the sample id and samplesheet uri from the event
+    # Get the instrument run id from the event
     instrument_run_id = event['instrumentRunId']
 
     # Get the libraries from the instrument run id via the sequence run manager
+    library_id_list = list(sorted(set(get_libraries_from_instrument_run_id(instrument_run_id))))
+
     return {
-        "libraryIdList": list(sorted(set(get_libraries_from_instrument_run_id(instrument_run_id))))
+        "libraryIdList": library_id_list,
+        "numLanesByLibraryId": get_num_lanes_by_library_id(instrument_run_id, library_id_list),
     }
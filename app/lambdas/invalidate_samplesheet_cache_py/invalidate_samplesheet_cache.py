@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+"""
+Invalidate the samplesheet cache
+
+Given the input instrumentRunId,
+drop the run from the samplesheet cache.
+
+Called at the start of the fastq set generation step function,
+which is triggered whenever the samplesheet of a run is uploaded (or re-uploaded),
+so that later steps never see the previous version of the samplesheet.
+"""
+
+# Imports
+from typing import Dict
+
+# Layer imports
+from fastq_glue_tools.samplesheet_cache import invalidate_samplesheet_cache
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler
+
+
+@instrument_handler
+def handler(event, context) -> Dict:
+    """
+    Invalidate the samplesheet cache for this instrument run id
+    :param event:
+    :param context:
+    :return:
+    """
+
+    # Get the inputs
+    instrument_run_id = event['instrumentRunId']
+
+    invalidate_samplesheet_cache(instrument_run_id)
+
+    return {}
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Plan the fastq set creation for an instrument run
+
+Given the inputs instrumentRunId, libraryIdList and numLanesByLibraryId (the output of the get library id list step),
+decide once for the whole run what the create fastq set object step should do for each library
+
+* exists - the library already has a fastq set on this instrument run, nothing to do
+* new - the library has no current fastq set, create one
+* append - the library has a current fastq set on another run (a topup), append the new fastqs to it
+* replace - the library has a current fastq set on another run and is a rerun in the tracking sheet,
+  supersede the current fastq set with a new one
+
+The fastq sets on this run are queried once, and each year tab of the tracking sheet is downloaded at most once.
+The current fastq sets of the remaining libraries cannot come from that query,
+a topup or rerun library's current fastq set holds only fastqs from earlier runs, so is not listed for this run.
+The fastq manager only filters fastq sets by a single library (and the unfiltered listing of every current fastq set
+grows with every library ever sequenced), so the remaining libraries are queried one library per request,
+FASTQ_MANAGER_MAX_WORKERS requests at a time.
+bench_plan_fastq_set_creation.py measures the cost of these requests per library.
+
+Alongside the plan we plan the batches the map fans out over (see fastq_glue_tools.batch_planner),
+each library costs the fastq manager requests of its action for its number of lanes,
+a topup (append) creates and links a fastq per lane, so costs far more than a library whose fastq set exists.
+Each batch descriptor carries the plan for its own libraries,
+the plan is not also returned for the whole run, so each library's action is held once in the state output.
+
+Returns
+
+{
+  "batchList": [
+    {
+      "batchIndex": 0,
+      "items": [<libraryId>, ...],
+      "estimatedWork": 120,
+      "estimatedPayloadBytes": 4096,
+      "fastqSetCreationPlan": {<libraryId>: "new" | "append" | "replace" | "exists", ...}
+    },
+    ...
+  ],
+  "recommendedMaxConcurrency": 20
+}
+"""
+
+# Imports
+import json
+import logging
+from collections import Counter
+from itertools import groupby
+from typing import Any, Dict, List, Literal, Tuple
+
+# Layer imports
+from orcabus_api_tools.fastq import get_fastq_sets
+from fastq_glue_tools.batch_planner import WorkItem, plan_batches
+from fastq_glue_tools.concurrency import (
+    call_with_retries,
+    get_max_workers,
+    get_retry_policy,
+    map_concurrently
+)
+from fastq_glue_tools.tracking_sheet import (
+    RERUN_SUFFIX,
+    get_tracking_sheet_library_ids_for_year,
+    get_year_from_library_id
+)
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+get_fastq_sets = instrument_api_call(get_fastq_sets)
+
+# Type hints
+FastqSetCreationAction = Literal['new', 'append', 'replace', 'exists']
+
+# Globals
+# Fastq manager requests (per library, per lane) of each fastq set creation action
+FASTQ_SET_CREATION_WORK: Dict[str, Tuple[int, int]] = {
+    "exists": (1, 0),
+    "new": (2, 0),
+    "replace": (3, 0),
+    "append": (3, 2),
+}
+# Bytes each library adds to the largest payload of its child execution,
+# the bclconvert data rows of each lane and the library's map output
+PAYLOAD_BYTES_PER_LIBRARY = 128
+PAYLOAD_BYTES_PER_LANE = 160
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_library_ids_with_fastq_sets_on_run(instrument_run_id: str) -> List[str]:
+    """
+    Get the library ids that already have a fastq set containing a fastq from this instrument run
+    :param instrument_run_id:
+    :return:
+    """
+    return list(set(map(
+        lambda fastq_set_iter_: fastq_set_iter_['library']['libraryId'],
+        call_with_retries(
+            lambda: get_fastq_sets(instrumentRunId=instrument_run_id),
+            retry_policy=get_retry_policy()
+        )
+    )))
+
+
+def get_library_ids_with_current_fastq_sets(library_id_list: List[str]) -> List[str]:
+    """
+    Get the library ids (from the list) that have a current fastq set.
+    The fastq manager filters fastq sets by a single library, so this is a request per library, made concurrently
+    :param library_id_list:
+    :return:
+    """
+    retry_policy = get_retry_policy()
+    has_current_fastq_set_list = map_concurrently(
+        lambda library_id_iter_: len(call_with_retries(
+            lambda: get_fastq_sets(
+                library=library_id_iter_,
+                currentFastqSet=json.dumps(True)
+            ),
+            retry_policy=retry_policy
+        )) > 0,
+        library_id_list,
+        max_workers=get_max_workers()
+    )
+
+    return list(map(
+        lambda library_has_current_iter_: library_has_current_iter_[0],
+        filter(
+            lambda library_has_current_iter_: library_has_current_iter_[1],
+            zip(library_id_list, has_current_fastq_set_list)
+        )
+    ))
+
+
+def get_rerun_library_ids(library_id_list: List[str]) -> List[str]:
+    """
+    Get the library ids (from the list) marked as reruns in the tracking sheet,
+    libraries are grouped by year so that each year tab is read once
+    :param library_id_list:
+    :return:
+    """
+    rerun_library_id_list = []
+    for year, year_library_id_iter in groupby(
+        sorted(library_id_list, key=get_year_from_library_id),
+        key=get_year_from_library_id
+    ):
+        tracking_sheet_library_id_set = get_tracking_sheet_library_ids_for_year(year)
+        rerun_library_id_list.extend(filter(
+            lambda library_id_iter_: f"{library_id_iter_}{RERUN_SUFFIX}" in tracking_sheet_library_id_set,
+            year_library_id_iter
+        ))
+
+    return rerun_library_id_list
+
+
+def get_library_work_item(
+        library_id: str,
+        num_lanes: int,
+        fastq_set_creation_action: FastqSetCreationAction
+) -> WorkItem:
+    """
+    Estimate the fastq manager requests and payload of creating the fastq set of a library
+    :param library_id:
+    :param num_lanes:
+    :param fastq_set_creation_action:
+    :return:
+    """
+    work_per_library, work_per_lane = FASTQ_SET_CREATION_WORK[fastq_set_creation_action]
+
+    return {
+        "item": library_id,
+        "estimatedWork": work_per_library + work_per_lane * num_lanes,
+        "estimatedPayloadBytes": PAYLOAD_BYTES_PER_LIBRARY + PAYLOAD_BYTES_PER_LANE * num_lanes,
+    }
+
+
+@instrument_handler
+def handler(event, context) -> Dict[str, Any]:
+    """
+    Plan the fastq set creation for each library in the instrument run
+    :param event:
+    :param context:
+    :return:
+    """
+
+    # Get the inputs
+    instrument_run_id = event['instrumentRunId']
+    library_id_list = event['libraryIdList']
+    # A library missing from the samplesheet counts as one lane
+    num_lanes_by_library_id: Dict[str, int] = event.get('numLanesByLibraryId', {})
+
+    # Libraries already on this run
+    existing_library_id_set = set(get_library_ids_with_fastq_sets_on_run(instrument_run_id))
+
+    # Libraries with a current fastq set on another run
+    resequenced_library_id_list = get_library_ids_with_current_fastq_sets(list(filter(
+        lambda library_id_iter_: library_id_iter_ not in existing_library_id_set,
+        library_id_list
+    )))
+
+    # Of which, the reruns (the rest are topups)
+    rerun_library_id_set = set(get_rerun_library_ids(resequenced_library_id_list))
+    resequenced_library_id_set = set(resequenced_library_id_list)
+
+    fastq_set_creation_plan: Dict[str, FastqSetCreationAction] = dict(map(
+        lambda library_id_iter_: (
+            library_id_iter_,
+            (
+                'exists' if library_id_iter_ in existing_library_id_set
+                else 'replace' if library_id_iter_ in rerun_library_id_set
+                else 'append' if library_id_iter_ in resequenced_library_id_set
+                else 'new'
+            )
+        ),
+        library_id_list
+    ))
+
+    logger.info(f"Fastq set creation plan for {instrument_run_id}: {json.dumps(Counter(fastq_set_creation_plan.values()))}")
+
+    # Weigh each library by its action and lanes and plan the batches
+    batch_plan = plan_batches(list(map(
+        lambda library_id_iter_: get_library_work_item(
+            library_id_iter_,
+            num_lanes_by_library_id.get(library_id_iter_, 1),
+            fastq_set_creation_plan[library_id_iter_]
+        ),
+        library_id_list
+    )))
+
+    return {
+        # Each batch carries the plan for its own libraries
+        "batchList": list(map(
+            lambda batch_iter_: {
+                **batch_iter_,
+                "fastqSetCreationPlan": dict(map(
+                    lambda library_id_iter_: (library_id_iter_, fastq_set_creation_plan[library_id_iter_]),
+                    batch_iter_['items']
+                )),
+            },
+            batch_plan['batchList']
+        )),
+        "recommendedMaxConcurrency": batch_plan['recommendedMaxConcurrency'],
+    }
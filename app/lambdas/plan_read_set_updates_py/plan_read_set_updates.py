@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+Plan the read set updates for an instrument run
+
+Given the inputs instrumentRunId and runManifestUri,
+the fastqs on the run are listed once and diffed against the run manifest (see fastq_glue_tools.read_set_diff),
+so a replayed copy event, where every fastq already has its read set and read counts, makes no writes at all.
+
+Fastqs listed without the s3 uris of their read set are fetched individually (with their s3 details).
+
+The updates are written next to the run manifest and the batches (see fastq_glue_tools.batch_planner)
+are planned over the libraries with at least one update, each library weighed by the calls its updates need.
+
+Returns
+
+{
+  "readSetUpdatesUri": "s3://.../read-set-updates/<sha256>.json.gz",
+  "batchList": [
+    {
+      "batchIndex": 0,
+      "items": [<libraryId>, ...],
+      "estimatedWork": 120,
+      "estimatedPayloadBytes": 4096
+    },
+    ...
+  ],
+  "recommendedMaxConcurrency": 20,
+  "readSetUpdateCounts": {
+    "skipped": 1520,
+    "updated": 0,
+    "new": 0
+  }
+}
+"""
+
+# Imports
+import json
+import logging
+from typing import Any, Dict, List
+
+# Layer imports
+from orcabus_api_tools.fastq import get_fastq, get_fastqs_in_instrument_run_id
+from fastq_glue_tools.batch_planner import WorkItem, plan_batches
+from fastq_glue_tools.concurrency import (
+    call_with_retries,
+    get_max_workers,
+    get_retry_policy,
+    map_concurrently
+)
+from fastq_glue_tools.read_set_diff import (
+    ReadSetUpdate,
+    diff_read_sets,
+    get_read_set_updates_by_library_id,
+    has_unresolved_read_set,
+    write_read_set_updates
+)
+from fastq_glue_tools.run_manifest import get_run_manifest_rows
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+get_fastq = instrument_api_call(get_fastq)
+get_fastqs_in_instrument_run_id = instrument_api_call(get_fastqs_in_instrument_run_id)
+
+# Globals
+# Bytes each library adds to the largest payload of its child execution (the library id)
+PAYLOAD_BYTES_PER_LIBRARY = 128
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_fastqs_with_read_sets(instrument_run_id: str) -> List[Dict[str, Any]]:
+    """
+    List the fastqs on the run, fetching the s3 details of any read set listed without them
+    :param instrument_run_id:
+    :return:
+    """
+    retry_policy = get_retry_policy()
+
+    fastq_list = call_with_retries(
+        lambda: get_fastqs_in_instrument_run_id(instrument_run_id),
+        retry_policy=retry_policy
+    )
+
+    return map_concurrently(
+        lambda fastq_object_iter_: (
+            call_with_retries(
+                lambda: get_fastq(fastq_object_iter_['id'], includeS3Details=True),
+                retry_policy=retry_policy
+            )
+            if has_unresolved_read_set(fastq_object_iter_)
+            else fastq_object_iter_
+        ),
+        fastq_list,
+        max_workers=get_max_workers()
+    )
+
+
+def get_library_work_item(library_id: str, read_set_update_list: List[ReadSetUpdate]) -> WorkItem:
+    """
+    Weigh the library by the fastq manager requests of its updates
+    :param library_id:
+    :param read_set_update_list:
+    :return:
+    """
+    return {
+        "item": library_id,
+        "estimatedWork": sum(map(
+            lambda read_set_update_iter_: (
+                int(read_set_update_iter_['detachReadSet']) +
+                int(read_set_update_iter_['readSet'] is not None) +
+                int(read_set_update_iter_['readCount'] is not None)
+            ),
+            read_set_update_list
+        )),
+        "estimatedPayloadBytes": PAYLOAD_BYTES_PER_LIBRARY,
+    }
+
+
+@instrument_handler
+def handler(event, context) -> Dict[str, Any]:
+    """
+    Diff the fastqs on the instrument run against the run manifest and plan the batches over the updates
+    :param event:
+    :param context:
+    :return:
+    """
+
+    # Get the inputs
+    instrument_run_id = event['instrumentRunId']
+    run_manifest_uri = event['runManifestUri']
+
+    # Diff the fastqs on the run against the manifest
+    read_set_diff = diff_read_sets(
+        get_fastqs_with_read_sets(instrument_run_id),
+        get_run_manifest_rows(run_manifest_uri)
+    )
+
+    logger.info(
+        f"Read set updates for {instrument_run_id}: {json.dumps(read_set_diff['readSetUpdateCounts'])}"
+    )
+
+    # Write out the updates, and plan the batches over the libraries with updates
+    read_set_updates_uri = write_read_set_updates(run_manifest_uri, read_set_diff['readSetUpdateList'])
+
+    batch_plan = plan_batches(list(map(
+        lambda library_updates_iter_: get_library_work_item(*library_updates_iter_),
+        sorted(get_read_set_updates_by_library_id(read_set_diff['readSetUpdateList']).items())
+    )))
+
+    return {
+        "readSetUpdatesUri": read_set_updates_uri,
+        "batchList": batch_plan['batchList'],
+        "recommendedMaxConcurrency": batch_plan['recommendedMaxConcurrency'],
+        "readSetUpdateCounts": read_set_diff['readSetUpdateCounts'],
+    }
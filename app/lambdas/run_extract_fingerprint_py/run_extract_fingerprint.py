@@ -4,33 +4,131 @@
 Given a fastq set id, reference name, and a bam uri, run the extract api to extract the fingerprint
 
 We do not expect a response since this is run asynchronously (and takes around 30 minutes to complete)
+
+Submissions go through the fingerprint queue (see fastq_glue_tools.fingerprint_queue),
+which drops duplicate submissions, caps the submissions in flight, and submits smaller bams first.
+
+The inputs are one of
+
+* fastqSetId, referenceName, and optionally bamUri and bamSizeBytes - a single submission
+* fastqSetIdList and referenceName - a submission for each fastq set (without a bam, as the daily sweep submits)
+* submissionKeyList - only dispatch from the queue, the keys returned by a previous invocation
+
+Returns
+
+{
+  "submissionKeyList": [<submissionKey>, ...],
+  "queuedCount": 0,
+  "submittedCount": 1
+}
+
+The step functions wait and invoke the lambda again with the submissionKeyList while queuedCount is above zero.
+If the queue is not configured, every submission is made straight away (and nothing is left queued).
+
+The queue module is imported when the lambda is first invoked rather than at cold start,
+so the import time of the lambda is that of the api tools and metrics only.
 """
 
+# Standard imports
+import typing
+from typing import Any, Dict, List
+
 # Layer imports
 from orcabus_api_tools.fastq import run_extract_fingerprint
 
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
 
-def handler(event, context):
+# Count and time every api call against its endpoint
+run_extract_fingerprint = instrument_api_call(run_extract_fingerprint)
+
+# Type hints
+if typing.TYPE_CHECKING:
+    from fastq_glue_tools.fingerprint_queue import FingerprintSubmission
+
+
+def submit_fingerprint_extraction(submission: 'FingerprintSubmission'):
     """
-    Launch extract fingerprint job
-    :param event:
-    :param context:
+    Launch the extract fingerprint job
+    :param submission:
     :return:
     """
-
-    # Get inputs
-    fastq_set_id = event['fastqSetId']
-    reference_name = event['referenceName']
-    bam_uri = event.get('bamUri', None)
-
-    # Run fingerprint extraction
     run_extract_fingerprint(
         **dict(filter(
             lambda kv_iter_: kv_iter_[1] is not None,
             {
-                "fastq_set_id": fastq_set_id,
-                "reference_name": reference_name,
-                "bam_uri": bam_uri,
+                "fastq_set_id": submission['fastqSetId'],
+                "reference_name": submission['referenceName'],
+                "bam_uri": submission['bamUri'],
             }.items()
         ))
     )
+
+
+def get_submission_list(event: Dict[str, Any]) -> List['FingerprintSubmission']:
+    from fastq_glue_tools.fingerprint_queue import get_submission
+
+    if 'fastqSetIdList' in event:
+        return list(map(
+            lambda fastq_set_id_iter_: get_submission({
+                "fastqSetId": fastq_set_id_iter_,
+                "referenceName": event['referenceName'],
+            }),
+            event['fastqSetIdList']
+        ))
+    if 'fastqSetId' in event:
+        return [get_submission(event)]
+    return []
+
+
+@instrument_handler
+def handler(event, context):
+    """
+    Queue the fingerprint submissions and dispatch from the queue
+    :param event:
+    :param context:
+    :return:
+    """
+
+    # Imported here, so the queue is not loaded at cold start (see above)
+    from fastq_glue_tools.fingerprint_queue import (
+        dispatch_submissions,
+        enqueue_submissions,
+        get_fingerprint_queue_store,
+        get_queue_summary
+    )
+    from fastq_glue_tools.library_lock import get_lease_seconds
+
+    # Get inputs
+    submission_list = get_submission_list(event)
+
+    # Without a queue, submit straight away
+    queue_store = get_fingerprint_queue_store()
+    if queue_store is None:
+        for submission_iter_ in submission_list:
+            submit_fingerprint_extraction(submission_iter_)
+        return {
+            "submissionKeyList": [],
+            "queuedCount": 0,
+            "submittedCount": len(submission_list),
+        }
+
+    # Queue the submissions, then dispatch what the in flight cap allows
+    submission_key_list = (
+        enqueue_submissions(submission_list, queue_store) +
+        event.get('submissionKeyList', [])
+    )
+
+    dispatch_submissions(
+        submit_fingerprint_extraction,
+        queue_store,
+        lease_seconds=get_lease_seconds(context)
+    )
+
+    queue_summary = get_queue_summary(submission_key_list, queue_store)
+
+    return {
+        "submissionKeyList": submission_key_list,
+        "queuedCount": queue_summary['queued'],
+        "submittedCount": queue_summary['submitted'],
+    }
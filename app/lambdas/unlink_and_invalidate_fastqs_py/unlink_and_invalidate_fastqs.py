@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""
+Unlink and invalidate fastqs
+
+Given fastqAndFastqSetIdPairs (the pairs of a batch planned by get fastq and fastq set ids from instrument run id),
+each fastq is unlinked from its fastq set and then invalidated.
+The unlink -> invalidate chain of each fastq is run concurrently with the chains of the other fastqs,
+calls within a chain are always made in order, a fastq that could not be unlinked is not invalidated.
+
+Fastqs already unlinked (no fastqSetId) are only invalidated, so the state machine can be rerun on the same run.
+
+Errors are captured per fastq rather than raised, so every fastq of the batch is attempted,
+the step function fails the batch if any fastq failed.
+Only the first MAX_FAILED_LIST_LENGTH failures are returned, so an outage does not push the task output
+past the step function payload limit, failedCount is always the full count and every failure is logged.
+
+Returns
+
+{
+  "succeededCount": 59,
+  "failedCount": 1,
+  "failedList": [
+    {
+      "fastqId": "fqr.123",
+      "fastqSetId": "fqs.456",
+      "failedStep": "invalidate",
+      "errorType": "HTTPError",
+      "errorMessage": "..."
+    }
+  ],
+  "failedListTruncated": false
+}
+
+Set FASTQ_MANAGER_MAX_WORKERS to 1 to run every request serially.
+"""
+
+# Standard imports
+import logging
+from typing import Any, Dict, List, Literal, Optional, TypedDict
+
+# Layer imports
+from orcabus_api_tools.fastq import unlink_fastq_from_fastq_set, invalidate_fastq
+from fastq_glue_tools.concurrency import (
+    RetryPolicy,
+    call_with_retries,
+    get_max_workers,
+    get_retry_policy,
+    map_concurrently
+)
+
+# Metrics
+from fastq_glue_tools.metrics import instrument_handler, instrument_api_call
+
+# Count and time every api call against its endpoint
+unlink_fastq_from_fastq_set = instrument_api_call(unlink_fastq_from_fastq_set)
+invalidate_fastq = instrument_api_call(invalidate_fastq)
+
+# Globals
+# Keep the summary compact, whatever the error, and however many fastqs failed
+MAX_ERROR_MESSAGE_LENGTH = 256
+MAX_FAILED_LIST_LENGTH = 20
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# Classes
+class FastqCleanUpFailure(TypedDict):
+    fastqId: str
+    fastqSetId: Optional[str]
+    failedStep: Literal['unlink', 'invalidate']
+    errorType: str
+    errorMessage: str
+
+
+class FastqCleanUpSummary(TypedDict):
+    succeededCount: int
+    failedCount: int
+    failedList: List[FastqCleanUpFailure]
+    failedListTruncated: bool
+
+
+def unlink_and_invalidate_fastq(
+        fastq_and_fastq_set_id_pair: Dict[str, Any],
+        retry_policy: RetryPolicy
+) -> Optional[FastqCleanUpFailure]:
+    """
+    Unlink the fastq from its fastq set, then invalidate it
+    :param fastq_and_fastq_set_id_pair:
+    :param retry_policy:
+    :return: The failure, or None if both calls succeeded
+    """
+    fastq_id = fastq_and_fastq_set_id_pair['fastqId']
+    fastq_set_id = fastq_and_fastq_set_id_pair.get('fastqSetId', None)
+
+    failed_step = 'unlink'
+    try:
+        if fastq_set_id is not None:
+            call_with_retries(
+                lambda: unlink_fastq_from_fastq_set(
+                    fastq_id=fastq_id,
+                    fastq_set_id=fastq_set_id,
+                ),
+                retry_policy=retry_policy
+            )
+        failed_step = 'invalidate'
+        call_with_retries(
+            lambda: invalidate_fastq(fastq_id),
+            retry_policy=retry_policy
+        )
+    except Exception as e:
+        logger.exception(f"Could not {failed_step} fastq {fastq_id} (fastq set {fastq_set_id})")
+        return {
+            "fastqId": fastq_id,
+            "fastqSetId": fastq_set_id,
+            "failedStep": failed_step,
+            "errorType": type(e).__name__,
+            "errorMessage": str(e)[:MAX_ERROR_MESSAGE_LENGTH],
+        }
+
+    return None
+
+
+@instrument_handler
+def handler(event, context) -> FastqCleanUpSummary:
+    """
+    Unlink and invalidate each fastq, returns the number of fastqs cleaned up and the first failures
+    :param event:
+    :param context:
+    :return:
+    """
+    # Get inputs
+    fastq_and_fastq_set_id_pairs = event['fastqAndFastqSetIdPairs']
+
+    # Get the concurrency / retry configuration
+    max_workers = get_max_workers()
+    retry_policy = get_retry_policy()
+
+    # Run the chain of each fastq
+    failed_list: List[FastqCleanUpFailure] = list(filter(
+        lambda failure_iter_: failure_iter_ is not None,
+        map_concurrently(
+            lambda fastq_and_fastq_set_id_iter_: unlink_and_invalidate_fastq(
+                fastq_and_fastq_set_id_iter_,
+                retry_policy=retry_policy
+            ),
+            fastq_and_fastq_set_id_pairs,
+            max_workers=max_workers
+        )
+    ))
+
+    return {
+        "succeededCount": len(fastq_and_fastq_set_id_pairs) - len(failed_list),
+        "failedCount": len(failed_list),
+        "failedList": failed_list[:MAX_FAILED_LIST_LENGTH],
+        "failedListTruncated": len(failed_list) > MAX_FAILED_LIST_LENGTH,
+    }
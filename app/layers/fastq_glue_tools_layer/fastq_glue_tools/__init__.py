@@ -0,0 +1,7 @@
+#!/usr/bin/env python3
+
+"""
+Fastq glue tools
+
+Helpers shared between the fastq glue lambdas, deployed as a lambda layer.
+"""
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+"""
+Batch planner
+
+The step functions fan out over a run (libraries, fastq sets, fastqs) with a distributed map,
+each child execution handles one batch of items.
+
+Rather than a fixed batch size and concurrency, batches are planned from the estimated work of each item
+(in fastq manager requests) and the estimated size of the payloads the item adds to the child execution,
+
+* enough batches that no batch holds more than FASTQ_GLUE_BATCH_TARGET_WORK of work,
+  so a small run is a single child execution and a large run is spread over many
+* no batch holds more than FASTQ_GLUE_BATCH_MAX_PAYLOAD_BYTES of payload (half of the 256 KiB state limit by default)
+* items are spread over the batches largest first, each going to the batch with the least work so far,
+  so batches finish at around the same time
+* the recommended concurrency is the number of batches, capped at FASTQ_GLUE_BATCH_MAX_CONCURRENCY
+  (each child execution runs up to FASTQ_MANAGER_MAX_WORKERS requests at once against the fastq manager),
+  overlapping writes to the same library are serialised by the library locks (see library_lock.py)
+
+Each batch descriptor is the input of one child execution, items keep their input order within a batch.
+
+{
+  "batchIndex": 0,
+  "items": [...],
+  "estimatedWork": 120,
+  "estimatedPayloadBytes": 4096
+}
+"""
+
+# Standard imports
+import json
+import heapq
+import math
+from os import environ
+from typing import Any, List, Optional, TypedDict
+
+# Globals
+TARGET_BATCH_WORK_ENV_VAR = "FASTQ_GLUE_BATCH_TARGET_WORK"
+MAX_BATCH_PAYLOAD_BYTES_ENV_VAR = "FASTQ_GLUE_BATCH_MAX_PAYLOAD_BYTES"
+MAX_BATCH_CONCURRENCY_ENV_VAR = "FASTQ_GLUE_BATCH_MAX_CONCURRENCY"
+
+# Step functions limits the input / output of each state to 256 KiB
+STATE_PAYLOAD_LIMIT_BYTES = 256 * 1024
+
+DEFAULT_TARGET_BATCH_WORK = 120
+DEFAULT_MAX_BATCH_PAYLOAD_BYTES = STATE_PAYLOAD_LIMIT_BYTES // 2
+DEFAULT_MAX_BATCH_CONCURRENCY = 20
+
+
+class WorkItem(TypedDict):
+    item: Any
+    # In fastq manager requests
+    estimatedWork: float
+    # Bytes the item adds to the largest state payload of the child execution
+    estimatedPayloadBytes: int
+
+
+class BatchDescriptor(TypedDict):
+    batchIndex: int
+    items: List[Any]
+    estimatedWork: float
+    estimatedPayloadBytes: int
+
+
+class BatchPlan(TypedDict):
+    batchList: List[BatchDescriptor]
+    recommendedMaxConcurrency: int
+
+
+def get_target_batch_work() -> float:
+    return max(float(environ.get(TARGET_BATCH_WORK_ENV_VAR, DEFAULT_TARGET_BATCH_WORK)), 1.0)
+
+
+def get_max_batch_payload_bytes() -> int:
+    return min(
+        int(environ.get(MAX_BATCH_PAYLOAD_BYTES_ENV_VAR, DEFAULT_MAX_BATCH_PAYLOAD_BYTES)),
+        STATE_PAYLOAD_LIMIT_BYTES
+    )
+
+
+def get_max_batch_concurrency() -> int:
+    return max(int(environ.get(MAX_BATCH_CONCURRENCY_ENV_VAR, DEFAULT_MAX_BATCH_CONCURRENCY)), 1)
+
+
+def get_json_size(obj: Any) -> int:
+    return len(json.dumps(obj, separators=(",", ":")))
+
+
+def plan_batches(
+        work_item_list: List[WorkItem],
+        target_batch_work: Optional[float] = None,
+        max_batch_payload_bytes: Optional[int] = None,
+        max_concurrency: Optional[int] = None
+) -> BatchPlan:
+    """
+    Group the work items into batches (see module docstring), settings default to the environment
+    :param work_item_list:
+    :param target_batch_work:
+    :param max_batch_payload_bytes:
+    :param max_concurrency:
+    :return:
+    """
+    if target_batch_work is None:
+        target_batch_work = get_target_batch_work()
+    if max_batch_payload_bytes is None:
+        max_batch_payload_bytes = get_max_batch_payload_bytes()
+    if max_concurrency is None:
+        max_concurrency = get_max_batch_concurrency()
+
+    if len(work_item_list) == 0:
+        return {
+            "batchList": [],
+            "recommendedMaxConcurrency": 1,
+        }
+
+    oversized_work_item_list = list(filter(
+        lambda work_item_iter_: work_item_iter_['estimatedPayloadBytes'] > max_batch_payload_bytes,
+        work_item_list
+    ))
+    if len(oversized_work_item_list) > 0:
+        raise ValueError(
+            f"Item {json.dumps(oversized_work_item_list[0]['item'])} alone is estimated at "
+            f"{oversized_work_item_list[0]['estimatedPayloadBytes']} bytes, "
+            f"over the batch payload limit of {max_batch_payload_bytes} bytes"
+        )
+
+    num_batches = max(
+        1,
+        math.ceil(sum(map(lambda work_item_iter_: work_item_iter_['estimatedWork'], work_item_list)) / target_batch_work),
+        math.ceil(
+            sum(map(lambda work_item_iter_: work_item_iter_['estimatedPayloadBytes'], work_item_list)) /
+            max_batch_payload_bytes
+        ),
+    )
+    num_batches = min(num_batches, len(work_item_list))
+
+    # Largest first, onto the batch with the least work that still has room for the payload
+    batch_item_indexes: List[List[int]] = [[] for _ in range(num_batches)]
+    batch_payload_bytes: List[int] = [0] * num_batches
+    batch_heap = [(0.0, batch_index_iter_) for batch_index_iter_ in range(num_batches)]
+    for item_index_iter_ in sorted(
+            range(len(work_item_list)),
+            key=lambda item_index_iter_: -work_item_list[item_index_iter_]['estimatedWork']
+    ):
+        work_item = work_item_list[item_index_iter_]
+        skipped_batches = []
+        while (
+                len(batch_heap) > 0 and
+                batch_payload_bytes[batch_heap[0][1]] + work_item['estimatedPayloadBytes'] > max_batch_payload_bytes
+        ):
+            skipped_batches.append(heapq.heappop(batch_heap))
+        if len(batch_heap) > 0:
+            batch_work, batch_index = heapq.heappop(batch_heap)
+        else:
+            # Every batch is full, open another
+            batch_work, batch_index = 0.0, len(batch_item_indexes)
+            batch_item_indexes.append([])
+            batch_payload_bytes.append(0)
+        batch_item_indexes[batch_index].append(item_index_iter_)
+        batch_payload_bytes[batch_index] += work_item['estimatedPayloadBytes']
+        heapq.heappush(batch_heap, (batch_work + work_item['estimatedWork'], batch_index))
+        for skipped_batch_iter_ in skipped_batches:
+            heapq.heappush(batch_heap, skipped_batch_iter_)
+
+    # Batches in order of their first item, items in input order
+    batch_item_indexes = sorted(
+        map(sorted, filter(lambda item_indexes_iter_: len(item_indexes_iter_) > 0, batch_item_indexes)),
+        key=lambda item_indexes_iter_: item_indexes_iter_[0]
+    )
+
+    batch_list: List[BatchDescriptor] = list(map(
+        lambda batch_iter_: {
+            "batchIndex": batch_iter_[0],
+            "items": list(map(lambda item_index_iter_: work_item_list[item_index_iter_]['item'], batch_iter_[1])),
+            "estimatedWork": sum(map(
+                lambda item_index_iter_: work_item_list[item_index_iter_]['estimatedWork'], batch_iter_[1]
+            )),
+            "estimatedPayloadBytes": sum(map(
+                lambda item_index_iter_: work_item_list[item_index_iter_]['estimatedPayloadBytes'], batch_iter_[1]
+            )),
+        },
+        enumerate(batch_item_indexes)
+    ))
+
+    return {
+        "batchList": batch_list,
+        "recommendedMaxConcurrency": min(len(batch_list), max_concurrency),
+    }
+
+
+def plan_uniform_batches(
+        item_list: List[Any],
+        work_per_item: float,
+        payload_bytes_per_item: int,
+        target_batch_work: Optional[float] = None
+) -> BatchPlan:
+    """
+    Plan batches of items that each take the same work, the payload of each item is its json size
+    plus payload_bytes_per_item (for the responses it adds to the child execution)
+    :param item_list:
+    :param work_per_item:
+    :param payload_bytes_per_item:
+    :param target_batch_work: Defaults to FASTQ_GLUE_BATCH_TARGET_WORK
+    :return:
+    """
+    return plan_batches(
+        list(map(
+            lambda item_iter_: {
+                "item": item_iter_,
+                "estimatedWork": work_per_item,
+                "estimatedPayloadBytes": get_json_size(item_iter_) + payload_bytes_per_item,
+            },
+            item_list
+        )),
+        target_batch_work=target_batch_work
+    )
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+"""
+Checkpoint journal
+
+Every lambda task is retried by the step function (up to 3 times on States.TaskFailed),
+a timeout halfway through appending fastqs to a fastq set or adding read sets would otherwise
+rerun every fastq manager write from the start,
+and in the append path create (and link) a second fastq object for each lane already written.
+
+Each completed write is recorded in the journal, keyed by
+
+* the execution id (of the parent execution, so it is the same for each retry and redrive of a child execution)
+* the library id
+* the lane ('*' for writes to the library's fastq set)
+* the operation
+
+alongside the value the write returned (i.e the new fastq object and its id).
+A retried invocation replays the recorded values rather than repeating the writes, and resumes from the first
+write that was not recorded.
+A write that completes but is not recorded (the lambda dies in between) is still repeated.
+
+The journal store is
+
+* a DynamoDB table (FASTQ_GLUE_JOURNAL_TABLE_NAME), partitioned by execution and library,
+  with a ttl on expiresAt
+* a SQLite database (LOCAL_JOURNAL_STORE_PATH), so the same code paths can be run offline,
+  ':memory:' keeps the journal in this process only
+
+The entries of an execution and library are read once, with a single query, when the journal is opened.
+If neither store is set, or no execution id is given, the journal is disabled and every write is made.
+
+Usage
+
+journal = get_checkpoint_journal(execution_id, library_id)
+fastq_object = journal.checkpoint("createFastqObject", lambda: create_fastq_object(...), lane=1)
+"""
+
+# Standard imports
+import json
+import typing
+import threading
+from contextlib import contextmanager
+from os import environ
+from time import time
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, Union
+
+# Local imports
+from .runtime import get_dynamodb_client
+
+# Type hints
+if typing.TYPE_CHECKING:
+    import sqlite3
+    from mypy_boto3_dynamodb import DynamoDBClient
+
+# Globals
+JOURNAL_TABLE_NAME_ENV_VAR = "FASTQ_GLUE_JOURNAL_TABLE_NAME"
+LOCAL_JOURNAL_STORE_PATH_ENV_VAR = "LOCAL_JOURNAL_STORE_PATH"
+
+# Step functions can redrive an execution for up to 14 days after it has stopped
+JOURNAL_ENTRY_TTL_SECONDS = 30 * 24 * 60 * 60
+LIBRARY_LANE_KEY = "*"
+
+R = TypeVar("R")
+
+
+def get_journal_key(execution_id: str, library_id: str) -> str:
+    return f"{execution_id}/{library_id}"
+
+
+def get_operation_key(operation: str, lane: Optional[int] = None) -> str:
+    return f"{lane if lane is not None else LIBRARY_LANE_KEY}/{operation}"
+
+
+class DynamoDbJournalStore:
+    """
+    Journal entries as items in a DynamoDB table,
+    partition key journalKey (execution / library), sort key operationKey (lane / operation)
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def get_dynamodb_client(self) -> 'DynamoDBClient':
+        # Shared with the worker threads and kept across warm invocations, see runtime.py
+        return get_dynamodb_client()
+
+    def get_entries(self, journal_key: str) -> Dict[str, Any]:
+        """
+        Get the recorded value of each operation of the execution / library
+        :param journal_key:
+        :return:
+        """
+        entries = {}
+        query_kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "journalKey = :journalKey",
+            "ExpressionAttributeValues": {
+                ":journalKey": {"S": journal_key},
+            },
+            "ConsistentRead": True,
+        }
+        while True:
+            response = self.get_dynamodb_client().query(**query_kwargs)
+            for item_iter_ in response['Items']:
+                entries[item_iter_['operationKey']['S']] = json.loads(item_iter_['result']['S'])
+            if "LastEvaluatedKey" not in response:
+                return entries
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def put_entry(self, journal_key: str, operation_key: str, result: Any):
+        self.get_dynamodb_client().put_item(
+            TableName=self.table_name,
+            Item={
+                "journalKey": {"S": journal_key},
+                "operationKey": {"S": operation_key},
+                "result": {"S": json.dumps(result)},
+                "expiresAt": {"N": str(int(time()) + JOURNAL_ENTRY_TTL_SECONDS)},
+            }
+        )
+
+
+class SqliteJournalStore:
+    """
+    Local stand-in for the DynamoDB table,
+    ':memory:' shares one connection between the threads of this process.
+    """
+
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self.memory_connection: Optional['sqlite3.Connection'] = None
+        self.memory_connection_lock = threading.Lock()
+        # Imported here, as the deployed lambdas only use the DynamoDB store
+        import sqlite3
+
+        if database_path == ":memory:":
+            self.memory_connection = sqlite3.connect(
+                ":memory:", isolation_level=None, check_same_thread=False
+            )
+        with self.connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS journal_entries "
+                "(journal_key TEXT NOT NULL, operation_key TEXT NOT NULL, result TEXT NOT NULL, "
+                "PRIMARY KEY (journal_key, operation_key))"
+            )
+
+    @contextmanager
+    def connection(self) -> Iterator['sqlite3.Connection']:
+        import sqlite3
+
+        if self.memory_connection is not None:
+            with self.memory_connection_lock:
+                yield self.memory_connection
+            return
+
+        connection = sqlite3.connect(self.database_path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def get_entries(self, journal_key: str) -> Dict[str, Any]:
+        with self.connection() as connection:
+            return dict(map(
+                lambda row_iter_: (row_iter_[0], json.loads(row_iter_[1])),
+                connection.execute(
+                    "SELECT operation_key, result FROM journal_entries WHERE journal_key = ?",
+                    (journal_key,)
+                ).fetchall()
+            ))
+
+    def put_entry(self, journal_key: str, operation_key: str, result: Any):
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO journal_entries (journal_key, operation_key, result) VALUES (?, ?, ?)",
+                (journal_key, operation_key, json.dumps(result))
+            )
+
+
+JournalStore = Union[DynamoDbJournalStore, SqliteJournalStore]
+
+# One sqlite store per database path, so a ':memory:' journal is shared by every caller in this process
+SQLITE_JOURNAL_STORES = {}
+SQLITE_JOURNAL_STORES_LOCK = threading.Lock()
+
+
+def get_journal_store() -> Optional[JournalStore]:
+    """
+    Get the journal store, use the sqlite stand-in if LOCAL_JOURNAL_STORE_PATH is set,
+    returns None if the journal has not been configured
+    :return:
+    """
+    if environ.get(LOCAL_JOURNAL_STORE_PATH_ENV_VAR, None):
+        database_path = environ[LOCAL_JOURNAL_STORE_PATH_ENV_VAR]
+        with SQLITE_JOURNAL_STORES_LOCK:
+            if database_path not in SQLITE_JOURNAL_STORES:
+                SQLITE_JOURNAL_STORES[database_path] = SqliteJournalStore(database_path)
+            return SQLITE_JOURNAL_STORES[database_path]
+    if environ.get(JOURNAL_TABLE_NAME_ENV_VAR, None):
+        return DynamoDbJournalStore(environ[JOURNAL_TABLE_NAME_ENV_VAR])
+    return None
+
+
+class CheckpointJournal:
+    """
+    The journal of one library within one execution,
+    the entries recorded by previous attempts are loaded when the journal is opened
+    """
+
+    def __init__(self, journal_store: Optional[JournalStore], journal_key: Optional[str] = None):
+        self.journal_store = journal_store
+        self.journal_key = journal_key
+        self.entries: Dict[str, Any] = (
+            journal_store.get_entries(journal_key)
+            if journal_store is not None
+            else {}
+        )
+        # Entries replayed from previous attempts
+        self.num_replayed = 0
+        self.lock = threading.Lock()
+
+    def is_enabled(self) -> bool:
+        return self.journal_store is not None
+
+    def has_checkpoint(self, operation: str, lane: Optional[int] = None) -> bool:
+        with self.lock:
+            return get_operation_key(operation, lane) in self.entries
+
+    def checkpoint(self, operation: str, func: Callable[[], R], lane: Optional[int] = None) -> R:
+        """
+        Return the recorded value of the operation if a previous attempt completed it,
+        otherwise call func and record its (json serialisable) value
+        :param operation:
+        :param func:
+        :param lane:
+        :return:
+        """
+        if self.journal_store is None:
+            return func()
+
+        operation_key = get_operation_key(operation, lane)
+        with self.lock:
+            if operation_key in self.entries:
+                self.num_replayed += 1
+                return self.entries[operation_key]
+
+        result = func()
+
+        self.journal_store.put_entry(self.journal_key, operation_key, result)
+        with self.lock:
+            self.entries[operation_key] = result
+        return result
+
+
+def get_checkpoint_journal(
+        execution_id: Optional[str],
+        library_id: str,
+        journal_store: Optional[JournalStore] = None
+) -> CheckpointJournal:
+    """
+    Open the journal of the library within the execution,
+    the journal is disabled if there is no execution id or journal store
+    :param execution_id:
+    :param library_id:
+    :param journal_store:
+    :return:
+    """
+    if journal_store is None:
+        journal_store = get_journal_store()
+    if execution_id is None or journal_store is None:
+        return CheckpointJournal(None)
+    return CheckpointJournal(journal_store, get_journal_key(execution_id, library_id))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Concurrency helpers
+
+Fastq manager requests are independent http round trips, so lambdas can run them on a bounded thread pool.
+
+Both the pool size and the retry policy are read from the environment,
+
+* FASTQ_MANAGER_MAX_WORKERS (1 runs every request serially, in order)
+* FASTQ_MANAGER_MAX_ATTEMPTS
+* FASTQ_MANAGER_BACKOFF_SECONDS
+* FASTQ_MANAGER_BACKOFF_RATE
+
+Retries follow the same shape as our step function retry blocks (interval, backoff rate, full jitter),
+and only apply to throttling, server errors and connection errors.
+"""
+
+# Standard imports
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from time import sleep
+from typing import Callable, Iterable, List, TypedDict, TypeVar
+
+# Globals
+MAX_WORKERS_ENV_VAR = "FASTQ_MANAGER_MAX_WORKERS"
+MAX_ATTEMPTS_ENV_VAR = "FASTQ_MANAGER_MAX_ATTEMPTS"
+BACKOFF_SECONDS_ENV_VAR = "FASTQ_MANAGER_BACKOFF_SECONDS"
+BACKOFF_RATE_ENV_VAR = "FASTQ_MANAGER_BACKOFF_RATE"
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+DEFAULT_BACKOFF_RATE = 2.0
+
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# Type hints
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class RetryPolicy(TypedDict):
+    maxAttempts: int
+    backoffSeconds: float
+    backoffRate: float
+
+
+def get_max_workers() -> int:
+    return max(int(environ.get(MAX_WORKERS_ENV_VAR, DEFAULT_MAX_WORKERS)), 1)
+
+
+def get_retry_policy() -> RetryPolicy:
+    return {
+        "maxAttempts": max(int(environ.get(MAX_ATTEMPTS_ENV_VAR, DEFAULT_MAX_ATTEMPTS)), 1),
+        "backoffSeconds": float(environ.get(BACKOFF_SECONDS_ENV_VAR, DEFAULT_BACKOFF_SECONDS)),
+        "backoffRate": float(environ.get(BACKOFF_RATE_ENV_VAR, DEFAULT_BACKOFF_RATE)),
+    }
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Retry on throttling and server errors (http errors with a retryable status code)
+    and on connection errors / timeouts (os errors without a response)
+    :param error:
+    :return:
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        return getattr(response, "status_code", None) in RETRYABLE_STATUS_CODES
+    return isinstance(error, OSError)
+
+
+def call_with_retries(
+        func: Callable[[], R],
+        retry_policy: RetryPolicy,
+        is_retryable: Callable[[Exception], bool] = is_retryable_error,
+) -> R:
+    """
+    Call func, retrying retryable errors with exponential backoff and full jitter
+    :param func:
+    :param retry_policy:
+    :param is_retryable:
+    :return:
+    """
+    for attempt_iter_ in range(1, retry_policy['maxAttempts'] + 1):
+        try:
+            return func()
+        except Exception as e:
+            if attempt_iter_ == retry_policy['maxAttempts'] or not is_retryable(e):
+                raise
+            backoff_seconds = (
+                retry_policy['backoffSeconds'] *
+                (retry_policy['backoffRate'] ** (attempt_iter_ - 1))
+            )
+            logger.warning(
+                f"Attempt {attempt_iter_} of {retry_policy['maxAttempts']} failed with '{e}', "
+                f"retrying in up to {backoff_seconds} seconds"
+            )
+            sleep(random.uniform(0, backoff_seconds))
+
+    # Unreachable, maxAttempts is at least one
+    raise RuntimeError("No attempts were made")
+
+
+def map_concurrently(
+        func: Callable[[T], R],
+        items: Iterable[T],
+        max_workers: int,
+) -> List[R]:
+    """
+    Like list(map(func, items)) but on a bounded thread pool, results are returned in the order of items.
+
+    If any call raises, the error of the first failing item (in item order) is raised once all calls have finished.
+    With max_workers set to 1, items are run serially in the calling thread.
+    :param func:
+    :param items:
+    :param max_workers:
+    :return:
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return list(map(func, items))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(func, item_iter_) for item_iter_ in items]
+        return [future_iter_.result() for future_iter_ in futures]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Demultiplex stats helpers
+
+The estimated base count of a fastq pair is the read count (from Demultiplex_Stats.csv)
+multiplied by the cycle count of that sample on that lane (from the samplesheet).
+
+Rather than look up the cycle count row by row, we build a cycle count lookup frame
+from the samplesheet index once and join it onto the demux stats.
+"""
+
+# Standard imports
+from typing import Dict, Any, List, Optional
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from .samplesheet import compile_samplesheet_index
+
+
+def get_cycle_count_lookup_df(
+        samplesheet: Dict[str, Any],
+        sample_id_list: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Get the cycle count for each sample id / lane combination in the samplesheet
+
+    Output columns are as follows:
+    * SampleID
+    * Lane
+    * cycleCount
+    :param samplesheet:
+    :param sample_id_list:
+    :return:
+    """
+    samplesheet_index = compile_samplesheet_index(samplesheet, sample_id_list=sample_id_list)
+
+    return pd.DataFrame(
+        [
+            {
+                "SampleID": sample_id_iter_,
+                "Lane": bclconvert_row_iter_['lane'],
+                "cycleCount": bclconvert_row_iter_['cycleCount'],
+            }
+            for sample_id_iter_, bclconvert_rows_iter_ in samplesheet_index['bclConvertDataBySampleId'].items()
+            for bclconvert_row_iter_ in bclconvert_rows_iter_
+        ],
+        columns=["SampleID", "Lane", "cycleCount"],
+    ).astype({
+        "Lane": "int64",
+        "cycleCount": "int64",
+    }).drop_duplicates(
+        subset=["SampleID", "Lane"],
+        keep="first"
+    )
+
+
+def get_base_count_est_series(
+        demux_stats_df: pd.DataFrame,
+        samplesheet: Dict[str, Any],
+        global_cycle_count: int,
+) -> pd.Series:
+    """
+    Join the cycle count lookup frame to the demux stats on SampleID / Lane
+    and compute cycleCount * '# Reads' in one column operation.
+
+    Rows without a matching samplesheet row use the global cycle count.
+    :param demux_stats_df:
+    :param samplesheet:
+    :param global_cycle_count:
+    :return: The estimated base count, aligned to the index of demux_stats_df
+    """
+    cycle_count_lookup_df = get_cycle_count_lookup_df(
+        samplesheet,
+        sample_id_list=demux_stats_df['SampleID'].unique().tolist()
+    )
+
+    # A left merge keeps the order (but not the index) of the demux stats
+    cycle_count_series = pd.merge(
+        demux_stats_df[['SampleID', 'Lane']].astype({"Lane": "int64"}),
+        cycle_count_lookup_df,
+        on=['SampleID', 'Lane'],
+        how='left',
+    )['cycleCount'].fillna(
+        global_cycle_count
+    ).astype("int64")
+
+    return pd.Series(
+        cycle_count_series.to_numpy() * demux_stats_df['# Reads'].astype("int64").to_numpy(),
+        index=demux_stats_df.index,
+        dtype="int64",
+    )
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+
+"""
+Fingerprint queue
+
+Each fingerprint extraction runs for around 30 minutes downstream.
+The same fastq set is submitted by trigger somalier extract (once per workflow run, so once per library per workflow)
+and again by the daily add missing fingerprints sweep if its fingerprint has not landed yet,
+and a large cohort finishing at once would otherwise submit every bam in a single burst.
+
+run_extract_fingerprint enqueues its submissions and then dispatches from the queue
+
+* a submission is keyed by (fastqSetId, referenceName, bamUri),
+  a key that is already queued, or was submitted within the dedupe window, is not queued again
+* at most max in flight submissions are made at a time,
+  the extractor does not tell us when it has finished, so a submission counts as in flight
+  for a fixed time after it was made
+* queued submissions are dispatched smallest bam first (bams of unknown size last), then oldest first
+
+Dispatching holds the dispatch lease (see library_lock.named_lock), so the in-flight cap holds across
+concurrent invocations. Submissions left queued are made by a later dispatch,
+the step functions poll with the keys of their submissions until none are left queued.
+
+Environment variables
+
+* FASTQ_GLUE_FINGERPRINT_DEDUPE_WINDOW_SECONDS (default 12 hours, shorter than the daily sweep,
+  so a failed extraction is submitted again by the next sweep)
+* FASTQ_GLUE_FINGERPRINT_MAX_IN_FLIGHT (default 20)
+* FASTQ_GLUE_FINGERPRINT_IN_FLIGHT_SECONDS (default 45 minutes)
+
+The queue store is
+
+* a DynamoDB table (FASTQ_GLUE_FINGERPRINT_QUEUE_TABLE_NAME), partition key queueName, sort key submissionKey,
+  with a ttl on expiresAt
+* a SQLite database (LOCAL_FINGERPRINT_QUEUE_STORE_PATH), so the same code paths can be run offline,
+  ':memory:' keeps the queue in this process only
+
+If neither is set, the queue is disabled and every submission is made straight away.
+
+Usage
+
+queue_store = get_fingerprint_queue_store()
+submission_key_list = enqueue_submissions(submission_list, queue_store)
+dispatch_submissions(lambda submission: run_extract_fingerprint(...), queue_store)
+queue_summary = get_queue_summary(submission_key_list, queue_store)
+"""
+
+# Standard imports
+import json
+import typing
+import logging
+import threading
+from contextlib import contextmanager
+from os import environ
+from time import time
+from typing import Callable, Dict, Iterator, List, Literal, Optional, TypedDict, Union
+
+# Local imports
+from .runtime import get_dynamodb_client
+
+# Type hints
+if typing.TYPE_CHECKING:
+    import sqlite3
+    from mypy_boto3_dynamodb import DynamoDBClient
+
+# Globals
+FINGERPRINT_QUEUE_TABLE_NAME_ENV_VAR = "FASTQ_GLUE_FINGERPRINT_QUEUE_TABLE_NAME"
+LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR = "LOCAL_FINGERPRINT_QUEUE_STORE_PATH"
+DEDUPE_WINDOW_SECONDS_ENV_VAR = "FASTQ_GLUE_FINGERPRINT_DEDUPE_WINDOW_SECONDS"
+MAX_IN_FLIGHT_ENV_VAR = "FASTQ_GLUE_FINGERPRINT_MAX_IN_FLIGHT"
+IN_FLIGHT_SECONDS_ENV_VAR = "FASTQ_GLUE_FINGERPRINT_IN_FLIGHT_SECONDS"
+
+DEFAULT_DEDUPE_WINDOW_SECONDS = 12 * 60 * 60
+DEFAULT_MAX_IN_FLIGHT = 20
+DEFAULT_IN_FLIGHT_SECONDS = 45 * 60
+# A submission still queued after a week is dropped, the daily sweep will queue it again
+QUEUED_ENTRY_TTL_SECONDS = 7 * 24 * 60 * 60
+
+FINGERPRINT_QUEUE_NAME = "fingerprints"
+DISPATCH_LOCK_KEY = "fingerprint-queue/dispatch"
+
+SubmissionStatus = Literal["queued", "submitted"]
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class FingerprintSubmission(TypedDict):
+    fastqSetId: str
+    referenceName: str
+    # Not given by the daily sweep, the extractor then finds the bam itself
+    bamUri: Optional[str]
+    bamSizeBytes: Optional[int]
+
+
+class FingerprintQueueEntry(FingerprintSubmission):
+    submissionKey: str
+    status: SubmissionStatus
+    enqueuedAt: float
+    submittedAt: Optional[float]
+    expiresAt: float
+
+
+class FingerprintQueueSummary(TypedDict):
+    queued: int
+    submitted: int
+
+
+def get_dedupe_window_seconds() -> float:
+    return float(environ.get(DEDUPE_WINDOW_SECONDS_ENV_VAR, DEFAULT_DEDUPE_WINDOW_SECONDS))
+
+
+def get_max_in_flight() -> int:
+    return int(environ.get(MAX_IN_FLIGHT_ENV_VAR, DEFAULT_MAX_IN_FLIGHT))
+
+
+def get_in_flight_seconds() -> float:
+    return float(environ.get(IN_FLIGHT_SECONDS_ENV_VAR, DEFAULT_IN_FLIGHT_SECONDS))
+
+
+def get_submission_key(submission: FingerprintSubmission) -> str:
+    # Imported here, hashlib is only needed for submissions with a bam
+    import hashlib
+
+    # Bam uris can be long, only their hash is part of the key
+    bam_uri_hash = (
+        hashlib.sha256(submission['bamUri'].encode()).hexdigest()[:16]
+        if submission.get('bamUri', None) is not None
+        else "-"
+    )
+    return f"{submission['fastqSetId']}/{submission['referenceName']}/{bam_uri_hash}"
+
+
+def get_submission(submission: Union[FingerprintSubmission, FingerprintQueueEntry]) -> FingerprintSubmission:
+    return {
+        "fastqSetId": submission['fastqSetId'],
+        "referenceName": submission['referenceName'],
+        "bamUri": submission.get('bamUri', None),
+        "bamSizeBytes": submission.get('bamSizeBytes', None),
+    }
+
+
+def get_dispatch_order(queue_entry: FingerprintQueueEntry):
+    # Smallest bam first, bams of unknown size last, then oldest first
+    return (
+        queue_entry['bamSizeBytes'] is None,
+        queue_entry['bamSizeBytes'] or 0,
+        queue_entry['enqueuedAt'],
+        queue_entry['submissionKey'],
+    )
+
+
+class DynamoDbFingerprintQueueStore:
+    """
+    Queue entries as items in a DynamoDB table,
+    partition key queueName, sort key submissionKey, the entry itself is stored as json
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def get_dynamodb_client(self) -> 'DynamoDBClient':
+        # Kept across warm invocations, see runtime.py
+        return get_dynamodb_client()
+
+    def get_entries(self, now: float) -> List[FingerprintQueueEntry]:
+        """
+        Get every queue entry that has not expired (the ttl deletes expired items eventually, not straight away)
+        :param now:
+        :return:
+        """
+        entries = []
+        query_kwargs = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "queueName = :queueName",
+            "FilterExpression": "expiresAt >= :now",
+            "ExpressionAttributeValues": {
+                ":queueName": {"S": FINGERPRINT_QUEUE_NAME},
+                ":now": {"N": str(now)},
+            },
+            "ConsistentRead": True,
+        }
+        while True:
+            response = self.get_dynamodb_client().query(**query_kwargs)
+            entries.extend(map(
+                lambda item_iter_: json.loads(item_iter_['entry']['S']),
+                response['Items']
+            ))
+            if "LastEvaluatedKey" not in response:
+                return entries
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get_item(self, queue_entry: FingerprintQueueEntry):
+        return {
+            "queueName": {"S": FINGERPRINT_QUEUE_NAME},
+            "submissionKey": {"S": queue_entry['submissionKey']},
+            "entry": {"S": json.dumps(queue_entry)},
+            # Whole seconds, for the table ttl
+            "expiresAt": {"N": str(int(queue_entry['expiresAt']) + 1)},
+        }
+
+    def try_put_entry(self, queue_entry: FingerprintQueueEntry, now: float) -> bool:
+        """
+        Put the entry if there is no entry for its submission key, or the entry has expired
+        :param queue_entry:
+        :param now:
+        :return:
+        """
+        # Imported here, as botocore is only on the path alongside boto3
+        from botocore.exceptions import ClientError
+
+        try:
+            self.get_dynamodb_client().put_item(
+                TableName=self.table_name,
+                Item=self.get_item(queue_entry),
+                ConditionExpression="attribute_not_exists(submissionKey) OR expiresAt < :now",
+                ExpressionAttributeValues={
+                    ":now": {"N": str(int(now))},
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def put_entry(self, queue_entry: FingerprintQueueEntry):
+        self.get_dynamodb_client().put_item(
+            TableName=self.table_name,
+            Item=self.get_item(queue_entry)
+        )
+
+
+class SqliteFingerprintQueueStore:
+    """
+    Local stand-in for the DynamoDB table.
+    Each conditional write is a single immediate transaction,
+    ':memory:' shares one connection between the threads of this process.
+    """
+
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self.memory_connection: Optional['sqlite3.Connection'] = None
+        self.memory_connection_lock = threading.Lock()
+        # Imported here, as the deployed lambdas only use the DynamoDB store
+        import sqlite3
+
+        if database_path == ":memory:":
+            self.memory_connection = sqlite3.connect(
+                ":memory:", isolation_level=None, check_same_thread=False
+            )
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprint_queue "
+                "(submission_key TEXT PRIMARY KEY, entry TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def transaction(self) -> Iterator['sqlite3.Connection']:
+        import sqlite3
+
+        if self.memory_connection is not None:
+            with self.memory_connection_lock:
+                yield self.memory_connection
+            return
+
+        connection = sqlite3.connect(self.database_path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def get_entries(self, now: float) -> List[FingerprintQueueEntry]:
+        with self.transaction() as connection:
+            return list(map(
+                lambda row_iter_: json.loads(row_iter_[0]),
+                connection.execute(
+                    "SELECT entry FROM fingerprint_queue WHERE expires_at >= ?",
+                    (now,)
+                ).fetchall()
+            ))
+
+    def try_put_entry(self, queue_entry: FingerprintQueueEntry, now: float) -> bool:
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO fingerprint_queue (submission_key, entry, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (submission_key) DO UPDATE SET entry = excluded.entry, expires_at = excluded.expires_at "
+                "WHERE fingerprint_queue.expires_at < ?",
+                (queue_entry['submissionKey'], json.dumps(queue_entry), queue_entry['expiresAt'], now)
+            )
+            return cursor.rowcount == 1
+
+    def put_entry(self, queue_entry: FingerprintQueueEntry):
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO fingerprint_queue (submission_key, entry, expires_at) VALUES (?, ?, ?)",
+                (queue_entry['submissionKey'], json.dumps(queue_entry), queue_entry['expiresAt'])
+            )
+
+
+FingerprintQueueStore = Union[DynamoDbFingerprintQueueStore, SqliteFingerprintQueueStore]
+
+# One sqlite store per database path, so a ':memory:' queue is shared by every caller in this process
+SQLITE_FINGERPRINT_QUEUE_STORES = {}
+SQLITE_FINGERPRINT_QUEUE_STORES_LOCK = threading.Lock()
+
+
+def get_fingerprint_queue_store() -> Optional[FingerprintQueueStore]:
+    """
+    Get the queue store, use the sqlite stand-in if LOCAL_FINGERPRINT_QUEUE_STORE_PATH is set,
+    returns None if the queue has not been configured
+    :return:
+    """
+    if environ.get(LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR, None):
+        database_path = environ[LOCAL_FINGERPRINT_QUEUE_STORE_PATH_ENV_VAR]
+        with SQLITE_FINGERPRINT_QUEUE_STORES_LOCK:
+            if database_path not in SQLITE_FINGERPRINT_QUEUE_STORES:
+                SQLITE_FINGERPRINT_QUEUE_STORES[database_path] = SqliteFingerprintQueueStore(database_path)
+            return SQLITE_FINGERPRINT_QUEUE_STORES[database_path]
+    if environ.get(FINGERPRINT_QUEUE_TABLE_NAME_ENV_VAR, None):
+        return DynamoDbFingerprintQueueStore(environ[FINGERPRINT_QUEUE_TABLE_NAME_ENV_VAR])
+    return None
+
+
+def enqueue_submissions(
+        submission_list: List[FingerprintSubmission],
+        queue_store: FingerprintQueueStore,
+        now: Optional[float] = None
+) -> List[str]:
+    """
+    Queue each submission, unless its key is already queued or was submitted within the dedupe window
+    :param submission_list:
+    :param queue_store:
+    :param now:
+    :return: The submission key of each submission (queued or not)
+    """
+    if now is None:
+        now = time()
+
+    submission_key_list = []
+    num_deduplicated = 0
+    for submission_iter_ in submission_list:
+        submission_key = get_submission_key(submission_iter_)
+        submission_key_list.append(submission_key)
+        is_queued = queue_store.try_put_entry(
+            {
+                **get_submission(submission_iter_),
+                "submissionKey": submission_key,
+                "status": "queued",
+                "enqueuedAt": now,
+                "submittedAt": None,
+                "expiresAt": now + QUEUED_ENTRY_TTL_SECONDS,
+            },
+            now=now
+        )
+        if not is_queued:
+            num_deduplicated += 1
+
+    if num_deduplicated > 0:
+        logger.info(f"{num_deduplicated} of {len(submission_list)} submissions were already queued or submitted")
+
+    return submission_key_list
+
+
+def dispatch_submissions(
+        submit: Callable[[FingerprintSubmission], None],
+        queue_store: FingerprintQueueStore,
+        max_in_flight: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+        now: Optional[float] = None
+) -> List[str]:
+    """
+    Submit queued submissions, smallest bam first, until max in flight submissions are in flight.
+    A submission that raises is put back in the queue (in its place) and the error is raised
+    :param submit:
+    :param queue_store:
+    :param max_in_flight:
+    :param lease_seconds: Lease on the dispatch lock, see library_lock.get_lease_seconds
+    :param now:
+    :return: The keys of the submissions made
+    """
+    # Imported here, the lease store is only needed to dispatch
+    from .library_lock import named_lock
+
+    if max_in_flight is None:
+        max_in_flight = get_max_in_flight()
+
+    with named_lock(DISPATCH_LOCK_KEY, lease_seconds=lease_seconds):
+        if now is None:
+            now = time()
+        in_flight_seconds = get_in_flight_seconds()
+        dedupe_window_seconds = get_dedupe_window_seconds()
+
+        queue_entry_list = queue_store.get_entries(now)
+        num_in_flight = len(list(filter(
+            lambda queue_entry_iter_: (
+                queue_entry_iter_['status'] == "submitted" and
+                queue_entry_iter_['submittedAt'] > now - in_flight_seconds
+            ),
+            queue_entry_list
+        )))
+        queued_entry_list = sorted(
+            filter(lambda queue_entry_iter_: queue_entry_iter_['status'] == "queued", queue_entry_list),
+            key=get_dispatch_order
+        )
+
+        submitted_key_list = []
+        for queue_entry_iter_ in queued_entry_list[:max(max_in_flight - num_in_flight, 0)]:
+            queue_store.put_entry({
+                **queue_entry_iter_,
+                "status": "submitted",
+                "submittedAt": now,
+                "expiresAt": now + dedupe_window_seconds,
+            })
+            try:
+                submit(get_submission(queue_entry_iter_))
+            except Exception:
+                queue_store.put_entry(queue_entry_iter_)
+                raise
+            submitted_key_list.append(queue_entry_iter_['submissionKey'])
+
+    logger.info(
+        f"Submitted {len(submitted_key_list)} of {len(queued_entry_list)} queued submissions, "
+        f"{num_in_flight} were already in flight"
+    )
+
+    return submitted_key_list
+
+
+def get_queue_summary(
+        submission_key_list: List[str],
+        queue_store: FingerprintQueueStore,
+        now: Optional[float] = None
+) -> FingerprintQueueSummary:
+    """
+    Count the submissions still queued, a submission no longer in the queue has been submitted (or dropped)
+    :param submission_key_list:
+    :param queue_store:
+    :param now:
+    :return:
+    """
+    if now is None:
+        now = time()
+
+    statuses_by_submission_key: Dict[str, SubmissionStatus] = dict(map(
+        lambda queue_entry_iter_: (queue_entry_iter_['submissionKey'], queue_entry_iter_['status']),
+        queue_store.get_entries(now)
+    ))
+
+    num_queued = len(list(filter(
+        lambda submission_key_iter_: statuses_by_submission_key.get(submission_key_iter_, None) == "queued",
+        set(submission_key_list)
+    )))
+
+    return {
+        "queued": num_queued,
+        "submitted": len(set(submission_key_list)) - num_queued,
+    }
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+"""
+Library locks
+
+Creating, appending to or replacing a library's fastq set reads the library's fastq sets and then writes,
+two invocations for the same library (a duplicate event, or a retry overlapping a slow first attempt)
+could otherwise both see no fastq set on the run and both create one.
+
+The writes for a library are made while holding a lease on the library id,
+taken with a conditional write, so only one invocation holds the lease at a time.
+A lease expires on its own after lease_seconds, so a lambda that times out or crashes cannot hold it forever,
+and is only released by its owner.
+
+The lease store is
+
+* a DynamoDB table (FASTQ_GLUE_LOCK_TABLE_NAME), keyed by lockKey, with a ttl on expiresAt
+* a SQLite database (LOCAL_LOCK_STORE_PATH), so the same code paths can be run offline,
+  ':memory:' keeps the leases in this process only
+
+If neither is set, locking is disabled and library_lock does nothing.
+
+named_lock takes a lease on any other key in the same store (i.e. the fingerprint queue's dispatch lease).
+
+Usage
+
+with library_lock(library_id, lease_seconds=get_lease_seconds(context)):
+    ...
+"""
+
+# Standard imports
+import random
+import typing
+import threading
+from contextlib import contextmanager
+from os import environ
+from time import sleep, time
+from typing import Any, Iterator, Optional, Union
+
+# Local imports
+from .runtime import get_dynamodb_client
+
+# Type hints
+if typing.TYPE_CHECKING:
+    import sqlite3
+
+# Globals
+LOCK_TABLE_NAME_ENV_VAR = "FASTQ_GLUE_LOCK_TABLE_NAME"
+LOCAL_LOCK_STORE_PATH_ENV_VAR = "LOCAL_LOCK_STORE_PATH"
+LOCK_LEASE_SECONDS_ENV_VAR = "FASTQ_GLUE_LOCK_LEASE_SECONDS"
+LOCK_WAIT_SECONDS_ENV_VAR = "FASTQ_GLUE_LOCK_WAIT_SECONDS"
+
+DEFAULT_LOCK_LEASE_SECONDS = 300
+DEFAULT_LOCK_WAIT_SECONDS = 30
+# Keep the lease for a little longer than the lambda can run
+LEASE_MARGIN_SECONDS = 5
+POLL_INTERVAL_SECONDS = 0.05
+MAX_POLL_INTERVAL_SECONDS = 1.0
+
+
+class LockNotAcquiredError(Exception):
+    """
+    Raised when the lease is still held by another owner after waiting,
+    the step function task retries on States.TaskFailed
+    """
+    pass
+
+
+def get_lock_lease_seconds() -> float:
+    return float(environ.get(LOCK_LEASE_SECONDS_ENV_VAR, DEFAULT_LOCK_LEASE_SECONDS))
+
+
+def get_lock_wait_seconds() -> float:
+    return float(environ.get(LOCK_WAIT_SECONDS_ENV_VAR, DEFAULT_LOCK_WAIT_SECONDS))
+
+
+def get_lease_seconds(context: Optional[Any] = None) -> float:
+    """
+    The lease lasts for the rest of the lambda invocation (plus a margin), or FASTQ_GLUE_LOCK_LEASE_SECONDS
+    if there is no lambda context
+    :param context:
+    :return:
+    """
+    if context is not None and hasattr(context, "get_remaining_time_in_millis"):
+        return context.get_remaining_time_in_millis() / 1000 + LEASE_MARGIN_SECONDS
+    return get_lock_lease_seconds()
+
+
+def get_library_lock_key(library_id: str) -> str:
+    return f"library/{library_id}"
+
+
+class DynamoDbLockStore:
+    """
+    Leases as items in a DynamoDB table, taken and released with conditional writes
+    """
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+
+    def try_acquire(self, lock_key: str, owner_id: str, lease_seconds: float) -> bool:
+        """
+        Take the lease if no one holds it, or the holder's lease has expired
+        :param lock_key:
+        :param owner_id:
+        :param lease_seconds:
+        :return:
+        """
+        # Imported here, as botocore is only on the path alongside boto3
+        from botocore.exceptions import ClientError
+
+        now = time()
+        try:
+            get_dynamodb_client().put_item(
+                TableName=self.table_name,
+                Item={
+                    "lockKey": {"S": lock_key},
+                    "ownerId": {"S": owner_id},
+                    # Whole seconds, so the table ttl can clean up expired leases
+                    "expiresAt": {"N": str(int(now + lease_seconds) + 1)},
+                },
+                ConditionExpression="attribute_not_exists(lockKey) OR expiresAt < :now",
+                ExpressionAttributeValues={
+                    ":now": {"N": str(int(now))},
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def release(self, lock_key: str, owner_id: str) -> bool:
+        """
+        Release the lease, if we still hold it
+        :param lock_key:
+        :param owner_id:
+        :return:
+        """
+        from botocore.exceptions import ClientError
+
+        try:
+            get_dynamodb_client().delete_item(
+                TableName=self.table_name,
+                Key={
+                    "lockKey": {"S": lock_key},
+                },
+                ConditionExpression="ownerId = :ownerId",
+                ExpressionAttributeValues={
+                    ":ownerId": {"S": owner_id},
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+
+class SqliteLockStore:
+    """
+    Local stand-in for the DynamoDB table.
+    Each conditional write is a single immediate transaction, so leases hold across threads and processes
+    sharing the database file, ':memory:' shares one connection between the threads of this process.
+    """
+
+    def __init__(self, database_path: str):
+        self.database_path = database_path
+        self.memory_connection: Optional['sqlite3.Connection'] = None
+        self.memory_connection_lock = threading.Lock()
+        # Imported here, as the deployed lambdas only use the DynamoDB store
+        import sqlite3
+
+        if database_path == ":memory:":
+            self.memory_connection = sqlite3.connect(
+                ":memory:", isolation_level=None, check_same_thread=False
+            )
+        with self.transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(lock_key TEXT PRIMARY KEY, owner_id TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def transaction(self) -> Iterator['sqlite3.Connection']:
+        import sqlite3
+
+        if self.memory_connection is not None:
+            with self.memory_connection_lock:
+                yield self.memory_connection
+            return
+
+        connection = sqlite3.connect(self.database_path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def try_acquire(self, lock_key: str, owner_id: str, lease_seconds: float) -> bool:
+        now = time()
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO leases (lock_key, owner_id, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (lock_key) DO UPDATE SET owner_id = excluded.owner_id, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ?",
+                (lock_key, owner_id, now + lease_seconds, now)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, lock_key: str, owner_id: str) -> bool:
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "DELETE FROM leases WHERE lock_key = ? AND owner_id = ?",
+                (lock_key, owner_id)
+            )
+            return cursor.rowcount == 1
+
+
+LockStore = Union[DynamoDbLockStore, SqliteLockStore]
+
+# One sqlite store per database path, so ':memory:' leases are shared by every caller in this process
+SQLITE_LOCK_STORES = {}
+SQLITE_LOCK_STORES_LOCK = threading.Lock()
+
+
+def get_lock_store() -> Optional[LockStore]:
+    """
+    Get the lease store, use the sqlite stand-in if LOCAL_LOCK_STORE_PATH is set,
+    returns None if locking has not been configured
+    :return:
+    """
+    if environ.get(LOCAL_LOCK_STORE_PATH_ENV_VAR, None):
+        database_path = environ[LOCAL_LOCK_STORE_PATH_ENV_VAR]
+        with SQLITE_LOCK_STORES_LOCK:
+            if database_path not in SQLITE_LOCK_STORES:
+                SQLITE_LOCK_STORES[database_path] = SqliteLockStore(database_path)
+            return SQLITE_LOCK_STORES[database_path]
+    if environ.get(LOCK_TABLE_NAME_ENV_VAR, None):
+        return DynamoDbLockStore(environ[LOCK_TABLE_NAME_ENV_VAR])
+    return None
+
+
+@contextmanager
+def named_lock(
+        lock_key: str,
+        lock_store: Optional[LockStore] = None,
+        lease_seconds: Optional[float] = None,
+        wait_seconds: Optional[float] = None
+) -> Iterator[Optional[str]]:
+    """
+    Hold the lease on the lock key for the duration of the block,
+    waiting (with jittered exponential backoff) up to wait_seconds for another owner to release it.
+    Yields the owner id, or None if locking is disabled
+    :param lock_key:
+    :param lock_store:
+    :param lease_seconds:
+    :param wait_seconds:
+    :return:
+    """
+    if lock_store is None:
+        lock_store = get_lock_store()
+    if lock_store is None:
+        yield None
+        return
+
+    if lease_seconds is None:
+        lease_seconds = get_lock_lease_seconds()
+    if wait_seconds is None:
+        wait_seconds = get_lock_wait_seconds()
+
+    # Imported here, uuid is only needed once a lease is taken
+    from uuid import uuid4
+
+    owner_id = uuid4().hex
+    deadline = time() + wait_seconds
+    poll_interval_seconds = POLL_INTERVAL_SECONDS
+    while not lock_store.try_acquire(lock_key, owner_id, lease_seconds):
+        if time() >= deadline:
+            raise LockNotAcquiredError(
+                f"Could not acquire the lock on {lock_key} after {wait_seconds} seconds"
+            )
+        sleep(random.uniform(0, poll_interval_seconds))
+        poll_interval_seconds = min(poll_interval_seconds * 2, MAX_POLL_INTERVAL_SECONDS)
+
+    try:
+        yield owner_id
+    finally:
+        lock_store.release(lock_key, owner_id)
+
+
+@contextmanager
+def library_lock(
+        library_id: str,
+        lock_store: Optional[LockStore] = None,
+        lease_seconds: Optional[float] = None,
+        wait_seconds: Optional[float] = None
+) -> Iterator[Optional[str]]:
+    """
+    Hold the lease on the library id for the duration of the block, see named_lock
+    :param library_id:
+    :param lock_store:
+    :param lease_seconds:
+    :param wait_seconds:
+    :return:
+    """
+    with named_lock(
+            get_library_lock_key(library_id),
+            lock_store=lock_store,
+            lease_seconds=lease_seconds,
+            wait_seconds=wait_seconds
+    ) as owner_id:
+        yield owner_id
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+
+"""
+Handler metrics
+
+Each handler is wrapped with instrument_handler, which collects metrics for the invocation
+and writes them to stdout in CloudWatch Embedded Metric Format (EMF) when the invocation ends.
+CloudWatch extracts the metrics from the lambda's log stream, so no extra requests are made.
+
+Per invocation we record
+
+* the handler wall time, and whether the handler raised
+* time spent in each phase (download, upload, parse, apiRead, apiWrite), summed over threads
+* bytes read from the object store and rows processed
+* call counts and latency (a sample of up to 100 values, plus a bucketed histogram) per api endpoint
+
+Api calls are recorded by wrapping the orcabus_api_tools functions with instrument_api_call,
+get_* and list_* endpoints count towards the apiRead phase, every other endpoint towards apiWrite.
+
+Recording is a no-op outside of an instrumented handler, and costs a lock and a couple of clock reads inside one.
+Phases should not be nested, nested time is counted in both phases.
+
+Environment variables
+
+* FASTQ_GLUE_METRICS_ENABLED (default true)
+* FASTQ_GLUE_METRICS_NAMESPACE (default OrcaBus/FastqGlue)
+* AWS_LAMBDA_FUNCTION_NAME (set by the lambda runtime), used as the FunctionName dimension
+"""
+
+# Standard imports
+import sys
+import json
+import random
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from os import environ
+from time import perf_counter, time
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+# Globals
+METRICS_ENABLED_ENV_VAR = "FASTQ_GLUE_METRICS_ENABLED"
+METRICS_NAMESPACE_ENV_VAR = "FASTQ_GLUE_METRICS_NAMESPACE"
+FUNCTION_NAME_ENV_VAR = "AWS_LAMBDA_FUNCTION_NAME"
+DEFAULT_METRICS_NAMESPACE = "OrcaBus/FastqGlue"
+
+PHASE_NAMES = ["download", "upload", "parse", "apiRead", "apiWrite"]
+API_READ_ENDPOINT_PREFIXES = ("get_", "list_")
+
+# EMF allows up to 100 metrics per document and 100 values per metric
+MAX_METRICS_PER_DOCUMENT = 100
+MAX_LATENCY_SAMPLES = 100
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_HISTOGRAM_BOUNDS_MS = [
+    1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, float("inf")
+]
+
+# Type hints
+R = TypeVar("R")
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def write_to_stdout(line: str):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+# Where EMF documents are written, swapped out with set_metrics_sink
+METRICS_SINK: Dict[str, Callable[[str], None]] = {"sink": write_to_stdout}
+
+
+def set_metrics_sink(sink: Optional[Callable[[str], None]] = None):
+    """
+    Write EMF documents (one json string per call) to sink rather than to stdout,
+    set sink to None to write to stdout again
+    :param sink:
+    :return:
+    """
+    METRICS_SINK['sink'] = sink if sink is not None else write_to_stdout
+
+
+def is_metrics_enabled() -> bool:
+    return environ.get(METRICS_ENABLED_ENV_VAR, "true").lower() not in ["false", "0", "no"]
+
+
+def get_metrics_namespace() -> str:
+    return environ.get(METRICS_NAMESPACE_ENV_VAR, DEFAULT_METRICS_NAMESPACE)
+
+
+def get_api_phase_name(endpoint_name: str) -> str:
+    return "apiRead" if endpoint_name.startswith(API_READ_ENDPOINT_PREFIXES) else "apiWrite"
+
+
+class EndpointMetrics:
+    """
+    Calls, errors and latency of one api endpoint
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_samples_ms: List[float] = []
+        self.latency_histogram_counts = [0] * len(LATENCY_HISTOGRAM_BOUNDS_MS)
+
+    def record(self, latency_ms: float, is_error: bool, rng: random.Random):
+        self.calls += 1
+        self.errors += int(is_error)
+        self.latency_histogram_counts[bisect_left(LATENCY_HISTOGRAM_BOUNDS_MS, latency_ms)] += 1
+
+        # Keep a uniform sample of the latencies (reservoir sampling)
+        if len(self.latency_samples_ms) < MAX_LATENCY_SAMPLES:
+            self.latency_samples_ms.append(latency_ms)
+        else:
+            sample_index = rng.randrange(self.calls)
+            if sample_index < MAX_LATENCY_SAMPLES:
+                self.latency_samples_ms[sample_index] = latency_ms
+
+    def get_latency_histogram(self) -> Dict[str, List[Any]]:
+        non_empty_buckets = list(filter(
+            lambda bucket_iter_: bucket_iter_[1] > 0,
+            zip(LATENCY_HISTOGRAM_BOUNDS_MS, self.latency_histogram_counts)
+        ))
+        return {
+            "UpperBoundsMilliseconds": list(map(
+                lambda bucket_iter_: bucket_iter_[0] if bucket_iter_[0] != float("inf") else "inf",
+                non_empty_buckets
+            )),
+            "Counts": list(map(lambda bucket_iter_: bucket_iter_[1], non_empty_buckets)),
+        }
+
+
+class HandlerMetrics:
+    """
+    Metrics of a single handler invocation, may be recorded to from any thread
+    """
+
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.lock = threading.Lock()
+        self.rng = random.Random()
+        self.phase_seconds: Dict[str, float] = {}
+        self.bytes_read = 0
+        self.rows_processed = 0
+        self.endpoint_metrics: Dict[str, EndpointMetrics] = {}
+
+    def add_phase_seconds(self, phase_name: str, seconds: float):
+        with self.lock:
+            self.phase_seconds[phase_name] = self.phase_seconds.get(phase_name, 0.0) + seconds
+
+    def add_bytes_read(self, num_bytes: int):
+        with self.lock:
+            self.bytes_read += num_bytes
+
+    def add_rows_processed(self, num_rows: int):
+        with self.lock:
+            self.rows_processed += num_rows
+
+    def record_api_call(self, endpoint_name: str, seconds: float, is_error: bool):
+        with self.lock:
+            self.phase_seconds[get_api_phase_name(endpoint_name)] = (
+                self.phase_seconds.get(get_api_phase_name(endpoint_name), 0.0) + seconds
+            )
+            if endpoint_name not in self.endpoint_metrics:
+                self.endpoint_metrics[endpoint_name] = EndpointMetrics()
+            self.endpoint_metrics[endpoint_name].record(seconds * 1000, is_error, self.rng)
+
+    def get_emf_documents(self, handler_seconds: float, is_error: bool) -> List[Dict[str, Any]]:
+        """
+        One document for the handler (FunctionName dimension)
+        and one per endpoint (FunctionName and Endpoint dimensions)
+        :param handler_seconds:
+        :param is_error:
+        :return:
+        """
+        timestamp_ms = int(time() * 1000)
+        namespace = get_metrics_namespace()
+
+        handler_metric_values: Dict[str, Any] = {
+            "HandlerMilliseconds": (handler_seconds * 1000, "Milliseconds"),
+            "Errors": (int(is_error), "Count"),
+            "BytesRead": (self.bytes_read, "Bytes"),
+            "RowsProcessed": (self.rows_processed, "Count"),
+            "ApiCalls": (
+                sum(map(lambda endpoint_iter_: endpoint_iter_.calls, self.endpoint_metrics.values())),
+                "Count"
+            ),
+            **dict(map(
+                lambda phase_iter_: (
+                    f"{phase_iter_[0]}Milliseconds",
+                    (phase_iter_[1] * 1000, "Milliseconds")
+                ),
+                self.phase_seconds.items()
+            )),
+        }
+
+        emf_documents = [
+            get_emf_document(
+                namespace, timestamp_ms,
+                dimensions={"FunctionName": self.function_name},
+                metric_values=handler_metric_values,
+            )
+        ]
+
+        for endpoint_name_iter_, endpoint_metrics_iter_ in sorted(self.endpoint_metrics.items()):
+            emf_documents.append(get_emf_document(
+                namespace, timestamp_ms,
+                dimensions={"FunctionName": self.function_name, "Endpoint": endpoint_name_iter_},
+                metric_values={
+                    "Calls": (endpoint_metrics_iter_.calls, "Count"),
+                    "CallErrors": (endpoint_metrics_iter_.errors, "Count"),
+                    "Latency": (endpoint_metrics_iter_.latency_samples_ms, "Milliseconds"),
+                },
+                properties={"LatencyHistogram": endpoint_metrics_iter_.get_latency_histogram()},
+            ))
+
+        return emf_documents
+
+
+def get_emf_document(
+        namespace: str,
+        timestamp_ms: int,
+        dimensions: Dict[str, str],
+        metric_values: Dict[str, Any],
+        properties: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Build an EMF document
+    :param namespace:
+    :param timestamp_ms:
+    :param dimensions: Dimension values by name, all dimensions form a single dimension set
+    :param metric_values: (value, unit) by metric name, value may be a list of values
+    :param properties: Extra (non-metric) fields, searchable with logs insights
+    :return:
+    """
+    if len(metric_values) > MAX_METRICS_PER_DOCUMENT:
+        raise ValueError(f"EMF documents hold at most {MAX_METRICS_PER_DOCUMENT} metrics")
+
+    return {
+        "_aws": {
+            "Timestamp": timestamp_ms,
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [list(dimensions.keys())],
+                    "Metrics": list(map(
+                        lambda metric_iter_: {"Name": metric_iter_[0], "Unit": metric_iter_[1][1]},
+                        metric_values.items()
+                    )),
+                }
+            ],
+        },
+        **dimensions,
+        **(properties if properties is not None else {}),
+        **dict(map(
+            lambda metric_iter_: (metric_iter_[0], metric_iter_[1][0]),
+            metric_values.items()
+        )),
+    }
+
+
+# The metrics of the running invocation, None outside of an instrumented handler
+ACTIVE_HANDLER_METRICS: Dict[str, Optional[HandlerMetrics]] = {"handlerMetrics": None}
+
+
+def get_active_handler_metrics() -> Optional[HandlerMetrics]:
+    return ACTIVE_HANDLER_METRICS['handlerMetrics']
+
+
+@contextmanager
+def timed_phase(phase_name: str) -> Iterator[None]:
+    """
+    Add the time spent in the block to the phase
+    :param phase_name: One of PHASE_NAMES
+    :return:
+    """
+    handler_metrics = get_active_handler_metrics()
+    if handler_metrics is None:
+        yield
+        return
+
+    start_time = perf_counter()
+    try:
+        yield
+    finally:
+        handler_metrics.add_phase_seconds(phase_name, perf_counter() - start_time)
+
+
+def add_bytes_read(num_bytes: int):
+    handler_metrics = get_active_handler_metrics()
+    if handler_metrics is not None:
+        handler_metrics.add_bytes_read(num_bytes)
+
+
+def add_rows_processed(num_rows: int):
+    handler_metrics = get_active_handler_metrics()
+    if handler_metrics is not None:
+        handler_metrics.add_rows_processed(num_rows)
+
+
+def instrument_api_call(func: Callable[..., R], endpoint_name: Optional[str] = None) -> Callable[..., R]:
+    """
+    Wrap an api function, so that each call is counted and timed against its endpoint
+    :param func:
+    :param endpoint_name: Defaults to the function name
+    :return:
+    """
+    if endpoint_name is None:
+        endpoint_name = getattr(func, "__name__", "unknown")
+
+    @wraps(func)
+    def instrumented_api_call(*args, **kwargs) -> R:
+        handler_metrics = get_active_handler_metrics()
+        if handler_metrics is None:
+            return func(*args, **kwargs)
+
+        start_time = perf_counter()
+        is_error = True
+        try:
+            response = func(*args, **kwargs)
+            is_error = False
+            return response
+        finally:
+            handler_metrics.record_api_call(endpoint_name, perf_counter() - start_time, is_error)
+
+    return instrumented_api_call
+
+
+def emit_handler_metrics(handler_metrics: HandlerMetrics, handler_seconds: float, is_error: bool):
+    sink = METRICS_SINK['sink']
+    for emf_document_iter_ in handler_metrics.get_emf_documents(handler_seconds, is_error):
+        sink(json.dumps(emf_document_iter_, separators=(",", ":")))
+
+
+def instrument_handler(handler: Callable[[Any, Any], R]) -> Callable[[Any, Any], R]:
+    """
+    Collect metrics for each invocation of the handler, and emit them when the invocation ends
+    :param handler:
+    :return:
+    """
+    @wraps(handler)
+    def instrumented_handler(event, context) -> R:
+        if not is_metrics_enabled():
+            return handler(event, context)
+
+        handler_metrics = HandlerMetrics(environ.get(FUNCTION_NAME_ENV_VAR, handler.__module__))
+        ACTIVE_HANDLER_METRICS['handlerMetrics'] = handler_metrics
+        start_time = perf_counter()
+        is_error = True
+        try:
+            response = handler(event, context)
+            is_error = False
+            return response
+        finally:
+            handler_seconds = perf_counter() - start_time
+            ACTIVE_HANDLER_METRICS['handlerMetrics'] = None
+            # Never fail an invocation because its metrics could not be written
+            try:
+                emit_handler_metrics(handler_metrics, handler_seconds, is_error)
+            except Exception as e:
+                logger.warning(f"Could not emit handler metrics: {e}")
+
+    return instrumented_handler
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+Object store helpers
+
+The lambdas read reports from, and write cache objects to, S3.
+
+Setting the LOCAL_OBJECT_STORE_DIR environment variable swaps S3 for a local directory
+so that the same code paths can be run offline.
+
+s3://<bucket>/<key> is then mapped to <LOCAL_OBJECT_STORE_DIR>/<bucket>/<key>
+
+Whole object reads and writes count towards the download / upload handler metric phases (see metrics.py),
+streamed reads are counted by the caller.
+"""
+
+# Standard imports
+import hashlib
+from os import environ
+from pathlib import Path
+from typing import Optional, Union, BinaryIO
+
+# Local imports
+from .metrics import timed_phase, add_bytes_read
+from .runtime import get_s3_client, get_bucket_key_from_s3_uri
+
+# Globals
+LOCAL_OBJECT_STORE_DIR_ENV_VAR = "LOCAL_OBJECT_STORE_DIR"
+FASTQ_GLUE_CACHE_URI_ENV_VAR = "FASTQ_GLUE_CACHE_URI"
+
+
+def get_cache_root_uri() -> Optional[str]:
+    """
+    Get the fastq glue cache root uri, returns None if caching has not been configured
+    :return:
+    """
+    cache_root_uri = environ.get(FASTQ_GLUE_CACHE_URI_ENV_VAR, None)
+    if not cache_root_uri:
+        return None
+    return cache_root_uri.rstrip("/") + "/"
+
+
+class S3ObjectStore:
+    """
+    Thin wrapper around the S3 client
+    """
+
+    def get_etag(self, uri: str) -> Optional[str]:
+        """
+        Return the etag of the object (without quotes), or None if the object does not exist
+        :param uri:
+        :return:
+        """
+        # Imported here, as botocore is only on the path alongside boto3
+        from botocore.exceptions import ClientError
+
+        bucket, key = get_bucket_key_from_s3_uri(uri)
+        try:
+            response = get_s3_client().head_object(
+                Bucket=bucket,
+                Key=key
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']:
+                return None
+            raise
+        return response['ETag'].strip('"')
+
+    def get_object_bytes(self, uri: str) -> bytes:
+        bucket, key = get_bucket_key_from_s3_uri(uri)
+        with timed_phase("download"):
+            object_bytes = get_s3_client().get_object(
+                Bucket=bucket,
+                Key=key
+            )['Body'].read()
+        add_bytes_read(len(object_bytes))
+        return object_bytes
+
+    def get_object_stream(self, uri: str) -> BinaryIO:
+        """
+        Stream the object body straight from the get_object response, nothing is written to disk
+        :param uri:
+        :return:
+        """
+        bucket, key = get_bucket_key_from_s3_uri(uri)
+        return get_s3_client().get_object(
+            Bucket=bucket,
+            Key=key
+        )['Body']
+
+    def put_object_bytes(self, uri: str, body: bytes):
+        bucket, key = get_bucket_key_from_s3_uri(uri)
+        with timed_phase("upload"):
+            get_s3_client().put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=body
+            )
+
+    def delete_object(self, uri: str):
+        bucket, key = get_bucket_key_from_s3_uri(uri)
+        get_s3_client().delete_object(
+            Bucket=bucket,
+            Key=key
+        )
+
+
+class LocalObjectStore:
+    """
+    Local directory stand-in for S3, etags are the md5sum of the object (as is the case for
+    objects uploaded to S3 in a single part)
+    """
+
+    def __init__(self, root_dir: Union[str, Path]):
+        self.root_dir = Path(root_dir)
+
+    def get_path(self, uri: str) -> Path:
+        bucket, key = get_bucket_key_from_s3_uri(uri)
+        return self.root_dir / bucket / key
+
+    def get_etag(self, uri: str) -> Optional[str]:
+        object_path = self.get_path(uri)
+        if not object_path.is_file():
+            return None
+        return hashlib.md5(object_path.read_bytes()).hexdigest()
+
+    def get_object_bytes(self, uri: str) -> bytes:
+        object_path = self.get_path(uri)
+        if not object_path.is_file():
+            raise FileNotFoundError(f"Could not find {uri} in local object store {self.root_dir}")
+        with timed_phase("download"):
+            object_bytes = object_path.read_bytes()
+        add_bytes_read(len(object_bytes))
+        return object_bytes
+
+    def get_object_stream(self, uri: str) -> BinaryIO:
+        object_path = self.get_path(uri)
+        if not object_path.is_file():
+            raise FileNotFoundError(f"Could not find {uri} in local object store {self.root_dir}")
+        return open(object_path, "rb")
+
+    def put_object_bytes(self, uri: str, body: bytes):
+        object_path = self.get_path(uri)
+        with timed_phase("upload"):
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            object_path.write_bytes(body)
+
+    def delete_object(self, uri: str):
+        self.get_path(uri).unlink(missing_ok=True)
+
+
+ObjectStore = Union[S3ObjectStore, LocalObjectStore]
+
+
+def get_object_store() -> ObjectStore:
+    """
+    Get the object store, use the local directory stand-in if LOCAL_OBJECT_STORE_DIR is set
+    :return:
+    """
+    if environ.get(LOCAL_OBJECT_STORE_DIR_ENV_VAR, None) is not None:
+        return LocalObjectStore(environ[LOCAL_OBJECT_STORE_DIR_ENV_VAR])
+    return S3ObjectStore()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+"""
+Portal run files
+
+A workflow run's outputs are found by listing every file under its portal run id from the file manager
+(tens of thousands of objects once intermediates are included), then matching a key suffix,
+i.e. dragen_wgts_dna_somatic_variant_calling/<libraryId>_tumor.bam.
+
+Rather than list the portal run once per file we need, and scan the listing for each suffix,
+the listing is turned into an index of the reversed keys, sorted,
+so that the keys ending in a suffix are those whose reversed key starts with the reversed suffix,
+a single binary search.
+As with a linear scan, the first match in listing order is returned.
+Files are returned with their size, where the file manager record has one,
+so that smaller bams can be fingerprinted first (see fingerprint_queue).
+
+Indexes are kept in an in-process LRU, keyed by portal run id, so that repeated lookups
+(i.e. the trigger somalier extract step function firing again for the same workflow run) on a warm lambda
+do not list the portal run again.
+Entries expire after PORTAL_RUN_FILE_INDEX_TTL_SECONDS, and a lookup that misses on a cached index
+lists the portal run again before giving up, in case the file was registered after the listing.
+
+Where a workflow run has more than one file to find (i.e. a tumor and a normal bam),
+find_files_by_suffixes looks every suffix up in the one index, and lists the portal run again at most once
+if any suffix misses on a cached index.
+
+Usage
+
+file_index = get_portal_run_file_index(
+    portal_run_id,
+    list_files=lambda: list_files_from_portal_run_id(portal_run_id=portal_run_id)
+)
+bam_uri = file_index.get_file_uri_by_suffix(f"{library_id}_tumor.bam")
+
+files_by_suffix = find_files_by_suffixes(
+    portal_run_id,
+    [f"{library_id}_tumor.bam", f"{library_id}_normal.bam"],
+    list_files=lambda: list_files_from_portal_run_id(portal_run_id=portal_run_id)
+)
+"""
+
+# Standard imports
+import bisect
+import logging
+from collections import OrderedDict
+from time import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypedDict
+from urllib.parse import urlunparse
+
+# Globals
+PORTAL_RUN_FILE_INDEX_TTL_SECONDS = 300
+PORTAL_RUN_FILE_INDEX_MEMORY_CACHE_MAX_ENTRIES = 8
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_file_uri(bucket: str, key: str) -> str:
+    return str(urlunparse((
+        "s3", bucket, key,
+        None, None, None
+    )))
+
+
+class PortalRunFile(TypedDict):
+    uri: str
+    # Bytes, if the file manager record has a size
+    size: Optional[int]
+
+
+def get_portal_run_file(file_obj: Dict[str, Any]) -> PortalRunFile:
+    return {
+        "uri": get_file_uri(file_obj['bucket'], file_obj['key']),
+        "size": file_obj.get('size', None),
+    }
+
+
+class PortalRunFileIndex:
+    """
+    The files of a portal run, indexed by reversed key.
+    Only the bucket, key and size of each file are kept
+    """
+
+    def __init__(self, file_list: Iterable[Dict[str, Any]]):
+        self.bucket_key_list: List[Tuple[str, str]] = []
+        self.size_list: List[Optional[int]] = []
+        for file_iter_ in file_list:
+            self.bucket_key_list.append((file_iter_['bucket'], file_iter_['key']))
+            self.size_list.append(file_iter_.get('size', None))
+        reversed_keys: List[str] = list(map(lambda bucket_key_iter_: bucket_key_iter_[1][::-1], self.bucket_key_list))
+
+        # Listing indexes, in order of their reversed keys
+        self.listing_indexes: List[int] = sorted(range(len(reversed_keys)), key=reversed_keys.__getitem__)
+        self.reversed_keys: List[str] = list(map(reversed_keys.__getitem__, self.listing_indexes))
+        self.created_at = time()
+
+    def get_num_files(self) -> int:
+        return len(self.bucket_key_list)
+
+    def get_file_by_suffix(self, suffix: str) -> Optional[PortalRunFile]:
+        """
+        Get the first file (in listing order) whose key ends with the suffix
+        :param suffix:
+        :return: None if no key ends with the suffix
+        """
+        reversed_suffix = suffix[::-1]
+        start_index = bisect.bisect_left(self.reversed_keys, reversed_suffix)
+        end_index = start_index
+        while (
+                end_index < len(self.reversed_keys) and
+                self.reversed_keys[end_index].startswith(reversed_suffix)
+        ):
+            end_index += 1
+
+        if start_index == end_index:
+            return None
+        listing_index = min(self.listing_indexes[start_index:end_index])
+        return {
+            "uri": get_file_uri(*self.bucket_key_list[listing_index]),
+            "size": self.size_list[listing_index],
+        }
+
+    def get_file_uri_by_suffix(self, suffix: str) -> Optional[str]:
+        portal_run_file = self.get_file_by_suffix(suffix)
+        return portal_run_file['uri'] if portal_run_file is not None else None
+
+
+# Portal run id -> file index
+PORTAL_RUN_FILE_INDEX_MEMORY_CACHE: 'OrderedDict[str, PortalRunFileIndex]' = OrderedDict()
+
+
+def clear_portal_run_file_index_memory_cache():
+    PORTAL_RUN_FILE_INDEX_MEMORY_CACHE.clear()
+
+
+def get_portal_run_file_index(
+        portal_run_id: str,
+        list_files: Callable[[], Iterable[Dict[str, Any]]],
+        refresh: bool = False
+) -> PortalRunFileIndex:
+    """
+    Get the file index of the portal run, through the in-process LRU
+    :param portal_run_id:
+    :param list_files: Lists every file of the portal run (each with bucket and key)
+    :param refresh: List the portal run again, even if its index is cached
+    :return:
+    """
+    if portal_run_id in PORTAL_RUN_FILE_INDEX_MEMORY_CACHE:
+        file_index = PORTAL_RUN_FILE_INDEX_MEMORY_CACHE[portal_run_id]
+        if not refresh and time() - file_index.created_at < PORTAL_RUN_FILE_INDEX_TTL_SECONDS:
+            PORTAL_RUN_FILE_INDEX_MEMORY_CACHE.move_to_end(portal_run_id)
+            return file_index
+        del PORTAL_RUN_FILE_INDEX_MEMORY_CACHE[portal_run_id]
+
+    file_index = PortalRunFileIndex(list_files())
+    logger.info(f"Indexed {file_index.get_num_files()} files for portal run {portal_run_id}")
+
+    PORTAL_RUN_FILE_INDEX_MEMORY_CACHE[portal_run_id] = file_index
+    while len(PORTAL_RUN_FILE_INDEX_MEMORY_CACHE) > PORTAL_RUN_FILE_INDEX_MEMORY_CACHE_MAX_ENTRIES:
+        PORTAL_RUN_FILE_INDEX_MEMORY_CACHE.popitem(last=False)
+
+    return file_index
+
+
+def get_file_by_suffix(
+        portal_run_id: str,
+        suffix: str,
+        list_files: Callable[[], Iterable[Dict[str, Any]]]
+) -> Optional[PortalRunFile]:
+    """
+    Get the first file of the portal run whose key ends with the suffix.
+    A miss on a previously cached index lists the portal run again
+    :param portal_run_id:
+    :param suffix:
+    :param list_files:
+    :return: None if no file of the portal run ends with the suffix
+    """
+    lookup_started_at = time()
+
+    file_index = get_portal_run_file_index(portal_run_id, list_files)
+    portal_run_file = file_index.get_file_by_suffix(suffix)
+
+    # The index came from the cache, the file may have been registered since
+    if portal_run_file is None and file_index.created_at < lookup_started_at:
+        portal_run_file = get_portal_run_file_index(portal_run_id, list_files, refresh=True).get_file_by_suffix(suffix)
+
+    return portal_run_file
+
+
+def get_file_uri_by_suffix(
+        portal_run_id: str,
+        suffix: str,
+        list_files: Callable[[], Iterable[Dict[str, Any]]]
+) -> Optional[str]:
+    """
+    Get the uri of the first file of the portal run whose key ends with the suffix,
+    see get_file_by_suffix
+    :param portal_run_id:
+    :param suffix:
+    :param list_files:
+    :return: None if no file of the portal run ends with the suffix
+    """
+    portal_run_file = get_file_by_suffix(portal_run_id, suffix, list_files)
+    return portal_run_file['uri'] if portal_run_file is not None else None
+
+
+def find_files_by_suffixes(
+        portal_run_id: str,
+        suffix_list: List[str],
+        list_files: Callable[[], Iterable[Dict[str, Any]]]
+) -> Dict[str, Optional[PortalRunFile]]:
+    """
+    Get the first file of the portal run whose key ends with each suffix, from a single file index.
+    If any suffix misses on a previously cached index, the portal run is listed again (once)
+    :param portal_run_id:
+    :param suffix_list:
+    :param list_files:
+    :return: The file of each suffix, None if no file of the portal run ends with it
+    """
+    lookup_started_at = time()
+
+    file_index = get_portal_run_file_index(portal_run_id, list_files)
+    files_by_suffix: Dict[str, Optional[PortalRunFile]] = dict(map(
+        lambda suffix_iter_: (suffix_iter_, file_index.get_file_by_suffix(suffix_iter_)),
+        suffix_list
+    ))
+
+    # The index came from the cache, the missing files may have been registered since
+    if None in files_by_suffix.values() and file_index.created_at < lookup_started_at:
+        file_index = get_portal_run_file_index(portal_run_id, list_files, refresh=True)
+        files_by_suffix = dict(map(
+            lambda suffix_iter_: (suffix_iter_, file_index.get_file_by_suffix(suffix_iter_)),
+            suffix_list
+        ))
+
+    return files_by_suffix
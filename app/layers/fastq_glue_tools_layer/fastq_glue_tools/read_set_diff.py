@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""
+Read set diff
+
+When a copy event is replayed, most (if not all) fastqs on the run already have the read set and read counts
+in the run manifest.
+
+Rather than fetch each fastq to find out, the fastqs of the run are listed once,
+indexed by (library id, lane) and diffed against the run manifest rows,
+so that only the fastqs whose read set or read counts differ are written to.
+
+Each fastq is one of
+
+* skipped (read set and read counts already match the manifest)
+* new (no read set attached)
+* updated (a different read set is attached, or only the read counts differ)
+
+Each update carries the calls it needs,
+
+{
+  "fastqId": "fqr.01JJY7P1AVFGHGVMEDE8T4VWJG",
+  "libraryId": "L2401544",
+  "lane": 1,
+  "updateType": "update",
+  "detachReadSet": true,          # A different read set is attached
+  "readSet": {...},               # null if the read set already matches
+  "readCount": {...}              # null if the read counts already match
+}
+
+A fastq whose lane has no fastq list row or no demux stats in the manifest raises a ValueError,
+as there is nothing to reconcile it against.
+
+The updates of a run can run to megabytes, well over the step function payload limit,
+so they are written next to the run manifest, keyed by their sha256 (so never modified once written),
+
+<manifest dir>/read-set-updates/<sha256>.json.gz  -> {libraryId: [updates]}
+
+and each batch reads the updates of its own libraries.
+"""
+
+# Standard imports
+import gzip
+import json
+import hashlib
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple, TypedDict
+
+# Local imports
+from .object_store import get_object_store, ObjectStore
+from .run_manifest import RunManifestRow, read_run_manifest_object
+
+# Globals
+READ_SET_UPDATES_PREFIX = "read-set-updates"
+
+
+class ReadCount(TypedDict):
+    readCount: Optional[int]
+    baseCountEst: Optional[int]
+
+
+class ReadSetUpdate(TypedDict):
+    fastqId: str
+    libraryId: str
+    lane: int
+    updateType: Literal['new', 'update']
+    detachReadSet: bool
+    readSet: Optional[Dict[str, Any]]
+    readCount: Optional[ReadCount]
+
+
+class ReadSetUpdateCounts(TypedDict):
+    skipped: int
+    updated: int
+    new: int
+
+
+class ReadSetDiff(TypedDict):
+    readSetUpdateList: List[ReadSetUpdate]
+    readSetUpdateCounts: ReadSetUpdateCounts
+
+
+def get_read_set_from_manifest_row(manifest_row: RunManifestRow) -> Dict[str, Any]:
+    return {
+        "r1": {
+            "s3Uri": manifest_row['read1FileUri']
+        },
+        "r2": {
+            "s3Uri": manifest_row['read2FileUri']
+        },
+        "compressionFormat": (
+            "ORA" if manifest_row['read1FileUri'].endswith('.ora') else "GZIP"
+        )
+    }
+
+
+def get_read_set_uris(fastq_object: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    read_set = fastq_object.get('readSet', None) or {}
+    return (
+        (read_set.get('r1', None) or {}).get('s3Uri', None),
+        (read_set.get('r2', None) or {}).get('s3Uri', None),
+    )
+
+
+def has_unresolved_read_set(fastq_object: Dict[str, Any]) -> bool:
+    """
+    A read set is attached, but the fastq was listed without its s3 details,
+    so its uris cannot be compared against the manifest
+    :param fastq_object:
+    :return:
+    """
+    return (
+        fastq_object.get('readSet', None) is not None and
+        get_read_set_uris(fastq_object)[0] is None
+    )
+
+
+def get_read_set_index(
+        fastq_list: Iterable[Dict[str, Any]]
+) -> Dict[Tuple[str, int], List[Dict[str, Any]]]:
+    """
+    Index the fastqs of the run by (library id, lane)
+    :param fastq_list:
+    :return:
+    """
+    read_set_index: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+    for fastq_object_iter_ in fastq_list:
+        read_set_index.setdefault(
+            (fastq_object_iter_['library']['libraryId'], int(fastq_object_iter_['lane'])),
+            []
+        ).append(fastq_object_iter_)
+    return read_set_index
+
+
+def get_read_set_update(
+        fastq_object: Dict[str, Any],
+        manifest_row: Optional[RunManifestRow]
+) -> Optional[ReadSetUpdate]:
+    """
+    Diff the fastq against its manifest row, returns None if the fastq already matches
+    :param fastq_object:
+    :param manifest_row:
+    :return:
+    """
+    if manifest_row is None or not manifest_row['hasFileNames']:
+        raise ValueError(
+            f"No fastq list row for fastq {fastq_object['id']} (lane {fastq_object['lane']}) in the run manifest"
+        )
+    if not manifest_row['hasDemuxStats']:
+        raise ValueError(
+            f"No demux stats for fastq {fastq_object['id']} (lane {fastq_object['lane']}) in the run manifest"
+        )
+
+    has_read_set = fastq_object.get('readSet', None) is not None
+    is_read_set_match = (
+        has_read_set and
+        get_read_set_uris(fastq_object) == (manifest_row['read1FileUri'], manifest_row['read2FileUri'])
+    )
+    is_read_count_match = (
+        fastq_object.get('readCount', None) == manifest_row['readCount'] and
+        fastq_object.get('baseCountEst', None) == manifest_row['baseCountEst']
+    )
+
+    if is_read_set_match and is_read_count_match:
+        return None
+
+    return {
+        "fastqId": fastq_object['id'],
+        "libraryId": fastq_object['library']['libraryId'],
+        "lane": int(fastq_object['lane']),
+        "updateType": "update" if has_read_set else "new",
+        "detachReadSet": has_read_set and not is_read_set_match,
+        "readSet": (
+            get_read_set_from_manifest_row(manifest_row)
+            if not is_read_set_match
+            else None
+        ),
+        "readCount": (
+            {
+                "readCount": manifest_row['readCount'],
+                "baseCountEst": manifest_row['baseCountEst'],
+            }
+            if not is_read_count_match
+            else None
+        ),
+    }
+
+
+def diff_read_sets(
+        fastq_list: List[Dict[str, Any]],
+        manifest_rows: Iterable[RunManifestRow]
+) -> ReadSetDiff:
+    """
+    Diff the fastqs of the run against the manifest rows of the run (see module docstring)
+    :param fastq_list: Listed with their s3 details
+    :param manifest_rows:
+    :return:
+    """
+    manifest_rows_by_library_lane: Dict[Tuple[str, int], RunManifestRow] = dict(map(
+        lambda manifest_row_iter_: ((manifest_row_iter_['libraryId'], manifest_row_iter_['lane']), manifest_row_iter_),
+        manifest_rows
+    ))
+
+    read_set_update_list: List[ReadSetUpdate] = []
+    num_skipped = 0
+    for library_lane_iter_, fastq_list_iter_ in sorted(get_read_set_index(fastq_list).items()):
+        for fastq_object_iter_ in fastq_list_iter_:
+            read_set_update = get_read_set_update(
+                fastq_object_iter_,
+                manifest_rows_by_library_lane.get(library_lane_iter_, None)
+            )
+            if read_set_update is None:
+                num_skipped += 1
+                continue
+            read_set_update_list.append(read_set_update)
+
+    return {
+        "readSetUpdateList": read_set_update_list,
+        "readSetUpdateCounts": {
+            "skipped": num_skipped,
+            "updated": len(list(filter(
+                lambda read_set_update_iter_: read_set_update_iter_['updateType'] == 'update',
+                read_set_update_list
+            ))),
+            "new": len(list(filter(
+                lambda read_set_update_iter_: read_set_update_iter_['updateType'] == 'new',
+                read_set_update_list
+            ))),
+        },
+    }
+
+
+def get_read_set_updates_by_library_id(
+        read_set_update_list: List[ReadSetUpdate]
+) -> Dict[str, List[ReadSetUpdate]]:
+    read_set_updates_by_library_id: Dict[str, List[ReadSetUpdate]] = {}
+    for read_set_update_iter_ in read_set_update_list:
+        read_set_updates_by_library_id.setdefault(read_set_update_iter_['libraryId'], []).append(read_set_update_iter_)
+    return read_set_updates_by_library_id
+
+
+def write_read_set_updates(
+        run_manifest_uri: str,
+        read_set_update_list: List[ReadSetUpdate],
+        object_store: Optional[ObjectStore] = None
+) -> str:
+    """
+    Write the updates next to the run manifest, keyed by library id
+    :param run_manifest_uri:
+    :param read_set_update_list:
+    :param object_store:
+    :return: The read set updates uri
+    """
+    if object_store is None:
+        object_store = get_object_store()
+
+    read_set_updates_bytes = json.dumps(
+        get_read_set_updates_by_library_id(read_set_update_list),
+        separators=(",", ":"),
+        sort_keys=True
+    ).encode()
+
+    read_set_updates_uri = "/".join([
+        run_manifest_uri.rsplit("/", 1)[0],
+        READ_SET_UPDATES_PREFIX,
+        f"{hashlib.sha256(read_set_updates_bytes).hexdigest()[:32]}.json.gz"
+    ])
+
+    if object_store.get_etag(read_set_updates_uri) is None:
+        object_store.put_object_bytes(
+            read_set_updates_uri,
+            gzip.compress(read_set_updates_bytes, mtime=0)
+        )
+
+    return read_set_updates_uri
+
+
+def get_read_set_updates_for_libraries(
+        read_set_updates_uri: str,
+        library_id_list: List[str],
+        object_store: Optional[ObjectStore] = None
+) -> List[ReadSetUpdate]:
+    """
+    Get the updates of the libraries, in library order
+    :param read_set_updates_uri:
+    :param library_id_list:
+    :param object_store:
+    :return:
+    """
+    read_set_updates_by_library_id = read_run_manifest_object(read_set_updates_uri, object_store=object_store)
+
+    return [
+        read_set_update_iter_
+        for library_id_iter_ in library_id_list
+        for read_set_update_iter_ in read_set_updates_by_library_id.get(library_id_iter_, [])
+    ]
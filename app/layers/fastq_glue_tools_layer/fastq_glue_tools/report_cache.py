@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+Run level report cache
+
+The fastq_list.csv and Demultiplex_Stats.csv reports of a run are parsed once per version of the report
+into a parquet 'sidecar' object, sorted by sample id.
+Readers then load the sidecar (the whole report, or only the row groups that contain their sample ids)
+rather than download and parse the csv again,
+i.e. when the run manifest is rebuilt for a re-uploaded samplesheet while the reports are unchanged.
+
+Sidecars are keyed by the etag of the source report, so a re-uploaded report is never
+served from a stale sidecar.
+
+Sidecars are stored under the FASTQ_GLUE_CACHE_URI prefix, i.e
+
+<FASTQ_GLUE_CACHE_URI>/reports/<report_name>/<source_bucket>/<source_key>/<etag>.parquet
+"""
+
+# Standard imports
+from io import BytesIO
+from typing import Optional, List
+from urllib.parse import urlunparse
+import logging
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from .object_store import get_object_store, get_bucket_key_from_s3_uri, get_cache_root_uri, ObjectStore
+from .reports import ReportSchema, read_report_csv
+
+# Globals
+REPORT_CACHE_PREFIX = "reports"
+# Small row groups mean a batch of sample ids only needs to decode a few of them
+SIDECAR_ROW_GROUP_SIZE = 512
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_report_sidecar_uri(
+        cache_root_uri: str,
+        report_uri: str,
+        report_etag: str,
+        report_schema: ReportSchema
+) -> str:
+    """
+    Get the location of the sidecar for this version of the report
+    :param cache_root_uri:
+    :param report_uri:
+    :param report_etag:
+    :param report_schema:
+    :return:
+    """
+    cache_bucket, cache_prefix = get_bucket_key_from_s3_uri(cache_root_uri)
+    report_bucket, report_key = get_bucket_key_from_s3_uri(report_uri)
+
+    return str(urlunparse((
+        "s3",
+        cache_bucket,
+        "/".join([
+            cache_prefix.rstrip("/"),
+            REPORT_CACHE_PREFIX,
+            report_schema['reportName'],
+            report_bucket,
+            report_key,
+            f"{report_etag}.parquet"
+        ]),
+        None, None, None
+    )))
+
+
+def build_report_sidecar(
+        report_uri: str,
+        report_schema: ReportSchema,
+        cache_root_uri: str,
+        object_store: Optional[ObjectStore] = None
+) -> str:
+    """
+    Parse the report once and write it out as a parquet sidecar sorted by sample id.
+    If the sidecar for this version of the report already exists we return early.
+    :param report_uri:
+    :param report_schema:
+    :param cache_root_uri:
+    :param object_store:
+    :return: The sidecar uri
+    """
+    if object_store is None:
+        object_store = get_object_store()
+
+    report_etag = object_store.get_etag(report_uri)
+    if report_etag is None:
+        raise FileNotFoundError(f"Could not find report {report_uri}")
+
+    sidecar_uri = get_report_sidecar_uri(
+        cache_root_uri=cache_root_uri,
+        report_uri=report_uri,
+        report_etag=report_etag,
+        report_schema=report_schema
+    )
+
+    if object_store.get_etag(sidecar_uri) is not None:
+        logger.info(f"Sidecar {sidecar_uri} already exists, skipping")
+        return sidecar_uri
+
+    # Sort by sample id, a stable sort keeps the original lane order within a sample
+    report_df = read_report_csv(
+        report_uri,
+        report_schema=report_schema,
+        object_store=object_store
+    ).sort_values(
+        by=report_schema['sampleIdColumn'],
+        kind="stable",
+    )
+
+    sidecar_buffer = BytesIO()
+    report_df.to_parquet(
+        sidecar_buffer,
+        engine="pyarrow",
+        index=False,
+        row_group_size=SIDECAR_ROW_GROUP_SIZE,
+    )
+
+    object_store.put_object_bytes(sidecar_uri, sidecar_buffer.getvalue())
+
+    return sidecar_uri
+
+
+def read_report_rows_from_cache(
+        report_uri: str,
+        sample_id_list: Optional[List[str]],
+        report_schema: ReportSchema,
+        object_store: Optional[ObjectStore] = None,
+) -> Optional[pd.DataFrame]:
+    """
+    Read the rows for the sample ids (every row if sample_id_list is None) from the report sidecar.
+    Returns None if caching is not configured or the sidecar for
+    the current version of the report has not been built, callers should then fall back to the report itself.
+    :param report_uri:
+    :param sample_id_list:
+    :param report_schema:
+    :param object_store:
+    :return:
+    """
+    cache_root_uri = get_cache_root_uri()
+    if cache_root_uri is None:
+        return None
+
+    if object_store is None:
+        object_store = get_object_store()
+
+    report_etag = object_store.get_etag(report_uri)
+    if report_etag is None:
+        return None
+
+    sidecar_uri = get_report_sidecar_uri(
+        cache_root_uri=cache_root_uri,
+        report_uri=report_uri,
+        report_etag=report_etag,
+        report_schema=report_schema
+    )
+
+    if object_store.get_etag(sidecar_uri) is None:
+        logger.info(f"No sidecar found for {report_uri}, falling back to the report")
+        return None
+
+    # Imported here, only readers of the sidecar need pyarrow
+    import pyarrow.parquet as pq
+
+    # Row group statistics on the (sorted) sample id column
+    # mean we only decode the row groups that hold our samples
+    return pq.read_table(
+        BytesIO(object_store.get_object_bytes(sidecar_uri)),
+        filters=(
+            [(report_schema['sampleIdColumn'], "in", list(sample_id_list))]
+            if sample_id_list is not None
+            else None
+        ),
+    ).to_pandas()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+"""
+BCLConvert report helpers
+
+The Reports/ directory of a BCLConvert output contains (amongst others)
+
+* fastq_list.csv with the columns RGID,RGSM,RGLB,Lane,Read1File,Read2File
+* Demultiplex_Stats.csv with the columns Lane,SampleID,Index,# Reads,# Perfect Index Reads,...
+
+We only ever need a handful of these columns, the report schemas below
+define which columns we read in, and with which dtypes.
+
+Reports are streamed straight from the get_object body in chunks,
+rows not belonging to the requested samples are dropped as each chunk arrives,
+so memory stays flat as the report grows and nothing is written to /tmp.
+"""
+
+# Standard imports
+import io
+import json
+import resource
+from typing import TypedDict, Dict, Optional, List, Tuple, BinaryIO
+import logging
+
+# Wider imports
+import pandas as pd
+
+# Local imports
+from .metrics import timed_phase, add_bytes_read, add_rows_processed
+from .object_store import get_object_store, ObjectStore
+
+# Globals
+REPORT_CHUNK_SIZE_ROWS = 50_000
+REPORT_STREAM_BUFFER_SIZE = 1024 * 1024
+PROC_STATM_PATH = "/proc/self/statm"
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ReportSchema(TypedDict):
+    # Name of the report, used when building cache keys
+    reportName: str
+    # The column we filter on when collecting rows for a list of samples
+    sampleIdColumn: str
+    # The columns we read in, and their dtypes
+    dtypes: Dict[str, str]
+
+
+class ReportReadStats(TypedDict):
+    reportUri: str
+    # Bytes pulled from the object body
+    bytesRead: int
+    # Rows parsed / rows kept after filtering on sample id
+    rowsRead: int
+    rowsKept: int
+    # Size of the kept rows in memory
+    bytesHeld: int
+    # Largest growth of the process resident set size during this read, sampled as each chunk is parsed
+    peakRssGrowthBytes: int
+
+
+FASTQ_LIST_REPORT_SCHEMA: ReportSchema = {
+    "reportName": "fastq_list",
+    "sampleIdColumn": "RGSM",
+    "dtypes": {
+        "RGSM": "str",
+        "Lane": "int16",
+        "Read1File": "str",
+        "Read2File": "str",
+    },
+}
+
+DEMUX_STATS_REPORT_SCHEMA: ReportSchema = {
+    "reportName": "demux_stats",
+    "sampleIdColumn": "SampleID",
+    "dtypes": {
+        "SampleID": "str",
+        "Lane": "int16",
+        "# Reads": "int64",
+    },
+}
+
+
+class CountingStream(io.RawIOBase):
+    """
+    Wrap a readable stream (such as the botocore StreamingBody) and count the bytes read through it
+    """
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+def get_rss_bytes() -> int:
+    """
+    Get the current resident set size of the process, 0 where /proc is not available.
+    Unlike ru_maxrss (the high water mark of the process lifetime) this can be compared before and after a read
+    :return:
+    """
+    try:
+        with open(PROC_STATM_PATH) as statm_h:
+            # size resident shared text lib data dt, in pages
+            return int(statm_h.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def stream_report_rows(
+        report_uri: str,
+        report_schema: ReportSchema,
+        sample_id_list: Optional[List[str]] = None,
+        object_store: Optional[ObjectStore] = None,
+        chunk_size: int = REPORT_CHUNK_SIZE_ROWS
+) -> Tuple[pd.DataFrame, ReportReadStats]:
+    """
+    Stream the report in chunks, keeping only the columns in the report schema
+    and (if sample_id_list is set) only the rows for those samples.
+    :param report_uri:
+    :param report_schema:
+    :param sample_id_list:
+    :param object_store:
+    :param chunk_size:
+    :return: The kept rows, and the read stats
+    """
+    if object_store is None:
+        object_store = get_object_store()
+
+    sample_id_set = set(sample_id_list) if sample_id_list is not None else None
+    rows_read = 0
+    rss_bytes_before = get_rss_bytes()
+    peak_rss_bytes = rss_bytes_before
+    kept_chunks: List[pd.DataFrame] = []
+
+    # The body is downloaded as it is parsed, so both count towards the parse phase
+    counting_stream = CountingStream(object_store.get_object_stream(report_uri))
+    with timed_phase("parse"), io.BufferedReader(counting_stream, buffer_size=REPORT_STREAM_BUFFER_SIZE) as report_h:
+        for chunk_df in pd.read_csv(
+            report_h,
+            # Will always have a header
+            header=0,
+            usecols=list(report_schema['dtypes'].keys()),
+            dtype=report_schema['dtypes'],
+            chunksize=chunk_size,
+        ):
+            rows_read += len(chunk_df)
+            # The unfiltered chunk is the most we hold at once
+            peak_rss_bytes = max(peak_rss_bytes, get_rss_bytes())
+            if sample_id_set is not None:
+                chunk_df = chunk_df.loc[chunk_df[report_schema['sampleIdColumn']].isin(sample_id_set)]
+            if not chunk_df.empty:
+                kept_chunks.append(chunk_df)
+
+    report_df = (
+        pd.concat(kept_chunks, ignore_index=True)
+        if len(kept_chunks) > 0
+        else pd.DataFrame({
+            column_name: pd.Series(dtype=column_dtype)
+            for column_name, column_dtype in report_schema['dtypes'].items()
+        })
+    )
+
+    add_bytes_read(counting_stream.bytes_read)
+    add_rows_processed(rows_read)
+
+    read_stats: ReportReadStats = {
+        "reportUri": report_uri,
+        "bytesRead": counting_stream.bytes_read,
+        "rowsRead": rows_read,
+        "rowsKept": len(report_df),
+        "bytesHeld": int(report_df.memory_usage(deep=True).sum()),
+        "peakRssGrowthBytes": max(peak_rss_bytes, get_rss_bytes()) - rss_bytes_before,
+    }
+
+    return report_df, read_stats
+
+
+def read_report_csv(
+        report_uri: str,
+        report_schema: ReportSchema,
+        sample_id_list: Optional[List[str]] = None,
+        object_store: Optional[ObjectStore] = None
+) -> pd.DataFrame:
+    """
+    Read in the report (see stream_report_rows) and log the read stats
+    :param report_uri:
+    :param report_schema:
+    :param sample_id_list:
+    :param object_store:
+    :return:
+    """
+    report_df, read_stats = stream_report_rows(
+        report_uri=report_uri,
+        report_schema=report_schema,
+        sample_id_list=sample_id_list,
+        object_store=object_store
+    )
+
+    logger.info(f"Read report: {json.dumps(read_stats)}")
+
+    return report_df
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+"""
+Run manifest
+
+Every library in the add-read-set step function needs its rows of the fastq_list.csv and
+Demultiplex_Stats.csv reports, along with its cycle counts from the samplesheet.
+
+Rather than have each batch read the reports and join them per library,
+the run manifest is built once per run (see the build run manifest lambda):
+the bclconvert data (from the samplesheet), the fastq list and the demux stats are each loaded once,
+joined on (libraryId, lane), and rows missing from any of the three sources are flagged.
+
+The manifest rows are written out in partitions, hashed on library id,
+so each library only reads its own partition.
+Run level readers (e.g. the read set diff) read every partition, concurrently, bypassing the in-process LRU.
+
+<FASTQ_GLUE_CACHE_URI>/manifests/<instrument_run_id>/<manifest_id>/manifest.json                  -> manifest index
+<FASTQ_GLUE_CACHE_URI>/manifests/<instrument_run_id>/<manifest_id>/partitions/<partition>.json.gz  -> {libraryId: [rows]}
+
+The manifest id is derived from the etags of both reports and the sha256 of the samplesheet,
+so a re-uploaded report or samplesheet always produces a new manifest.
+Manifest objects are never modified once written, so readers can keep them in memory across warm invocations.
+
+Partitions are plain (gzipped) json, readers do not need pandas.
+"""
+
+# Standard imports
+import gzip
+import json
+import zlib
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, TypedDict
+
+# Local imports
+from .concurrency import get_max_workers, map_concurrently
+from .metrics import timed_phase
+from .object_store import get_object_store, get_bucket_key_from_s3_uri, ObjectStore
+
+# Globals
+RUN_MANIFEST_PREFIX = "manifests"
+RUN_MANIFEST_INDEX_FILE_NAME = "manifest.json"
+RUN_MANIFEST_LIBRARIES_PER_PARTITION = 32
+RUN_MANIFEST_MEMORY_CACHE_MAX_ENTRIES = 8
+
+# uri -> parsed manifest object
+RUN_MANIFEST_MEMORY_CACHE: 'OrderedDict[str, Any]' = OrderedDict()
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class RunManifestRow(TypedDict):
+    libraryId: str
+    lane: int
+    # From the samplesheet
+    index: Optional[str]
+    cycleCount: Optional[int]
+    # From the fastq list
+    read1FileUri: Optional[str]
+    read2FileUri: Optional[str]
+    # From the demux stats
+    readCount: Optional[int]
+    baseCountEst: Optional[int]
+    # Which sources the row was found in
+    hasBclconvertData: bool
+    hasFileNames: bool
+    hasDemuxStats: bool
+
+
+class RunManifestSources(TypedDict):
+    fastqListUri: str
+    fastqListEtag: str
+    demuxStatsUri: str
+    demuxStatsEtag: str
+    samplesheetSha256: str
+
+
+class RunManifestIndex(TypedDict):
+    instrumentRunId: str
+    manifestId: str
+    sources: RunManifestSources
+    numPartitions: int
+    numLibraries: int
+    numRows: int
+    # Rows not found in all three sources
+    unmatchedRows: List[RunManifestRow]
+
+
+def is_matched_row(run_manifest_row: RunManifestRow) -> bool:
+    return (
+        run_manifest_row['hasBclconvertData'] and
+        run_manifest_row['hasFileNames'] and
+        run_manifest_row['hasDemuxStats']
+    )
+
+
+def get_run_manifest_id(sources: RunManifestSources) -> str:
+    return hashlib.sha256(
+        json.dumps(sources, sort_keys=True).encode()
+    ).hexdigest()[:32]
+
+
+def get_num_partitions(num_libraries: int) -> int:
+    return max(1, -(-num_libraries // RUN_MANIFEST_LIBRARIES_PER_PARTITION))
+
+
+def get_partition_number(library_id: str, num_partitions: int) -> int:
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(library_id.encode()) % num_partitions
+
+
+def get_run_manifest_uri(cache_root_uri: str, instrument_run_id: str, manifest_id: str) -> str:
+    # urllib.parse is a few milliseconds to import, lambdas that only read the manifest never build its uri
+    from urllib.parse import urlunparse
+
+    cache_bucket, cache_prefix = get_bucket_key_from_s3_uri(cache_root_uri)
+    return str(urlunparse((
+        "s3",
+        cache_bucket,
+        "/".join([
+            cache_prefix.rstrip("/"),
+            RUN_MANIFEST_PREFIX,
+            instrument_run_id,
+            manifest_id,
+            RUN_MANIFEST_INDEX_FILE_NAME
+        ]),
+        None, None, None
+    )))
+
+
+def get_run_manifest_partition_uri(run_manifest_uri: str, partition_number: int) -> str:
+    return "/".join([
+        run_manifest_uri.rsplit("/", 1)[0],
+        "partitions",
+        f"{partition_number:05d}.json.gz"
+    ])
+
+
+def write_run_manifest(
+        cache_root_uri: str,
+        instrument_run_id: str,
+        sources: RunManifestSources,
+        run_manifest_rows: List[RunManifestRow],
+        object_store: Optional[ObjectStore] = None
+) -> str:
+    """
+    Write the manifest partitions, then the manifest index.
+    The index is written last, so an index only ever exists for a complete manifest.
+    If the manifest for these sources already exists we return early.
+    :param cache_root_uri:
+    :param instrument_run_id:
+    :param sources:
+    :param run_manifest_rows: Sorted by library id and lane
+    :param object_store:
+    :return: The manifest (index) uri
+    """
+    if object_store is None:
+        object_store = get_object_store()
+
+    manifest_id = get_run_manifest_id(sources)
+    run_manifest_uri = get_run_manifest_uri(cache_root_uri, instrument_run_id, manifest_id)
+    if object_store.get_etag(run_manifest_uri) is not None:
+        logger.info(f"Run manifest {run_manifest_uri} already exists, skipping")
+        return run_manifest_uri
+
+    rows_by_library_id: Dict[str, List[RunManifestRow]] = {}
+    for run_manifest_row_iter_ in run_manifest_rows:
+        rows_by_library_id.setdefault(run_manifest_row_iter_['libraryId'], []).append(run_manifest_row_iter_)
+
+    num_partitions = get_num_partitions(len(rows_by_library_id))
+    partitions: List[Dict[str, List[RunManifestRow]]] = [{} for _ in range(num_partitions)]
+    for library_id_iter_, library_rows_iter_ in rows_by_library_id.items():
+        partitions[get_partition_number(library_id_iter_, num_partitions)][library_id_iter_] = library_rows_iter_
+
+    for partition_number_iter_, partition_iter_ in enumerate(partitions):
+        object_store.put_object_bytes(
+            get_run_manifest_partition_uri(run_manifest_uri, partition_number_iter_),
+            gzip.compress(
+                json.dumps(partition_iter_, separators=(",", ":")).encode(),
+                mtime=0
+            )
+        )
+
+    run_manifest_index: RunManifestIndex = {
+        "instrumentRunId": instrument_run_id,
+        "manifestId": manifest_id,
+        "sources": sources,
+        "numPartitions": num_partitions,
+        "numLibraries": len(rows_by_library_id),
+        "numRows": len(run_manifest_rows),
+        "unmatchedRows": list(filter(
+            lambda run_manifest_row_iter_: not is_matched_row(run_manifest_row_iter_),
+            run_manifest_rows
+        )),
+    }
+
+    object_store.put_object_bytes(
+        run_manifest_uri,
+        json.dumps(run_manifest_index, indent=2).encode()
+    )
+
+    return run_manifest_uri
+
+
+def clear_run_manifest_memory_cache():
+    RUN_MANIFEST_MEMORY_CACHE.clear()
+
+
+def parse_run_manifest_object(uri: str, object_bytes: bytes) -> Any:
+    with timed_phase("parse"):
+        if uri.endswith(".gz"):
+            object_bytes = gzip.decompress(object_bytes)
+        return json.loads(object_bytes)
+
+
+def read_run_manifest_object(uri: str, object_store: Optional[ObjectStore] = None) -> Any:
+    """
+    Read (and parse) a manifest object, through the in-process LRU
+    :param uri:
+    :param object_store:
+    :return:
+    """
+    if uri in RUN_MANIFEST_MEMORY_CACHE:
+        RUN_MANIFEST_MEMORY_CACHE.move_to_end(uri)
+        return RUN_MANIFEST_MEMORY_CACHE[uri]
+
+    if object_store is None:
+        object_store = get_object_store()
+
+    RUN_MANIFEST_MEMORY_CACHE[uri] = parse_run_manifest_object(uri, object_store.get_object_bytes(uri))
+    while len(RUN_MANIFEST_MEMORY_CACHE) > RUN_MANIFEST_MEMORY_CACHE_MAX_ENTRIES:
+        RUN_MANIFEST_MEMORY_CACHE.popitem(last=False)
+
+    return RUN_MANIFEST_MEMORY_CACHE[uri]
+
+
+def get_run_manifest_index(run_manifest_uri: str, object_store: Optional[ObjectStore] = None) -> RunManifestIndex:
+    return read_run_manifest_object(run_manifest_uri, object_store=object_store)
+
+
+def get_run_manifest_rows_for_library(
+        run_manifest_uri: str,
+        library_id: str,
+        object_store: Optional[ObjectStore] = None
+) -> List[RunManifestRow]:
+    """
+    Get the manifest rows for the library, reading only the library's partition.
+    Returns an empty list if the library is in none of the three sources.
+    :param run_manifest_uri:
+    :param library_id:
+    :param object_store:
+    :return:
+    """
+    run_manifest_index = get_run_manifest_index(run_manifest_uri, object_store=object_store)
+
+    partition = read_run_manifest_object(
+        get_run_manifest_partition_uri(
+            run_manifest_uri,
+            get_partition_number(library_id, run_manifest_index['numPartitions'])
+        ),
+        object_store=object_store
+    )
+
+    return partition.get(library_id, [])
+
+
+def get_run_manifest_rows(
+        run_manifest_uri: str,
+        object_store: Optional[ObjectStore] = None
+) -> List[RunManifestRow]:
+    """
+    Get the manifest rows of every library on the run, sorted by library id and lane.
+    Partitions are read concurrently and are not kept in the in-process LRU,
+    a run level read would otherwise evict the partitions of every other manifest.
+    :param run_manifest_uri:
+    :param object_store:
+    :return:
+    """
+    if object_store is None:
+        object_store = get_object_store()
+
+    run_manifest_index = get_run_manifest_index(run_manifest_uri, object_store=object_store)
+
+    partition_list: List[Dict[str, List[RunManifestRow]]] = map_concurrently(
+        lambda partition_uri_iter_: parse_run_manifest_object(
+            partition_uri_iter_,
+            object_store.get_object_bytes(partition_uri_iter_)
+        ),
+        map(
+            lambda partition_number_iter_: get_run_manifest_partition_uri(run_manifest_uri, partition_number_iter_),
+            range(run_manifest_index['numPartitions'])
+        ),
+        max_workers=get_max_workers()
+    )
+
+    return sorted(
+        (
+            run_manifest_row_iter_
+            for partition_iter_ in partition_list
+            for library_rows_iter_ in partition_iter_.values()
+            for run_manifest_row_iter_ in library_rows_iter_
+        ),
+        key=lambda run_manifest_row_iter_: (run_manifest_row_iter_['libraryId'], run_manifest_row_iter_['lane'])
+    )
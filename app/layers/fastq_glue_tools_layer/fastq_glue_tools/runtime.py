@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+"""
+Runtime helpers
+
+Clients and connections that should outlive a single invocation of a warm lambda.
+
+* boto3 clients (s3, ssm, dynamodb) are created once per execution environment and shared by every thread.
+  Creating a client loads the botocore service model and opens a new connection pool,
+  a few tens of milliseconds on every call otherwise.
+  Connection pools are sized to FASTQ_GLUE_MAX_POOL_CONNECTIONS
+  (default the larger of FASTQ_MANAGER_MAX_WORKERS and botocore's default of 10),
+  so the worker threads (see concurrency.py) do not wait on, or discard, connections.
+* SSM parameter values are cached for FASTQ_GLUE_SSM_PARAMETER_CACHE_TTL_SECONDS (default one hour).
+* Each thread gets its own keep-alive requests session (requests sessions are not thread safe),
+  with a connection pool sized as the boto3 clients' are.
+  Pass it to the http calls made from that thread, rather than calling requests.get / requests.post etc,
+  which open a new session (and a new TLS connection) per call.
+
+boto3 and requests are only imported when first needed, lambdas that never talk to AWS do not pay for them.
+
+Usage
+
+from fastq_glue_tools.runtime import get_http_session
+
+response = get_http_session().get(url, params=params)
+"""
+
+# Standard imports
+import typing
+import threading
+from os import environ
+from time import time
+from typing import Any, Dict, Tuple
+
+# Type hints
+if typing.TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_ssm import SSMClient
+    from requests import Session
+
+# Globals
+MAX_POOL_CONNECTIONS_ENV_VAR = "FASTQ_GLUE_MAX_POOL_CONNECTIONS"
+SSM_PARAMETER_CACHE_TTL_SECONDS_ENV_VAR = "FASTQ_GLUE_SSM_PARAMETER_CACHE_TTL_SECONDS"
+
+# botocore's (and urllib3's) default pool size
+DEFAULT_MIN_POOL_CONNECTIONS = 10
+DEFAULT_SSM_PARAMETER_CACHE_TTL_SECONDS = 3600
+
+# service name -> boto3 client
+BOTO3_CLIENT_CACHE: Dict[str, Any] = {}
+BOTO3_CLIENT_CACHE_LOCK = threading.Lock()
+
+# ssm parameter name -> (cached at, value)
+SSM_PARAMETER_CACHE: Dict[str, Tuple[float, str]] = {}
+
+# The keep-alive session of each thread
+HTTP_SESSION_STATE = threading.local()
+
+
+def get_max_pool_connections() -> int:
+    if environ.get(MAX_POOL_CONNECTIONS_ENV_VAR, None):
+        return max(int(environ[MAX_POOL_CONNECTIONS_ENV_VAR]), 1)
+
+    # Imported here, the thread pool is only needed once a client is created
+    from .concurrency import get_max_workers
+
+    return max(get_max_workers(), DEFAULT_MIN_POOL_CONNECTIONS)
+
+
+def get_ssm_parameter_cache_ttl_seconds() -> float:
+    return float(environ.get(SSM_PARAMETER_CACHE_TTL_SECONDS_ENV_VAR, DEFAULT_SSM_PARAMETER_CACHE_TTL_SECONDS))
+
+
+def get_bucket_key_from_s3_uri(url: str) -> Tuple[str, str]:
+    # urllib.parse is a few milliseconds to import, lambdas that only take leases never parse an s3 uri
+    from urllib.parse import urlparse
+
+    url_obj = urlparse(url)
+    return url_obj.netloc, url_obj.path.lstrip("/")
+
+
+def get_boto3_client(service_name: str) -> Any:
+    """
+    Get the boto3 client for the service, created once per execution environment
+    :param service_name:
+    :return:
+    """
+    boto3_client = BOTO3_CLIENT_CACHE.get(service_name, None)
+    if boto3_client is not None:
+        return boto3_client
+
+    # boto3's default session is not thread safe, create each client once, under the lock
+    with BOTO3_CLIENT_CACHE_LOCK:
+        if service_name not in BOTO3_CLIENT_CACHE:
+            # boto3 takes a couple of hundred milliseconds to import, only pay for it when we actually talk to AWS
+            import boto3
+            from botocore.config import Config
+
+            BOTO3_CLIENT_CACHE[service_name] = boto3.client(
+                service_name,
+                config=Config(
+                    max_pool_connections=get_max_pool_connections(),
+                    tcp_keepalive=True
+                )
+            )
+        return BOTO3_CLIENT_CACHE[service_name]
+
+
+def get_s3_client() -> 'S3Client':
+    return get_boto3_client('s3')
+
+
+def get_ssm_client() -> 'SSMClient':
+    return get_boto3_client('ssm')
+
+
+def get_dynamodb_client() -> 'DynamoDBClient':
+    return get_boto3_client('dynamodb')
+
+
+def clear_boto3_client_cache():
+    with BOTO3_CLIENT_CACHE_LOCK:
+        BOTO3_CLIENT_CACHE.clear()
+
+
+def get_ssm_parameter_value(parameter_name: str) -> str:
+    """
+    Get the (decrypted) value of the ssm parameter, cached for FASTQ_GLUE_SSM_PARAMETER_CACHE_TTL_SECONDS
+    :param parameter_name:
+    :return:
+    """
+    if parameter_name in SSM_PARAMETER_CACHE:
+        cached_at, parameter_value = SSM_PARAMETER_CACHE[parameter_name]
+        if time() - cached_at <= get_ssm_parameter_cache_ttl_seconds():
+            return parameter_value
+
+    parameter_value = get_ssm_client().get_parameter(
+        Name=parameter_name,
+        WithDecryption=True
+    ).get("Parameter").get("Value")
+
+    SSM_PARAMETER_CACHE[parameter_name] = (time(), parameter_value)
+
+    return parameter_value
+
+
+def clear_ssm_parameter_cache():
+    SSM_PARAMETER_CACHE.clear()
+
+
+def get_http_session() -> 'Session':
+    """
+    Get the keep-alive requests session of this thread, created on its first http call,
+    its connection pool is sized as the boto3 clients' are
+    :return:
+    """
+    http_session = getattr(HTTP_SESSION_STATE, 'session', None)
+    if http_session is not None:
+        return http_session
+
+    # requests is only imported by lambdas that make http calls
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    http_session = requests.Session()
+    http_adapter = HTTPAdapter(pool_maxsize=get_max_pool_connections())
+    http_session.mount("https://", http_adapter)
+    http_session.mount("http://", http_adapter)
+    HTTP_SESSION_STATE.session = http_session
+    return http_session
+
+
+def reset_http_session():
+    """
+    Close the keep-alive session of this thread
+    :return:
+    """
+    http_session = getattr(HTTP_SESSION_STATE, 'session', None)
+    if http_session is not None:
+        del HTTP_SESSION_STATE.session
+        http_session.close()
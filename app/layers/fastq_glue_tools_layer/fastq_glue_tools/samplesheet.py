@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""
+Samplesheet helpers
+
+The sequence run manager returns the v2 samplesheet as a json object, the bclconvertData section
+holds one row per sample per lane.
+
+Rather than scan the bclconvertData section once per library, we compile the samplesheet once into
+a samplesheet index, mapping each sample id to its precomputed rows
+
+* index (with index2 appended, reverse complemented for NovaSeq X samplesheets)
+* lane (as an int)
+* cycleCount (from the row's overrideCycles, falling back to the global cycle count)
+"""
+
+# Standard imports
+import re
+from functools import lru_cache
+from typing import Dict, List, TypedDict, Any, Optional
+
+# Local imports
+from .metrics import timed_phase, add_rows_processed
+
+# Globals
+OVERRIDE_CYCLES_READ_REGEX = re.compile(r"[yY]([0-9]+)")
+INDEX_COMPLEMENT_TRANSLATION = str.maketrans("ACGTN", "TGCAN")
+
+
+class BclConvertDataRow(TypedDict):
+    libraryId: str
+    index: str
+    lane: int
+    cycleCount: int
+
+
+class SamplesheetIndex(TypedDict):
+    isReversed: bool
+    globalCycleCount: int
+    bclConvertDataBySampleId: Dict[str, List[BclConvertDataRow]]
+
+
+@lru_cache(maxsize=None)
+def get_cycle_count_from_override_cycles(override_cycles: str) -> int:
+    """
+    Sum the read cycles of the first two reads, i.e Y151;I10;I10;Y151 returns 302
+    Override cycles strings repeat across the samplesheet, so we cache the result
+    :param override_cycles:
+    :return:
+    """
+    read_cycle_regex_match = OVERRIDE_CYCLES_READ_REGEX.findall(override_cycles)
+    if read_cycle_regex_match is None or len(read_cycle_regex_match) == 0:
+        raise ValueError("Invalid override_cycles format")
+    if len(read_cycle_regex_match) == 1:
+        return int(read_cycle_regex_match[0])
+    return int(read_cycle_regex_match[0]) + int(read_cycle_regex_match[1])
+
+
+def get_global_cycle_count(samplesheet: Dict[str, Any]) -> int:
+    if samplesheet['bclconvertSettings'].get("overrideCycles") is not None:
+        override_cycles = samplesheet['bclconvertSettings']['overrideCycles']
+        return get_cycle_count_from_override_cycles(override_cycles)
+    return samplesheet['reads']['read1Cycles'] + samplesheet['reads'].get('read2Cycles', 0)
+
+
+def get_index(
+        index_str: str,
+        is_reversed: bool
+) -> str:
+    """
+    Make the index reverse complemented if is_reversed is True
+    Otherwise return the index as is
+    :param index_str: A string containing ACGTN characters
+    :param is_reversed: Boolean indicating if the index should be reverse complemented
+    :return: The (possibly reverse complemented) index string
+    """
+    if not is_reversed:
+        return index_str
+    return index_str.translate(INDEX_COMPLEMENT_TRANSLATION)[::-1]
+
+
+def is_reversed_samplesheet(samplesheet: Dict[str, Any]) -> bool:
+    """
+    The i5 index is flipped on the NovaSeq X series
+    :param samplesheet:
+    :return:
+    """
+    return (
+        samplesheet['header'].get("instrumentPlatform", "").lower() == "novaseqxseries" or
+        samplesheet['header'].get("instrumentType", "").lower() == "novaseq x"
+    )
+
+
+def compile_samplesheet_index(
+        samplesheet: Dict[str, Any],
+        sample_id_list: Optional[List[str]] = None
+) -> SamplesheetIndex:
+    """
+    Compile the samplesheet into a samplesheet index in a single pass over the bclconvertData section.
+    Rows keep their samplesheet order within each sample id.
+
+    If sample_id_list is set, only the rows for those samples are compiled,
+    this is cheaper when the index is only used for a single batch of libraries.
+    :param samplesheet:
+    :param sample_id_list:
+    :return:
+    """
+    is_reversed = is_reversed_samplesheet(samplesheet)
+    global_cycle_count = get_global_cycle_count(samplesheet)
+    sample_id_set = set(sample_id_list) if sample_id_list is not None else None
+
+    bclconvert_data_by_sample_id: Dict[str, List[BclConvertDataRow]] = {}
+    with timed_phase("parse"):
+        for bclconvert_row_iter_ in samplesheet['bclconvertData']:
+            if sample_id_set is not None and bclconvert_row_iter_['sampleId'] not in sample_id_set:
+                continue
+            bclconvert_data_by_sample_id.setdefault(bclconvert_row_iter_['sampleId'], []).append({
+                "libraryId": bclconvert_row_iter_['sampleId'],
+                "index": (
+                    bclconvert_row_iter_['index'] +
+                    (
+                        "+" + get_index(bclconvert_row_iter_['index2'], is_reversed=is_reversed)
+                        if bclconvert_row_iter_.get('index2')
+                        else ""
+                    )
+                ),
+                "lane": int(bclconvert_row_iter_['lane']),
+                "cycleCount": (
+                    get_cycle_count_from_override_cycles(bclconvert_row_iter_['overrideCycles'])
+                    if "overrideCycles" in bclconvert_row_iter_
+                    else global_cycle_count
+                ),
+            })
+    add_rows_processed(len(samplesheet['bclconvertData']))
+
+    return {
+        "isReversed": is_reversed,
+        "globalCycleCount": global_cycle_count,
+        "bclConvertDataBySampleId": bclconvert_data_by_sample_id,
+    }
+
+
+def get_bclconvert_data_rows_for_sample(
+        samplesheet_index: SamplesheetIndex,
+        sample_id: str
+) -> List[BclConvertDataRow]:
+    """
+    Get the bclconvert data rows for a sample id, an empty list if the sample is not in the samplesheet
+    :param samplesheet_index:
+    :param sample_id:
+    :return:
+    """
+    return list(map(
+        lambda bclconvert_row_iter_: BclConvertDataRow(**bclconvert_row_iter_),
+        samplesheet_index['bclConvertDataBySampleId'].get(sample_id, [])
+    ))
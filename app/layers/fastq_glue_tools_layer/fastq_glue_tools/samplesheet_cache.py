@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+"""
+Samplesheet cache
+
+Every batch of libraries requests the same samplesheet from the sequence run manager.
+The samplesheet is instead cached in two tiers, keyed by instrument run id.
+
+Tier one is an in-process LRU, which survives across warm invocations of the same lambda.
+Each entry records the ETag of the run pointer (below) it was read from, or written to.
+Every lookup checks the pointer's ETag (a single head request) before serving from tier one,
+so once a run has been invalidated no lambda serves its old samplesheet from memory.
+Without a shared store there is nothing to check against, tier one entries then only live for
+UNVALIDATED_MEMORY_CACHE_TTL_SECONDS.
+
+Tier two is a content-addressed store under the FASTQ_GLUE_CACHE_URI prefix, shared by all lambdas.
+It holds a compact form of the samplesheet (only the sections and columns the lambdas use), gzipped.
+
+<FASTQ_GLUE_CACHE_URI>/samplesheets/runs/<instrument_run_id>.json  -> pointer {"sha256": ..., "cachedAt": ...}
+<FASTQ_GLUE_CACHE_URI>/samplesheets/objects/<sha256>.json.gz        -> compact samplesheet
+
+Entries in both tiers expire after SAMPLESHEET_CACHE_TTL_SECONDS.
+When a run's samplesheet is re-uploaded, invalidate_samplesheet_cache removes the run pointer,
+the next request from any lambda then falls through to the sequence run manager.
+"""
+
+# Standard imports
+import gzip
+import json
+import hashlib
+import logging
+from collections import Counter, OrderedDict
+from os import environ
+from time import time
+from typing import Dict, Any, Callable, Optional, Tuple
+from urllib.parse import urlunparse
+
+# Local imports
+from .object_store import get_object_store, get_bucket_key_from_s3_uri, get_cache_root_uri, ObjectStore
+
+# Globals
+SAMPLESHEET_CACHE_PREFIX = "samplesheets"
+SAMPLESHEET_CACHE_TTL_SECONDS_ENV_VAR = "SAMPLESHEET_CACHE_TTL_SECONDS"
+DEFAULT_SAMPLESHEET_CACHE_TTL_SECONDS = 3600
+SAMPLESHEET_MEMORY_CACHE_MAX_ENTRIES = 4
+# Tier one entries that cannot be checked against the shared store
+UNVALIDATED_MEMORY_CACHE_TTL_SECONDS = 60
+
+# The only samplesheet fields read by the lambdas
+COMPACT_HEADER_KEYS = ["instrumentPlatform", "instrumentType"]
+COMPACT_BCLCONVERT_DATA_KEYS = ["sampleId", "lane", "index", "index2", "overrideCycles"]
+
+# Tier one, instrument run id -> (cached at, run pointer etag (None without a shared store), compact samplesheet)
+SAMPLESHEET_MEMORY_CACHE: 'OrderedDict[str, Tuple[float, Optional[str], Dict[str, Any]]]' = OrderedDict()
+
+# Hit / miss counters, for the lifetime of the execution environment
+SAMPLESHEET_CACHE_COUNTERS: Counter = Counter()
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_samplesheet_cache_ttl_seconds() -> int:
+    return int(environ.get(SAMPLESHEET_CACHE_TTL_SECONDS_ENV_VAR, DEFAULT_SAMPLESHEET_CACHE_TTL_SECONDS))
+
+
+def get_samplesheet_cache_counters() -> Dict[str, int]:
+    """
+    Get the cache counters, keys are
+    * memoryHits
+    * staleMemoryEntries
+    * storeHits
+    * misses
+    * invalidations
+    :return:
+    """
+    return {
+        "memoryHits": SAMPLESHEET_CACHE_COUNTERS["memoryHits"],
+        "staleMemoryEntries": SAMPLESHEET_CACHE_COUNTERS["staleMemoryEntries"],
+        "storeHits": SAMPLESHEET_CACHE_COUNTERS["storeHits"],
+        "misses": SAMPLESHEET_CACHE_COUNTERS["misses"],
+        "invalidations": SAMPLESHEET_CACHE_COUNTERS["invalidations"],
+    }
+
+
+def record_samplesheet_cache_event(instrument_run_id: str, counter_name: str):
+    SAMPLESHEET_CACHE_COUNTERS[counter_name] += 1
+    logger.info(
+        f"Samplesheet cache {counter_name} for {instrument_run_id}, "
+        f"counters: {json.dumps(get_samplesheet_cache_counters())}"
+    )
+
+
+def clear_samplesheet_memory_cache():
+    SAMPLESHEET_MEMORY_CACHE.clear()
+
+
+def get_compact_samplesheet(samplesheet: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Keep only the samplesheet fields the lambdas use,
+    the compact samplesheet can be passed to any of the samplesheet helpers in place of the full samplesheet.
+    :param samplesheet:
+    :return:
+    """
+    return {
+        "header": dict(filter(
+            lambda kv_iter_: kv_iter_[0] in COMPACT_HEADER_KEYS,
+            samplesheet.get('header', {}).items()
+        )),
+        "reads": samplesheet.get('reads', {}),
+        "bclconvertSettings": samplesheet.get('bclconvertSettings', {}),
+        "bclconvertData": list(map(
+            lambda bclconvert_row_iter_: dict(filter(
+                lambda kv_iter_: kv_iter_[0] in COMPACT_BCLCONVERT_DATA_KEYS,
+                bclconvert_row_iter_.items()
+            )),
+            samplesheet.get('bclconvertData', [])
+        )),
+    }
+
+
+def get_samplesheet_cache_uri(cache_root_uri: str, *path_parts: str) -> str:
+    cache_bucket, cache_prefix = get_bucket_key_from_s3_uri(cache_root_uri)
+    return str(urlunparse((
+        "s3",
+        cache_bucket,
+        "/".join([
+            cache_prefix.rstrip("/"),
+            SAMPLESHEET_CACHE_PREFIX,
+            *path_parts
+        ]),
+        None, None, None
+    )))
+
+
+def get_samplesheet_pointer_uri(cache_root_uri: str, instrument_run_id: str) -> str:
+    return get_samplesheet_cache_uri(cache_root_uri, "runs", f"{instrument_run_id}.json")
+
+
+def get_samplesheet_object_uri(cache_root_uri: str, samplesheet_sha256: str) -> str:
+    return get_samplesheet_cache_uri(cache_root_uri, "objects", f"{samplesheet_sha256}.json.gz")
+
+
+def is_expired(cached_at: float, ttl_seconds: Optional[float] = None) -> bool:
+    if ttl_seconds is None:
+        ttl_seconds = get_samplesheet_cache_ttl_seconds()
+    return time() - cached_at > ttl_seconds
+
+
+def read_samplesheet_from_store(
+        cache_root_uri: str,
+        instrument_run_id: str,
+        object_store: ObjectStore
+) -> Optional[Tuple[float, Dict[str, Any]]]:
+    """
+    Read the compact samplesheet for the run from the shared store, the caller has checked the run pointer exists.
+    Returns None if the pointer has expired or the object does not match its content address.
+    :param cache_root_uri:
+    :param instrument_run_id:
+    :param object_store:
+    :return:
+    """
+    pointer_uri = get_samplesheet_pointer_uri(cache_root_uri, instrument_run_id)
+    pointer = json.loads(object_store.get_object_bytes(pointer_uri))
+    if is_expired(pointer['cachedAt']):
+        logger.info(f"Samplesheet cache pointer for {instrument_run_id} has expired")
+        return None
+
+    object_uri = get_samplesheet_object_uri(cache_root_uri, pointer['sha256'])
+    if object_store.get_etag(object_uri) is None:
+        return None
+
+    compact_samplesheet_bytes = gzip.decompress(object_store.get_object_bytes(object_uri))
+    if hashlib.sha256(compact_samplesheet_bytes).hexdigest() != pointer['sha256']:
+        logger.warning(f"Samplesheet cache object {object_uri} does not match its content address, ignoring")
+        return None
+
+    return pointer['cachedAt'], json.loads(compact_samplesheet_bytes)
+
+
+def write_samplesheet_to_store(
+        cache_root_uri: str,
+        instrument_run_id: str,
+        cached_at: float,
+        compact_samplesheet: Dict[str, Any],
+        object_store: ObjectStore
+) -> Optional[str]:
+    """
+    Write the compact samplesheet object (if not already present) and then point the run at it
+    :param cache_root_uri:
+    :param instrument_run_id:
+    :param cached_at:
+    :param compact_samplesheet:
+    :param object_store:
+    :return: The etag of the run pointer
+    """
+    compact_samplesheet_bytes = json.dumps(
+        compact_samplesheet,
+        sort_keys=True,
+        separators=(",", ":")
+    ).encode()
+    samplesheet_sha256 = hashlib.sha256(compact_samplesheet_bytes).hexdigest()
+
+    object_uri = get_samplesheet_object_uri(cache_root_uri, samplesheet_sha256)
+    if object_store.get_etag(object_uri) is None:
+        object_store.put_object_bytes(
+            object_uri,
+            # Fixed mtime so the same samplesheet always gzips to the same bytes
+            gzip.compress(compact_samplesheet_bytes, mtime=0)
+        )
+
+    pointer_uri = get_samplesheet_pointer_uri(cache_root_uri, instrument_run_id)
+    object_store.put_object_bytes(
+        pointer_uri,
+        json.dumps({
+            "instrumentRunId": instrument_run_id,
+            "sha256": samplesheet_sha256,
+            "cachedAt": cached_at,
+        }).encode()
+    )
+
+    return object_store.get_etag(pointer_uri)
+
+
+def add_samplesheet_to_memory_cache(
+        instrument_run_id: str,
+        cached_at: float,
+        pointer_etag: Optional[str],
+        compact_samplesheet: Dict[str, Any]
+):
+    SAMPLESHEET_MEMORY_CACHE[instrument_run_id] = (cached_at, pointer_etag, compact_samplesheet)
+    SAMPLESHEET_MEMORY_CACHE.move_to_end(instrument_run_id)
+    while len(SAMPLESHEET_MEMORY_CACHE) > SAMPLESHEET_MEMORY_CACHE_MAX_ENTRIES:
+        SAMPLESHEET_MEMORY_CACHE.popitem(last=False)
+
+
+def get_cached_samplesheet(
+        instrument_run_id: str,
+        fetch_samplesheet: Callable[[], Dict[str, Any]],
+        object_store: Optional[ObjectStore] = None
+) -> Dict[str, Any]:
+    """
+    Get the compact samplesheet for the instrument run id,
+    trying the in-process cache, then the shared store and finally calling fetch_samplesheet.
+
+    The in-process copy is only served while the run pointer in the shared store has the etag it was cached with.
+
+    An empty samplesheet returned by fetch_samplesheet is passed through but never cached.
+    :param instrument_run_id:
+    :param fetch_samplesheet: Returns the samplesheet content for the run, i.e from the sequence run manager
+    :param object_store:
+    :return:
+    """
+    # The run pointer etag, None if the run has no pointer (or it has been invalidated)
+    cache_root_uri = get_cache_root_uri()
+    pointer_etag = None
+    if cache_root_uri is not None:
+        if object_store is None:
+            object_store = get_object_store()
+        pointer_etag = object_store.get_etag(get_samplesheet_pointer_uri(cache_root_uri, instrument_run_id))
+
+    # Tier one
+    if instrument_run_id in SAMPLESHEET_MEMORY_CACHE:
+        cached_at, cached_pointer_etag, compact_samplesheet = SAMPLESHEET_MEMORY_CACHE[instrument_run_id]
+        if cache_root_uri is None:
+            is_current = not is_expired(cached_at, min(
+                UNVALIDATED_MEMORY_CACHE_TTL_SECONDS,
+                get_samplesheet_cache_ttl_seconds()
+            ))
+        else:
+            is_current = (
+                pointer_etag is not None and
+                pointer_etag == cached_pointer_etag and
+                not is_expired(cached_at)
+            )
+        if is_current:
+            SAMPLESHEET_MEMORY_CACHE.move_to_end(instrument_run_id)
+            record_samplesheet_cache_event(instrument_run_id, "memoryHits")
+            return compact_samplesheet
+        record_samplesheet_cache_event(instrument_run_id, "staleMemoryEntries")
+        del SAMPLESHEET_MEMORY_CACHE[instrument_run_id]
+
+    # Tier two
+    if pointer_etag is not None:
+        store_entry = read_samplesheet_from_store(cache_root_uri, instrument_run_id, object_store)
+        if store_entry is not None:
+            record_samplesheet_cache_event(instrument_run_id, "storeHits")
+            cached_at, compact_samplesheet = store_entry
+            add_samplesheet_to_memory_cache(instrument_run_id, cached_at, pointer_etag, compact_samplesheet)
+            return compact_samplesheet
+
+    # Miss
+    record_samplesheet_cache_event(instrument_run_id, "misses")
+    samplesheet = fetch_samplesheet()
+    if not samplesheet:
+        return samplesheet
+
+    cached_at = time()
+    compact_samplesheet = get_compact_samplesheet(samplesheet)
+
+    if cache_root_uri is None:
+        add_samplesheet_to_memory_cache(instrument_run_id, cached_at, None, compact_samplesheet)
+        return compact_samplesheet
+
+    try:
+        pointer_etag = write_samplesheet_to_store(
+            cache_root_uri, instrument_run_id, cached_at, compact_samplesheet, object_store
+        )
+    except Exception as e:
+        # The cache is an optimisation, the samplesheet is still returned
+        logger.warning(f"Could not write samplesheet for {instrument_run_id} to the cache: {e}")
+        return compact_samplesheet
+
+    if pointer_etag is not None:
+        add_samplesheet_to_memory_cache(instrument_run_id, cached_at, pointer_etag, compact_samplesheet)
+
+    return compact_samplesheet
+
+
+def invalidate_samplesheet_cache(
+        instrument_run_id: str,
+        object_store: Optional[ObjectStore] = None
+):
+    """
+    Drop the run from the in-process cache and remove its pointer from the shared store,
+    other lambdas drop their in-process copy on their next lookup, when the pointer is no longer found.
+    Objects are content-addressed so are left in place, a re-uploaded samplesheet is written to a new object.
+    :param instrument_run_id:
+    :param object_store:
+    :return:
+    """
+    record_samplesheet_cache_event(instrument_run_id, "invalidations")
+    SAMPLESHEET_MEMORY_CACHE.pop(instrument_run_id, None)
+
+    cache_root_uri = get_cache_root_uri()
+    if cache_root_uri is None:
+        return
+
+    if object_store is None:
+        object_store = get_object_store()
+
+    object_store.delete_object(get_samplesheet_pointer_uri(cache_root_uri, instrument_run_id))
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Metadata tracking sheet helpers
+
+The samplesheet does not tell us whether a re-sequenced library is a 'topup' or a 'rerun',
+so we look for <library_id>_topup / <library_id>_rerun in the LibraryID column
+of the lab-metadata tracking sheet (one tab per year).
+
+Each year tab is downloaded at most once per TRACKING_SHEET_CACHE_TTL_SECONDS,
+and only its LibraryID column is kept (as a frozenset).
+The SSM parameter values (see runtime.py) and the gspread pandas credentials directory are also kept across warm invocations.
+
+gspread_pandas is only imported when a year tab is actually downloaded,
+lambdas that call these helpers must include gspread-pandas in their requirements.
+"""
+
+# Standard imports
+import re
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from os import environ
+from pathlib import Path
+from tempfile import mkdtemp
+from time import time
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple, TypedDict
+
+# Local imports
+from .runtime import get_ssm_parameter_value
+
+# Globals
+GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH_ENV_VAR = "GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH"
+METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH_ENV_VAR = "METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH"
+GSPREAD_PANDAS_CONFIG_DIR_ENV_VAR = "GSPREAD_PANDAS_CONFIG_DIR"
+GOOGLE_SECRET_FILE_NAME = "google_secret.json"
+
+TRACKING_SHEET_CACHE_TTL_SECONDS_ENV_VAR = "TRACKING_SHEET_CACHE_TTL_SECONDS"
+DEFAULT_TRACKING_SHEET_CACHE_TTL_SECONDS = 900
+
+LIBRARY_ID_COLUMN = "LibraryID"
+TOPUP_SUFFIX = "_topup"
+RERUN_SUFFIX = "_rerun"
+
+GET_YEAR_FROM_LIBRARY_ID_REGEX = re.compile(r"L(?:PRJ)?(\d{2})(?:\d{5})?")
+
+# year -> (cached at, library ids in the year tab)
+TRACKING_SHEET_LIBRARY_ID_CACHE: Dict[int, Tuple[float, FrozenSet[str]]] = {}
+
+# Hit / miss counters, for the lifetime of the execution environment
+TRACKING_SHEET_CACHE_COUNTERS: Counter = Counter()
+
+# Set logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class TrackingSheetClassification(TypedDict):
+    isTopup: bool
+    isRerun: bool
+
+
+def get_tracking_sheet_cache_ttl_seconds() -> int:
+    return int(environ.get(TRACKING_SHEET_CACHE_TTL_SECONDS_ENV_VAR, DEFAULT_TRACKING_SHEET_CACHE_TTL_SECONDS))
+
+
+def get_tracking_sheet_cache_counters() -> Dict[str, int]:
+    """
+    Get the cache counters, keys are
+    * hits
+    * misses
+    :return:
+    """
+    return {
+        "hits": TRACKING_SHEET_CACHE_COUNTERS["hits"],
+        "misses": TRACKING_SHEET_CACHE_COUNTERS["misses"],
+    }
+
+
+def clear_tracking_sheet_cache():
+    TRACKING_SHEET_LIBRARY_ID_CACHE.clear()
+
+
+def get_tracking_sheet_id() -> str:
+    """
+    Get the sheet id for glims
+    """
+    return get_ssm_parameter_value(environ[METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH_ENV_VAR])
+
+
+def get_google_secret_contents() -> str:
+    return get_ssm_parameter_value(environ[GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH_ENV_VAR])
+
+
+def set_google_secrets():
+    """
+    Write the google secret into the gspread pandas config directory and point gspread pandas at it.
+
+    The directory is kept for the lifetime of the execution environment,
+    the secret is only rewritten if its value has changed.
+    :return:
+    """
+    if environ.get(GSPREAD_PANDAS_CONFIG_DIR_ENV_VAR, None) is None:
+        environ[GSPREAD_PANDAS_CONFIG_DIR_ENV_VAR] = mkdtemp(prefix="gspread_pandas_")
+
+    google_secret_path = Path(environ[GSPREAD_PANDAS_CONFIG_DIR_ENV_VAR]) / GOOGLE_SECRET_FILE_NAME
+    secret_contents = get_google_secret_contents()
+
+    if google_secret_path.is_file() and google_secret_path.read_text() == secret_contents:
+        return
+
+    google_secret_path.parent.mkdir(parents=True, exist_ok=True)
+    google_secret_path.write_text(secret_contents)
+
+
+def get_spread(spread: str, sheet: str) -> Any:
+    """
+    Default spread factory, import gspread pandas only when we actually need to read the sheet
+    :param spread:
+    :param sheet:
+    :return:
+    """
+    from gspread_pandas import Spread
+
+    set_google_secrets()
+
+    return Spread(
+        spread=spread,
+        sheet=sheet
+    )
+
+
+def get_year_from_library_id(library_id: str) -> int:
+    """
+    Regex to get the year from the library id
+    L(?:PRJ)?\\d{2}(?:\\d{5})?
+    :param library_id:
+    :return:
+    """
+    library_regex_obj = GET_YEAR_FROM_LIBRARY_ID_REGEX.match(
+        library_id
+    )
+
+    if library_regex_obj is None:
+        raise ValueError(
+            f"Could not get year from library id: {library_id}"
+        )
+
+    # Get the year from the library id
+    year = library_regex_obj.group(1)
+
+    return datetime.strptime(year, "%y").year
+
+
+def get_tracking_sheet_library_ids_for_year(
+        year: int,
+        spread_factory: Optional[Callable[[str, str], Any]] = None
+) -> FrozenSet[str]:
+    """
+    Get the set of library ids in the year tab of the tracking sheet.
+    The year tab is downloaded at most once per ttl.
+    :param year:
+    :param spread_factory: Callable taking (spread, sheet) and returning an object with a sheet_to_df method,
+        defaults to gspread_pandas.Spread
+    :return:
+    """
+    if year in TRACKING_SHEET_LIBRARY_ID_CACHE:
+        cached_at, library_id_set = TRACKING_SHEET_LIBRARY_ID_CACHE[year]
+        if time() - cached_at <= get_tracking_sheet_cache_ttl_seconds():
+            TRACKING_SHEET_CACHE_COUNTERS["hits"] += 1
+            return library_id_set
+
+    TRACKING_SHEET_CACHE_COUNTERS["misses"] += 1
+
+    if spread_factory is None:
+        spread_factory = get_spread
+
+    metadata_sheet_df = spread_factory(
+        get_tracking_sheet_id(),
+        f"{year}"
+    ).sheet_to_df(index=0)
+
+    library_id_set = frozenset(filter(
+        lambda library_id_iter_: isinstance(library_id_iter_, str) and library_id_iter_ != "",
+        metadata_sheet_df[LIBRARY_ID_COLUMN].tolist()
+    ))
+
+    TRACKING_SHEET_LIBRARY_ID_CACHE[year] = (time(), library_id_set)
+
+    logger.info(
+        f"Downloaded tracking sheet tab {year} ({len(library_id_set)} library ids), "
+        f"counters: {json.dumps(get_tracking_sheet_cache_counters())}"
+    )
+
+    return library_id_set
+
+
+def get_tracking_sheet_classification(
+        library_id: str,
+        spread_factory: Optional[Callable[[str, str], Any]] = None
+) -> TrackingSheetClassification:
+    """
+    Check whether the library is a topup and / or a rerun, from a single read of its year tab
+    :param library_id:
+    :param spread_factory:
+    :return:
+    """
+    library_id_set = get_tracking_sheet_library_ids_for_year(
+        get_year_from_library_id(library_id),
+        spread_factory=spread_factory
+    )
+
+    return {
+        "isTopup": f"{library_id}{TOPUP_SUFFIX}" in library_id_set,
+        "isRerun": f"{library_id}{RERUN_SUFFIX}" in library_id_set,
+    }
+
+
+def is_topup(library_id: str) -> bool:
+    return get_tracking_sheet_classification(library_id)['isTopup']
+
+
+def is_rerun(library_id: str) -> bool:
+    return get_tracking_sheet_classification(library_id)['isRerun']
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+"""
+Shared fixtures for the unit tests
+
+The tests run against the in-process orcabus_api_tools fakes used by the benchmarks (see app/benchmarks),
+installed once before any lambda module is imported, as lambda modules bind the fake endpoints at import time.
+
+python3 -m pytest app/tests
+"""
+
+# Standard imports
+import sys
+from pathlib import Path
+from typing import Iterator
+
+# Wider imports
+import pytest
+
+# Globals
+BENCHMARKS_DIR = Path(__file__).absolute().parent.parent / "benchmarks"
+sys.path.insert(0, str(BENCHMARKS_DIR))
+
+# Local imports
+from bench_utils import add_layer_to_path, discard_handler_metrics, add_lambda_to_path  # noqa: E402
+from fake_orcabus_api_tools import (  # noqa: E402
+    FakeFastqManager,
+    FakeSequenceRunManager,
+    install_fake_orcabus_api_tools
+)
+
+add_layer_to_path()
+discard_handler_metrics()
+add_lambda_to_path("create_fastq_set_object_py")
+add_lambda_to_path("add_read_sets_to_fastq_objects_py")
+add_lambda_to_path("unlink_and_invalidate_fastqs_py")
+
+FAKE_FASTQ_MANAGER = FakeFastqManager()
+FAKE_SEQUENCE_RUN_MANAGER = FakeSequenceRunManager()
+install_fake_orcabus_api_tools(FAKE_FASTQ_MANAGER, FAKE_SEQUENCE_RUN_MANAGER)
+
+
+@pytest.fixture
+def fake_fastq_manager() -> Iterator[FakeFastqManager]:
+    FAKE_FASTQ_MANAGER.reset()
+    yield FAKE_FASTQ_MANAGER
+    FAKE_FASTQ_MANAGER.on_request = None
+    FAKE_FASTQ_MANAGER.reset()
+
+
+@pytest.fixture(autouse=True)
+def local_stores(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """
+    Point the object store at a temporary directory and switch off the lease and journal stores,
+    tests that need a store set it themselves
+    """
+    monkeypatch.setenv("LOCAL_OBJECT_STORE_DIR", str(tmp_path / "object-store"))
+    monkeypatch.delenv("LOCAL_LOCK_STORE_PATH", raising=False)
+    monkeypatch.delenv("LOCAL_JOURNAL_STORE_PATH", raising=False)
+    monkeypatch.delenv("FASTQ_GLUE_LOCK_TABLE_NAME", raising=False)
+    monkeypatch.delenv("FASTQ_GLUE_JOURNAL_TABLE_NAME", raising=False)
+    monkeypatch.setenv("FASTQ_MANAGER_MAX_WORKERS", "1")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+"""
+Retried invocations replay the writes checkpointed by the failed attempt
+"""
+
+# Standard imports
+from pathlib import Path
+from typing import List
+
+# Wider imports
+import pytest
+
+# Local imports
+from bench_checkpoint_journal import (
+    LIBRARY_ID_BY_ACTION,
+    WriteInterrupter,
+    get_library_violations,
+    run_with_retry,
+    seed_library
+)
+from bench_create_fastq_set_object_api_calls import INSTRUMENT_RUN_ID, get_bclconvert_data
+from fake_orcabus_api_tools import FakeFastqManager
+
+# Layer imports
+from fastq_glue_tools.checkpoint_journal import SqliteJournalStore, get_checkpoint_journal
+
+# Lambda imports
+import create_fastq_set_object
+
+# Globals
+EXECUTION_ID = "arn:aws:states:ap-southeast-2:123456789012:execution:fastq-glue:test-execution"
+LIBRARY_ID = "L2500001"
+
+
+@pytest.fixture(params=["memory", "file"])
+def journal_store(request: pytest.FixtureRequest, tmp_path: Path) -> SqliteJournalStore:
+    if request.param == "memory":
+        return SqliteJournalStore(":memory:")
+    return SqliteJournalStore(str(tmp_path / "journal.sqlite"))
+
+
+class CallRecorder:
+    def __init__(self):
+        self.call_list: List[str] = []
+
+    def __call__(self, name: str):
+        def call():
+            self.call_list.append(name)
+            return {"id": f"fqr.{name}"}
+
+        return call
+
+
+def test_journal_is_disabled_without_an_execution_id(journal_store: SqliteJournalStore):
+    call_recorder = CallRecorder()
+    journal = get_checkpoint_journal(None, LIBRARY_ID, journal_store=journal_store)
+
+    assert not journal.is_enabled()
+    journal.checkpoint("createFastqObject", call_recorder("lane1"), lane=1)
+    journal.checkpoint("createFastqObject", call_recorder("lane1"), lane=1)
+
+    assert call_recorder.call_list == ["lane1", "lane1"]
+
+
+def test_journal_is_disabled_without_a_store():
+    assert not get_checkpoint_journal(EXECUTION_ID, LIBRARY_ID).is_enabled()
+
+
+def test_retry_replays_checkpointed_writes(journal_store: SqliteJournalStore):
+    call_recorder = CallRecorder()
+    first_attempt = get_checkpoint_journal(EXECUTION_ID, LIBRARY_ID, journal_store=journal_store)
+    assert first_attempt.checkpoint("createFastqObject", call_recorder("lane1"), lane=1) == {"id": "fqr.lane1"}
+    assert first_attempt.checkpoint("createFastqObject", call_recorder("lane2"), lane=2) == {"id": "fqr.lane2"}
+
+    # The retry opens the journal again, replays lanes 1 and 2 and resumes from lane 3
+    retry_attempt = get_checkpoint_journal(EXECUTION_ID, LIBRARY_ID, journal_store=journal_store)
+    for lane_iter_ in [1, 2, 3]:
+        assert retry_attempt.checkpoint(
+            "createFastqObject", call_recorder(f"lane{lane_iter_}"), lane=lane_iter_
+        ) == {"id": f"fqr.lane{lane_iter_}"}
+
+    assert call_recorder.call_list == ["lane1", "lane2", "lane3"]
+    assert retry_attempt.num_replayed == 2
+    assert retry_attempt.has_checkpoint("createFastqObject", lane=3)
+    assert not retry_attempt.has_checkpoint("createFastqObject")
+
+
+def test_journals_are_kept_per_execution_and_library(journal_store: SqliteJournalStore):
+    call_recorder = CallRecorder()
+    get_checkpoint_journal(EXECUTION_ID, LIBRARY_ID, journal_store=journal_store).checkpoint(
+        "createFastqSet", call_recorder("fastqSet")
+    )
+
+    other_library_journal = get_checkpoint_journal(EXECUTION_ID, "L2500002", journal_store=journal_store)
+    other_execution_journal = get_checkpoint_journal(f"{EXECUTION_ID}-2", LIBRARY_ID, journal_store=journal_store)
+
+    assert not other_library_journal.has_checkpoint("createFastqSet")
+    assert not other_execution_journal.has_checkpoint("createFastqSet")
+
+
+def test_failed_write_is_not_recorded(journal_store: SqliteJournalStore):
+    def fail():
+        raise TimeoutError("Timed out")
+
+    journal = get_checkpoint_journal(EXECUTION_ID, LIBRARY_ID, journal_store=journal_store)
+    with pytest.raises(TimeoutError):
+        journal.checkpoint("createFastqSet", fail)
+
+    assert not get_checkpoint_journal(
+        EXECUTION_ID, LIBRARY_ID, journal_store=journal_store
+    ).has_checkpoint("createFastqSet")
+
+
+@pytest.mark.parametrize("action, library_id", LIBRARY_ID_BY_ACTION.items())
+def test_interrupted_handler_resumes_on_retry(
+        fake_fastq_manager: FakeFastqManager,
+        monkeypatch: pytest.MonkeyPatch,
+        action: str,
+        library_id: str
+):
+    monkeypatch.setenv("LOCAL_JOURNAL_STORE_PATH", ":memory:")
+    interrupter = WriteInterrupter()
+    fake_fastq_manager.on_request = interrupter
+    event = {
+        "instrumentRunId": INSTRUMENT_RUN_ID,
+        "libraryId": library_id,
+        "bclConvertData": get_bclconvert_data(library_id),
+        "fastqSetCreationAction": action,
+    }
+
+    # Count the writes of an uninterrupted invocation
+    seed_library(fake_fastq_manager, action, library_id)
+    create_fastq_set_object.handler(event, None)
+    num_writes = interrupter.num_writes
+    assert num_writes > 0
+
+    # Fail before each write in turn, the retry must not repeat a write the failed attempt made
+    for fail_after_iter_ in range(num_writes):
+        seed_library(fake_fastq_manager, action, library_id)
+        interrupter.num_writes = 0
+        assert run_with_retry(
+            create_fastq_set_object.handler,
+            {**event, "executionId": f"{EXECUTION_ID}-{action}-{fail_after_iter_}"},
+            interrupter,
+            fail_after_iter_
+        ) is None
+        assert interrupter.num_writes <= num_writes
+        assert get_library_violations(fake_fastq_manager, library_id) == []
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""
+Create, append to or replace a library's fastq set from a single read of its fastq sets
+"""
+
+# Standard imports
+from typing import Any, Dict, List, Optional
+
+# Wider imports
+import pytest
+
+# Local imports
+from bench_create_fastq_set_object_api_calls import (
+    INSTRUMENT_RUN_ID,
+    NUM_LANES,
+    PREVIOUS_INSTRUMENT_RUN_ID,
+    RERUN_LIBRARY_ID,
+    TOPUP_LIBRARY_ID,
+    FakeSpread,
+    add_existing_fastq_set,
+    get_bclconvert_data
+)
+from fake_orcabus_api_tools import FakeFastqManager
+
+# Layer imports
+from fastq_glue_tools import tracking_sheet
+from fastq_glue_tools.checkpoint_journal import get_checkpoint_journal
+
+# Lambda imports
+import create_fastq_set_object
+
+# Globals
+NEW_LIBRARY_ID = "L2500001"
+EXISTING_LIBRARY_ID = "L2500004"
+
+# library id, instrument run of its existing fastq set, expected action
+SCENARIOS = [
+    (NEW_LIBRARY_ID, None, "new"),
+    (TOPUP_LIBRARY_ID, PREVIOUS_INSTRUMENT_RUN_ID, "append"),
+    (RERUN_LIBRARY_ID, PREVIOUS_INSTRUMENT_RUN_ID, "replace"),
+    (EXISTING_LIBRARY_ID, INSTRUMENT_RUN_ID, "exists"),
+]
+
+
+@pytest.fixture(autouse=True)
+def fake_tracking_sheet(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(tracking_sheet, "get_spread", FakeSpread)
+    monkeypatch.setattr(tracking_sheet, "get_tracking_sheet_id", lambda: "fake-tracking-sheet-id")
+    tracking_sheet.clear_tracking_sheet_cache()
+    yield
+    tracking_sheet.clear_tracking_sheet_cache()
+
+
+def seed_library(
+        fake_fastq_manager: FakeFastqManager,
+        library_id: str,
+        existing_instrument_run_id: Optional[str]
+):
+    if existing_instrument_run_id is not None:
+        add_existing_fastq_set(fake_fastq_manager, library_id, existing_instrument_run_id)
+    # Only count the requests made by the lambda
+    fake_fastq_manager.request_counter.clear()
+
+
+def get_library_fastq_sets(fake_fastq_manager: FakeFastqManager, library_id: str) -> List[Dict[str, Any]]:
+    return list(map(
+        fake_fastq_manager.get_fastq_set_with_fastqs,
+        fake_fastq_manager.fastq_set_ids_by_library_id.get(library_id, [])
+    ))
+
+
+def get_instrument_run_ids(fastq_set: Dict[str, Any]) -> List[str]:
+    return sorted(set(map(lambda fastq_iter_: fastq_iter_['instrumentRunId'], fastq_set['fastqSet'])))
+
+
+@pytest.mark.parametrize("library_id, existing_instrument_run_id, expected_action", SCENARIOS)
+def test_classification(
+        fake_fastq_manager: FakeFastqManager,
+        library_id: str,
+        existing_instrument_run_id: Optional[str],
+        expected_action: str
+):
+    seed_library(fake_fastq_manager, library_id, existing_instrument_run_id)
+
+    library_fastq_set_snapshot = create_fastq_set_object.get_library_fastq_set_snapshot(
+        library_id=library_id,
+        instrument_run_id=INSTRUMENT_RUN_ID
+    )
+
+    assert create_fastq_set_object.resolve_fastq_set_creation_action(
+        library_fastq_set_snapshot,
+        journal=get_checkpoint_journal(None, library_id)
+    ) == expected_action
+
+
+@pytest.mark.parametrize("use_plan", [False, True])
+@pytest.mark.parametrize("library_id, existing_instrument_run_id, expected_action", SCENARIOS)
+def test_handler_reads_fastq_sets_once(
+        fake_fastq_manager: FakeFastqManager,
+        library_id: str,
+        existing_instrument_run_id: Optional[str],
+        expected_action: str,
+        use_plan: bool
+):
+    seed_library(fake_fastq_manager, library_id, existing_instrument_run_id)
+
+    create_fastq_set_object.handler(
+        {
+            "instrumentRunId": INSTRUMENT_RUN_ID,
+            "bclConvertData": get_bclconvert_data(library_id),
+            **({"fastqSetCreationAction": expected_action} if use_plan else {}),
+        },
+        None
+    )
+
+    assert fake_fastq_manager.request_counter["get_fastq_sets"] == 1
+
+    fastq_set_list = get_library_fastq_sets(fake_fastq_manager, library_id)
+    current_fastq_set_list = list(filter(
+        lambda fastq_set_iter_: fastq_set_iter_['isCurrentFastqSet'],
+        fastq_set_list
+    ))
+    assert len(current_fastq_set_list) == 1
+    assert not current_fastq_set_list[0]['allowAdditionalFastq']
+
+    if expected_action == "new":
+        assert len(fastq_set_list) == 1
+        assert get_instrument_run_ids(current_fastq_set_list[0]) == [INSTRUMENT_RUN_ID]
+    elif expected_action == "append":
+        # The topup's fastqs are appended to the existing fastq set
+        assert len(fastq_set_list) == 1
+        assert get_instrument_run_ids(current_fastq_set_list[0]) == sorted([
+            PREVIOUS_INSTRUMENT_RUN_ID, INSTRUMENT_RUN_ID
+        ])
+        assert len(current_fastq_set_list[0]['fastqSet']) == 2 * NUM_LANES
+    elif expected_action == "replace":
+        # The rerun supersedes the existing fastq set
+        assert len(fastq_set_list) == 2
+        assert get_instrument_run_ids(current_fastq_set_list[0]) == [INSTRUMENT_RUN_ID]
+    else:
+        # Nothing is written
+        assert len(fastq_set_list) == 1
+        assert sum(fake_fastq_manager.request_counter.values()) == 1
+
+
+def test_planned_action_yields_to_fastq_set_on_run(fake_fastq_manager: FakeFastqManager):
+    # The plan was made before a previous invocation created the fastq set
+    seed_library(fake_fastq_manager, NEW_LIBRARY_ID, INSTRUMENT_RUN_ID)
+
+    library_fastq_set_snapshot = create_fastq_set_object.get_library_fastq_set_snapshot(
+        library_id=NEW_LIBRARY_ID,
+        instrument_run_id=INSTRUMENT_RUN_ID
+    )
+
+    assert create_fastq_set_object.resolve_fastq_set_creation_action(
+        library_fastq_set_snapshot,
+        journal=get_checkpoint_journal(None, NEW_LIBRARY_ID),
+        fastq_set_creation_action="new"
+    ) == "exists"
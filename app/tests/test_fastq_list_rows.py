@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+"""
+The columnar fastq list rows match the previous iterrows construction, through the benchmark's entry points
+"""
+
+# Standard imports
+import json
+
+# Wider imports
+import pytest
+
+# Local imports
+from bench_fastq_list_rows import generate_bclconvert_data_dfs, get_payload, run_columnar, run_legacy
+
+# Lambda imports
+import create_fastq_set_object
+
+
+@pytest.mark.parametrize("num_lanes", [1, 8])
+def test_columnar_payloads_match_iterrows(monkeypatch: pytest.MonkeyPatch, num_lanes: int):
+    # Return the request payloads rather than calling the (fake) fastq manager
+    monkeypatch.setattr(create_fastq_set_object, "create_fastq_object", get_payload)
+    monkeypatch.setattr(create_fastq_set_object, "create_fastq_set_object", get_payload)
+    bclconvert_data_dfs = generate_bclconvert_data_dfs(num_lanes, num_libraries=5)
+
+    columnar_payloads = run_columnar(create_fastq_set_object, bclconvert_data_dfs)
+
+    assert json.dumps(columnar_payloads) == json.dumps(run_legacy(create_fastq_set_object, bclconvert_data_dfs))
+    assert len(columnar_payloads) == 5
+    assert len(columnar_payloads[0][1]) == num_lanes
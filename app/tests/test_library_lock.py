@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Library leases, taken from a sqlite lease store
+"""
+
+# Standard imports
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import sleep
+
+# Wider imports
+import pytest
+
+# Layer imports
+from fastq_glue_tools.library_lock import (
+    LockNotAcquiredError,
+    SqliteLockStore,
+    get_library_lock_key,
+    get_lock_store,
+    library_lock
+)
+
+# Globals
+LIBRARY_ID = "L2500001"
+
+
+@pytest.fixture(params=["memory", "file"])
+def lock_store(request: pytest.FixtureRequest, tmp_path: Path) -> SqliteLockStore:
+    if request.param == "memory":
+        return SqliteLockStore(":memory:")
+    return SqliteLockStore(str(tmp_path / "leases.db"))
+
+
+def test_locking_is_disabled_without_a_store():
+    assert get_lock_store() is None
+    with library_lock(LIBRARY_ID) as owner_id:
+        assert owner_id is None
+
+
+def test_second_owner_waits_then_fails(lock_store: SqliteLockStore):
+    with library_lock(LIBRARY_ID, lock_store=lock_store, lease_seconds=60) as owner_id:
+        assert owner_id is not None
+        with pytest.raises(LockNotAcquiredError):
+            with library_lock(LIBRARY_ID, lock_store=lock_store, lease_seconds=60, wait_seconds=0.1):
+                pass
+
+        # Other libraries are not blocked
+        with library_lock("L2500002", lock_store=lock_store, lease_seconds=60, wait_seconds=0) as other_owner_id:
+            assert other_owner_id is not None
+
+
+def test_lease_can_be_taken_once_released(lock_store: SqliteLockStore):
+    with library_lock(LIBRARY_ID, lock_store=lock_store, lease_seconds=60) as first_owner_id:
+        pass
+
+    with library_lock(LIBRARY_ID, lock_store=lock_store, lease_seconds=60, wait_seconds=0) as second_owner_id:
+        assert second_owner_id != first_owner_id
+
+
+def test_expired_lease_is_taken_over(lock_store: SqliteLockStore):
+    # An owner that crashed without releasing its lease
+    assert lock_store.try_acquire(get_library_lock_key(LIBRARY_ID), "crashed-owner", lease_seconds=0.05)
+    sleep(0.1)
+
+    with library_lock(LIBRARY_ID, lock_store=lock_store, lease_seconds=60, wait_seconds=0) as owner_id:
+        assert owner_id is not None
+
+    # The crashed owner cannot release a lease it no longer holds
+    assert not lock_store.release(get_library_lock_key(LIBRARY_ID), "crashed-owner")
+
+
+def test_owners_hold_the_lease_one_at_a_time(lock_store: SqliteLockStore):
+    holder_counts = {"current": 0, "max": 0}
+    holder_counts_lock = threading.Lock()
+
+    def hold_library_lock(_):
+        with library_lock(LIBRARY_ID, lock_store=lock_store, lease_seconds=60, wait_seconds=30):
+            with holder_counts_lock:
+                holder_counts['current'] += 1
+                holder_counts['max'] = max(holder_counts['max'], holder_counts['current'])
+            sleep(0.01)
+            with holder_counts_lock:
+                holder_counts['current'] -= 1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(hold_library_lock, range(16)))
+
+    assert holder_counts['max'] == 1
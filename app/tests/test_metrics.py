@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Shape of the EMF documents written by an instrumented handler
+"""
+
+# Standard imports
+import json
+from typing import Any, Dict, Iterator, List
+
+# Wider imports
+import pytest
+
+# Local imports
+from bench_utils import discard_handler_metrics
+
+# Layer imports
+from fastq_glue_tools import metrics
+
+# Globals
+FUNCTION_NAME = "test-function"
+
+
+@pytest.fixture
+def emf_documents(monkeypatch: pytest.MonkeyPatch) -> Iterator[List[Dict[str, Any]]]:
+    monkeypatch.setenv(metrics.FUNCTION_NAME_ENV_VAR, FUNCTION_NAME)
+    monkeypatch.delenv(metrics.METRICS_ENABLED_ENV_VAR, raising=False)
+    monkeypatch.delenv(metrics.METRICS_NAMESPACE_ENV_VAR, raising=False)
+    emf_document_list: List[Dict[str, Any]] = []
+    metrics.set_metrics_sink(lambda line: emf_document_list.append(json.loads(line)))
+    yield emf_document_list
+    discard_handler_metrics()
+
+
+def get_fake_api_call():
+    def get_fastq_set(fastq_set_id: str) -> Dict[str, str]:
+        return {"id": fastq_set_id}
+
+    return metrics.instrument_api_call(get_fastq_set)
+
+
+def assert_emf_document_shape(emf_document: Dict[str, Any], dimension_names: List[str]):
+    cloudwatch_metrics = emf_document['_aws']['CloudWatchMetrics']
+    assert isinstance(emf_document['_aws']['Timestamp'], int)
+    assert len(cloudwatch_metrics) == 1
+    assert cloudwatch_metrics[0]['Namespace'] == metrics.DEFAULT_METRICS_NAMESPACE
+    assert cloudwatch_metrics[0]['Dimensions'] == [dimension_names]
+    # Each dimension and metric is a top level field of the document
+    for dimension_name_iter_ in dimension_names:
+        assert dimension_name_iter_ in emf_document
+    for metric_iter_ in cloudwatch_metrics[0]['Metrics']:
+        assert set(metric_iter_.keys()) == {"Name", "Unit"}
+        assert metric_iter_['Name'] in emf_document
+
+
+def get_metric_names(emf_document: Dict[str, Any]) -> List[str]:
+    return list(map(
+        lambda metric_iter_: metric_iter_['Name'],
+        emf_document['_aws']['CloudWatchMetrics'][0]['Metrics']
+    ))
+
+
+def test_handler_and_endpoint_documents(emf_documents: List[Dict[str, Any]]):
+    get_fastq_set = get_fake_api_call()
+
+    @metrics.instrument_handler
+    def handler(event, context):
+        with metrics.timed_phase("download"):
+            metrics.add_bytes_read(1024)
+        metrics.add_rows_processed(8)
+        get_fastq_set("fqs.1")
+        get_fastq_set("fqs.2")
+        return "done"
+
+    assert handler({}, None) == "done"
+
+    assert len(emf_documents) == 2
+    handler_document, endpoint_document = emf_documents
+
+    assert_emf_document_shape(handler_document, ["FunctionName"])
+    assert handler_document['FunctionName'] == FUNCTION_NAME
+    assert set(get_metric_names(handler_document)) == {
+        "HandlerMilliseconds", "Errors", "BytesRead", "RowsProcessed", "ApiCalls",
+        "downloadMilliseconds", "apiReadMilliseconds",
+    }
+    assert handler_document['Errors'] == 0
+    assert handler_document['BytesRead'] == 1024
+    assert handler_document['RowsProcessed'] == 8
+    assert handler_document['ApiCalls'] == 2
+
+    assert_emf_document_shape(endpoint_document, ["FunctionName", "Endpoint"])
+    assert endpoint_document['Endpoint'] == "get_fastq_set"
+    assert set(get_metric_names(endpoint_document)) == {"Calls", "CallErrors", "Latency"}
+    assert endpoint_document['Calls'] == 2
+    assert endpoint_document['CallErrors'] == 0
+    assert len(endpoint_document['Latency']) == 2
+    assert sum(endpoint_document['LatencyHistogram']['Counts']) == 2
+
+
+def test_errors_are_counted_when_the_handler_raises(emf_documents: List[Dict[str, Any]]):
+    @metrics.instrument_handler
+    def handler(event, context):
+        raise ValueError("Handler failed")
+
+    with pytest.raises(ValueError):
+        handler({}, None)
+
+    assert len(emf_documents) == 1
+    assert emf_documents[0]['Errors'] == 1
+    assert metrics.get_active_handler_metrics() is None
+
+
+def test_no_documents_when_disabled(emf_documents: List[Dict[str, Any]], monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv(metrics.METRICS_ENABLED_ENV_VAR, "false")
+
+    @metrics.instrument_handler
+    def handler(event, context):
+        return get_fake_api_call()("fqs.1")
+
+    assert handler({}, None) == {"id": "fqs.1"}
+    assert emf_documents == []
+
+
+def test_emf_document_metric_limit():
+    with pytest.raises(ValueError):
+        metrics.get_emf_document(
+            metrics.DEFAULT_METRICS_NAMESPACE, 0,
+            dimensions={"FunctionName": FUNCTION_NAME},
+            metric_values={
+                f"Metric{metric_iter_}": (metric_iter_, "Count")
+                for metric_iter_ in range(metrics.MAX_METRICS_PER_DOCUMENT + 1)
+            },
+        )
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Topup / rerun classification from the cached year tabs of the tracking sheet
+"""
+
+# Standard imports
+from typing import Iterator, List
+
+# Wider imports
+import pandas as pd
+import pytest
+
+# Layer imports
+from fastq_glue_tools import tracking_sheet
+
+
+class CountingSpreadFactory:
+    """
+    Stand-in for gspread_pandas.Spread, records each year tab downloaded
+    """
+
+    def __init__(self):
+        self.sheet_list: List[str] = []
+
+    def __call__(self, spread: str, sheet: str) -> "CountingSpreadFactory":
+        self.sheet_list.append(sheet)
+        return self
+
+    def sheet_to_df(self, index: int = 0) -> pd.DataFrame:
+        year_suffix = self.sheet_list[-1][2:]
+        return pd.DataFrame({
+            "LibraryID": [
+                f"L{year_suffix}00001",
+                f"L{year_suffix}00002_topup",
+                f"L{year_suffix}00003_rerun",
+                "",
+            ]
+        })
+
+
+@pytest.fixture
+def spread_factory(monkeypatch: pytest.MonkeyPatch) -> Iterator[CountingSpreadFactory]:
+    monkeypatch.setattr(tracking_sheet, "get_tracking_sheet_id", lambda: "fake-tracking-sheet-id")
+    tracking_sheet.clear_tracking_sheet_cache()
+    yield CountingSpreadFactory()
+    tracking_sheet.clear_tracking_sheet_cache()
+
+
+def test_get_year_from_library_id():
+    assert tracking_sheet.get_year_from_library_id("L2500001") == 2025
+    assert tracking_sheet.get_year_from_library_id("LPRJ240001") == 2024
+    with pytest.raises(ValueError):
+        tracking_sheet.get_year_from_library_id("PRJ250001")
+
+
+def test_classification(spread_factory: CountingSpreadFactory):
+    assert tracking_sheet.get_tracking_sheet_classification("L2500001", spread_factory) == {
+        "isTopup": False,
+        "isRerun": False,
+    }
+    assert tracking_sheet.get_tracking_sheet_classification("L2500002", spread_factory) == {
+        "isTopup": True,
+        "isRerun": False,
+    }
+    assert tracking_sheet.get_tracking_sheet_classification("L2500003", spread_factory) == {
+        "isTopup": False,
+        "isRerun": True,
+    }
+
+
+def test_each_year_tab_is_downloaded_once(spread_factory: CountingSpreadFactory):
+    for library_id_iter_ in ["L2500001", "L2500002", "L2400003", "L2500003", "L2400001"]:
+        tracking_sheet.get_tracking_sheet_classification(library_id_iter_, spread_factory)
+
+    assert sorted(spread_factory.sheet_list) == ["2024", "2025"]
+    # Empty library ids are dropped
+    assert "" not in tracking_sheet.get_tracking_sheet_library_ids_for_year(2025, spread_factory)
+
+
+def test_year_tab_is_downloaded_again_once_expired(
+        spread_factory: CountingSpreadFactory,
+        monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setenv(tracking_sheet.TRACKING_SHEET_CACHE_TTL_SECONDS_ENV_VAR, "-1")
+
+    tracking_sheet.get_tracking_sheet_classification("L2500001", spread_factory)
+    tracking_sheet.get_tracking_sheet_classification("L2500002", spread_factory)
+
+    assert spread_factory.sheet_list == ["2025", "2025"]
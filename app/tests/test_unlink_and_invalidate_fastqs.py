@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Per fastq failures of the unlink and invalidate fastqs handler, and the cap on the failures returned
+"""
+
+# Standard imports
+from typing import List
+
+# Local imports
+from fake_orcabus_api_tools import FakeFastqManager
+
+# Lambda imports
+import unlink_and_invalidate_fastqs
+
+
+def add_fastqs(fake_fastq_manager: FakeFastqManager, fastq_id_list: List[str]):
+    for fastq_id_iter_ in fastq_id_list:
+        fake_fastq_manager.fastqs[fastq_id_iter_] = {"id": fastq_id_iter_, "fastqSetId": None, "isValid": True}
+
+
+def test_every_fastq_is_attempted(fake_fastq_manager: FakeFastqManager):
+    add_fastqs(fake_fastq_manager, ["fqr.1", "fqr.3"])
+
+    # fqr.2 is unknown to the fastq manager, so cannot be invalidated
+    summary = unlink_and_invalidate_fastqs.handler(
+        {"fastqAndFastqSetIdPairs": [{"fastqId": "fqr.1"}, {"fastqId": "fqr.2"}, {"fastqId": "fqr.3"}]},
+        None
+    )
+
+    assert summary['succeededCount'] == 2
+    assert summary['failedCount'] == 1
+    assert list(map(lambda failure_iter_: failure_iter_['fastqId'], summary['failedList'])) == ["fqr.2"]
+    assert summary['failedList'][0]['failedStep'] == "invalidate"
+    assert not summary['failedListTruncated']
+    assert not fake_fastq_manager.fastqs["fqr.1"]['isValid']
+    assert not fake_fastq_manager.fastqs["fqr.3"]['isValid']
+
+
+def test_failed_list_is_capped(fake_fastq_manager: FakeFastqManager):
+    num_fastqs = unlink_and_invalidate_fastqs.MAX_FAILED_LIST_LENGTH * 3
+
+    summary = unlink_and_invalidate_fastqs.handler(
+        {
+            "fastqAndFastqSetIdPairs": list(map(
+                lambda fastq_iter_: {"fastqId": f"fqr.{fastq_iter_}"},
+                range(num_fastqs)
+            )),
+        },
+        None
+    )
+
+    assert summary['succeededCount'] == 0
+    assert summary['failedCount'] == num_fastqs
+    assert len(summary['failedList']) == unlink_and_invalidate_fastqs.MAX_FAILED_LIST_LENGTH
+    assert summary['failedListTruncated']
+    # The first failures, in the order of the batch
+    assert summary['failedList'][0]['fastqId'] == "fqr.0"
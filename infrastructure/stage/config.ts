@@ -1,9 +1,26 @@
 import { StatefulApplicationStackConfig, StatelessApplicationStackConfig } from './interfaces';
-import { AWS_S3_CACHE_BUCKET_NAME, AWS_S3_PRIMARY_DATA_PREFIX, EVENT_BUS_NAME } from './constants';
+import {
+  AWS_S3_CACHE_BUCKET_NAME,
+  AWS_S3_FASTQ_GLUE_CACHE_PREFIX,
+  AWS_S3_PRIMARY_DATA_PREFIX,
+  EVENT_BUS_NAME,
+  LIBRARY_LOCK_TABLE_NAME,
+  CHECKPOINT_JOURNAL_TABLE_NAME,
+  FINGERPRINT_QUEUE_TABLE_NAME,
+} from './constants';
 import { StageName } from '@orcabus/platform-cdk-constructs/shared-config/accounts';
 
 export const getStatefulStackProps = (): StatefulApplicationStackConfig => {
-  return {};
+  return {
+    // Library lock table
+    libraryLockTableName: LIBRARY_LOCK_TABLE_NAME,
+
+    // Checkpoint journal table
+    checkpointJournalTableName: CHECKPOINT_JOURNAL_TABLE_NAME,
+
+    // Fingerprint queue table
+    fingerprintQueueTableName: FINGERPRINT_QUEUE_TABLE_NAME,
+  };
 };
 
 export const getStatelessStackProps = (stage: StageName): StatelessApplicationStackConfig => {
@@ -17,5 +34,15 @@ export const getStatelessStackProps = (stage: StageName): StatelessApplicationSt
     // AWS S3 Bucket Stuff - some lambdas will need read permissions to this bucket
     awsS3CacheBucketName: AWS_S3_CACHE_BUCKET_NAME[stage],
     awsS3PrimaryDataPrefix: AWS_S3_PRIMARY_DATA_PREFIX[stage],
+    awsS3FastqGlueCachePrefix: AWS_S3_FASTQ_GLUE_CACHE_PREFIX[stage],
+
+    // Library lock table - some lambdas will need read / write permissions to this table
+    libraryLockTableName: LIBRARY_LOCK_TABLE_NAME,
+
+    // Checkpoint journal table - some lambdas will need read / write permissions to this table
+    checkpointJournalTableName: CHECKPOINT_JOURNAL_TABLE_NAME,
+
+    // Fingerprint queue table - some lambdas will need read / write permissions to this table
+    fingerprintQueueTableName: FINGERPRINT_QUEUE_TABLE_NAME,
   };
 };
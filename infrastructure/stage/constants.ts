@@ -9,6 +9,7 @@ export const APP_ROOT = path.join(__dirname, '../../app');
 export const LAMBDA_DIR = path.join(APP_ROOT, 'lambdas');
 export const STEP_FUNCTIONS_DIR = path.join(APP_ROOT, 'step-function-templates');
 export const EVENT_SCHEMAS_DIR = path.join(APP_ROOT, 'event-schemas');
+export const LAYERS_DIR = path.join(APP_ROOT, 'layers');
 export const EVENT_BUS_NAME = 'OrcaBusMain';
 
 /* SRM Constants */
@@ -59,6 +60,33 @@ export const AWS_S3_PRIMARY_DATA_PREFIX: Record<StageName, string> = {
   ['PROD']: 'byob-icav2/production/primary/',
 };
 
+/*
+Fastq glue cache (parsed run reports etc.) lives in the cache bucket under this prefix
+*/
+export const AWS_S3_FASTQ_GLUE_CACHE_PREFIX: Record<StageName, string> = {
+  ['BETA']: 'byob-icav2/development/cache/fastq-glue/',
+  ['GAMMA']: 'byob-icav2/staging/cache/fastq-glue/',
+  ['PROD']: 'byob-icav2/production/cache/fastq-glue/',
+};
+
+/*
+Leases on library ids (so that only one invocation writes a library's fastq sets at a time)
+are held in this DynamoDB table, built by the stateful stack
+*/
+export const LIBRARY_LOCK_TABLE_NAME = 'FastqGlueLibraryLocks';
+
+/*
+Completed fastq manager writes of each execution / library (so that a retried invocation resumes, rather than repeats them)
+are journaled in this DynamoDB table, built by the stateful stack
+*/
+export const CHECKPOINT_JOURNAL_TABLE_NAME = 'FastqGlueCheckpointJournal';
+
+/*
+Fingerprint extraction submissions (de-duplicated, and dispatched so that only so many are in flight at once)
+are queued in this DynamoDB table, built by the stateful stack
+*/
+export const FINGERPRINT_QUEUE_TABLE_NAME = 'FastqGlueFingerprintQueue';
+
 /* Schema constants */
 export const SCHEMA_REGISTRY_NAME = EVENT_SCHEMA_REGISTRY_NAME;
 export const SSM_SCHEMA_ROOT = path.join(SSM_PARAMETER_PATH_PREFIX, 'schemas');
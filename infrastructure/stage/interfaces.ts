@@ -22,6 +22,27 @@ export interface StatelessApplicationStackConfig {
   */
   awsS3CacheBucketName: string;
   awsS3PrimaryDataPrefix: string;
+
+  /* Fastq glue cache prefix (in the cache bucket) - some lambdas will need read / write permissions */
+  awsS3FastqGlueCachePrefix: string;
+
+  /* Library lock table - some lambdas will need read / write permissions */
+  libraryLockTableName: string;
+
+  /* Checkpoint journal table - some lambdas will need read / write permissions */
+  checkpointJournalTableName: string;
+
+  /* Fingerprint queue table - some lambdas will need read / write permissions */
+  fingerprintQueueTableName: string;
 }
 
-export type StatefulApplicationStackConfig = object;
+export interface StatefulApplicationStackConfig {
+  /* Library lock table */
+  libraryLockTableName: string;
+
+  /* Checkpoint journal table */
+  checkpointJournalTableName: string;
+
+  /* Fingerprint queue table */
+  fingerprintQueueTableName: string;
+}
@@ -6,10 +6,12 @@ import {
   lambdaToRequirementsMap,
 } from './interfaces';
 import { PythonUvFunction } from '@orcabus/platform-cdk-constructs/lambda';
+import { PythonLayerVersion } from '@aws-cdk/aws-lambda-python-alpha';
 import path from 'path';
 import {
   GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH,
   LAMBDA_DIR,
+  LAYERS_DIR,
   METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH,
 } from '../constants';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
@@ -19,6 +21,16 @@ import { Construct } from 'constructs';
 import { NagSuppressions } from 'cdk-nag';
 import * as ssm from 'aws-cdk-lib/aws-ssm';
 
+export function buildFastqGlueToolsLayer(scope: Construct): PythonLayerVersion {
+  /* Helpers shared between the lambdas in this service */
+  return new PythonLayerVersion(scope, 'fastqGlueToolsLayer', {
+    entry: path.join(LAYERS_DIR, 'fastq_glue_tools_layer'),
+    compatibleRuntimes: [lambda.Runtime.PYTHON_3_14],
+    compatibleArchitectures: [lambda.Architecture.ARM_64],
+    description: 'Helpers shared between the fastq glue lambdas',
+  });
+}
+
 export function buildLambdaFunction(scope: Construct, props: BuildLambdaProps): LambdaObject {
   const lambdaNameToSnakeCase = camelCaseToSnakeCase(props.lambdaName);
   const lambdaRequirementsMap = lambdaToRequirementsMap[props.lambdaName];
@@ -37,6 +49,11 @@ export function buildLambdaFunction(scope: Construct, props: BuildLambdaProps):
     memorySize: lambdaRequirementsMap.needsMoreMemory ? 1024 : undefined,
   });
 
+  /* Do we need the fastq glue tools layer? */
+  if (lambdaRequirementsMap.needsFastqGlueToolsLayer) {
+    lambdaFunction.addLayers(props.fastqGlueToolsLayer);
+  }
+
   /* Do we need the bssh tools layer? */
   if (lambdaRequirementsMap.needsAwsReadAccess) {
     // Grant the lambda read access to the S3 bucket
@@ -57,18 +74,79 @@ export function buildLambdaFunction(scope: Construct, props: BuildLambdaProps):
     );
   }
 
-  if (props.lambdaName == 'createFastqSetObject') {
+  /* Do we need access to the fastq glue cache? */
+  if (lambdaRequirementsMap.needsCacheReadAccess || lambdaRequirementsMap.needsCacheWriteAccess) {
+    lambdaFunction.addEnvironment(
+      'FASTQ_GLUE_CACHE_URI',
+      `s3://${props.cacheS3BucketPrefix.s3Bucket.bucketName}/${props.cacheS3BucketPrefix.s3Prefix}`
+    );
+
+    if (lambdaRequirementsMap.needsCacheReadAccess) {
+      props.cacheS3BucketPrefix.s3Bucket.grantRead(
+        lambdaFunction.currentVersion,
+        `${props.cacheS3BucketPrefix.s3Prefix}*`
+      );
+    }
+
+    if (lambdaRequirementsMap.needsCacheWriteAccess) {
+      props.cacheS3BucketPrefix.s3Bucket.grantPut(
+        lambdaFunction.currentVersion,
+        `${props.cacheS3BucketPrefix.s3Prefix}*`
+      );
+      props.cacheS3BucketPrefix.s3Bucket.grantDelete(
+        lambdaFunction.currentVersion,
+        `${props.cacheS3BucketPrefix.s3Prefix}*`
+      );
+    }
+
+    NagSuppressions.addResourceSuppressions(
+      lambdaFunction,
+      [
+        {
+          id: 'AwsSolutions-IAM5',
+          reason: 'This lambda requires access to the fastq glue cache prefix.',
+        },
+      ],
+      true
+    );
+  }
+
+  /* Do we need to take leases on library ids? */
+  if (lambdaRequirementsMap.needsLibraryLockAccess) {
+    lambdaFunction.addEnvironment('FASTQ_GLUE_LOCK_TABLE_NAME', props.libraryLockTable.tableName);
+    props.libraryLockTable.grantReadWriteData(lambdaFunction.currentVersion);
+  }
+
+  /* Do we need to journal fastq manager writes? */
+  if (lambdaRequirementsMap.needsCheckpointJournalAccess) {
+    lambdaFunction.addEnvironment(
+      'FASTQ_GLUE_JOURNAL_TABLE_NAME',
+      props.checkpointJournalTable.tableName
+    );
+    props.checkpointJournalTable.grantReadWriteData(lambdaFunction.currentVersion);
+  }
+
+  /* Do we need to queue fingerprint extraction submissions? */
+  if (lambdaRequirementsMap.needsFingerprintQueueAccess) {
+    lambdaFunction.addEnvironment(
+      'FASTQ_GLUE_FINGERPRINT_QUEUE_TABLE_NAME',
+      props.fingerprintQueueTable.tableName
+    );
+    props.fingerprintQueueTable.grantReadWriteData(lambdaFunction.currentVersion);
+  }
+
+  if (lambdaRequirementsMap.needsTrackingSheetAccess) {
     const metadataTrackingSheetIdSsmParameterObj =
       ssm.StringParameter.fromSecureStringParameterAttributes(
         scope,
-        'metadata_tracking_sheet_id_ssm_parameter',
+        `${props.lambdaName}_metadata_tracking_sheet_id_ssm_parameter`,
         {
           parameterName: METADATA_TRACKING_SHEET_ID_SSM_PARAMETER_PATH,
         }
       );
     const gDriveAuthJsonSsmParameterObj = ssm.StringParameter.fromSecureStringParameterAttributes(
       scope,
-      'gdrive_auth_json_ssm_parameter',
+      `${props.lambdaName}_gdrive_auth_json_ssm_parameter`,
       {
         parameterName: GDRIVE_AUTH_JSON_SSM_PARAMETER_PATH,
       }
@@ -100,12 +178,16 @@ export function buildAllLambdaFunctions(
   scope: Construct,
   props: BuildLambdasProps
 ): LambdaObject[] {
+  // Build the shared layer once
+  const fastqGlueToolsLayer = buildFastqGlueToolsLayer(scope);
+
   // Iterate over lambdaNameList and create the lambda functions
   const lambdaObjects: LambdaObject[] = [];
   for (const lambdaName of lambdaNameList) {
     lambdaObjects.push(
       buildLambdaFunction(scope, {
         lambdaName: lambdaName,
+        fastqGlueToolsLayer: fastqGlueToolsLayer,
         ...props,
       })
     );
@@ -1,21 +1,24 @@
 import { IBucket } from 'aws-cdk-lib/aws-s3';
 import { PythonFunction } from '@aws-cdk/aws-lambda-python-alpha';
+import { ILayerVersion } from 'aws-cdk-lib/aws-lambda';
+import { ITable } from 'aws-cdk-lib/aws-dynamodb';
 
 /** Lambda Interfaces **/
 export type LambdaNameList =
   // Fastq set creation
+  | 'invalidateSamplesheetCache'
   | 'getLibraryIdListFromSamplesheet'
   | 'getBclconvertDataFromSamplesheet'
+  | 'planFastqSetCreation'
   | 'createFastqSetObject'
   // Fastq deprecation
   | 'getFastqAndFastqSetIdsFromInstrumentRunId'
-  | 'unlinkFastqFromFastqSet'
-  | 'invalidateFastq'
+  | 'unlinkAndInvalidateFastqs'
   // Add readset related
+  | 'buildRunReportsCache'
+  | 'buildRunManifest'
+  | 'planReadSetUpdates'
   | 'addReadSetsToFastqObjects'
-  | 'getFastqObjects'
-  | 'getFileNamesFromFastqListCsv'
-  | 'getSampleDemultiplexStats'
   // Extract fingerprint related
   | 'findMissingFingerprints'
   | 'getBamByLibraryId'
@@ -24,18 +27,19 @@ export type LambdaNameList =
 
 export const lambdaNameList: Array<LambdaNameList> = [
   // Fastq set creation
+  'invalidateSamplesheetCache',
   'getLibraryIdListFromSamplesheet',
   'getBclconvertDataFromSamplesheet',
+  'planFastqSetCreation',
   'createFastqSetObject',
   // Fastq deprecation
   'getFastqAndFastqSetIdsFromInstrumentRunId',
-  'unlinkFastqFromFastqSet',
-  'invalidateFastq',
+  'unlinkAndInvalidateFastqs',
   // Add readset related
+  'buildRunReportsCache',
+  'buildRunManifest',
+  'planReadSetUpdates',
   'addReadSetsToFastqObjects',
-  'getFastqObjects',
-  'getFileNamesFromFastqListCsv',
-  'getSampleDemultiplexStats',
   // Extract fingerprint related
   'findMissingFingerprints',
   'getBamByLibraryId',
@@ -55,6 +59,27 @@ export interface LambdaRequirementProps {
   /* Needs orcabus api tools layer */
   needsOrcabusApiToolsLayer?: boolean;
 
+  /* Needs the fastq glue tools layer */
+  needsFastqGlueToolsLayer?: boolean;
+
+  /* Does the lambda need read access to the fastq glue cache prefix? */
+  needsCacheReadAccess?: boolean;
+
+  /* Does the lambda need write (and delete) access to the fastq glue cache prefix? */
+  needsCacheWriteAccess?: boolean;
+
+  /* Does the lambda need to take leases on library ids? */
+  needsLibraryLockAccess?: boolean;
+
+  /* Does the lambda journal its fastq manager writes? */
+  needsCheckpointJournalAccess?: boolean;
+
+  /* Does the lambda queue fingerprint extraction submissions? */
+  needsFingerprintQueueAccess?: boolean;
+
+  /* Does the lambda need to read the lab-metadata tracking sheet? */
+  needsTrackingSheetAccess?: boolean;
+
   /* Needs More memory */
   needsMoreMemory?: boolean;
 
@@ -65,11 +90,26 @@ export interface LambdaRequirementProps {
 export interface BuildLambdasProps {
   /* Specific env vars */
   s3BucketPrefix: S3BucketPrefix;
+
+  /* Fastq glue cache */
+  cacheS3BucketPrefix: S3BucketPrefix;
+
+  /* Library lock table */
+  libraryLockTable: ITable;
+
+  /* Checkpoint journal table */
+  checkpointJournalTable: ITable;
+
+  /* Fingerprint queue table */
+  fingerprintQueueTable: ITable;
 }
 
 export interface BuildLambdaProps extends BuildLambdasProps {
   /* Naming formation */
   lambdaName: LambdaNameList;
+
+  /* Shared fastq glue tools layer */
+  fastqGlueToolsLayer: ILayerVersion;
 }
 
 export interface LambdaObject {
@@ -83,52 +123,98 @@ export type LambdaToRequirementsMapType = { [key in LambdaNameList]: LambdaRequi
 
 export const lambdaToRequirementsMap: LambdaToRequirementsMapType = {
   // Fastq set creation related
+  invalidateSamplesheetCache: {
+    needsFastqGlueToolsLayer: true,
+    needsCacheReadAccess: true,
+    needsCacheWriteAccess: true,
+  },
   getLibraryIdListFromSamplesheet: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsCacheReadAccess: true,
+    needsCacheWriteAccess: true,
   },
   getBclconvertDataFromSamplesheet: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsCacheReadAccess: true,
+    needsCacheWriteAccess: true,
+  },
+  planFastqSetCreation: {
+    needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsTrackingSheetAccess: true,
+    needsMoreMemory: true,
+    needsLongerTimeout: true,
   },
   createFastqSetObject: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsLibraryLockAccess: true,
+    needsCheckpointJournalAccess: true,
+    needsTrackingSheetAccess: true,
     needsMoreMemory: true,
     needsLongerTimeout: true,
   },
   // Fastq deprecation
   getFastqAndFastqSetIdsFromInstrumentRunId: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
   },
-  unlinkFastqFromFastqSet: {
-    needsOrcabusApiToolsLayer: true,
-  },
-  invalidateFastq: {
+  unlinkAndInvalidateFastqs: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsLongerTimeout: true,
   },
   // Fastq add readset related
-  addReadSetsToFastqObjects: {
-    needsOrcabusApiToolsLayer: true,
+  buildRunReportsCache: {
+    needsFastqGlueToolsLayer: true,
+    needsAwsReadAccess: true,
+    needsCacheReadAccess: true,
+    needsCacheWriteAccess: true,
+    needsMoreMemory: true,
+    needsLongerTimeout: true,
   },
-  getFastqObjects: {
+  buildRunManifest: {
     needsOrcabusApiToolsLayer: true,
-  },
-  getFileNamesFromFastqListCsv: {
+    needsFastqGlueToolsLayer: true,
     needsAwsReadAccess: true,
+    needsCacheReadAccess: true,
+    needsCacheWriteAccess: true,
+    needsMoreMemory: true,
+    needsLongerTimeout: true,
   },
-  getSampleDemultiplexStats: {
+  planReadSetUpdates: {
     needsOrcabusApiToolsLayer: true,
-    needsAwsReadAccess: true,
+    needsFastqGlueToolsLayer: true,
+    needsCacheReadAccess: true,
+    needsCacheWriteAccess: true,
+    needsMoreMemory: true,
+    needsLongerTimeout: true,
+  },
+  addReadSetsToFastqObjects: {
+    needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsCacheReadAccess: true,
+    needsCheckpointJournalAccess: true,
   },
   // Extract fingerprint related
   findMissingFingerprints: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
   },
   getBamByLibraryId: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
   },
   runExtractFingerprint: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
+    needsLibraryLockAccess: true,
+    needsFingerprintQueueAccess: true,
   },
   getFastqSetIdByLibrary: {
     needsOrcabusApiToolsLayer: true,
+    needsFastqGlueToolsLayer: true,
   },
 };
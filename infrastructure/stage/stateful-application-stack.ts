@@ -1,5 +1,7 @@
 import * as cdk from 'aws-cdk-lib';
 import { Construct } from 'constructs';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
+import { NagSuppressions } from 'cdk-nag';
 import { StatefulApplicationStackConfig } from './interfaces';
 import { buildSchemas } from './event-schemas';
 
@@ -16,5 +18,73 @@ export class StatefulApplicationStack extends cdk.Stack {
      */
     // Add to the schema registry
     buildSchemas(this);
+
+    // Library lock table
+    // Leases expire on their own (expiresAt), the ttl only cleans up the expired items
+    const libraryLockTable = new dynamodb.Table(this, 'libraryLockTable', {
+      tableName: props.libraryLockTableName,
+      partitionKey: {
+        name: 'lockKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    NagSuppressions.addResourceSuppressions(libraryLockTable, [
+      {
+        id: 'AwsSolutions-DDB3',
+        reason: 'Leases only last for the length of a lambda invocation, there is nothing to recover',
+      },
+    ]);
+
+    // Checkpoint journal table
+    // Entries are only read back by retries and redrives of the same execution, the ttl cleans them up
+    const checkpointJournalTable = new dynamodb.Table(this, 'checkpointJournalTable', {
+      tableName: props.checkpointJournalTableName,
+      partitionKey: {
+        name: 'journalKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'operationKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    NagSuppressions.addResourceSuppressions(checkpointJournalTable, [
+      {
+        id: 'AwsSolutions-DDB3',
+        reason: 'Journal entries are only needed while an execution can still be retried or redriven',
+      },
+    ]);
+
+    // Fingerprint queue table
+    // Submissions are only kept for the dedupe window (or a week while queued), the ttl cleans them up
+    const fingerprintQueueTable = new dynamodb.Table(this, 'fingerprintQueueTable', {
+      tableName: props.fingerprintQueueTableName,
+      partitionKey: {
+        name: 'queueName',
+        type: dynamodb.AttributeType.STRING,
+      },
+      sortKey: {
+        name: 'submissionKey',
+        type: dynamodb.AttributeType.STRING,
+      },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    NagSuppressions.addResourceSuppressions(fingerprintQueueTable, [
+      {
+        id: 'AwsSolutions-DDB3',
+        reason: 'Queued submissions are requeued by the daily missing fingerprints sweep, there is nothing to recover',
+      },
+    ]);
   }
 }
@@ -2,6 +2,7 @@
 import * as cdk from 'aws-cdk-lib';
 import { Construct } from 'constructs';
 import * as s3 from 'aws-cdk-lib/aws-s3';
+import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
 import { StatelessApplicationStackConfig } from './interfaces';
 import * as events from 'aws-cdk-lib/aws-events';
 import { buildAllLambdaFunctions } from './lambdas';
@@ -25,12 +26,40 @@ export class StatelessApplicationStack extends cdk.Stack {
     // Get S3 Bucket
     const s3Bucket = s3.Bucket.fromBucketName(this, 's3Bucket', props.awsS3CacheBucketName);
 
+    // Get Library Lock Table
+    const libraryLockTable = dynamodb.Table.fromTableName(
+      this,
+      'libraryLockTable',
+      props.libraryLockTableName
+    );
+
+    // Get Checkpoint Journal Table
+    const checkpointJournalTable = dynamodb.Table.fromTableName(
+      this,
+      'checkpointJournalTable',
+      props.checkpointJournalTableName
+    );
+
+    // Get Fingerprint Queue Table
+    const fingerprintQueueTable = dynamodb.Table.fromTableName(
+      this,
+      'fingerprintQueueTable',
+      props.fingerprintQueueTableName
+    );
+
     // Build Lambdas
     const lambdas = buildAllLambdaFunctions(this, {
       s3BucketPrefix: {
         s3Bucket: s3Bucket,
         s3Prefix: props.awsS3PrimaryDataPrefix,
       },
+      cacheS3BucketPrefix: {
+        s3Bucket: s3Bucket,
+        s3Prefix: props.awsS3FastqGlueCachePrefix,
+      },
+      libraryLockTable: libraryLockTable,
+      checkpointJournalTable: checkpointJournalTable,
+      fingerprintQueueTable: fingerprintQueueTable,
     });
 
     // Build Step Functions
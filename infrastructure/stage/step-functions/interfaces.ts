@@ -39,23 +39,23 @@ export interface SfnObject extends SfnProps {
 }
 
 export const fastqSetGenerationLambdaList: Array<LambdaNameList> = [
+  'invalidateSamplesheetCache',
   'getLibraryIdListFromSamplesheet',
   'getBclconvertDataFromSamplesheet',
+  'planFastqSetCreation',
   'createFastqSetObject',
 ];
 
 export const fastqSetAddReadSetLambdaList: Array<LambdaNameList> = [
+  'buildRunReportsCache',
+  'buildRunManifest',
+  'planReadSetUpdates',
   'addReadSetsToFastqObjects',
-  'getLibraryIdListFromSamplesheet',
-  'getFastqObjects',
-  'getFileNamesFromFastqListCsv',
-  'getSampleDemultiplexStats',
 ];
 
 export const handleSequencingRunFailureLambdaList: Array<LambdaNameList> = [
   'getFastqAndFastqSetIdsFromInstrumentRunId',
-  'unlinkFastqFromFastqSet',
-  'invalidateFastq',
+  'unlinkAndInvalidateFastqs',
 ];
 
 export const triggerSomalierExtractLambdaList: Array<LambdaNameList> = [